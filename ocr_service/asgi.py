@@ -0,0 +1,154 @@
+"""
+Entrada ASGI del servicio OCR
+
+POST /api/ocr/process con JSON (image_base64 o image_path) o con
+application/octet-stream se atiende de forma nativa con
+GeminiOCRClient.process_acta_async: mientras Gemini responde (30-120 s por
+acta) el request no ocupa un hilo, así que cada worker sostiene decenas de
+actas en vuelo con el mismo cliente, rate limiter y cache.
+
+El resto de rutas (multipart, streaming SSE, lotes, trabajos, /health,
+/metrics...) pasa a la app Flask de main.py a través de asgiref, con un
+hilo por request como en WSGI.
+
+Uso:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+
+import io
+import os
+import json
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+
+import main
+from metrics import REQUESTS_IN_FLIGHT, StageTimer
+
+_flask = WsgiToAsgi(main.app)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status_code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    raw_headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(payload)).encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]
+    raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _load_request(scope, receive, mimetype: str, timer: StageTimer):
+    """
+    Equivalente asíncrono de main._load_ocr_request para JSON y octet-stream
+
+    Returns:
+        (opciones, imagen)
+    """
+    client = main.gemini_client
+    body = await _read_body(receive)
+
+    with timer.stage('parseo_body'):
+        if mimetype == 'application/octet-stream':
+            if not body:
+                raise main.OCRRequestError('Request body vacío')
+            headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+            fields = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+            data = main.upload_options(fields, headers.get('x-ocr-metadata') or fields.get('metadata'))
+        else:
+            data = json.loads(body) if body else None
+
+    if not data:
+        raise main.OCRRequestError('Request body vacío')
+    if not data.get('metadata'):
+        raise main.OCRRequestError('Metadata requerida')
+
+    # Decodificar fuera del event loop
+    if mimetype == 'application/octet-stream':
+        with timer.stage('apertura_imagen'):
+            image = await asyncio.to_thread(client.load_image_from_file, io.BytesIO(body))
+    elif 'image_base64' in data:
+        image = await asyncio.to_thread(client.load_image_from_base64, data['image_base64'], timer)
+    elif 'image_path' in data:
+        image_path = data['image_path']
+        if not os.path.exists(image_path):
+            raise main.OCRRequestError(f'Imagen no encontrada: {image_path}', 404)
+        with timer.stage('apertura_imagen'):
+            image = await asyncio.to_thread(client.load_and_prepare_image, image_path)
+    else:
+        raise main.OCRRequestError('Imagen requerida (image_base64 o image_path)')
+
+    return data, image
+
+
+async def process_ocr(scope, receive, send, mimetype: str):
+    """POST /api/ocr/process sin un hilo por request (mismo contrato que main.process_ocr)"""
+    if not main.gemini_client:
+        await _send_json(send, 503, {
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        })
+        return
+
+    REQUESTS_IN_FLIGHT.inc(endpoint='process_ocr')
+    timer = StageTimer()
+    try:
+        data, image = await _load_request(scope, receive, mimetype, timer)
+        resultado = await main.gemini_client.process_acta_async(
+            image,
+            data['metadata'],
+            use_cache=bool(data.get('use_cache', True)),
+            preprocess=data.get('preprocess'),
+            timer=timer,
+            bands=data.get('bands'),
+        )
+        body, status_code, headers = {'success': True, 'data': resultado}, 200, {}
+    except Exception as e:
+        body, status_code, headers = main.ocr_error_response(e)
+    finally:
+        REQUESTS_IN_FLIGHT.dec(endpoint='process_ocr')
+
+    await _send_json(send, status_code, body, headers)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Servicios del worker: se crean en el proceso que atiende requests
+            main.create_app()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    # Servidores sin lifespan: inicializar en el primer request
+    main.init_services()
+
+    if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/ocr/process':
+        headers = dict(scope['headers'])
+        mimetype = headers.get(b'content-type', b'').decode('latin-1').split(';')[0].strip().lower()
+        if mimetype in ('application/json', 'application/octet-stream'):
+            await process_ocr(scope, receive, send, mimetype)
+            return
+
+    await _flask(scope, receive, send)
@@ -0,0 +1,86 @@
+"""
+Utilidades compartidas por los benchmarks del servicio OCR
+
+Formato de las actas grabadas (directorio):
+    acta_001.jpg    Imagen escaneada (jpg, jpeg, png, tif, tiff, webp)
+    acta_001.json   {"metadata": {...}, "resultado": {...}}
+
+"resultado" es la salida verificada de /api/ocr/process (formato backend)
+y se usa como referencia para medir la concordancia de la extracción.
+"""
+
+import os
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp')
+
+# Campos comparados por estudiante (además de cada nota)
+COMPARED_FIELDS = ('apellidoPaterno', 'apellidoMaterno', 'nombres', 'sexo', 'situacionFinal')
+
+
+def iter_recorded_actas(directory: str) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Recorre las actas grabadas de un directorio
+
+    Yields:
+        (nombre, ruta_imagen, grabacion) para cada imagen con su JSON de referencia
+    """
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        json_path = os.path.join(directory, f"{name}.json")
+        if not os.path.exists(json_path):
+            print(f"⚠️  {filename}: sin {name}.json de referencia, se omite")
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            yield name, os.path.join(directory, filename), json.load(f)
+
+
+def extraction_agreement(reference: Dict[str, Any], candidate: Optional[Dict[str, Any]]) -> float:
+    """
+    Concordancia entre dos resultados en formato backend
+
+    Compara estudiante por estudiante (emparejados por 'numero') cada nota y
+    los campos de COMPARED_FIELDS. Los estudiantes faltantes cuentan como
+    celdas en desacuerdo.
+
+    Returns:
+        float: Fracción de celdas coincidentes (0.0 - 1.0)
+    """
+    reference_students = reference.get('estudiantes', [])
+    if not reference_students:
+        return 1.0 if not candidate or not candidate.get('estudiantes') else 0.0
+
+    candidate_by_numero = {
+        est.get('numero'): est for est in (candidate or {}).get('estudiantes', [])
+    }
+
+    total = 0
+    matches = 0
+    for ref in reference_students:
+        cand = candidate_by_numero.get(ref.get('numero'), {})
+
+        for field in COMPARED_FIELDS:
+            total += 1
+            if str(ref.get(field, '')).strip().upper() == str(cand.get(field, '')).strip().upper():
+                matches += 1
+
+        ref_notas = ref.get('notas') or []
+        cand_notas = cand.get('notas') or []
+        for i, nota in enumerate(ref_notas):
+            total += 1
+            if i < len(cand_notas) and cand_notas[i] == nota:
+                matches += 1
+
+    return matches / total if total else 1.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil simple (sin interpolación) de una lista de valores"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,148 @@
+"""
+Benchmark de memoria: libro multipágina procesado de forma perezosa vs
+todas las páginas decodificadas de antemano
+
+Genera un TIFF de N páginas (comprimido, como un escaneo real) y lo procesa
+con un modelo falso (no llama a Gemini) en un subproceso por medición,
+reportando el pico de memoria residente (VmHWM del subproceso; ru_maxrss
+no sirve porque hereda el pico del proceso que generó el TIFF) y el tiempo:
+
+- documento: iter_document_results (cada página se decodifica al tomarla
+  un worker y se libera al terminar)
+- eager: todas las páginas decodificadas en una lista antes de procesar
+  (equivalente a separar el libro y enviar cada página en base64)
+
+Uso:
+    python bench_document.py [--paginas 10,50,100] [--ancho 2480] [--alto 3508] [--concurrencia 4]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}'} for i in range(11)],
+}
+RESPONSE = json.dumps({'estudiantes': [
+    {'numero': 1, 'apellido_paterno': 'QUISPE', 'nombres': 'ANA', 'notas': [14] * 11, 'situacion_final': 'P'}
+]})
+
+
+class FakeModel:
+    def generate_content(self, contents, stream=False):
+        time.sleep(0.05)
+        return SimpleNamespace(
+            text=RESPONSE,
+            candidates=[SimpleNamespace(finish_reason=1, safety_ratings=[])],
+            usage_metadata=None,
+        )
+
+
+class FakePool:
+    def get(self, model_name, system_instruction=None, generation_config=None, **kwargs):
+        return FakeModel()
+
+
+def make_tiff(path: str, pages: int, width: int, height: int):
+    """TIFF multipágina con renglones dibujados (se comprime como un escaneo)"""
+    def page(n):
+        img = Image.new('L', (width, height), color=255)
+        draw = ImageDraw.Draw(img)
+        for y in range(100, height - 100, 60):
+            draw.line([(80, y), (width - 80, y)], fill=0, width=2)
+            draw.text((100, y - 40), f"Pagina {n} fila {y}", fill=0)
+        return img
+
+    first = page(1)
+    first.save(path, save_all=True, append_images=(page(n + 2) for n in range(pages - 1)), compression='tiff_deflate')
+
+
+def peak_rss_mb() -> float:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run(mode: str, path: str, concurrency: int):
+    from gemini_client import GeminiOCRClient
+    from ocr_batch import iter_document_results
+    from ocr_document import open_document
+    from rate_limiter import TokenBucketRateLimiter
+
+    client = GeminiOCRClient(
+        'benchmark-sin-llamadas', model_pool=FakePool(),
+        rate_limiter=TokenBucketRateLimiter(requests_per_minute=1_000_000, tokens_per_minute=10 ** 12),
+    )
+    start = time.perf_counter()
+    with open_document(path) as document:
+        if mode == 'documento':
+            results = iter_document_results(client, document, METADATA, max_concurrency=concurrency)
+            exitosas = [item for item in results if item['tipo'] == 'resumen'][0]['exitosas']
+        else:
+            images = [document.page(pagina) for pagina in range(1, document.page_count + 1)]
+            for image in images:
+                image.load()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                exitosas = len(list(pool.map(lambda image: client.process_acta(image, METADATA), images)))
+    print(json.dumps({
+        'segundos': time.perf_counter() - start,
+        'rss_mb': peak_rss_mb(),
+        'exitosas': exitosas,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memoria de un libro multipágina: perezoso vs eager')
+    parser.add_argument('--paginas', default='10,50,100')
+    parser.add_argument('--ancho', type=int, default=2480, help='Ancho de página en px (A4 a 300 DPI)')
+    parser.add_argument('--alto', type=int, default=3508)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--modos', default='documento,eager')
+    parser.add_argument('--medir', help=argparse.SUPPRESS)
+    parser.add_argument('--archivo', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        run(args.medir, args.archivo, args.concurrencia)
+        return
+
+    env = dict(os.environ, OCR_LOG_LEVEL='WARNING')
+    workdir = tempfile.mkdtemp()
+    print("=" * 70)
+    print(f"📚 Libro TIFF de {args.ancho}x{args.alto} px por página, {args.concurrencia} páginas en paralelo")
+    print("=" * 70)
+    print(f"   {'páginas':>8} {'archivo':>10} " + ''.join(f"{mode + ' RSS':>16} {'tiempo':>8} " for mode in args.modos.split(',')))
+    for pages in (int(p) for p in args.paginas.split(',')):
+        path = os.path.join(workdir, f'libro_{pages}.tif')
+        make_tiff(path, pages, args.ancho, args.alto)
+        row = f"   {pages:>8} {os.path.getsize(path) / 1e6:8.1f}MB "
+        for mode in args.modos.split(','):
+            output = subprocess.run(
+                [sys.executable, '-W', 'ignore', __file__, '--medir', mode, '--archivo', path,
+                 '--concurrencia', str(args.concurrencia)],
+                capture_output=True, text=True, env=env, check=True,
+            ).stdout
+            stats = json.loads(output.strip().splitlines()[-1])
+            assert stats['exitosas'] == pages, stats
+            row += f"{stats['rss_mb']:14.0f}MB {stats['segundos']:7.1f}s "
+        print(row)
+        os.remove(path)
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
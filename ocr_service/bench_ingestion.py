@@ -0,0 +1,112 @@
+"""
+Benchmark de ingesta de imágenes en /api/ocr/process
+
+Compara el pico de memoria (tracemalloc) y el tiempo de la ingesta para:
+- JSON con image_base64 (ruta de compatibilidad)
+- multipart/form-data
+- application/octet-stream
+
+No llama a Gemini: process_acta se reemplaza por una función que solo
+decodifica la imagen, para aislar el costo de recibir y abrir el upload.
+
+Uso:
+    python bench_ingestion.py [ruta_imagen]
+    (sin imagen se genera un escaneo sintético de ~10 MB)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import tempfile
+
+# Configuración del servicio antes de importar main
+os.environ['OCR_TRACE_MEMORY'] = 'true'
+os.environ['OCR_CACHE_ENABLED'] = 'false'
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark-sin-llamadas')
+os.environ['OCR_JOBS_DB'] = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+
+from PIL import Image
+
+import main
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+}
+
+
+def decode_only(image, metadata, **kwargs):
+    image.load()
+    return {'totalEstudiantes': 0}
+
+
+def synthetic_scan() -> bytes:
+    # Ruido: PNG prácticamente incompresible (~10 MB)
+    image = Image.frombytes('L', (4000, 2600), os.urandom(4000 * 2600))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def main_bench():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_scan()
+
+    main.create_app()
+    main.gemini_client.process_acta = decode_only
+    client = main.app.test_client()
+    metadata_json = json.dumps(METADATA)
+
+    def post_json():
+        body = json.dumps({
+            'image_base64': 'data:image/png;base64,' + base64.b64encode(image_bytes).decode('ascii'),
+            'metadata': METADATA,
+        })
+        return client.post('/api/ocr/process', data=body, content_type='application/json')
+
+    def post_multipart():
+        return client.post(
+            '/api/ocr/process',
+            data={'image': (io.BytesIO(image_bytes), 'acta.png'), 'metadata': metadata_json},
+            content_type='multipart/form-data',
+        )
+
+    def post_octet_stream():
+        return client.post(
+            '/api/ocr/process',
+            data=image_bytes,
+            content_type='application/octet-stream',
+            headers={'X-OCR-Metadata': metadata_json},
+        )
+
+    print("=" * 70)
+    print(f"📦 Ingesta de imagen de {len(image_bytes):,} bytes")
+    print("=" * 70)
+    print(f"{'Ruta':<16} {'Pico memoria':>16} {'Tiempo':>10}")
+
+    for name, fn in (('base64 JSON', post_json), ('multipart', post_multipart), ('octet-stream', post_octet_stream)):
+        # El pico incluye solo lo asignado dentro del handler (no el body armado por el cliente)
+        start = time.perf_counter()
+        response = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        data = response.get_json()
+        if not data.get('success'):
+            print(f"{name:<16} ERROR: {data.get('error')}")
+            continue
+        peak = data['data']['memoria']['picoBytes']
+        print(f"{name:<16} {peak / 1024 / 1024:>13.1f} MB {elapsed:>8.0f}ms")
+
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main_bench()
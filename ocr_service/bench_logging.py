@@ -0,0 +1,125 @@
+"""
+Micro-benchmark: costo del logging en la conversión de una respuesta
+
+Mide convert_to_backend_format sobre un acta sintética (40 estudiantes,
+11 áreas) en tres modos:
+- print (anterior): json.dumps(indent=2) + print de cada estudiante
+- Detalle en cola: log_detail=True con el QueueHandler en segundo plano
+- Producción (INFO): sin detalle por estudiante
+
+La salida se descarta (StringIO / NullHandler) para medir solo el costo
+que paga el hilo del request.
+
+Uso:
+    python bench_logging.py [iteraciones]
+"""
+
+import io
+import sys
+import json
+import time
+import logging
+import statistics
+import contextlib
+
+from logging_setup import setup_logging
+import response_parser
+from response_parser import convert_to_backend_format
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [
+        {'posicion': i + 1, 'nombre': f'AREA {i + 1}', 'codigo': f'A{i + 1}'}
+        for i in range(11)
+    ],
+}
+
+GEMINI_DATA = {
+    'estudiantes': [
+        {
+            'numero': n + 1,
+            'codigo': f'{n + 1:06d}',
+            'tipo': 'G',
+            'apellido_paterno': 'QUISPE',
+            'apellido_materno': 'MAMANI',
+            'nombres': 'Juan Carlos',
+            'sexo': 'M' if n % 2 else 'H',
+            'notas': [10 + (n + i) % 9 for i in range(11)],
+            'comportamiento': '16',
+            'situacion_final': 'A',
+            'observaciones': None,
+        }
+        for n in range(40)
+    ]
+}
+
+
+def legacy_print_conversion():
+    """Emula el comportamiento anterior: volcar cada estudiante con print"""
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        for i, est in enumerate(GEMINI_DATA['estudiantes']):
+            print(f"\n🔍 DEBUG - Estudiante #{i+1} RAW de Gemini:")
+            print(f"{'-'*70}")
+            print(json.dumps(est, indent=2, ensure_ascii=False))
+            print(f"{'-'*70}")
+        return convert_to_backend_format(GEMINI_DATA, METADATA, log_detail=False)
+
+
+def measure(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)  # µs
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"   {name:<18} media={statistics.mean(samples):8.1f}µs  "
+          f"p50={statistics.median(samples):8.1f}µs  p95={p95:8.1f}µs")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    listener = setup_logging(level='INFO')
+    # Descartar la salida del listener: solo interesa el costo en el hilo del request
+    listener.handlers = (logging.NullHandler(),)
+
+    modes = [
+        ('print (anterior)', legacy_print_conversion),
+        ('Detalle en cola', lambda: convert_to_backend_format(GEMINI_DATA, METADATA, log_detail=True)),
+        ('Producción (INFO)', lambda: convert_to_backend_format(GEMINI_DATA, METADATA)),
+    ]
+
+    # Calentamiento
+    for _, fn in modes:
+        for _ in range(20):
+            fn()
+
+    print("=" * 70)
+    print(f"⏱️  Conversión de un acta de 40 estudiantes ({iterations} iteraciones)")
+    print("=" * 70)
+
+    results = {}
+    for name, fn in modes:
+        results[name] = measure(fn, iterations)
+        report(name, results[name])
+
+    legacy = statistics.mean(results['print (anterior)'])
+    production = statistics.mean(results['Producción (INFO)'])
+    print(f"\n   Ahorro por acta en producción: {legacy - production:.1f}µs "
+          f"({legacy / production:.1f}x)")
+    print(f"   Nivel efectivo de response_parser: "
+          f"{logging.getLevelName(response_parser.logger.getEffectiveLevel())}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
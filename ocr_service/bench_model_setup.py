@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: costo de preparar un request a Gemini
+
+Compara, sin llamar a la API:
+- Modelo fresco: construir GenerativeModel + safety_settings + generation_config
+  en cada request (comportamiento anterior)
+- Pool: reutilizar un handle pre-configurado del ModelPool
+
+En ambos casos se incluye la construcción del GenerateContentRequest
+(_prepare_request), que es lo que el SDK hace antes de enviar.
+
+Uso:
+    python bench_model_setup.py [iteraciones]
+"""
+
+import sys
+import time
+import statistics
+
+import google.generativeai as genai
+
+from model_pool import ModelPool, OCR_GENERATION_CONFIG, SAFETY_SETTINGS
+from prompt_builder import build_acta_prompt
+
+SYSTEM_INSTRUCTION = "Eres un sistema OCR de alta precisión especializado en documentos educativos peruanos."
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [
+        {'posicion': i + 1, 'nombre': f'AREA {i + 1}', 'codigo': f'A{i + 1}'}
+        for i in range(11)
+    ],
+}
+
+
+def fresh_model_setup(prompt: str):
+    model = genai.GenerativeModel('gemini-2.5-pro', system_instruction=SYSTEM_INSTRUCTION)
+    safety_settings = [dict(s) for s in SAFETY_SETTINGS]
+    generation_config = dict(OCR_GENERATION_CONFIG)
+    return model._prepare_request(
+        contents=[prompt],
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+        tools=None,
+        tool_config=None,
+    )
+
+
+def pooled_model_setup(pool: ModelPool, prompt: str):
+    model = pool.get(
+        'gemini-2.5-pro',
+        system_instruction=SYSTEM_INSTRUCTION,
+        generation_config=OCR_GENERATION_CONFIG,
+    )
+    return model._prepare_request(
+        contents=[prompt],
+        tools=None,
+        tool_config=None,
+    )
+
+
+def measure(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)  # µs
+    return samples
+
+
+def report(name: str, samples: list):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"   {name:<14} media={statistics.mean(samples):8.1f}µs  "
+          f"p50={statistics.median(samples):8.1f}µs  p95={p95:8.1f}µs")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    prompt = build_acta_prompt(METADATA)
+    pool = ModelPool()
+
+    # Calentamiento
+    for _ in range(50):
+        fresh_model_setup(prompt)
+        pooled_model_setup(pool, prompt)
+
+    print("=" * 70)
+    print(f"⏱️  Costo de preparación por request ({iterations} iteraciones)")
+    print("=" * 70)
+
+    fresh = measure(lambda: fresh_model_setup(prompt), iterations)
+    pooled = measure(lambda: pooled_model_setup(pool, prompt), iterations)
+
+    report('Modelo fresco', fresh)
+    report('Pool', pooled)
+    print(f"\n   Ahorro por request: {statistics.mean(fresh) - statistics.mean(pooled):.1f}µs "
+          f"({statistics.mean(fresh) / statistics.mean(pooled):.1f}x)")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
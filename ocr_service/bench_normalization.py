@@ -0,0 +1,249 @@
+"""
+Benchmark: re-normalización de un corpus de respuestas de Gemini
+
+Cuando cambian las reglas de normalización se re-procesa todo el archivo
+de respuestas. Este benchmark mide la conversión al formato backend
+(convert_to_backend_format + conteo por situación final) sobre miles de
+respuestas y la compara con la implementación anterior (substrings por
+variante, tres fallbacks de nombre duplicados y pasadas separadas para
+advertencias y conteos), que se conserva aquí solo como referencia.
+
+También cuenta los estudiantes cuyo resultado cambia entre ambas reglas.
+
+Corpus:
+- Sin --corpus: respuestas sintéticas con variantes reales de escritura
+  (sexo "FEMENINO", situación "APROBADO", nombres en nombre_completo...)
+- --corpus DIR: archivos .json/.txt con el texto crudo de cada respuesta
+
+Uso:
+    python bench_normalization.py [--respuestas 3000] [--corpus DIR]
+"""
+
+import gc
+import os
+import sys
+import time
+import random
+import argparse
+
+from response_parser import (
+    extract_json_from_response,
+    convert_to_backend_format,
+    normalize_sexo,
+    normalize_situacion_final,
+)
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}', 'codigo': f'A{i + 1}'} for i in range(11)],
+}
+
+SEXOS = ['M', 'F', 'M', 'F', 'H', 'MASCULINO', 'FEMENINO', 'MUJER', 'f', None]
+SITUACIONES = ['P', 'A', 'R', 'P', 'A', 'APROBADO', 'PROMOVIDO', 'REPROBADO', 'RETIRADO', '-', None, 'r']
+
+
+# --- Reglas anteriores (referencia) -----------------------------------------
+
+def legacy_normalize_sexo(sexo):
+    if sexo is None:
+        return 'M'
+    sexo_str = str(sexo).upper().strip()
+    masculino_variaciones = ['M', 'MASCULINO', 'MALE', 'H', 'HOMBRE', 'VARON', 'V']
+    femenino_variaciones = ['F', 'FEMENINO', 'FEMALE', 'MUJER', 'DAMA']
+    if any(var in sexo_str for var in masculino_variaciones):
+        return 'M'
+    elif any(var in sexo_str for var in femenino_variaciones):
+        return 'F'
+    return 'M'
+
+
+def legacy_normalize_situacion_final(situacion):
+    if situacion is None or str(situacion).strip() in ['', '-', 'N/A', 'NONE', 'NULL']:
+        return 'R'
+    situacion_str = str(situacion).upper().strip()
+    promovido_variaciones = ['P', 'PROMOVIDO', 'PROMOCIONADO', 'PASE DIRECTO', 'PASE', 'DIRECTO']
+    aprobado_variaciones = ['A', 'APROBADO', 'APROBADA', 'PASS', 'OK']
+    reprobado_variaciones = ['R', 'REPROBADO', 'REPROBADA', 'RETIRADO', 'RETIRADA', 'DESAPROBADO',
+                             'DESAPROBADA', 'FAIL', 'NO', 'D', 'REPITENTE']
+    if any(var in situacion_str for var in promovido_variaciones):
+        return 'P'
+    elif any(var in situacion_str for var in aprobado_variaciones):
+        return 'A'
+    elif any(var in situacion_str for var in reprobado_variaciones):
+        return 'R'
+    return 'R'
+
+
+def legacy_split(text, comma):
+    if comma and ',' in text:
+        apellidos, nombres = text.split(',', 1)
+        partes_apellidos = apellidos.strip().split(' ', 1)
+        return (partes_apellidos[0], partes_apellidos[1] if len(partes_apellidos) > 1 else '', nombres.strip())
+    partes = text.strip().split(' ')
+    return (partes[0], partes[1] if len(partes) > 1 else '', ' '.join(partes[2:]) if len(partes) > 2 else '')
+
+
+def legacy_convert_student(est):
+    notas = est.get('notas', [])
+    if isinstance(notas, list):
+        asignaturas_desaprobadas = sum(1 for nota in notas if nota is not None and nota < 11)
+    elif isinstance(notas, dict):
+        asignaturas_desaprobadas = sum(1 for nota in notas.values() if nota is not None and nota < 11)
+    else:
+        asignaturas_desaprobadas = 0
+    apellido_pat = str(est.get('apellido_paterno', '') or '').strip()
+    apellido_mat = str(est.get('apellido_materno', '') or '').strip()
+    nombres = str(est.get('nombres', '') or '').strip()
+    for field, comma in (('nombre_completo', True), ('apellidos_y_nombres', True), ('nombre', False)):
+        if not apellido_pat and not nombres and field in est:
+            value = str(est.get(field, '')).strip()
+            if value:
+                apellido_pat, apellido_mat, nombres = legacy_split(value, comma)
+    nombre_completo_str = f"{apellido_pat} {apellido_mat}, {nombres}".strip()
+    nombre_completo_str = ' '.join(nombre_completo_str.split())
+    nombre_completo_str = nombre_completo_str.replace(' ,', ',').replace(',  ', ', ')
+    if not nombre_completo_str or nombre_completo_str in [',', ', ', '  ,  ', '  ']:
+        nombre_completo_str, apellido_pat, apellido_mat, nombres = "Sin nombre", '', '', ''
+    return {
+        'numero': est.get('numero', 0),
+        'codigo': est.get('codigo', ''),
+        'tipo': est.get('tipo', 'G'),
+        'nombreCompleto': nombre_completo_str,
+        'apellidoPaterno': apellido_pat,
+        'apellidoMaterno': apellido_mat,
+        'nombres': nombres,
+        'sexo': legacy_normalize_sexo(est.get('sexo')),
+        'notas': notas,
+        'comportamiento': str(est.get('comportamiento', '0')),
+        'asignaturasDesaprobadas': asignaturas_desaprobadas,
+        'situacionFinal': legacy_normalize_situacion_final(est.get('situacion_final')),
+        'observaciones': est.get('observaciones'),
+    }
+
+
+def legacy_convert(gemini_data, metadata):
+    estudiantes_backend = [legacy_convert_student(est) for est in gemini_data.get('estudiantes', [])]
+    resultado = {'totalEstudiantes': len(estudiantes_backend), 'estudiantes': estudiantes_backend, 'advertencias': []}
+    for est in estudiantes_backend:
+        if est['asignaturasDesaprobadas'] > 3:
+            resultado['advertencias'].append(
+                f"Estudiante {est['numero']}: {est['asignaturasDesaprobadas']} asignaturas desaprobadas"
+            )
+    # Conteo de aprobados que hacía process_acta en otra pasada
+    resultado['aprobados'] = sum(1 for est in estudiantes_backend if est.get('situacionFinal') == 'A')
+    return resultado
+
+
+# --- Corpus -----------------------------------------------------------------
+
+def synthetic_corpus(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        estudiantes = []
+        for n in range(rng.randint(25, 45)):
+            est = {
+                'numero': n + 1,
+                'codigo': f'{rng.randint(0, 999999):06d}',
+                'tipo': 'G',
+                'sexo': rng.choice(SEXOS),
+                'notas': [rng.choice([None] + list(range(5, 21))) for _ in range(11)],
+                'comportamiento': str(rng.randint(11, 20)),
+                'situacion_final': rng.choice(SITUACIONES),
+                'observaciones': None,
+            }
+            if rng.random() < 0.1:
+                est['nombre_completo'] = 'QUISPE MAMANI, JUAN CARLOS'
+            else:
+                est.update(apellido_paterno='QUISPE', apellido_materno='MAMANI', nombres='JUAN CARLOS')
+            estudiantes.append(est)
+        corpus.append({'estudiantes': estudiantes})
+    return corpus
+
+
+def load_corpus(directory: str) -> list:
+    corpus = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(('.json', '.txt')):
+            continue
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+            try:
+                data = extract_json_from_response(f.read())
+            except ValueError:
+                continue
+        if isinstance(data, dict) and isinstance(data.get('estudiantes'), list):
+            corpus.append(data)
+    return corpus
+
+
+def run(fn, corpus: list) -> tuple:
+    # Sin GC durante la medición (como timeit): el corpus crea millones de
+    # objetos y las colecciones agregan ruido que no depende de las reglas
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        results = [fn(data, METADATA) for data in corpus]
+        return time.perf_counter() - start, results
+    finally:
+        gc.enable()
+
+
+def time_calls(fn, values: list, repeat: int = 20) -> float:
+    """ns por llamada de un normalizador sobre una lista de valores"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            fn(value)
+    return (time.perf_counter() - start) / (repeat * len(values)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de normalización de respuestas')
+    parser.add_argument('--respuestas', type=int, default=3000, help='Tamaño del corpus sintético')
+    parser.add_argument('--corpus', help='Directorio con respuestas crudas grabadas')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.respuestas)
+    if not corpus:
+        print("❌ Corpus vacío")
+        sys.exit(1)
+    total_students = sum(len(data['estudiantes']) for data in corpus)
+
+    # Calentamiento
+    for data in corpus[:50]:
+        legacy_convert(data, METADATA)
+        convert_to_backend_format(data, METADATA)
+
+    legacy_time, legacy_results = run(legacy_convert, corpus)
+    new_time, new_results = run(convert_to_backend_format, corpus)
+
+    cambios = {'sexo': 0, 'situacionFinal': 0, 'nombreCompleto': 0}
+    for old, new in zip(legacy_results, new_results):
+        for old_est, new_est in zip(old['estudiantes'], new['estudiantes']):
+            for field in cambios:
+                if old_est[field] != new_est[field]:
+                    cambios[field] += 1
+
+    print("=" * 70)
+    print(f"🔁 Re-normalización de {len(corpus)} respuestas ({total_students} estudiantes)")
+    print("=" * 70)
+    for name, elapsed in (('anterior', legacy_time), ('tablas', new_time)):
+        print(f"   {name:<9} {elapsed * 1000:8.1f}ms  {total_students / elapsed:10.0f} estudiantes/s")
+    print(f"\n   Aceleración: {legacy_time / new_time:.1f}x")
+    sexos = [est.get('sexo') for data in corpus[:200] for est in data['estudiantes']]
+    situaciones = [est.get('situacion_final') for data in corpus[:200] for est in data['estudiantes']]
+    print(f"   normalize_sexo:            {time_calls(legacy_normalize_sexo, sexos):6.0f}ns → "
+          f"{time_calls(normalize_sexo, sexos):6.0f}ns por llamada")
+    print(f"   normalize_situacion_final: {time_calls(legacy_normalize_situacion_final, situaciones):6.0f}ns → "
+          f"{time_calls(normalize_situacion_final, situaciones):6.0f}ns por llamada")
+    print("   Estudiantes con resultado distinto entre reglas: "
+          + ', '.join(f"{field}={count}" for field, count in cambios.items()))
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
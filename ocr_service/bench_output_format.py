@@ -0,0 +1,192 @@
+"""
+Benchmark: formato de salida 'objetos' vs 'filas'
+
+Sin --ocr no se llama a la API: arma la respuesta que devolvería el modelo
+para un acta sintética (40 estudiantes, 11 áreas por defecto) en cada
+formato y mide:
+- Tamaño de la salida (caracteres y tokens estimados)
+- Latencia de generación estimada con --tokens-por-segundo
+- Costo local de parseo + expansión + conversión al formato backend
+
+Con --ocr procesa las actas grabadas de un directorio con Gemini en ambos
+formatos y reporta tokens de salida reales (usage_metadata), latencia y
+concordancia con la referencia.
+
+Uso:
+    python bench_output_format.py [--estudiantes 40] [--areas 11] [--tokens-por-segundo 80]
+    python bench_output_format.py --ocr <directorio_actas>
+
+Ver bench_common.py para el formato del directorio.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+
+from bench_common import iter_recorded_actas, extraction_agreement, percentile
+from response_parser import (
+    COMPACT_COLUMNS,
+    OUTPUT_FORMATS,
+    OUTPUT_FORMAT_FILAS,
+    convert_to_backend_format,
+    expand_compact_response,
+    extract_json_from_response,
+)
+
+# Aproximación de la tokenización de JSON: cada palabra, número, signo de
+# puntuación o salto de línea con su indentación cuenta como un token.
+# Subestima las claves largas (BPE las parte en varios tokens), así que el
+# ahorro real de 'filas' es algo mayor que el estimado
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]|\n\s*')
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+def synthetic_students(count: int, num_areas: int) -> list:
+    return [
+        {
+            'numero': n + 1,
+            'codigo': f'{n + 1:06d}',
+            'tipo': 'G',
+            'apellido_paterno': 'QUISPE',
+            'apellido_materno': 'MAMANI',
+            'nombres': 'JUAN CARLOS',
+            'sexo': 'M' if n % 2 else 'F',
+            'notas': [8 + (n + i) % 12 for i in range(num_areas)],
+            'comportamiento': '16',
+            'asignaturas_desaprobadas': sum(1 for i in range(num_areas) if 8 + (n + i) % 12 < 11),
+            'situacion_final': 'A',
+            'observaciones': None,
+        }
+        for n in range(count)
+    ]
+
+
+def render_objetos(students: list) -> str:
+    """Respuesta como la del ejemplo del prompt (objetos con indentación)"""
+    return json.dumps({'estudiantes': students}, indent=2, ensure_ascii=False)
+
+
+def render_filas(students: list) -> str:
+    """Respuesta compacta: una fila por línea, como el ejemplo del prompt"""
+    rows = []
+    for est in students:
+        datos = [str(est[c]) if est[c] is not None else None for c in COMPACT_COLUMNS]
+        rows.append('  ' + json.dumps({'d': datos, 'n': est['notas']}, ensure_ascii=False))
+    return '{"filas": [\n' + ',\n'.join(rows) + '\n]}'
+
+
+def decode(text: str, output_format: str, metadata: dict) -> dict:
+    data = extract_json_from_response(text)
+    if output_format == OUTPUT_FORMAT_FILAS:
+        data = expand_compact_response(data)
+    return convert_to_backend_format(data, metadata)
+
+
+def measure(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)  # µs
+    return samples
+
+
+def run_offline(args):
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}', 'codigo': f'A{i + 1}'} for i in range(args.areas)],
+    }
+    students = synthetic_students(args.estudiantes, args.areas)
+    responses = {'objetos': render_objetos(students), 'filas': render_filas(students)}
+
+    # Ambos formatos deben producir exactamente el mismo resultado
+    assert decode(responses['objetos'], 'objetos', metadata) == decode(responses['filas'], 'filas', metadata)
+
+    print("=" * 70)
+    print(f"📏 Salida del modelo: {args.estudiantes} estudiantes, {args.areas} áreas")
+    print("=" * 70)
+    results = {}
+    for name, text in responses.items():
+        tokens = estimate_tokens(text)
+        samples = measure(lambda: decode(text, name, metadata), args.iteraciones)
+        results[name] = tokens
+        print(f"   {name:<8} {len(text):6d} caracteres  ~{tokens:5d} tokens  "
+              f"generación ~{tokens / args.tokens_por_segundo:5.1f}s  "
+              f"decodificación p50={statistics.median(samples):7.1f}µs")
+
+    ahorro = 1 - results['filas'] / results['objetos']
+    print(f"\n   Tokens de salida: -{ahorro:.0%} con 'filas' "
+          f"(~{(results['objetos'] - results['filas']) / args.tokens_por_segundo:.1f}s menos por acta "
+          f"a {args.tokens_por_segundo:.0f} tokens/s)")
+    print("=" * 70)
+
+
+def run_ocr(args):
+    from dotenv import load_dotenv
+    from gemini_client import GeminiOCRClient
+
+    actas = list(iter_recorded_actas(args.ocr))
+    if not actas:
+        print("❌ No se encontraron actas grabadas")
+        sys.exit(1)
+
+    load_dotenv()
+    api_key = os.getenv('GEMINI_API_KEY', '')
+    if not api_key:
+        print("❌ --ocr requiere GEMINI_API_KEY")
+        sys.exit(1)
+    # Sin cache: cada formato debe pagar su propia llamada
+    client = GeminiOCRClient(api_key, os.getenv('GEMINI_MODEL', 'gemini-2.5-pro'))
+
+    print("=" * 70)
+    print(f"🤖 Formatos de salida sobre {len(actas)} actas grabadas")
+    print("=" * 70)
+    for output_format in OUTPUT_FORMATS:
+        tokens, latencies, agreements = [], [], []
+        for name, image_path, grabacion in actas:
+            image = client.load_and_prepare_image(image_path)
+            try:
+                resultado = client.process_acta(image, grabacion['metadata'], output_format=output_format)
+            except Exception as e:
+                print(f"   ⚠️  {name} ({output_format}): {e}")
+                agreements.append(0.0)
+                continue
+            tokens.append(resultado['tokens']['salida'])
+            latencies.append(resultado['tiempoProcesamientoMs'])
+            agreements.append(extraction_agreement(grabacion['resultado'], resultado))
+
+        if not tokens:
+            print(f"   {output_format:<8} sin resultados")
+            continue
+        print(f"   {output_format:<8} tokens de salida media={statistics.mean(tokens):7.0f}  "
+              f"latencia p50={percentile(latencies, 50):6.0f}ms p95={percentile(latencies, 95):6.0f}ms  "
+              f"concordancia={statistics.mean(agreements):.1%}")
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de formatos de salida del modelo')
+    parser.add_argument('--estudiantes', type=int, default=40)
+    parser.add_argument('--areas', type=int, default=11)
+    parser.add_argument('--tokens-por-segundo', type=float, default=80,
+                        help='Velocidad de generación supuesta para estimar la latencia')
+    parser.add_argument('--iteraciones', type=int, default=300)
+    parser.add_argument('--ocr', metavar='DIRECTORIO',
+                        help='Procesar actas grabadas con Gemini en ambos formatos')
+    args = parser.parse_args()
+
+    if args.ocr:
+        run_ocr(args)
+    else:
+        run_offline(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de presets de preprocesamiento sobre actas grabadas
+
+Para cada preset mide:
+- Bytes y píxeles enviados a Gemini
+- Tiempo de preprocesamiento
+- Con --ocr: latencia de Gemini y concordancia con la referencia
+
+Sin --ocr no se llama a la API (solo mide el payload).
+
+Uso:
+    python bench_preprocessing.py <directorio_actas> [--ocr] [--presets original,balanceado]
+
+Ver bench_common.py para el formato del directorio.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+from dotenv import load_dotenv
+
+from bench_common import iter_recorded_actas, extraction_agreement, percentile
+from image_preprocessing import PRESETS, get_preset, preprocess_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de preprocesamiento de imágenes')
+    parser.add_argument('directorio', help='Directorio con actas grabadas (imagen + JSON de referencia)')
+    parser.add_argument('--ocr', action='store_true', help='Procesar con Gemini y medir latencia/concordancia')
+    parser.add_argument('--presets', default=','.join(['original'] + list(PRESETS)),
+                        help='Presets a comparar, separados por coma')
+    args = parser.parse_args()
+
+    presets = [p.strip() for p in args.presets.split(',') if p.strip()]
+    actas = list(iter_recorded_actas(args.directorio))
+    if not actas:
+        print("❌ No se encontraron actas grabadas")
+        sys.exit(1)
+
+    client = None
+    if args.ocr:
+        load_dotenv()
+        from gemini_client import GeminiOCRClient
+        api_key = os.getenv('GEMINI_API_KEY', '')
+        if not api_key:
+            print("❌ --ocr requiere GEMINI_API_KEY")
+            sys.exit(1)
+        # Sin cache: cada preset debe pagar su propia llamada
+        client = GeminiOCRClient(api_key, os.getenv('GEMINI_MODEL', 'gemini-2.5-pro'))
+
+    rows = []
+    for preset in presets:
+        config = get_preset(preset)
+        bytes_out, pixels_out, prep_ms, latencies, agreements = [], [], [], [], []
+
+        for name, image_path, grabacion in actas:
+            image_bytes = os.path.getsize(image_path)
+            if client:
+                image = client.load_and_prepare_image(image_path)
+            else:
+                from PIL import Image
+                image = Image.open(image_path)
+                image.info['source_bytes'] = image_bytes
+
+            image.load()  # Decodificar fuera de la medición
+
+            if config is None:
+                bytes_out.append(image_bytes)
+                pixels_out.append(image.size[0] * image.size[1])
+                prep_ms.append(0)
+            else:
+                start = time.perf_counter()
+                prepared = preprocess_image(image, config)
+                prep_ms.append((time.perf_counter() - start) * 1000)
+                bytes_out.append(prepared.stats['bytesDespues'])
+                pixels_out.append(prepared.stats['pixelesDespues'])
+
+            if client:
+                start = time.perf_counter()
+                try:
+                    resultado = client.process_acta(image, grabacion['metadata'], preprocess=preset)
+                except Exception as e:
+                    print(f"⚠️  {name} [{preset}]: {e}")
+                    resultado = None
+                latencies.append(time.perf_counter() - start)
+                agreements.append(extraction_agreement(grabacion['resultado'], resultado))
+
+        rows.append((preset, bytes_out, pixels_out, prep_ms, latencies, agreements))
+
+    print("\n" + "=" * 100)
+    print(f"📊 Preprocesamiento sobre {len(actas)} actas")
+    print("=" * 100)
+    print(f"{'Preset':<12} {'Bytes (media)':>14} {'MPx (media)':>12} {'Prep ms':>9} "
+          f"{'Lat p50 s':>10} {'Lat p95 s':>10} {'Concordancia':>13}")
+    for preset, bytes_out, pixels_out, prep_ms, latencies, agreements in rows:
+        lat50 = f"{statistics.median(latencies):.1f}" if latencies else '-'
+        lat95 = f"{percentile(latencies, 95):.1f}" if latencies else '-'
+        agree = f"{statistics.mean(agreements) * 100:.2f}%" if agreements else '-'
+        print(f"{preset:<12} {statistics.mean(bytes_out):>14,.0f} {statistics.mean(pixels_out) / 1e6:>12.2f} "
+              f"{statistics.mean(prep_ms):>9.1f} {lat50:>10} {lat95:>10} {agree:>13}")
+    print("=" * 100)
+
+
+if __name__ == '__main__':
+    main()
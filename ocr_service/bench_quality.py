@@ -0,0 +1,77 @@
+"""
+Benchmark del control de calidad de imagen (image_quality.assess_image)
+
+Genera un acta sintética del tamaño pedido (por defecto un escaneo de
+6000x4000) y sus variantes problemáticas, y mide el tiempo del análisis y
+de la corrección. El análisis corre antes de cada llamada a Gemini, por
+eso debe quedar muy por debajo de 100 ms.
+
+Uso:
+    python bench_quality.py [--ancho 6000] [--alto 4000] [--repeticiones 10]
+"""
+
+import time
+import argparse
+import statistics
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from image_quality import ImageQualityError, QualityConfig, apply_quality_gate, assess_image
+
+
+def make_acta(width: int, height: int) -> Image.Image:
+    """Tabla con renglones y texto, como un acta escaneada"""
+    img = Image.new('L', (width, height), color=235)
+    draw = ImageDraw.Draw(img)
+    for y in range(300, height - 300, 90):
+        draw.line([(200, y), (width - 200, y)], fill=30, width=4)
+        for x in range(300, width - 400, 420):
+            draw.text((x, y + 25), "QUISPE MAMANI 14 15", fill=20, font_size=40)
+    for x in range(200, width - 200, 420):
+        draw.line([(x, 300), (x, height - 300)], fill=30, width=3)
+    return img.convert('RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiempo del control de calidad de imagen')
+    parser.add_argument('--ancho', type=int, default=6000)
+    parser.add_argument('--alto', type=int, default=4000)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    base = make_acta(args.ancho, args.alto)
+    casos = {
+        'limpia': base,
+        'en_blanco': Image.new('RGB', base.size, (240, 240, 240)),
+        'borrosa': base.filter(ImageFilter.GaussianBlur(6)),
+        'bajo_contraste': base.point(lambda v: 110 + v * 0.12),
+        'inclinada 7°': base.rotate(7, expand=True, fillcolor=(235, 235, 235)),
+        'RGBA': base.convert('RGBA'),
+        'paleta': base.convert('P'),
+    }
+
+    print("=" * 78)
+    print(f"🔎 Control de calidad sobre {args.ancho}x{args.alto} px ({args.repeticiones} repeticiones)")
+    print("=" * 78)
+    print(f"   {'caso':<16} {'mediana':>9} {'máximo':>9} {'corrección':>11}  códigos")
+    for nombre, image in casos.items():
+        image.load()
+        tiempos = []
+        for _ in range(args.repeticiones):
+            start = time.perf_counter()
+            report = assess_image(image)
+            tiempos.append((time.perf_counter() - start) * 1000)
+        try:
+            _, gate = apply_quality_gate(image, QualityConfig())
+            correccion = f"{gate.metricas['correccionMs']:9.0f}ms" if gate.correcciones else f"{'-':>11}"
+        except ImageQualityError:
+            correccion = f"{'rechazo':>11}"
+        print(
+            f"   {nombre:<16} {statistics.median(tiempos):7.1f}ms {max(tiempos):7.1f}ms "
+            f"{correccion}  {', '.join(report.codigos) or '-'}"
+        )
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark de carga: servidor de desarrollo vs WSGI (gunicorn) vs ASGI (uvicorn)
+
+Levanta el servicio en un subproceso con un modelo falso (no llama a
+Gemini: cada llamada espera --latencia segundos y devuelve un acta válida)
+y envía --requests actas a /api/ocr/process (octet-stream) con
+--concurrencia clientes en paralelo. Reporta throughput, latencia p50/p95
+y el pico de hilos del servidor.
+
+Servidores:
+- dev:      app.run (servidor de desarrollo de Flask, un hilo por request)
+- gunicorn: 'main:create_app()' con worker gthread (--hilos por worker)
+- asgi:     uvicorn asgi:app (process_acta_async, sin hilo por request)
+
+Uso:
+    python bench_serving.py [--requests 200] [--concurrencia 50] [--latencia 2]
+                            [--servidores dev,gunicorn,asgi] [--hilos 32]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import statistics
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import percentile
+
+METADATA = {
+    'anio_lectivo': 1995,
+    'grado': 'Quinto Grado',
+    'seccion': 'A',
+    'turno': 'MAÑANA',
+    'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}', 'codigo': f'A{i + 1}'} for i in range(11)],
+}
+
+
+# --- Servidor (subproceso) --------------------------------------------------
+
+class FakeModel:
+    """Modelo falso: espera la latencia configurada y devuelve 30 estudiantes"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.text = json.dumps({'estudiantes': [
+            {'numero': n + 1, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI', 'nombres': 'ANA',
+             'sexo': 'F', 'notas': [14] * 11, 'comportamiento': '16', 'situacion_final': 'P'}
+            for n in range(30)
+        ]})
+
+    def _response(self):
+        return SimpleNamespace(
+            text=self.text,
+            candidates=[SimpleNamespace(finish_reason=1, safety_ratings=[])],
+            usage_metadata=SimpleNamespace(prompt_token_count=3000, candidates_token_count=2500,
+                                           total_token_count=5500, cached_content_token_count=0),
+        )
+
+    def generate_content(self, contents, stream=False):
+        time.sleep(self.latency)
+        return self._response()
+
+    async def generate_content_async(self, contents):
+        await asyncio.sleep(self.latency)
+        return self._response()
+
+
+class FakePool:
+    def __init__(self, latency: float):
+        self.model = FakeModel(latency)
+
+    def get(self, model_name, system_instruction=None, generation_config=None, **kwargs):
+        return self.model
+
+
+def configure_environment():
+    # Sin cache (cada request debe llegar al modelo) y cuota sin límite práctico
+    os.environ['GEMINI_API_KEY'] = 'benchmark-sin-llamadas'
+    os.environ['OCR_CACHE_ENABLED'] = 'false'
+    os.environ['GEMINI_RPM'] = '1000000'
+    os.environ['GEMINI_TPM'] = '1000000000'
+    os.environ['OCR_LOG_LEVEL'] = 'WARNING'
+    os.environ['OCR_JOBS_DB'] = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+
+
+def fake_app(latency: float):
+    """create_app con el modelo falso instalado (se llama en cada worker)"""
+    import main
+    app = main.create_app()
+    main.gemini_client.model_pool = FakePool(latency)
+    return app
+
+
+def serve(kind: str, port: int, latency: float, threads: int):
+    configure_environment()
+    if kind == 'dev':
+        fake_app(latency).run(host='127.0.0.1', port=port, threaded=True)
+    elif kind == 'gunicorn':
+        from gunicorn.app.base import BaseApplication
+
+        class Server(BaseApplication):
+            def load_config(self):
+                for key, value in {'bind': f'127.0.0.1:{port}', 'workers': 1, 'worker_class': 'gthread',
+                                   'threads': threads, 'timeout': 300, 'loglevel': 'warning'}.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return fake_app(latency)
+
+        Server().run()
+    elif kind == 'asgi':
+        import uvicorn
+        fake_app(latency)
+        import asgi
+        uvicorn.run(asgi.app, host='127.0.0.1', port=port, log_level='warning')
+    else:
+        raise ValueError(f"Servidor desconocido: {kind}")
+
+
+# --- Cliente de carga -------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"El servidor no respondió en el puerto {port}")
+
+
+def process_tree_threads(pid: int) -> int:
+    """Hilos del proceso y sus hijos (workers de gunicorn), vía /proc"""
+    total = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] = ppid, fields[17] = num_threads
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += int(fields[17])
+    return total
+
+
+def sample_image() -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('L', (1200, 800), color=255).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def run_load(port: int, server_pid: int, image: bytes, requests: int, concurrency: int):
+    headers = {'Content-Type': 'application/octet-stream', 'X-OCR-Metadata': json.dumps(METADATA)}
+    latencies, errors = [], []
+    peak_threads = 0
+    done = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, process_tree_threads(server_pid))
+            time.sleep(0.05)
+
+    def one(_):
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+        conn.request('POST', '/api/ocr/process', body=image, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            errors.append(response.status)
+        latencies.append(time.perf_counter() - start)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return elapsed, latencies, errors, peak_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de carga del servicio OCR con modelo falso')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrencia', type=int, default=50)
+    parser.add_argument('--latencia', type=float, default=2.0, help='Segundos por llamada al modelo falso')
+    parser.add_argument('--servidores', default='dev,gunicorn,asgi')
+    parser.add_argument('--hilos', type=int, default=32, help='Hilos del worker gthread de gunicorn')
+    parser.add_argument('--servir', help=argparse.SUPPRESS)
+    parser.add_argument('--puerto', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir:
+        serve(args.servir, args.puerto, args.latencia, args.hilos)
+        return
+
+    image = sample_image()
+    ideal = args.concurrencia / args.latencia
+    print("=" * 70)
+    print(f"🚦 {args.requests} actas, {args.concurrencia} en paralelo, modelo falso de {args.latencia:.1f}s "
+          f"(ideal: {ideal:.1f} actas/s)")
+    print("=" * 70)
+    for kind in args.servidores.split(','):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, __file__, '--servir', kind, '--puerto', str(port),
+             '--latencia', str(args.latencia), '--hilos', str(args.hilos)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_ready(port)
+            elapsed, latencies, errors, peak_threads = run_load(
+                port, server.pid, image, args.requests, args.concurrencia
+            )
+        except Exception as e:
+            print(f"   {kind:<9} ⚠️  {e}")
+            continue
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        print(f"   {kind:<9} {args.requests / elapsed:6.1f} actas/s  "
+              f"p50={statistics.median(latencies):5.2f}s p95={percentile(latencies, 95):5.2f}s  "
+              f"hilos pico={peak_threads:4d}  errores={len(errors)}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark de arranque en frío del servicio
+
+Mide por separado:
+- Import: tiempo de `import main` en un intérprete nuevo (y, como
+  referencia, el de google.generativeai solo)
+- Primer /health: desde que se lanza el proceso hasta el primer 200
+- Primer OCR: desde que se lanza el proceso hasta la respuesta del primer
+  /api/ocr/process, y la latencia de ese request
+
+para cada modo de OCR_WARMUP (off, background, sync; sync equivale a cargar
+el SDK antes de servir, como hacía el import eager). El servidor usa los
+handles reales del SDK (import, configure, GenerativeModel) pero responde
+sin llamar a la API.
+
+Uso:
+    python bench_startup.py [--repeticiones 3] [--espera 1.0] [--modos off,background,sync]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import http.client
+import statistics
+from types import SimpleNamespace
+
+from bench_serving import METADATA, free_port, FakeModel
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+
+
+# --- Servidor (subproceso) --------------------------------------------------
+
+class OfflineModel:
+    """Handle real del SDK cuya llamada responde localmente"""
+
+    def __init__(self, model):
+        self.model = model
+        self.fake = FakeModel(latency=0)
+
+    def generate_content(self, contents, stream=False):
+        return self.fake.generate_content(contents)
+
+
+def serve(port: int):
+    import main
+    app = main.create_app()
+    pool = main.gemini_client.model_pool
+    real_get = pool.get
+    pool.get = lambda *args, **kwargs: OfflineModel(real_get(*args, **kwargs))
+    app.run(host='127.0.0.1', port=port, threaded=True)
+
+
+# --- Mediciones -------------------------------------------------------------
+
+def import_time(module: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, '-W', 'ignore', '-c', IMPORT_SNIPPET.format(module=module)],
+        capture_output=True, text=True, env=env, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def request(port: int, method: str, path: str, body: bytes = None, headers: dict = None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def cold_start(mode: str, env: dict, image: bytes, wait: float) -> SimpleNamespace:
+    port = free_port()
+    env = dict(env, OCR_WARMUP=mode)
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', __file__, '--servir', '--puerto', str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                status, _ = request(port, 'GET', '/health')
+                if status == 200:
+                    break
+            except OSError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"El servidor terminó (código {server.returncode})")
+            time.sleep(0.005)
+        healthy = time.perf_counter() - start
+
+        time.sleep(wait)
+        ocr_start = time.perf_counter()
+        status, body = request(port, 'POST', '/api/ocr/process', body=image, headers={
+            'Content-Type': 'application/octet-stream',
+            'X-OCR-Metadata': json.dumps(METADATA),
+        })
+        if status != 200:
+            raise RuntimeError(f"OCR respondió {status}: {body[:200]!r}")
+        first_ocr = time.perf_counter() - start
+        return SimpleNamespace(
+            healthy=healthy * 1000,
+            first_ocr=first_ocr * 1000,
+            ocr_latency=(time.perf_counter() - ocr_start) * 1000,
+        )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de arranque en frío')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--espera', type=float, default=1.0,
+                        help='Segundos entre el primer /health y el primer OCR (tráfico tras el health check)')
+    parser.add_argument('--modos', default='off,background,sync')
+    parser.add_argument('--servir', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--puerto', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir:
+        serve(args.puerto)
+        return
+
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY='benchmark-sin-llamadas',
+        OCR_CACHE_ENABLED='false',
+        OCR_LOG_LEVEL='WARNING',
+        OCR_JOBS_DB=os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'),
+    )
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('L', (1200, 800), color=255).save(buffer, format='PNG')
+    image = buffer.getvalue()
+
+    print("=" * 70)
+    print(f"🚀 Arranque en frío (mediana de {args.repeticiones}, primer OCR {args.espera:.1f}s después del health)")
+    print("=" * 70)
+    for module in ('main', 'google.generativeai'):
+        samples = [import_time(module, env) for _ in range(args.repeticiones)]
+        print(f"   import {module:<22} {statistics.median(samples):7.0f}ms")
+    print()
+    print(f"   {'OCR_WARMUP':<12} {'primer /health':>15} {'primer OCR':>12} {'latencia OCR':>14}")
+    for mode in args.modos.split(','):
+        runs = [cold_start(mode, env, image, args.espera) for _ in range(args.repeticiones)]
+        print(f"   {mode:<12} {statistics.median(r.healthy for r in runs):13.0f}ms "
+              f"{statistics.median(r.first_ocr for r in runs):10.0f}ms "
+              f"{statistics.median(r.ocr_latency for r in runs):12.0f}ms")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
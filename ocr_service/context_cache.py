@@ -0,0 +1,282 @@
+"""
+Cache de contexto de Gemini para el prefijo estático del prompt
+
+Las instrucciones de sistema y las reglas de extracción (el prefijo del
+ActaPrompt) son idénticas para todas las actas con el mismo conjunto de
+áreas. Con el cache de contexto se suben una sola vez como CachedContent y
+cada request envía solo la imagen y el sufijo del acta: los tokens del
+prefijo se cobran a la tarifa reducida de tokens cacheados.
+
+Backends:
+- GeminiContextCacheBackend: API real (genai.caching.CachedContent)
+- LocalContextCacheBackend: stand-in local que reproduce el contrato del
+  API (el prefijo se antepone a cada request y se reporta como cacheado
+  en usage_metadata.cached_content_token_count). Para pruebas y desarrollo.
+
+Si crear el cache falla (ej: el prefijo no alcanza el mínimo de tokens que
+exige el modelo) el request sigue sin cache y no se reintenta hasta pasado
+retry_after.
+"""
+
+import time
+import hashlib
+import logging
+import datetime
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from metrics import CONTEXT_CACHE_EVENTS
+from model_pool import ModelPool, SAFETY_SETTINGS, load_genai
+from prompt_builder import ActaPrompt
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiContextCacheBackend:
+    """Cache de contexto del API de Gemini"""
+
+    name = 'gemini'
+
+    def create(self, model_name: str, system_instruction: str, prefix: str, ttl_seconds: int, display_name: str):
+        genai = load_genai()
+        return genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=display_name,
+            system_instruction=system_instruction,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+
+    def model_from(self, handle, generation_config: Optional[Dict[str, Any]]):
+        genai = load_genai()
+        return genai.GenerativeModel.from_cached_content(
+            handle,
+            generation_config=dict(generation_config) if generation_config else None,
+            safety_settings=[dict(s) for s in SAFETY_SETTINGS],
+        )
+
+    def delete(self, handle):
+        handle.delete()
+
+
+@dataclass
+class LocalCachedContent:
+    """Equivalente local de un CachedContent"""
+    name: str
+    model: str
+    system_instruction: str
+    prefix: str
+    token_count: int                # ~4 caracteres por token, como estimate_request_tokens
+
+
+class _LocalCachedResponse:
+    """Respuesta del modelo con cached_content_token_count, como la del API"""
+
+    def __init__(self, response, cached_tokens: int):
+        self._response = response
+        self._cached_tokens = cached_tokens
+
+    def __getattr__(self, name: str):
+        return getattr(self._response, name)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._response)
+
+    @property
+    def usage_metadata(self):
+        usage = getattr(self._response, 'usage_metadata', None)
+        return SimpleNamespace(
+            prompt_token_count=getattr(usage, 'prompt_token_count', 0) or 0,
+            candidates_token_count=getattr(usage, 'candidates_token_count', 0) or 0,
+            total_token_count=getattr(usage, 'total_token_count', 0) or 0,
+            cached_content_token_count=self._cached_tokens,
+        )
+
+
+class _LocalCachedModel:
+    """Modelo que antepone el contenido cacheado a cada request"""
+
+    def __init__(self, model, handle: LocalCachedContent):
+        self._model = model
+        self._handle = handle
+
+    def generate_content(self, contents, **kwargs):
+        response = self._model.generate_content([self._handle.prefix] + list(contents), **kwargs)
+        return _LocalCachedResponse(response, self._handle.token_count)
+
+    async def generate_content_async(self, contents, **kwargs):
+        response = await self._model.generate_content_async([self._handle.prefix] + list(contents), **kwargs)
+        return _LocalCachedResponse(response, self._handle.token_count)
+
+
+class LocalContextCacheBackend:
+    """Stand-in local del cache de contexto (no ahorra tokens reales)"""
+
+    name = 'local'
+
+    def __init__(self, model_pool: Optional[ModelPool] = None):
+        self.model_pool = model_pool or ModelPool()
+        self.handles: Dict[str, LocalCachedContent] = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def create(self, model_name: str, system_instruction: str, prefix: str, ttl_seconds: int, display_name: str):
+        with self._lock:
+            self._counter += 1
+            name = f"cachedContents/local-{self._counter}"
+            handle = LocalCachedContent(
+                name=name,
+                model=model_name,
+                system_instruction=system_instruction,
+                prefix=prefix,
+                token_count=len(system_instruction + prefix) // 4,
+            )
+            self.handles[name] = handle
+        return handle
+
+    def model_from(self, handle: LocalCachedContent, generation_config: Optional[Dict[str, Any]]):
+        model = self.model_pool.get(
+            handle.model,
+            system_instruction=handle.system_instruction,
+            generation_config=generation_config,
+        )
+        return _LocalCachedModel(model, handle)
+
+    def delete(self, handle: LocalCachedContent):
+        with self._lock:
+            self.handles.pop(handle.name, None)
+
+
+@dataclass
+class _Entry:
+    handle: Any                     # None si la creación falló
+    model: Any
+    refresh_at: float               # time.monotonic() a partir del cual se recrea
+
+
+class PromptContextCache:
+    """Handles de modelo con el prefijo cacheado, uno por (modelo, prefijo)"""
+
+    def __init__(
+        self,
+        backend,
+        ttl_seconds: int = 3600,
+        refresh_margin: int = 300,
+        retry_after: int = 600
+    ):
+        """
+        Args:
+            backend: GeminiContextCacheBackend o LocalContextCacheBackend
+            ttl_seconds: Vida de cada CachedContent en el API
+            refresh_margin: Segundos antes del vencimiento en que se recrea
+            retry_after: Espera antes de reintentar una creación fallida
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = min(refresh_margin, ttl_seconds // 2)
+        self.retry_after = retry_after
+        self._entries: Dict[Tuple[str, str, str], _Entry] = {}
+        self._lock = threading.Lock()
+
+    def get_model(
+        self,
+        model_name: str,
+        system_instruction: str,
+        prompt: ActaPrompt,
+        generation_config: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Devuelve un handle de modelo con el prefijo del prompt ya cacheado
+
+        Returns:
+            Modelo listo para generate_content([imagen, prompt.suffix]),
+            o None si no hay cache disponible (enviar el prompt completo)
+        """
+        system_key = hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()[:16]
+        key = (model_name, prompt.signature, system_key)
+
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry.refresh_at:
+            if entry.model is not None:
+                CONTEXT_CACHE_EVENTS.inc(evento='reutilizado')
+            return entry.model
+
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and now < entry.refresh_at:
+                return entry.model
+
+            try:
+                handle = self.backend.create(
+                    model_name, system_instruction, prompt.prefix, self.ttl_seconds,
+                    display_name=f"ocr-actas-{prompt.signature}",
+                )
+                model = self.backend.model_from(handle, generation_config)
+            except Exception as e:
+                CONTEXT_CACHE_EVENTS.inc(evento='error')
+                logger.warning(
+                    "No se pudo crear el cache de contexto (%s); se envía el prompt completo "
+                    "durante %ds: %s", self.backend.name, self.retry_after, e
+                )
+                self._entries[key] = _Entry(handle=None, model=None, refresh_at=now + self.retry_after)
+                return None
+
+            self._entries[key] = _Entry(
+                handle=handle,
+                model=model,
+                refresh_at=now + self.ttl_seconds - self.refresh_margin,
+            )
+            # El anterior vence solo por TTL: no se borra porque puede haber
+            # requests en curso usándolo
+            CONTEXT_CACHE_EVENTS.inc(evento='creado')
+            logger.info(
+                "Cache de contexto creado (%s): prefijo %s, modelo %s, TTL %ds",
+                self.backend.name, prompt.signature, model_name, self.ttl_seconds
+            )
+            return model
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del cache para /health"""
+        now = time.monotonic()
+        entries = list(self._entries.values())
+        return {
+            'backend': self.backend.name,
+            'ttl_segundos': self.ttl_seconds,
+            'prefijos_cacheados': sum(1 for e in entries if e.model is not None and now < e.refresh_at),
+            'prefijos_sin_cache': sum(1 for e in entries if e.model is None and now < e.refresh_at),
+        }
+
+    def close(self):
+        """Borra los CachedContent creados (al apagar el servicio)"""
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            if entry.handle is None:
+                continue
+            try:
+                self.backend.delete(entry.handle)
+            except Exception as e:
+                logger.warning("No se pudo borrar el cache de contexto: %s", e)
+
+
+def create_context_cache(mode: str, model_pool: Optional[ModelPool] = None, ttl_seconds: int = 3600) -> Optional[PromptContextCache]:
+    """
+    Construye el cache de contexto según OCR_CONTEXT_CACHE
+
+    Args:
+        mode: off, gemini o local
+
+    Returns:
+        PromptContextCache o None si está desactivado
+    """
+    mode = (mode or 'off').strip().lower()
+    if mode in ('off', 'false', '0', ''):
+        return None
+    if mode == 'gemini':
+        return PromptContextCache(GeminiContextCacheBackend(), ttl_seconds=ttl_seconds)
+    if mode == 'local':
+        return PromptContextCache(LocalContextCacheBackend(model_pool), ttl_seconds=ttl_seconds)
+    raise ValueError(f"OCR_CONTEXT_CACHE inválido: {mode} (usar off, gemini o local)")
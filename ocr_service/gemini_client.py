@@ -4,41 +4,262 @@ Cliente de Google Gemini para procesamiento OCR de actas
 
 import os
 import io
+import copy
+import json
 import time
 import base64
-from typing import Dict, Any, Union
+import hashlib
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, Any, BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
 from PIL import Image
-import google.generativeai as genai
 
-from prompt_builder import build_acta_prompt, validate_metadata
+from prompt_builder import (
+    ActaPrompt,
+    compile_acta_prompt,
+    build_band_instructions,
+    build_continuation_instructions,
+    validate_metadata,
+    PROMPT_VERSION,
+)
+from ocr_cache import OCRResultCache, compute_cache_key, image_digest
+from rate_limiter import TokenBucketRateLimiter, RateLimitExceeded, estimate_request_tokens
+from model_pool import ModelPool, OCR_GENERATION_CONFIG, configure_gemini, load_genai
+from image_preprocessing import PreprocessConfig, get_preset, preprocess_image
+from image_quality import QualityConfig, QualityReport, apply_quality_gate
+from table_detection import TableDetectionConfig, TableRegion, locate_table
+from model_cascade import CascadeConfig, ModelCascade, MOTIVO_ERROR, MOTIVO_VALIDACION, NIVEL_FUERTE, NIVEL_RAPIDO
+from ocr_consistency import UMBRAL_REVISION, ConsistencyReport, StudentScorer, apply_confidence, check_consistency
+from ocr_tiling import TilingConfig, should_tile, split_into_bands, merge_band_students, student_numero
+from context_cache import PromptContextCache
+from response_archive import ResponseArchive
+from single_flight import Flight, SingleFlight
+from upstream_guard import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    RetryPolicy,
+    RetriesExhausted,
+    UpstreamUnavailable,
+    UPSTREAM_ERRORS,
+    classify_error,
+)
+from logging_setup import sample_request
+from metrics import (
+    StageTimer,
+    TokenUsage,
+    FINISH_REASONS,
+    BLOCKED,
+    PARSE_FAILURES,
+    TRUNCATED,
+    CONTINUATIONS,
+    MODEL_CALLS_IN_FLIGHT,
+    MODEL_ERRORS,
+    MODEL_RETRIES,
+    CONCURRENCY_LIMIT,
+    CIRCUIT_REJECTED,
+    TABLE_ROWS,
+    ACTA_CONFIDENCE,
+    finish_reason_name,
+)
 from response_parser import (
+    OUTPUT_FORMAT_FILAS,
+    OUTPUT_FORMAT_OBJETOS,
+    OUTPUT_FORMATS,
+    IncrementalStudentParser,
+    compact_response_schema,
+    expand_compact_response,
     extract_json_from_response,
+    salvage_students,
     validate_ocr_response,
+    convert_student,
     convert_to_backend_format
 )
 
+logger = logging.getLogger(__name__)
+
+
+def decode_base64_image(base64_str: str) -> bytes:
+    """
+    Decodifica una imagen en base64, con o sin prefijo data URL
+    
+    Args:
+        base64_str: String base64 (ej: "data:image/png;base64,iVBOR...")
+    
+    Returns:
+        bytes: Bytes del archivo de imagen
+    """
+    # Remover prefijo si existe (data:image/png;base64,)
+    if ',' in base64_str:
+        base64_str = base64_str.split(',', 1)[1]
+    
+    return base64.b64decode(base64_str)
+
+
+class TruncatedResponseError(RuntimeError):
+    """Respuesta cortada o malformada de la que se recuperaron estudiantes"""
+    
+    def __init__(self, message: str, estudiantes: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.estudiantes = estudiantes
+
+
+@dataclass
+class _OCRRequest:
+    """Estado de un acta entre la preparación y la conversión del resultado"""
+    metadata: Dict[str, Any]
+    acta_prompt: ActaPrompt
+    cache_key: Optional[str]
+    timer: StageTimer
+    log_detail: bool
+    detail_level: int
+    image: Image.Image                  # Imagen enviada (preprocesada si corresponde)
+    model_input: Any
+    tiled: bool
+    tiling_config: Optional[TilingConfig]
+    preprocess_config: Optional[PreprocessConfig]
+    preprocess_stats: Optional[Dict[str, Any]]
+    usage: TokenUsage
+    responses: Optional[List[Dict[str, Any]]]
+    flight: Optional[Flight] = None     # Single-flight del que este request es líder
+    quality: Optional[QualityReport] = None
+    table: Optional[TableRegion] = None
+    model_used: Optional[str] = None    # Modelo de la última llamada (nivel de la cascada)
+    consistency: Optional[ConsistencyReport] = None
+
+
+@dataclass
+class _DuplicateRequest:
+    """Request idéntico a uno en curso: espera el resultado del líder"""
+    flight: Flight
+    timer: StageTimer
+    on_student: Optional[Callable[[Dict[str, Any]], None]]
+
+
+@dataclass
+class _UpstreamGuard:
+    """Límite de concurrencia y circuit breaker de un modelo"""
+    concurrency: AdaptiveConcurrencyLimiter
+    breaker: CircuitBreaker
+
+
+def _response_text(response) -> str:
+    """Texto de la respuesta, o '' si el candidato no tiene partes"""
+    try:
+        return response.text or ''
+    except ValueError:
+        return ''
+
 
 class GeminiOCRClient:
     """Cliente para procesar actas con Google Gemini"""
     
-    def __init__(self, api_key: str, model: str = "gemini-2.5-pro"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gemini-2.5-pro",
+        cache: Optional[OCRResultCache] = None,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        rate_limit_max_wait: float = 120,
+        model_pool: Optional[ModelPool] = None,
+        preprocess: Optional[PreprocessConfig] = None,
+        tiling: Optional[TilingConfig] = None,
+        context_cache: Optional[PromptContextCache] = None,
+        output_format: str = OUTPUT_FORMAT_OBJETOS,
+        archive: Optional[ResponseArchive] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        concurrency: Optional[AdaptiveConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        single_flight: Optional[SingleFlight] = None,
+        quality: Optional[QualityConfig] = None,
+        table_detection: Optional[TableDetectionConfig] = None,
+        cascade: Optional[CascadeConfig] = None,
+        confidence_threshold: int = UMBRAL_REVISION
+    ):
         """
         Inicializa el cliente de Gemini
 
         Args:
             api_key: API Key de Google AI Studio
             model: Modelo de Gemini a usar (default: gemini-2.5-pro)
+            cache: Cache de resultados OCR (None = sin cache)
+            rate_limiter: Limiter RPM/TPM compartido (default: 30 RPM, 1M TPM)
+            rate_limit_max_wait: Espera máxima en segundos por un permiso
+            model_pool: Pool de handles de modelo (default: uno propio)
+            preprocess: Preprocesamiento por defecto de las imágenes
+                (None = enviar la imagen original)
+            tiling: Modo franjas por defecto (None = acta completa en una llamada)
+            context_cache: Cache de contexto para el prefijo del prompt
+                (None = enviar el prompt completo en cada llamada)
+            output_format: Formato de salida pedido al modelo: 'objetos' (un
+                objeto JSON por estudiante) o 'filas' (compacto, con response_schema)
+            archive: Archivo de respuestas crudas (None = no se archivan)
+            retry_policy: Reintentos ante errores de cuota/servidor/timeout
+                (default: 3 intentos con backoff desde 2s)
+            concurrency: Límite adaptativo de llamadas simultáneas
+                (default: AIMD entre 1 y 64, empezando en 16)
+            breaker: Circuit breaker de las llamadas (default: abre tras 5
+                errores seguidos durante 30s)
+                Ambos son los de model; cada otro modelo (ej: el rápido de
+                la cascada) usa una copia propia con la misma configuración
+            single_flight: Registro de actas en vuelo para que los requests
+                idénticos concurrentes compartan una llamada (None = sin deduplicar)
+            quality: Control de calidad de la imagen antes de la llamada
+                (None = sin control)
+            table_detection: Detección local de la tabla: recorte, filas
+                esperadas en el prompt y max_output_tokens (None = desactivada)
+            cascade: Cascada de modelos: el acta va primero a un modelo rápido
+                y solo se escala a model si falla la validación o la
+                consistencia (None = siempre model)
+            confidence_threshold: Confianza (0-100) bajo la cual un estudiante
+                va a revisionSugerida y el acta se marca para reprocesar
         """
         if not api_key:
             raise ValueError("API Key de Gemini es requerida")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de salida inválido: {output_format} (usar {', '.join(OUTPUT_FORMATS)})")
 
         self.api_key = api_key
         self.model_name = model
-        self.last_request_time = 0  # Control de rate limiting
-        self.min_request_interval = 2  # Mínimo 2 segundos entre requests
+        self.cache = cache
+        self.model_pool = model_pool or ModelPool()
+        self.preprocess_config = preprocess
+        self.tiling_config = tiling
+        self.context_cache = context_cache
+        self.output_format = output_format
+        self.archive = archive
+        self.single_flight = single_flight
+        self.quality_config = quality
+        self.table_detection_config = table_detection
+        self.cascade = ModelCascade(cascade) if cascade is not None else None
+        self.confidence_threshold = confidence_threshold
+        
+        # Control de rate limiting compartido entre hilos (RPM + TPM)
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(
+            requests_per_minute=30,
+            tokens_per_minute=1_000_000
+        )
+        self.rate_limit_max_wait = rate_limit_max_wait
+        # Sobrecarga del upstream: reintentos, concurrencia AIMD y circuit breaker
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.concurrency = concurrency or AdaptiveConcurrencyLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        CONCURRENCY_LIMIT.set(self.concurrency.limit)
+        # Un modelo degradado no debe abrir el circuito ni reducir la
+        # concurrencia de los demás
+        self._guards = {model: _UpstreamGuard(self.concurrency, self.breaker)}
+        self._guards_lock = threading.Lock()
+        # Tokens de salida esperados por acta, solo para la reserva inicial;
+        # se ajusta con el uso real reportado por Gemini
+        self.expected_output_tokens = 4096
+        # Requests de continuación por acta si la respuesta se corta (MAX_TOKENS)
+        self.max_continuations = 2
 
-        # Configurar Gemini
-        genai.configure(api_key=api_key)
+        # Configurar Gemini (se aplica al cargar el SDK, ver model_pool.load_genai)
+        configure_gemini(api_key)
 
         # Guardar instrucciones de sistema para reutilizar en cada request
         self.system_instruction = """
@@ -63,7 +284,77 @@ CARACTERÍSTICAS DE TU EXTRACCIÓN:
 Eres confiable, preciso y exhaustivo.
 """
 
-        print(f"✓ Gemini {model} configurado correctamente (modelo fresco para cada request)")
+        logger.info("Gemini %s configurado correctamente (handles sin estado del pool)", model)
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Precarga lo que el primer request pagaría: el SDK de Gemini (gRPC +
+        protobuf), los handles OCR del pool y el prefijo del prompt de las
+        áreas por defecto. No llama a la API.
+        
+        Returns:
+            dict: Milisegundos de cada paso
+        """
+        pasos = {}
+        
+        start = time.perf_counter()
+        load_genai()
+        pasos['sdk'] = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        # Sin áreas se compila el prefijo de DEFAULT_AREAS
+        prompt = compile_acta_prompt({}, self.output_format)
+        self.get_ocr_model(self._generation_config(prompt))
+        if self.cascade is not None:
+            self.get_ocr_model(self._generation_config(prompt), self.cascade.fast_model)
+        Image.init()  # Plugins de formatos de imagen
+        pasos['modelo_y_prompt'] = (time.perf_counter() - start) * 1000
+        
+        logger.info(
+            "Warm-up completado en %.0fms", sum(pasos.values()),
+            extra={paso: round(ms, 1) for paso, ms in pasos.items()}
+        )
+        return pasos
+    
+    @property
+    def model(self):
+        """Handle del modelo sin instrucciones de sistema (pruebas simples de imagen)"""
+        return self.model_pool.get(self.model_name)
+    
+    def get_ocr_model(self, generation_config: Optional[Dict[str, Any]] = None, model_name: Optional[str] = None):
+        """Handle del modelo configurado para extracción OCR de actas (default: el modelo fuerte)"""
+        return self.model_pool.get(
+            model_name or self.model_name,
+            system_instruction=self.system_instruction,
+            generation_config=generation_config or OCR_GENERATION_CONFIG,
+        )
+    
+    @staticmethod
+    def _generation_config(prompt: ActaPrompt) -> Dict[str, Any]:
+        """generation_config del formato de salida (filas: JSON con response_schema)"""
+        if prompt.output_format == OUTPUT_FORMAT_FILAS:
+            return dict(
+                OCR_GENERATION_CONFIG,
+                response_mime_type='application/json',
+                response_schema=compact_response_schema(prompt.num_areas),
+            )
+        return OCR_GENERATION_CONFIG
+    
+    def _ocr_model_for(self, prompt: ActaPrompt, model_name: Optional[str] = None) -> Tuple[Any, str]:
+        """
+        Handle del modelo y texto a enviar junto a la imagen
+        
+        Con cache de contexto, las instrucciones de sistema y el prefijo ya
+        están en el CachedContent y solo se envía el sufijo.
+        """
+        generation_config = self._generation_config(prompt)
+        if self.context_cache is not None:
+            model = self.context_cache.get_model(
+                model_name or self.model_name, self.system_instruction, prompt, generation_config
+            )
+            if model is not None:
+                return model, prompt.suffix
+        return self.get_ocr_model(generation_config, model_name), prompt.text
     
     def load_and_prepare_image(self, image_path: str) -> Image.Image:
         """
@@ -76,7 +367,12 @@ Eres confiable, preciso y exhaustivo.
             PIL.Image: Imagen preparada
         """
         try:
+            with open(image_path, 'rb') as f:
+                source_data = f.read()
+
             img = Image.open(image_path)
+            img.info['source_sha256'] = hashlib.sha256(source_data).hexdigest()
+            img.info['source_bytes'] = len(source_data)
             
             # NO convertir a RGB - Gemini funciona mejor con el formato original
             # Solo redimensionar si es EXTREMADAMENTE grande
@@ -84,40 +380,89 @@ Eres confiable, preciso y exhaustivo.
             if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
                 # Usar LANCZOS para mantener máxima calidad
                 img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                print(f"⚠️  Imagen redimensionada a {img.size}")
+                logger.warning("Imagen redimensionada a %s", img.size)
             
-            print(f"✓ Imagen cargada: Modo={img.mode}, Tamaño={img.size}, Formato={img.format}")
+            logger.info("Imagen cargada: modo=%s tamaño=%s formato=%s", img.mode, img.size, img.format)
             
             return img
         except Exception as e:
             raise RuntimeError(f"Error al cargar imagen: {e}")
     
-    def load_image_from_base64(self, base64_str: str) -> Image.Image:
+    def load_image_from_bytes(self, image_data: bytes) -> Image.Image:
+        """
+        Carga una imagen desde bytes ya decodificados
+        
+        Args:
+            image_data: Bytes del archivo de imagen (PNG, JPEG, TIFF...)
+        
+        Returns:
+            PIL.Image: Imagen con el hash de los bytes originales en info['source_sha256']
+        """
+        img = Image.open(io.BytesIO(image_data))
+        img.info['source_sha256'] = hashlib.sha256(image_data).hexdigest()
+        img.info['source_bytes'] = len(image_data)
+        return img
+    
+    def load_image_from_file(self, file_obj: BinaryIO) -> Image.Image:
+        """
+        Carga una imagen desde un archivo abierto (upload binario o temporal)
+        
+        PIL lee directamente del archivo, sin copiar su contenido a strings
+        intermedios. El archivo debe permanecer abierto hasta terminar de
+        procesar la imagen.
+        
+        Args:
+            file_obj: Archivo binario posicionable (seek/read)
+        
+        Returns:
+            PIL.Image: Imagen con el hash de los bytes originales en info['source_sha256']
+        """
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            file_obj.seek(0)
+            for chunk in iter(lambda: file_obj.read(1024 * 1024), b''):
+                hasher.update(chunk)
+                size += len(chunk)
+            file_obj.seek(0)
+            
+            img = Image.open(file_obj)
+            img.info['source_sha256'] = hasher.hexdigest()
+            img.info['source_bytes'] = size
+            
+            logger.info(
+                "Imagen cargada desde upload binario: modo=%s tamaño=%s formato=%s bytes=%d",
+                img.mode, img.size, img.format, size
+            )
+            
+            return img
+        except Exception as e:
+            raise RuntimeError(f"Error al cargar imagen desde upload: {e}")
+    
+    def load_image_from_base64(self, base64_str: str, timer: Optional[StageTimer] = None) -> Image.Image:
         """
         Carga una imagen desde base64 manteniendo máxima calidad
         
         Args:
             base64_str: String base64 de la imagen
+            timer: Medidor de etapas del request (opcional)
         
         Returns:
             PIL.Image: Imagen preparada
         """
+        timer = timer or StageTimer()
         try:
-            # Remover prefijo si existe (data:image/png;base64,)
-            if ',' in base64_str:
-                base64_str = base64_str.split(',', 1)[1]
-            
-            # Decodificar
-            image_data = base64.b64decode(base64_str)
-            img = Image.open(io.BytesIO(image_data))
+            with timer.stage('decodificacion_base64'):
+                image_data = decode_base64_image(base64_str)
+            with timer.stage('apertura_imagen'):
+                img = self.load_image_from_bytes(image_data)
             
             # NO convertir a RGB - mantener el formato original
             # Gemini funciona mejor con la imagen original sin procesamiento
-            print(f"✓ Imagen cargada desde base64:")
-            print(f"   - Modo: {img.mode}")
-            print(f"   - Tamaño: {img.size}")
-            print(f"   - Formato: {img.format if hasattr(img, 'format') else 'desconocido'}")
-            print(f"   - Tamaño en bytes: {len(image_data):,}")
+            logger.info(
+                "Imagen cargada desde base64: modo=%s tamaño=%s formato=%s bytes=%d",
+                img.mode, img.size, getattr(img, 'format', None), len(image_data)
+            )
             
             return img
         except Exception as e:
@@ -127,7 +472,13 @@ Eres confiable, preciso y exhaustivo.
         self,
         image: Image.Image,
         metadata: Dict[str, Any],
-        timeout: int = 30
+        timeout: int = 30,
+        use_cache: bool = True,
+        preprocess: Optional[Union[str, PreprocessConfig]] = None,
+        timer: Optional[StageTimer] = None,
+        bands: Optional[int] = None,
+        on_student: Optional[Callable[[Dict[str, Any]], None]] = None,
+        output_format: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Procesa un acta con Gemini OCR
@@ -136,6 +487,19 @@ Eres confiable, preciso y exhaustivo.
             image: Imagen PIL del acta
             metadata: Metadata del acta (año, grado, sección, áreas, etc.)
             timeout: Timeout en segundos (default: 30)
+            use_cache: Si es False, ignora el cache y fuerza una nueva
+                llamada a Gemini (el resultado igual se guarda en cache)
+            preprocess: Preset ('original', 'calidad', 'balanceado', 'compacto')
+                o configuración de preprocesamiento; None usa la del cliente
+            timer: Medidor de etapas del request; si se omite se crea uno.
+                El desglose se devuelve en resultado['etapasMs']
+            bands: Número de franjas horizontales (0 o 1 = acta completa);
+                None usa la configuración del cliente
+            on_student: Si se indica, la respuesta se genera en streaming y se
+                llama con cada estudiante (formato backend) en cuanto está
+                completo. El resultado final es el mismo que sin streaming
+            output_format: 'objetos' o 'filas'; None usa el del cliente.
+                No cambia el resultado, solo cómo responde el modelo
         
         Returns:
             dict: Resultado OCR en formato backend
@@ -144,187 +508,1371 @@ Eres confiable, preciso y exhaustivo.
             ValueError: Si la metadata es inválida
             RuntimeError: Si hay error en el procesamiento
         """
+        request = self._prepare_request(
+            image, metadata, use_cache, preprocess, timer, bands, on_student, output_format
+        )
+        if isinstance(request, dict):
+            return request  # Resultado servido desde cache
+        
+        start_time = time.time()
+        if isinstance(request, _DuplicateRequest):
+            with request.timer.stage('espera_en_vuelo'):
+                resultado = request.flight.future.result()
+            return self._duplicate_result(request, resultado, start_time)
+        
+        try:
+            if self.cascade is not None:
+                resultado = self._run_cascade(request, on_student)
+            else:
+                resultado = self._finish_request(request, *self._run_model(request, self.model_name, on_student))
+            
+        except RateLimitExceeded as e:
+            self._settle_flight(request, error=e)
+            raise
+        except Exception as e:
+            error = self._request_failed(request, e, start_time)
+            self._settle_flight(request, error=error)
+            raise error
+        except BaseException as e:
+            self._settle_flight(request, error=e)
+            raise
+        
+        self._settle_flight(request, resultado=resultado)
+        return resultado
+    
+    async def process_acta_async(
+        self,
+        image: Image.Image,
+        metadata: Dict[str, Any],
+        timeout: int = 30,
+        use_cache: bool = True,
+        preprocess: Optional[Union[str, PreprocessConfig]] = None,
+        timer: Optional[StageTimer] = None,
+        bands: Optional[int] = None,
+        output_format: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de process_acta (mismos argumentos, sin on_student)
+        
+        La espera a Gemini (rate limiter y llamada al modelo, incluidas las
+        continuaciones) no ocupa un hilo: un solo proceso puede tener decenas
+        de actas en vuelo. La preparación de la imagen (decodificación,
+        preprocesamiento, consulta al cache) corre en el pool de hilos por
+        defecto del event loop, y el modo franjas sigue usando un hilo por franja.
+        
+        Returns:
+            dict: El mismo resultado que process_acta
+        """
+        request = await asyncio.to_thread(
+            self._prepare_request, image, metadata, use_cache, preprocess, timer, bands, None, output_format
+        )
+        if isinstance(request, dict):
+            return request
+        
+        start_time = time.time()
+        if isinstance(request, _DuplicateRequest):
+            with request.timer.stage('espera_en_vuelo'):
+                # shield: cancelar este request no cancela el Future compartido
+                resultado = await asyncio.shield(asyncio.wrap_future(request.flight.future))
+            return self._duplicate_result(request, resultado, start_time)
+        
+        try:
+            if self.cascade is not None:
+                resultado = await self._run_cascade_async(request)
+            else:
+                resultado = self._finish_request(request, *await self._run_model_async(request, self.model_name))
+            
+        except RateLimitExceeded as e:
+            self._settle_flight(request, error=e)
+            raise
+        except Exception as e:
+            error = self._request_failed(request, e, start_time)
+            self._settle_flight(request, error=error)
+            raise error
+        except BaseException as e:
+            self._settle_flight(request, error=e)
+            raise
+        
+        self._settle_flight(request, resultado=resultado)
+        return resultado
+    
+    def _prepare_request(
+        self,
+        image: Image.Image,
+        metadata: Dict[str, Any],
+        use_cache: bool,
+        preprocess: Optional[Union[str, PreprocessConfig]],
+        timer: Optional[StageTimer],
+        bands: Optional[int],
+        on_student: Optional[Callable[[Dict[str, Any]], None]],
+        output_format: Optional[str]
+    ) -> Union[Dict[str, Any], _OCRRequest]:
+        """
+        Valida, arma el prompt, consulta el cache y prepara la imagen
+        
+        Returns:
+            El resultado cacheado (dict), un _DuplicateRequest si un request
+            idéntico ya está en curso, o el estado del request para la
+            llamada al modelo
+        """
         # Validar metadata
         is_valid, error_msg = validate_metadata(metadata)
         if not is_valid:
             raise ValueError(f"Metadata inválida: {error_msg}")
         
+        # Resolver preprocesamiento
+        if preprocess is None:
+            preprocess_config = self.preprocess_config
+        elif isinstance(preprocess, str):
+            preprocess_config = get_preset(preprocess)
+        else:
+            preprocess_config = preprocess
+        
+        # Resolver modo franjas
+        if bands is None:
+            tiling_config = self.tiling_config
+        else:
+            bands = int(bands)
+            if bands < 0:
+                raise ValueError(f"Número de franjas inválido: {bands}")
+            tiling_config = replace(self.tiling_config or TilingConfig(), bands=bands)
+        
+        output_format = output_format or self.output_format
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de salida inválido: {output_format}")
+        
+        timer = timer or StageTimer()
+        
         # Construir prompt
-        prompt = build_acta_prompt(metadata)
+        with timer.stage('construccion_prompt'):
+            acta_prompt = compile_acta_prompt(metadata, output_format)
+            prompt = acta_prompt.text
+        
+        # Consultar cache: reintentos y re-subidas de la misma acta no pagan otra llamada.
+        # La misma clave es la huella del request en el archivo de respuestas
+        cache_key = None
+        if self.cache is not None:
+            cache_start = time.time()
+            with timer.stage('consulta_cache'):
+                cache_key = self._request_fingerprint(image, metadata, prompt, preprocess_config, tiling_config)
+                cached, nivel = self.cache.get(cache_key) if use_cache else (None, None)
+            
+            if cached is not None:
+                lookup_time = int((time.time() - cache_start) * 1000)
+                logger.info(
+                    "Resultado servido desde cache (%s) en %dms",
+                    nivel, lookup_time, extra={'cache_key': cache_key[:12]}
+                )
+                return self._reused_result(cached, nivel, cache_key, lookup_time, timer, on_student)
+        
+        # Sin cache la huella igual identifica el request en el archivo de
+        # respuestas y en el single-flight
+        dedupe = self.single_flight is not None and use_cache
+        if cache_key is None and (self.archive is not None or dedupe):
+            cache_key = self._request_fingerprint(image, metadata, prompt, preprocess_config, tiling_config)
+        
+        # Acta idéntica en curso: esperar su resultado en lugar de otra llamada
+        flight = None
+        if dedupe:
+            flight, leader = self.single_flight.join(cache_key)
+            if not leader:
+                logger.info(
+                    "Acta idéntica en curso: se espera su resultado (sin nueva llamada a Gemini)",
+                    extra={'cache_key': cache_key[:12]}
+                )
+                return _DuplicateRequest(flight=flight, timer=timer, on_student=on_student)
+        
+        try:
+            return self._prepare_model_request(
+                image, metadata, acta_prompt, cache_key, preprocess_config, tiling_config, timer, flight
+            )
+        except BaseException as e:
+            if flight is not None:
+                self.single_flight.finish(flight, error=e)
+            raise
+    
+    def _prepare_model_request(
+        self,
+        image: Image.Image,
+        metadata: Dict[str, Any],
+        acta_prompt: ActaPrompt,
+        cache_key: Optional[str],
+        preprocess_config: Optional[PreprocessConfig],
+        tiling_config: Optional[TilingConfig],
+        timer: StageTimer,
+        flight: Optional[Flight]
+    ) -> _OCRRequest:
+        """Decodifica y preprocesa la imagen para la llamada al modelo (cache miss)"""
+        prompt = acta_prompt.text
+        
+        # Detalle completo (prompt, respuesta cruda, estudiantes) solo en DEBUG
+        # o para la fracción de requests muestreados (OCR_LOG_SAMPLE_RATE)
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        log_detail = debug_enabled or sample_request()
+        detail_level = logging.DEBUG if debug_enabled else logging.INFO
         
         # Procesar con Gemini
-        print(f"\n{'='*70}")
-        print(f"🤖 Procesando acta con Gemini {self.model_name}")
-        print(f"{'='*70}")
-        print(f"📚 Grado: {metadata.get('grado', 'N/A')} - Sección: {metadata.get('seccion', 'N/A')}")
-        print(f"📅 Año: {metadata.get('anio', 'N/A')}")
-        print(f"📊 Áreas curriculares: {len(metadata.get('areas', []))}")
-        print(f"📷 Imagen: {type(image).__name__} - Tamaño: {image.size if hasattr(image, 'size') else 'N/A'}")
-        print(f"\n📝 Prompt enviado:")
-        print(f"{'-'*70}")
-        print(prompt[:500])  # Primeros 500 caracteres
-        print(f"...")
-        print(f"{'-'*70}\n")
+        logger.info(
+            "Procesando acta con Gemini %s", self.model_name,
+            extra={
+                'grado': metadata.get('grado'),
+                'seccion': metadata.get('seccion'),
+                'anio': metadata.get('anio_lectivo'),
+                'areas': len(metadata.get('areas', [])),
+                'imagen': getattr(image, 'size', None),
+            }
+        )
+        if log_detail:
+            logger.log(detail_level, "Prompt enviado (primeros 500 caracteres):\n%s", prompt[:500])
+        
+        # Decodificar los píxeles aquí (Image.open es perezoso) para que su
+        # costo no se atribuya al preprocesamiento o a la llamada al modelo
+        with timer.stage('carga_imagen'):
+            image.load()
+        
+        # Control de calidad: rechaza páginas en blanco o borrosas antes de
+        # pagar la llamada al modelo y corrige modo, contraste e inclinación
+        quality_report = None
+        if self.quality_config is not None:
+            with timer.stage('control_calidad'):
+                image, quality_report = apply_quality_gate(image, self.quality_config)
+        
+        # Tabla: recortar márgenes, sellos y firmas y contar las filas
+        table = None
+        if self.table_detection_config is not None:
+            with timer.stage('deteccion_tabla'):
+                image, table = locate_table(image, self.table_detection_config)
+        
+        tiled = should_tile(image, tiling_config)
+        if table is not None and table.filas and not tiled:
+            # Las franjas llevan sus propias instrucciones: las filas
+            # esperadas solo van en el prompt del acta completa
+            acta_prompt = compile_acta_prompt(metadata, acta_prompt.output_format, expected_rows=table.filas)
+        model_input = image
+        preprocess_stats = None
+        if not tiled:
+            # Preprocesar imagen (escala de grises, DPI objetivo, re-codificación)
+            model_input, image, preprocess_stats = self._prepare_model_input(image, preprocess_config, timer)
+        
+        return _OCRRequest(
+            metadata=metadata,
+            acta_prompt=acta_prompt,
+            cache_key=cache_key,
+            timer=timer,
+            log_detail=log_detail,
+            detail_level=detail_level,
+            image=image,
+            model_input=model_input,
+            tiled=tiled,
+            tiling_config=tiling_config,
+            preprocess_config=preprocess_config,
+            preprocess_stats=preprocess_stats,
+            quality=quality_report,
+            table=table,
+            usage=TokenUsage(),
+            # Texto crudo de cada llamada, para el archivo de respuestas
+            responses=[] if self.archive is not None else None,
+            flight=flight,
+        )
+    
+    def _reused_result(
+        self,
+        resultado: Dict[str, Any],
+        nivel: str,
+        cache_key: str,
+        tiempo_ms: int,
+        timer: StageTimer,
+        on_student: Optional[Callable[[Dict[str, Any]], None]]
+    ) -> Dict[str, Any]:
+        """
+        Anota un resultado que no costó una llamada al modelo: servido desde
+        cache (nivel 'memoria'/'disco') o de un request idéntico en curso
+        (nivel 'en_vuelo')
+        """
+        resultado['cache'] = {
+            'hit': True,
+            'nivel': nivel,
+            'clave': cache_key,
+            'tiempoOriginalMs': resultado.get('tiempoProcesamientoMs'),
+        }
+        resultado['tiempoProcesamientoMs'] = tiempo_ms
+        resultado['cache']['tokensOriginales'] = resultado.get('tokens')
+        resultado['tokens'] = TokenUsage().as_dict()
+        resultado['etapasMs'] = timer.as_dict()
+        if on_student is not None:
+            for estudiante in resultado['estudiantes']:
+                on_student(estudiante)
+        return resultado
+    
+    def _duplicate_result(self, request: _DuplicateRequest, resultado: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        """Copia del resultado del líder para un request duplicado"""
+        wait_time = int((time.time() - start_time) * 1000)
+        logger.info("Resultado compartido con un request idéntico en %dms", wait_time,
+                    extra={'cache_key': request.flight.key[:12]})
+        return self._reused_result(
+            copy.deepcopy(resultado), 'en_vuelo', request.flight.key, wait_time, request.timer, request.on_student
+        )
+    
+    def _settle_flight(self, request: _OCRRequest, resultado: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None):
+        """El líder entrega su resultado o error a los requests duplicados"""
+        if request.flight is None:
+            return
+        if error is not None and not isinstance(error, Exception):
+            # Cancelación del líder: los duplicados no deben quedar esperando
+            error = RuntimeError("El procesamiento del acta idéntica en curso fue cancelado")
+        self.single_flight.finish(request.flight, result=resultado, error=error)
+    
+    def _run_model(
+        self,
+        request: _OCRRequest,
+        model_name: str,
+        on_student: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[Dict[str, Any], int, int, Optional[List[Dict[str, Any]]]]:
+        """
+        Procesa el acta con un modelo (acta completa o por franjas)
         
+        Returns:
+            (datos parseados, tiempo en ms, requests de continuación, resumen por franja o None)
+        """
+        request.model_used = model_name
         start_time = time.time()
+        if not request.tiled:
+            gemini_data, processing_time, continuaciones = self._generate_complete(
+                request.model_input, request.image, request.acta_prompt, request.timer,
+                request.log_detail, request.detail_level, on_student,
+                usage=request.usage, responses=request.responses, model_name=model_name
+            )
+            return gemini_data, processing_time, continuaciones, None
+        
+        # Franjas en paralelo: la latencia sigue a la franja más lenta
+        with request.timer.stage('ocr_bandas'):
+            gemini_data, bandas = self._process_bands(
+                request.image, request.acta_prompt, request.tiling_config, request.preprocess_config,
+                request.log_detail, request.detail_level,
+                usage=request.usage, responses=request.responses, model_name=model_name
+            )
+        processing_time = int((time.time() - start_time) * 1000)
+        # Las franjas terminan en cualquier orden: emitir ya fusionados
+        if on_student is not None:
+            scorer = StudentScorer(request.acta_prompt.num_areas)
+            for est in gemini_data['estudiantes']:
+                if isinstance(est, dict):
+                    on_student(self._scored_student(est, scorer))
+        return gemini_data, processing_time, 0, bandas
+    
+    async def _run_model_async(
+        self,
+        request: _OCRRequest,
+        model_name: str
+    ) -> Tuple[Dict[str, Any], int, int, Optional[List[Dict[str, Any]]]]:
+        """Versión asíncrona de _run_model (sin streaming)"""
+        request.model_used = model_name
+        start_time = time.time()
+        if not request.tiled:
+            gemini_data, processing_time, continuaciones = await self._generate_complete_async(
+                request.model_input, request.image, request.acta_prompt, request.timer,
+                request.log_detail, request.detail_level,
+                usage=request.usage, responses=request.responses, model_name=model_name
+            )
+            return gemini_data, processing_time, continuaciones, None
+        
+        with request.timer.stage('ocr_bandas'):
+            gemini_data, bandas = await asyncio.to_thread(
+                self._process_bands,
+                request.image, request.acta_prompt, request.tiling_config, request.preprocess_config,
+                request.log_detail, request.detail_level, request.usage, request.responses, model_name
+            )
+        return gemini_data, int((time.time() - start_time) * 1000), 0, bandas
+    
+    def _run_cascade(
+        self,
+        request: _OCRRequest,
+        on_student: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Cascada: modelo rápido, y el fuerte solo si el resultado no se acepta
         
+        Los estudiantes del modelo rápido se emiten (on_student) recién
+        cuando su resultado se acepta; si se escala, el modelo fuerte
+        transmite los suyos en streaming como sin cascada.
+        """
+        fast_start = time.time()
         try:
-            # Rate limiting: Esperar si es necesario para evitar saturar API
-            elapsed_since_last = time.time() - self.last_request_time
-            if elapsed_since_last < self.min_request_interval:
-                wait_time = self.min_request_interval - elapsed_since_last
-                print(f"⏱️  Esperando {wait_time:.1f}s para evitar rate limit...")
-                time.sleep(wait_time)
-            
-            self.last_request_time = time.time()
-            
-            # Logging de imagen antes de enviar
-            print(f"📸 Enviando imagen a Gemini:")
-            print(f"   - Modo: {image.mode}")
-            print(f"   - Tamaño: {image.size}")
-            print(f"   - Formato: {image.format if hasattr(image, 'format') else 'N/A'}")
-
-            # ✅ CRÍTICO: Crear un modelo FRESCO para cada request
-            # Esto evita acumulación de historial de chat que causa:
-            # 1. Lentitud progresiva (124+ segundos)
-            # 2. Bloqueos SAFETY por contexto acumulado
-            # 3. Límites de tokens excedidos
-            print(f"🔄 Creando modelo fresco (sin historial)...")
-            fresh_model = genai.GenerativeModel(
-                self.model_name,
-                system_instruction=self.system_instruction
+            gemini_data, processing_time, continuaciones, bandas = self._run_model(request, self.cascade.fast_model)
+            resultado, motivo = self._review_fast_result(request, gemini_data, processing_time, continuaciones, bandas)
+        except UpstreamUnavailable as e:
+            # Reintentos agotados o circuito abierto del modelo rápido: el
+            # fuerte tiene su propio breaker y límite de concurrencia
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_ERROR)
+        except RateLimitExceeded:
+            # Sin cuota en el rate limiter (compartido): el fuerte tampoco pasaría
+            raise
+        except ValueError as e:
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_VALIDACION)
+        except Exception as e:
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_ERROR)
+        fast_seconds = time.time() - fast_start
+        
+        if motivo is None:
+            self.cascade.accepted(fast_seconds)
+            if on_student is not None:
+                for estudiante in resultado['estudiantes']:
+                    on_student(estudiante)
+            return self._store_result(request, resultado)
+        
+        self._escalate(request, motivo, fast_seconds)
+        strong_start = time.time()
+        gemini_data, processing_time, continuaciones, bandas = self._run_model(request, self.model_name, on_student)
+        self.cascade.observe_strong(time.time() - strong_start)
+        resultado = self._build_result(request, gemini_data, processing_time, continuaciones, bandas)
+        return self._escalated_result(request, resultado, motivo, fast_seconds)
+    
+    async def _run_cascade_async(self, request: _OCRRequest) -> Dict[str, Any]:
+        """Versión asíncrona de _run_cascade"""
+        fast_start = time.time()
+        try:
+            gemini_data, processing_time, continuaciones, bandas = await self._run_model_async(
+                request, self.cascade.fast_model
             )
+            resultado, motivo = self._review_fast_result(request, gemini_data, processing_time, continuaciones, bandas)
+        except UpstreamUnavailable as e:
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_ERROR)
+        except RateLimitExceeded:
+            raise
+        except ValueError as e:
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_VALIDACION)
+        except Exception as e:
+            resultado, motivo = None, self._fast_model_failed(e, MOTIVO_ERROR)
+        fast_seconds = time.time() - fast_start
+        
+        if motivo is None:
+            self.cascade.accepted(fast_seconds)
+            return self._store_result(request, resultado)
+        
+        self._escalate(request, motivo, fast_seconds)
+        strong_start = time.time()
+        gemini_data, processing_time, continuaciones, bandas = await self._run_model_async(request, self.model_name)
+        self.cascade.observe_strong(time.time() - strong_start)
+        resultado = self._build_result(request, gemini_data, processing_time, continuaciones, bandas)
+        return self._escalated_result(request, resultado, motivo, fast_seconds)
+    
+    def _review_fast_result(
+        self,
+        request: _OCRRequest,
+        gemini_data: Dict[str, Any],
+        processing_time: int,
+        continuaciones: int,
+        bandas: Optional[List[Dict[str, Any]]]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Valida y puntúa el resultado del modelo rápido
+        
+        Returns:
+            (resultado, None) si se acepta, o (None, motivo) para escalar
+        
+        Raises:
+            ValueError: Si la respuesta no pasa la validación
+        """
+        resultado = self._build_result(
+            request, gemini_data, processing_time, continuaciones, bandas, record_failure=False
+        )
+        report = request.consistency
+        motivo = self.cascade.review(report)
+        if motivo is not None:
+            logger.info(
+                "Cascada: puntaje de consistencia %.2f de %s (mínimo %.2f)",
+                report.puntaje, self.cascade.fast_model, self.cascade.config.min_score,
+                extra={'problemas': report.conteo}
+            )
+            return None, motivo
+        resultado['cascada'] = {'nivel': NIVEL_RAPIDO, 'escalada': False}
+        return resultado, None
+    
+    def _fast_model_failed(self, error: Exception, motivo: str) -> str:
+        """Registra la falla del modelo rápido (JSON o validación inválidos, o error de la llamada)"""
+        logger.warning("Cascada: el modelo rápido %s falló (%s), se escala: %s", self.cascade.fast_model, motivo, error)
+        return motivo
+    
+    def _escalate(self, request: _OCRRequest, motivo: str, fast_seconds: float):
+        """Registra la escalada y descarta las respuestas crudas del modelo rápido"""
+        self.cascade.escalated(motivo, fast_seconds)
+        # El archivo guarda solo las respuestas que produjeron el resultado:
+        # al re-parsear no deben mezclarse con las del modelo rápido
+        if request.responses:
+            request.responses.clear()
+    
+    def _escalated_result(
+        self,
+        request: _OCRRequest,
+        resultado: Dict[str, Any],
+        motivo: str,
+        fast_seconds: float
+    ) -> Dict[str, Any]:
+        """Anota y guarda el resultado del modelo fuerte después de escalar"""
+        resultado['tiempoProcesamientoMs'] += int(fast_seconds * 1000)
+        resultado['cascada'] = {
+            'nivel': NIVEL_FUERTE,
+            'escalada': True,
+            'motivo': motivo,
+            'modeloRapido': self.cascade.fast_model,
+            'tiempoModeloRapidoMs': int(fast_seconds * 1000),
+        }
+        return self._store_result(request, resultado)
+    
+    def _finish_request(
+        self,
+        request: _OCRRequest,
+        gemini_data: Dict[str, Any],
+        processing_time: int,
+        continuaciones: int = 0,
+        bandas: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Valida la respuesta, la convierte al formato backend y la guarda en cache"""
+        resultado = self._build_result(request, gemini_data, processing_time, continuaciones, bandas)
+        return self._store_result(request, resultado)
+    
+    def _build_result(
+        self,
+        request: _OCRRequest,
+        gemini_data: Dict[str, Any],
+        processing_time: int,
+        continuaciones: int = 0,
+        bandas: Optional[List[Dict[str, Any]]] = None,
+        record_failure: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Valida la respuesta y la convierte al formato backend
+        
+        Las métricas del resultado (filas de la tabla, confianza) se
+        registran en _store_result, solo para el resultado que se devuelve.
+        
+        Args:
+            record_failure: Contar una validación fallida en PARSE_FAILURES
+                (False para el modelo rápido de la cascada, que se escala)
+        
+        Raises:
+            ValueError: Si la respuesta no pasa validate_ocr_response
+        """
+        timer = request.timer
+        log_detail = request.log_detail
+        if log_detail:
+            logger.log(
+                request.detail_level, "Datos parseados (primeros 3 estudiantes):\n%s",
+                json.dumps(gemini_data.get('estudiantes', [])[:3], indent=2, ensure_ascii=False)
+            )
+        
+        # Validar respuesta
+        with timer.stage('validacion'):
+            is_valid, error_msg = validate_ocr_response(gemini_data)
+        if not is_valid:
+            if record_failure:
+                PARSE_FAILURES.inc(tipo='validacion')
+            raise ValueError(f"Respuesta OCR inválida: {error_msg}")
+        
+        # Convertir a formato backend
+        with timer.stage('conversion_backend'):
+            resultado = convert_to_backend_format(
+                gemini_data, request.metadata, log_detail=log_detail,
+                model_name=request.model_used or self.model_name
+            )
+        
+        if request.table is not None:
+            self._check_table_rows(request.table, resultado)
+        
+        # Confianza calculada a partir de la consistencia de lo extraído
+        with timer.stage('consistencia'):
+            request.consistency = check_consistency(
+                gemini_data['estudiantes'], request.acta_prompt.num_areas,
+                request.table.filas if request.table is not None else None
+            )
+            apply_confidence(resultado, request.consistency, self.confidence_threshold)
+        
+        # Agregar tiempo de procesamiento
+        resultado['tiempoProcesamientoMs'] = processing_time
+        resultado['preprocesamiento'] = request.preprocess_stats
+        if request.quality is not None:
+            resultado['calidadImagen'] = request.quality.as_dict()
+        if bandas is not None:
+            resultado['bandas'] = bandas
+            continuaciones = sum(banda['continuaciones'] for banda in bandas)
+        if continuaciones:
+            resultado['continuaciones'] = continuaciones
+            resultado['advertencias'].append(
+                f"Respuesta truncada: se completó con {continuaciones} request(s) de continuación"
+            )
+        return resultado
+    
+    def _store_result(self, request: _OCRRequest, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """Guarda el resultado en cache y en el archivo de respuestas y lo registra"""
+        timer = request.timer
+        bandas = resultado.get('bandas')
+        processing_time = resultado['tiempoProcesamientoMs']
+        # Tokens de todas las llamadas del acta (ambos niveles si se escaló)
+        resultado['tokens'] = request.usage.as_dict()
+        ACTA_CONFIDENCE.observe(resultado['confianza'])
+        if 'tabla' in resultado:
+            TABLE_ROWS.inc(resultado=self._table_rows_label(resultado['tabla']))
+        
+        # Guardar en cache antes de anotar el estado del cache
+        if self.cache is not None:
+            with timer.stage('guardado_cache'):
+                self.cache.set(request.cache_key, resultado, resultado['procesadoCon'], PROMPT_VERSION)
+        resultado['cache'] = {'hit': False, 'nivel': None, 'clave': request.cache_key}
+        resultado['etapasMs'] = timer.as_dict()
+        self._archive_responses(request, resultado=resultado)
+        
+        # Resumen de resultados
+        resumen = resultado['resumenSituacion']
+        logger.info(
+            "Extracción completada: %d estudiantes en %dms (%s)",
+            resultado['totalEstudiantes'], processing_time, resultado['procesadoCon'],
+            extra={
+                'confianza': resultado['confianza'],
+                'promovidos': resumen['promovidos'],
+                'aprobados': resumen['aprobados'],
+                'reprobados': resumen['reprobados'],
+                'advertencias': len(resultado.get('advertencias', [])),
+                'bandas': len(bandas) if bandas else None,
+            }
+        )
+        
+        return resultado
+    
+    @staticmethod
+    def _check_table_rows(table: TableRegion, resultado: Dict[str, Any]):
+        """Compara las filas detectadas en la imagen con los estudiantes extraídos"""
+        resultado['tabla'] = table.as_dict()
+        if not table.filas:
+            return
+        extraidos = resultado['totalEstudiantes']
+        resultado['tabla']['coincide'] = table.filas == extraidos
+        if table.filas == extraidos:
+            return
+        logger.warning("Filas detectadas (%d) distintas de estudiantes extraídos (%d)", table.filas, extraidos)
+        resultado['advertencias'].append(
+            f"Se detectaron {table.filas} filas con estudiantes en la tabla pero se extrajeron {extraidos}"
+        )
+    
+    @staticmethod
+    def _table_rows_label(tabla: Dict[str, Any]) -> str:
+        """Etiqueta de TABLE_ROWS: coincide, difiere o sin_tabla"""
+        if not tabla.get('filas'):
+            return 'sin_tabla'
+        return 'coincide' if tabla.get('coincide') else 'difiere'
+    
+    def _request_failed(self, request: _OCRRequest, error: Exception, start_time: float) -> RuntimeError:
+        """Archiva las respuestas de un acta fallida y arma el error a propagar"""
+        processing_time = int((time.time() - start_time) * 1000)
+        self._archive_responses(request, error=str(error))
+        return RuntimeError(f"Error en procesamiento OCR (después de {processing_time}ms): {error}")
+    
+    def _request_fingerprint(
+        self,
+        image: Image.Image,
+        metadata: Dict[str, Any],
+        prompt: str,
+        preprocess_config: Optional[PreprocessConfig],
+        tiling_config: Optional[TilingConfig]
+    ) -> str:
+        """Huella del request: clave del cache OCR y del archivo de respuestas"""
+        image_hash = image_digest(image)
+        if preprocess_config is not None:
+            image_hash = f"{image_hash}|{preprocess_config.signature()}"
+        if should_tile(image, tiling_config):
+            image_hash = f"{image_hash}|bandas:{tiling_config.signature()}"
+        if self.quality_config is not None:
+            image_hash = f"{image_hash}|calidad:{self.quality_config.signature()}"
+        if self.table_detection_config is not None:
+            image_hash = f"{image_hash}|tabla:{self.table_detection_config.signature()}"
+        # Con cascada el resultado puede venir de cualquiera de los dos modelos
+        model_key = self.model_name if self.cascade is None else f"{self.cascade.fast_model}>{self.model_name}"
+        return compute_cache_key(image_hash, metadata, prompt, model_key)
+    
+    def _archive_responses(
+        self,
+        request: _OCRRequest,
+        resultado: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ):
+        """Guarda las respuestas crudas del acta; un fallo del archivo no afecta al request"""
+        if self.archive is None or not request.responses:
+            return
+        try:
+            self.archive.append(
+                request.cache_key, request.model_used or self.model_name, PROMPT_VERSION,
+                request.acta_prompt.output_format,
+                request.metadata, request.responses, resultado=resultado, error=error
+            )
+        except Exception as e:
+            logger.warning("No se pudo archivar la respuesta de Gemini: %s", e)
+    
+    def _prepare_model_input(
+        self,
+        image: Image.Image,
+        preprocess_config: Optional[PreprocessConfig],
+        timer: StageTimer
+    ) -> Tuple[Any, Image.Image, Optional[Dict[str, Any]]]:
+        """
+        Aplica el preprocesamiento configurado a la imagen que se envía
+        
+        Returns:
+            (model_input, imagen_enviada, estadísticas o None)
+        """
+        if preprocess_config is None:
+            return image, image, None
+        
+        with timer.stage('preprocesamiento'):
+            prepared = preprocess_image(image, preprocess_config)
+        stats = prepared.stats
+        logger.info(
+            "Preprocesamiento '%s': %d → %d px, %s → %d bytes (%dms)",
+            preprocess_config.name,
+            stats['pixelesAntes'], stats['pixelesDespues'],
+            stats['bytesAntes'], stats['bytesDespues'],
+            stats['tiempoMs']
+        )
+        return prepared.payload, prepared.image, stats
+    
+    def _generate(
+        self,
+        model_input: Any,
+        image: Image.Image,
+        prompt: ActaPrompt,
+        timer: StageTimer,
+        log_detail: bool = False,
+        detail_level: int = logging.INFO,
+        on_student: Optional[Callable[[Dict[str, Any]], None]] = None,
+        usage: Optional[TokenUsage] = None,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        model_name: Optional[str] = None,
+        scorer: Optional[StudentScorer] = None
+    ) -> Tuple[Dict[str, Any], int]:
+        """
+        Llama a Gemini con una imagen y devuelve el JSON parseado
+        
+        Reserva cuota en el rate limiter, verifica bloqueos y finish_reason
+        y extrae el JSON de la respuesta (sin validarlo). Con on_student la
+        respuesta se consume en streaming y cada estudiante se emite en
+        cuanto su objeto JSON está completo. Los tokens de la llamada se
+        acumulan en usage y el texto crudo se agrega a responses. model_name
+        elige el modelo (default: el configurado, el fuerte de la cascada).
+        
+        Returns:
+            (datos parseados, tiempo de la llamada en ms)
+        
+        Los errores de cuota, servidor y timeout se reintentan según
+        retry_policy con la misma imagen ya preparada (model_input); cada
+        intento pasa por el circuit breaker, el rate limiter y el límite de
+        concurrencia adaptativo.
+        
+        Raises:
+            RateLimitExceeded: Si no hay cuota dentro de rate_limit_max_wait
+            UpstreamUnavailable: Si el circuito está abierto o se agotaron
+                los reintentos
+            TruncatedResponseError: Si la respuesta se cortó o está malformada
+                pero se recuperaron estudiantes completos
+            RuntimeError: Si Gemini bloquea o no completa la respuesta
+            ValueError: Si la respuesta no contiene JSON válido
+        """
+        estimated_tokens = self._estimate_tokens(image, prompt)
+        
+        # Logging de imagen antes de enviar
+        logger.debug(
+            "Enviando imagen a Gemini: modo=%s tamaño=%s formato=%s",
+            image.mode, image.size, getattr(image, 'format', None)
+        )
 
-            # ✅ CONFIGURACIÓN DE SEGURIDAD CORRECTA
-            # Desactivar TODOS los filtros de seguridad
-            # Categorías bloqueadas (según error): 7, 8, 9, 10
-            # Categoría 7: HARM_CATEGORY_HARASSMENT
-            # Categoría 8: HARM_CATEGORY_HATE_SPEECH
-            # Categoría 9: HARM_CATEGORY_SEXUALLY_EXPLICIT
-            # Categoría 10: HARM_CATEGORY_DANGEROUS_CONTENT
-            #
-            # IMPORTANTE: Usar formato de lista con strings para máxima compatibilidad
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            print(f"🛡️  Safety settings configurados: BLOCK_NONE para todas las categorías")
+        # Handle pre-configurado del pool (o con el prefijo en cache de
+        # contexto): generate_content no guarda historial de chat, así que
+        # no se arrastra contexto entre actas
+        model, prompt_text = self._ocr_model_for(prompt, model_name)
+        call_options = self._call_options(prompt)
+        guard = self._guard(model_name)
 
-            # IMPORTANTE: Enviar la imagen con texto en el orden correcto
-            # Gemini procesa mejor cuando la imagen va DESPUÉS del prompt
-            response = fresh_model.generate_content(
-                [image, prompt],  # Imagen PRIMERO para mejor procesamiento OCR
-                generation_config={
-                    'temperature': 0.1,  # Aumentado ligeramente para mejor interpretación
-                    'top_p': 0.95,  # Ajustado para mejor balance
-                    'top_k': 40,  # Aumentado para más opciones de tokens
-                    'max_output_tokens': 16384,  # Suficiente para actas grandes
-                },
-                safety_settings=safety_settings  # ✅ Usar objeto de configuración correcto
-            )
-            
-            processing_time = int((time.time() - start_time) * 1000)  # ms
-            print(f"✓ Respuesta recibida en {processing_time}ms")
-            
-            # Verificar si la respuesta fue bloqueada por seguridad
-            if not response.candidates or len(response.candidates) == 0:
-                raise RuntimeError(
-                    "Gemini bloqueó la respuesta. Esto puede deberse a:\n"
-                    "1. Contenido de la imagen detectado como sensible\n"
-                    "2. Límite de contexto excedido\n"
-                    "3. Problema temporal con la API\n"
-                    "Intenta con otra imagen o espera unos minutos."
-                )
-            
-            candidate = response.candidates[0]
-            
-            # Verificar finish_reason
-            if candidate.finish_reason not in [1, None]:  # 1 = STOP (normal)
-                finish_reasons = {
-                    2: "SAFETY - Contenido bloqueado por filtros de seguridad",
-                    3: "RECITATION - Respuesta bloqueada por contener contenido con derechos de autor",
-                    4: "MAX_TOKENS - Límite de tokens excedido",
-                    5: "OTHER - Otro motivo de bloqueo"
-                }
-                reason_text = finish_reasons.get(candidate.finish_reason, f"Desconocido ({candidate.finish_reason})")
-                
-                error_msg = f"Gemini no completó la respuesta. Motivo: {reason_text}"
-                
-                # Si hay safety_ratings, mostrarlos
-                if candidate.safety_ratings:
-                    error_msg += "\n\nDetalles de seguridad:"
-                    for rating in candidate.safety_ratings:
-                        error_msg += f"\n  - {rating.category}: {rating.probability}"
-                
-                raise RuntimeError(error_msg)
-            
-            # Logging de respuesta recibida
-            print(f"\n📤 Respuesta de Gemini (primeros 500 chars):")
-            print(f"{'-'*70}")
-            
-            # Extraer texto de la respuesta
-            response_text = response.text
-            print(response_text[:500])
-            print(f"...")
-            print(f"{'-'*70}\n")
-            
-            # DEBUG: Imprimir JSON completo para depuración
-            print(f"\n🔍 DEBUG - Respuesta JSON COMPLETA de Gemini:")
-            print(f"{'-'*70}")
-            print(response_text)
-            print(f"{'-'*70}\n")
-            
-            # Parsear JSON
-            gemini_data = extract_json_from_response(response_text)
+        # En streaming solo se reintenta si aún no se emitió ningún estudiante
+        emitted = 0
+        
+        def emit(est: Dict[str, Any]):
+            nonlocal emitted
+            emitted += 1
+            on_student(est)
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            # Circuit breaker, cuota (RPM + TPM) y concurrencia antes de llamar a la API
+            self._breaker_check(guard)
+            try:
+                with timer.stage('espera_rate_limit'):
+                    permit = self.rate_limiter.acquire(estimated_tokens, timeout=self.rate_limit_max_wait)
+                with timer.stage('espera_concurrencia'):
+                    guard.concurrency.acquire(timeout=self.rate_limit_max_wait)
+            except BaseException:
+                guard.breaker.cancel()
+                raise
             
-            # DEBUG: Imprimir estructura parseada
-            import json as json_lib
-            print(f"\n🔍 DEBUG - Datos parseados (primeros 3 estudiantes):")
-            print(f"{'-'*70}")
-            estudiantes_sample = gemini_data.get('estudiantes', [])[:3]
-            print(json_lib.dumps(estudiantes_sample, indent=2, ensure_ascii=False))
-            print(f"{'-'*70}\n")
+            start_time = time.time()
+            try:
+                # IMPORTANTE: Enviar la imagen con texto en el orden correcto
+                # Gemini procesa mejor cuando la imagen va DESPUÉS del prompt
+                with timer.stage('llamada_modelo'), MODEL_CALLS_IN_FLIGHT.track_inprogress():
+                    if on_student is None:
+                        response = model.generate_content(
+                            [model_input, prompt_text],  # Imagen PRIMERO para mejor procesamiento OCR
+                            **call_options
+                        )
+                    else:
+                        response = model.generate_content([model_input, prompt_text], stream=True, **call_options)
+                        self._consume_stream(response, emit, timer, prompt.output_format, scorer)
+            except Exception as e:
+                delay = self._call_failed(guard, e, attempt, can_retry=emitted == 0)
+                with timer.stage('espera_reintento'):
+                    self.retry_policy.sleep(delay)
+                continue
+            except BaseException:
+                self._call_cancelled(guard)
+                raise
+            self._call_succeeded(guard)
+            break
+        
+        return self._handle_response(
+            response, permit, start_time, prompt, timer, log_detail, detail_level, usage, responses
+        )
+    
+    async def _generate_async(
+        self,
+        model_input: Any,
+        image: Image.Image,
+        prompt: ActaPrompt,
+        timer: StageTimer,
+        log_detail: bool = False,
+        detail_level: int = logging.INFO,
+        usage: Optional[TokenUsage] = None,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        model_name: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], int]:
+        """Como _generate, esperando el rate limiter, la llamada y los reintentos sin bloquear el event loop"""
+        estimated_tokens = self._estimate_tokens(image, prompt)
+        model, prompt_text = self._ocr_model_for(prompt, model_name)
+        call_options = self._call_options(prompt)
+        guard = self._guard(model_name)
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            self._breaker_check(guard)
+            try:
+                with timer.stage('espera_rate_limit'):
+                    permit = await self.rate_limiter.acquire_async(estimated_tokens, timeout=self.rate_limit_max_wait)
+                with timer.stage('espera_concurrencia'):
+                    await guard.concurrency.acquire_async(timeout=self.rate_limit_max_wait)
+            except BaseException:
+                guard.breaker.cancel()
+                raise
             
-            # Validar respuesta
-            is_valid, error_msg = validate_ocr_response(gemini_data)
-            if not is_valid:
-                raise ValueError(f"Respuesta OCR inválida: {error_msg}")
+            start_time = time.time()
+            try:
+                with timer.stage('llamada_modelo'), MODEL_CALLS_IN_FLIGHT.track_inprogress():
+                    response = await model.generate_content_async([model_input, prompt_text], **call_options)
+            except Exception as e:
+                delay = self._call_failed(guard, e, attempt)
+                with timer.stage('espera_reintento'):
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelación del request (asyncio.CancelledError)
+                self._call_cancelled(guard)
+                raise
+            self._call_succeeded(guard)
+            break
+        
+        return self._handle_response(
+            response, permit, start_time, prompt, timer, log_detail, detail_level, usage, responses
+        )
+    
+    def _guard(self, model_name: Optional[str]) -> _UpstreamGuard:
+        """Concurrencia y breaker del modelo (se crean al primer uso)"""
+        model_name = model_name or self.model_name
+        with self._guards_lock:
+            guard = self._guards.get(model_name)
+            if guard is None:
+                guard = _UpstreamGuard(self.concurrency.clone(), self.breaker.clone())
+                self._guards[model_name] = guard
+            return guard
+    
+    def upstream_stats(self) -> Dict[str, Any]:
+        """Concurrencia y circuit breaker de cada modelo usado (para /health)"""
+        with self._guards_lock:
+            guards = dict(self._guards)
+        return {
+            name: {'concurrency': guard.concurrency.stats(), 'circuit_breaker': guard.breaker.stats()}
+            for name, guard in guards.items()
+        }
+    
+    def _breaker_check(self, guard: _UpstreamGuard):
+        """
+        Falla rápido si el circuit breaker del modelo está abierto
+        
+        Raises:
+            UpstreamUnavailable: Con el tiempo hasta la próxima llamada de prueba
+        """
+        try:
+            guard.breaker.before_call()
+        except UpstreamUnavailable:
+            CIRCUIT_REJECTED.inc()
+            raise
+    
+    def _call_succeeded(self, guard: _UpstreamGuard):
+        guard.concurrency.release()
+        guard.breaker.record()
+        CONCURRENCY_LIMIT.set(self.concurrency.limit)
+    
+    def _call_cancelled(self, guard: _UpstreamGuard):
+        guard.concurrency.release('cancelada')
+        guard.breaker.cancel()
+    
+    def _call_failed(self, guard: _UpstreamGuard, error: Exception, attempt: int, can_retry: bool = True) -> float:
+        """
+        Registra una llamada fallida y decide si reintentarla
+        
+        Returns:
+            Segundos a esperar antes del siguiente intento
+        
+        Raises:
+            La excepción original si no es un error del upstream;
+            RetriesExhausted si se agotaron los intentos
+        """
+        kind = classify_error(error)
+        guard.concurrency.release(kind)
+        guard.breaker.record(kind)
+        CONCURRENCY_LIMIT.set(self.concurrency.limit)
+        MODEL_ERRORS.inc(tipo=kind)
+        
+        if kind not in UPSTREAM_ERRORS:
+            raise error
+        delay = self.retry_policy.delay(attempt)
+        if not can_retry or not self.retry_policy.should_retry(kind, attempt):
+            raise RetriesExhausted(
+                f"Gemini no respondió después de {attempt} intento(s) (error de {kind}): {error}",
+                retry_after=delay, kind=kind
+            ) from error
+        
+        MODEL_RETRIES.inc(tipo=kind)
+        logger.warning(
+            "Error de %s en la llamada a Gemini (intento %d/%d), reintentando en %.1fs: %s",
+            kind, attempt, self.retry_policy.max_attempts, delay, error
+        )
+        return delay
+    
+    @staticmethod
+    def _call_options(prompt: ActaPrompt) -> Dict[str, Any]:
+        """
+        Argumentos extra de generate_content: con las filas detectadas,
+        max_output_tokens a la medida del acta (el SDK lo combina con el
+        generation_config del handle, que se comparte entre actas)
+        """
+        max_output_tokens = prompt.max_output_tokens()
+        if max_output_tokens is None:
+            return {}
+        return {'generation_config': {'max_output_tokens': max_output_tokens}}
+    
+    def _estimate_tokens(self, image: Image.Image, prompt: ActaPrompt) -> int:
+        """Tokens a reservar en el rate limiter para una llamada"""
+        estimated_tokens = estimate_request_tokens(
+            getattr(image, 'size', None),
+            self.system_instruction + prompt.text,
+            prompt.expected_output_tokens() or self.expected_output_tokens
+        )
+        wait_time = self.rate_limiter.estimate_wait(estimated_tokens)
+        if wait_time > 0:
+            logger.info("Esperando ~%.1fs por cuota de Gemini (rate limit)", wait_time)
+        return estimated_tokens
+    
+    def _handle_response(
+        self,
+        response,
+        permit,
+        start_time: float,
+        prompt: ActaPrompt,
+        timer: StageTimer,
+        log_detail: bool,
+        detail_level: int,
+        usage: Optional[TokenUsage],
+        responses: Optional[List[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], int]:
+        """
+        Registra el uso de tokens, verifica bloqueos y finish_reason y
+        extrae el JSON de la respuesta (común a _generate y _generate_async)
+        """
+        # Ajustar la reserva del limiter con el uso real de tokens
+        usage_metadata = getattr(response, 'usage_metadata', None)
+        self.rate_limiter.record_usage(permit, getattr(usage_metadata, 'total_token_count', None))
+        (usage if usage is not None else TokenUsage()).add(usage_metadata)
+        
+        processing_time = int((time.time() - start_time) * 1000)  # ms
+        logger.info("Respuesta recibida en %dms", processing_time)
+        
+        # Verificar si la respuesta fue bloqueada por seguridad
+        if not response.candidates or len(response.candidates) == 0:
+            BLOCKED.inc(motivo='sin_candidatos')
+            raise RuntimeError(
+                "Gemini bloqueó la respuesta. Esto puede deberse a:\n"
+                "1. Contenido de la imagen detectado como sensible\n"
+                "2. Límite de contexto excedido\n"
+                "3. Problema temporal con la API\n"
+                "Intenta con otra imagen o espera unos minutos."
+            )
+        
+        candidate = response.candidates[0]
+        reason_name = finish_reason_name(candidate.finish_reason)
+        FINISH_REASONS.inc(reason=reason_name)
+        if responses is not None:
+            responses.append({'texto': _response_text(response), 'finishReason': reason_name})
+        
+        # Verificar finish_reason
+        if candidate.finish_reason not in [1, None]:  # 1 = STOP (normal)
+            if reason_name in ('SAFETY', 'RECITATION', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'):
+                BLOCKED.inc(motivo=reason_name)
+            finish_reasons = {
+                'MAX_TOKENS': "MAX_TOKENS - Límite de tokens excedido",
+                'SAFETY': "SAFETY - Contenido bloqueado por filtros de seguridad",
+                'RECITATION': "RECITATION - Respuesta bloqueada por contener contenido con derechos de autor",
+                'OTHER': "OTHER - Otro motivo de bloqueo",
+            }
+            reason_text = finish_reasons.get(reason_name, f"Desconocido ({candidate.finish_reason})")
             
-            # Convertir a formato backend
-            resultado = convert_to_backend_format(gemini_data, metadata)
+            error_msg = f"Gemini no completó la respuesta. Motivo: {reason_text}"
             
-            # Agregar tiempo de procesamiento
-            resultado['tiempoProcesamientoMs'] = processing_time
+            # Respuesta cortada por longitud: lo ya generado sigue siendo útil
+            if reason_name == 'MAX_TOKENS':
+                salvaged = salvage_students(_response_text(response), prompt.output_format)
+                if salvaged:
+                    TRUNCATED.inc(motivo='max_tokens')
+                    raise TruncatedResponseError(error_msg, salvaged)
             
-            # Logging detallado de resultados
-            print(f"\n{'='*70}")
-            print(f"✅ EXTRACCIÓN COMPLETADA")
-            print(f"{'='*70}")
-            print(f"👥 Estudiantes detectados: {resultado['totalEstudiantes']}")
-            print(f"📊 Confianza: {resultado['confianza']}%")
-            print(f"⏱️ Tiempo de procesamiento: {processing_time}ms ({processing_time/1000:.2f}s)")
+            # Si hay safety_ratings, mostrarlos
+            if candidate.safety_ratings:
+                error_msg += "\n\nDetalles de seguridad:"
+                for rating in candidate.safety_ratings:
+                    error_msg += f"\n  - {rating.category}: {rating.probability}"
             
-            # Contar aprobados/desaprobados
-            aprobados = sum(1 for est in resultado['estudiantes'] if est.get('situacionFinal') == 'A')
-            desaprobados = resultado['totalEstudiantes'] - aprobados
-            print(f"✓ Aprobados: {aprobados}")
-            print(f"✗ Desaprobados: {desaprobados}")
+            raise RuntimeError(error_msg)
+        
+        # Extraer texto de la respuesta
+        response_text = response.text
+        
+        # Respuesta cruda completa solo en modo detalle
+        if log_detail:
+            logger.log(detail_level, "Respuesta JSON completa de Gemini:\n%s", response_text)
+        
+        # Parsear JSON
+        with timer.stage('extraccion_json'):
+            try:
+                gemini_data = extract_json_from_response(response_text)
+            except ValueError as e:
+                PARSE_FAILURES.inc(tipo='json')
+                salvaged = salvage_students(response_text, prompt.output_format)
+                if not salvaged:
+                    raise
+                TRUNCATED.inc(motivo='json_invalido')
+                raise TruncatedResponseError(str(e), salvaged)
+            if prompt.output_format == OUTPUT_FORMAT_FILAS:
+                gemini_data = expand_compact_response(gemini_data)
+        
+        return gemini_data, processing_time
+    
+    def _generate_complete(
+        self,
+        model_input: Any,
+        image: Image.Image,
+        prompt: ActaPrompt,
+        timer: StageTimer,
+        log_detail: bool = False,
+        detail_level: int = logging.INFO,
+        on_student: Optional[Callable[[Dict[str, Any]], None]] = None,
+        usage: Optional[TokenUsage] = None,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        model_name: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], int, int]:
+        """
+        Como _generate, pero si la respuesta se corta conserva los
+        estudiantes recuperados y pide solo las filas siguientes
+        
+        En streaming, las continuaciones no vuelven a emitir los números
+        de orden ya emitidos (el modelo suele repetir la última fila), y
+        un mismo StudentScorer da a cada estudiante la confianza que
+        tendrá en el resultado final.
+        
+        Returns:
+            (datos parseados, tiempo total en ms, requests de continuación)
+        """
+        start_time = time.time()
+        streaming = on_student is not None
+        scorer = StudentScorer(prompt.num_areas) if streaming else None
+        emitted = set()
+        
+        def emit_first(est: Dict[str, Any]):
+            emitted.add(student_numero(est))
+            on_student(est)
+        
+        def emit_continuation(est: Dict[str, Any]):
+            numero = student_numero(est)
+            if numero is not None and numero in emitted:
+                return
+            emitted.add(numero)
+            on_student(est)
+        
+        try:
+            gemini_data, processing_time = self._generate(
+                model_input, image, prompt, timer, log_detail, detail_level, emit_first if streaming else None,
+                usage, responses, model_name, scorer
+            )
+            return gemini_data, processing_time, 0
+        except TruncatedResponseError as e:
+            estudiantes = self._truncated(e)
+        
+        continuaciones = 0
+        while continuaciones < self.max_continuations:
+            last_numero = max((student_numero(est) for est in estudiantes), default=None)
+            if last_numero is None:
+                break
             
-            if resultado.get('advertencias'):
-                print(f"⚠️  Advertencias: {len(resultado['advertencias'])}")
-                for adv in resultado['advertencias'][:3]:  # Mostrar primeras 3
-                    print(f"   - {adv}")
+            continuaciones += 1
+            continuation_prompt = self._continuation_prompt(prompt, continuaciones, last_numero)
+            try:
+                data, _ = self._generate(
+                    model_input, image, continuation_prompt, timer, log_detail, detail_level,
+                    emit_continuation if streaming else None, usage, responses, model_name, scorer
+                )
+                nuevos = data.get('estudiantes', []) if isinstance(data, dict) else []
+                complete = True
+            except TruncatedResponseError as e:
+                nuevos = e.estudiantes
+                complete = False
             
-            print(f"{'='*70}\n")
+            estudiantes = merge_band_students([estudiantes, nuevos])
+            progressed = any((student_numero(est) or 0) > last_numero for est in nuevos)
+            if complete or not progressed:
+                break
+        
+        processing_time = int((time.time() - start_time) * 1000)
+        return {'estudiantes': estudiantes}, processing_time, continuaciones
+    
+    async def _generate_complete_async(
+        self,
+        model_input: Any,
+        image: Image.Image,
+        prompt: ActaPrompt,
+        timer: StageTimer,
+        log_detail: bool = False,
+        detail_level: int = logging.INFO,
+        usage: Optional[TokenUsage] = None,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        model_name: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], int, int]:
+        """Versión asíncrona de _generate_complete"""
+        start_time = time.time()
+        try:
+            gemini_data, processing_time = await self._generate_async(
+                model_input, image, prompt, timer, log_detail, detail_level, usage, responses, model_name
+            )
+            return gemini_data, processing_time, 0
+        except TruncatedResponseError as e:
+            estudiantes = self._truncated(e)
+        
+        continuaciones = 0
+        while continuaciones < self.max_continuations:
+            last_numero = max((student_numero(est) for est in estudiantes), default=None)
+            if last_numero is None:
+                break
             
-            return resultado
+            continuaciones += 1
+            continuation_prompt = self._continuation_prompt(prompt, continuaciones, last_numero)
+            try:
+                data, _ = await self._generate_async(
+                    model_input, image, continuation_prompt, timer, log_detail, detail_level, usage, responses,
+                    model_name
+                )
+                nuevos = data.get('estudiantes', []) if isinstance(data, dict) else []
+                complete = True
+            except TruncatedResponseError as e:
+                nuevos = e.estudiantes
+                complete = False
             
-        except Exception as e:
-            processing_time = int((time.time() - start_time) * 1000)
-            raise RuntimeError(f"Error en procesamiento OCR (después de {processing_time}ms): {e}")
+            estudiantes = merge_band_students([estudiantes, nuevos])
+            progressed = any((student_numero(est) or 0) > last_numero for est in nuevos)
+            if complete or not progressed:
+                break
+        
+        processing_time = int((time.time() - start_time) * 1000)
+        return {'estudiantes': estudiantes}, processing_time, continuaciones
+    
+    @staticmethod
+    def _truncated(error: TruncatedResponseError) -> List[Dict[str, Any]]:
+        logger.warning(
+            "Respuesta truncada: %d estudiantes recuperados (%s)",
+            len(error.estudiantes), str(error).splitlines()[0]
+        )
+        return error.estudiantes
+    
+    @staticmethod
+    def _continuation_prompt(prompt: ActaPrompt, continuaciones: int, last_numero: int) -> ActaPrompt:
+        CONTINUATIONS.inc()
+        logger.info("Continuación %d: filas posteriores al Nº %d", continuaciones, last_numero)
+        return prompt.with_instructions(build_continuation_instructions(last_numero))
+    
+    def _consume_stream(
+        self,
+        response,
+        on_student: Callable[[Dict[str, Any]], None],
+        timer: StageTimer,
+        output_format: str = OUTPUT_FORMAT_OBJETOS,
+        scorer: Optional[StudentScorer] = None
+    ):
+        """
+        Recorre los fragmentos de una respuesta en streaming y emite cada
+        estudiante completo (con su confianza si se indica scorer). Al
+        terminar, la respuesta queda agregada (response.text, candidates,
+        usage_metadata) como sin streaming.
+        """
+        parser = IncrementalStudentParser.for_format(output_format)
+        start = time.perf_counter()
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Fragmento sin texto (ej: el último, solo con finish_reason)
+                continue
+            for est in parser.feed(text):
+                if not isinstance(est, dict):
+                    continue
+                if parser.count == 1:
+                    timer.record('primer_estudiante', time.perf_counter() - start)
+                on_student(self._scored_student(est, scorer) if scorer is not None else convert_student(est))
+    
+    @staticmethod
+    def _scored_student(est: Dict[str, Any], scorer: StudentScorer) -> Dict[str, Any]:
+        """Registro del backend con la confianza que le asigna scorer"""
+        record = convert_student(est)
+        _, record['confianza'] = scorer.score(est)
+        return record
+    
+    def process_acta_stream(self, image: Image.Image, metadata: Dict[str, Any], **kwargs) -> Iterator[Dict[str, Any]]:
+        """
+        Versión en streaming de process_acta
+        
+        El procesamiento corre en un hilo propio; este generador entrega los
+        eventos a medida que se producen.
+        
+        Args:
+            image, metadata, **kwargs: Los mismos de process_acta
+        
+        Yields:
+            {'tipo': 'estudiante', 'indice': n, 'data': {...}} por cada estudiante
+            {'tipo': 'resultado', 'data': {...}} al final, idéntico a process_acta
+        
+        Raises:
+            Las mismas excepciones que process_acta, al consumir el generador
+        """
+        events: 'queue.Queue[Tuple[str, Any]]' = queue.Queue()
+        
+        def run():
+            try:
+                resultado = self.process_acta(
+                    image, metadata,
+                    on_student=lambda est: events.put(('estudiante', est)),
+                    **kwargs
+                )
+                events.put(('resultado', resultado))
+            except BaseException as e:
+                events.put(('error', e))
+        
+        # Si el cliente se desconecta el hilo termina igual: el resultado
+        # queda en cache y no se pierde la llamada ya pagada
+        threading.Thread(target=run, name='ocr-stream', daemon=True).start()
+        
+        indice = 0
+        while True:
+            tipo, payload = events.get()
+            if tipo == 'estudiante':
+                yield {'tipo': 'estudiante', 'indice': indice, 'data': payload}
+                indice += 1
+            elif tipo == 'resultado':
+                yield {'tipo': 'resultado', 'data': payload}
+                return
+            else:
+                raise payload
+    
+    def _process_bands(
+        self,
+        image: Image.Image,
+        prompt: ActaPrompt,
+        tiling_config: TilingConfig,
+        preprocess_config: Optional[PreprocessConfig],
+        log_detail: bool = False,
+        detail_level: int = logging.INFO,
+        usage: Optional[TokenUsage] = None,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        model_name: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Procesa el acta por franjas horizontales en paralelo
+        
+        Returns:
+            (datos fusionados {'estudiantes': [...]}, resumen por franja)
+        
+        Raises:
+            RuntimeError: Si alguna franja falla (el acta quedaría incompleta)
+        """
+        bands = split_into_bands(image, tiling_config)
+        logger.info(
+            "Procesando acta en %d franjas (solapamiento %.0f%%)",
+            len(bands), tiling_config.overlap * 100
+        )
+        
+        def run_band(band):
+            # Cada franja mide sus etapas por separado (alimentan los mismos
+            # histogramas); en el desglose del acta solo cuenta el tiempo total
+            band_timer = StageTimer()
+            band_start = time.time()
+            model_input, sent_image, _ = self._prepare_model_input(band.image, preprocess_config, band_timer)
+            band_prompt = prompt.with_instructions(build_band_instructions(band.index, band.total))
+            data, _, continuaciones = self._generate_complete(
+                model_input, sent_image, band_prompt, band_timer, log_detail, detail_level,
+                usage=usage, responses=responses, model_name=model_name
+            )
+            estudiantes = data.get('estudiantes', []) if isinstance(data, dict) else []
+            return estudiantes, {
+                'indice': band.index,
+                'filasPx': [band.top, band.bottom],
+                'estudiantes': len(estudiantes),
+                'continuaciones': continuaciones,
+                'tiempoMs': int((time.time() - band_start) * 1000),
+            }
+        
+        executor = ThreadPoolExecutor(max_workers=len(bands), thread_name_prefix='ocr-banda')
+        futures = [executor.submit(run_band, band) for band in bands]
+        try:
+            results = []
+            for band, future in zip(bands, futures):
+                try:
+                    results.append(future.result())
+                except RateLimitExceeded:
+                    raise
+                except Exception as e:
+                    raise RuntimeError(f"Franja {band.index + 1}/{band.total}: {e}")
+        finally:
+            # Si una franja falla no seguir gastando llamadas en las demás
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        estudiantes = merge_band_students([students for students, _ in results])
+        resumen = [info for _, info in results]
+        duplicados = sum(info['estudiantes'] for info in resumen) - len(estudiantes)
+        logger.info(
+            "Franjas fusionadas: %d estudiantes (%d duplicados descartados)",
+            len(estudiantes), duplicados
+        )
+        return {'estudiantes': estudiantes}, resumen
     
     def health_check(self) -> bool:
         """
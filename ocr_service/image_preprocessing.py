@@ -0,0 +1,196 @@
+"""
+Preprocesamiento de imágenes antes de enviarlas a Gemini
+
+Reduce el payload (tiempo de subida y tokens de entrada) con:
+- Conversión a escala de grises
+- Reducción a un DPI efectivo objetivo
+- Normalización de contraste (opcional)
+- Re-codificación a JPEG/WebP con calidad configurable
+
+Sin preprocesamiento, el SDK de Gemini re-codifica cada imagen PIL como
+WebP sin pérdida, lo que para escaneos RGBA/PNG produce varios megabytes.
+"""
+
+import io
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """Configuración del preprocesamiento"""
+    name: str = 'personalizado'
+    grayscale: bool = True
+    target_dpi: Optional[int] = 200        # None = no reducir por DPI
+    page_width_inches: float = 16.5        # Ancho asumido (A3 horizontal) si la imagen no trae DPI
+    max_side: int = 8192                   # Lado máximo en píxeles
+    autocontrast: bool = False
+    autocontrast_cutoff: float = 1.0       # % de píxeles recortados en cada extremo
+    output_format: str = 'JPEG'            # JPEG o WEBP
+    quality: int = 85
+
+    def signature(self) -> str:
+        """Firma estable de la configuración (forma parte de la clave del cache)"""
+        values = asdict(self)
+        values.pop('name')
+        return ','.join(f"{key}={values[key]}" for key in sorted(values))
+
+
+# Presets evaluados con bench_preprocessing.py
+PRESETS: Dict[str, PreprocessConfig] = {
+    'calidad': PreprocessConfig(
+        name='calidad', grayscale=True, target_dpi=300,
+        autocontrast=False, output_format='JPEG', quality=92,
+    ),
+    'balanceado': PreprocessConfig(
+        name='balanceado', grayscale=True, target_dpi=200,
+        autocontrast=True, output_format='JPEG', quality=85,
+    ),
+    'compacto': PreprocessConfig(
+        name='compacto', grayscale=True, target_dpi=150,
+        autocontrast=True, output_format='WEBP', quality=75,
+    ),
+}
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+}
+
+
+@dataclass
+class PreprocessResult:
+    """Imagen preprocesada lista para enviar a Gemini"""
+    image: Image.Image            # Imagen procesada (para logging / estimaciones)
+    payload: Dict[str, Any]       # Blob {'mime_type', 'data'} que se envía al modelo
+    stats: Dict[str, Any]         # Bytes y píxeles antes/después
+
+
+def get_preset(name: Optional[str]) -> Optional[PreprocessConfig]:
+    """
+    Obtiene un preset por nombre
+
+    Args:
+        name: Nombre del preset; None, '' u 'original' desactivan el preprocesamiento
+
+    Returns:
+        PreprocessConfig o None
+
+    Raises:
+        ValueError: Si el preset no existe
+    """
+    if not name or name == 'original':
+        return None
+    if name not in PRESETS:
+        raise ValueError(f"Preset de preprocesamiento desconocido: {name} (disponibles: original, {', '.join(PRESETS)})")
+    return PRESETS[name]
+
+
+def _source_dpi(image: Image.Image, config: PreprocessConfig) -> float:
+    """DPI de origen: el declarado en la imagen o uno estimado por el ancho de página"""
+    dpi = image.info.get('dpi')
+    if dpi:
+        try:
+            value = float(dpi[0] if isinstance(dpi, (tuple, list)) else dpi)
+            if value > 1:
+                return value
+        except (TypeError, ValueError):
+            pass
+    return image.size[0] / config.page_width_inches
+
+
+def _target_size(size: Tuple[int, int], source_dpi: float, config: PreprocessConfig) -> Tuple[int, int]:
+    width, height = size
+    scale = 1.0
+
+    if config.target_dpi:
+        if source_dpi > config.target_dpi:
+            scale = config.target_dpi / source_dpi
+
+    longest = max(width, height) * scale
+    if longest > config.max_side:
+        scale *= config.max_side / longest
+
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(image: Image.Image, config: PreprocessConfig) -> PreprocessResult:
+    """
+    Aplica el preprocesamiento configurado a una imagen
+
+    Args:
+        image: Imagen PIL original
+        config: Configuración del preprocesamiento
+
+    Returns:
+        PreprocessResult: Imagen procesada, payload codificado y estadísticas
+    """
+    start_time = time.time()
+    original_size = image.size
+    original_mode = image.mode
+    # Leer el DPI antes de convertir: las conversiones no conservan image.info
+    source_dpi = _source_dpi(image, config)
+
+    img = image
+
+    # Transparencia: componer sobre fondo blanco (papel) antes de convertir.
+    # Los escaneos RGBA suelen ser totalmente opacos: en ese caso basta
+    # con descartar el canal alfa, que es mucho más barato que componer
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img if img.mode == 'RGBA' else img.convert('RGBA')
+        if rgba.getchannel('A').getextrema()[0] < 255:
+            background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, rgba)
+        else:
+            img = rgba
+
+    if config.grayscale:
+        img = img.convert('L')
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    target_size = _target_size(img.size, source_dpi, config)
+    if target_size != img.size:
+        # reduce() con factor entero es mucho más rápido que LANCZOS sobre el original
+        factor = min(img.size[0] // target_size[0], img.size[1] // target_size[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.size != target_size:
+            img = img.resize(target_size, Image.Resampling.LANCZOS)
+
+    if config.autocontrast:
+        img = ImageOps.autocontrast(img, cutoff=config.autocontrast_cutoff)
+
+    output_format = config.output_format.upper()
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Formato de salida no soportado: {config.output_format}")
+
+    buffer = io.BytesIO()
+    save_kwargs = {'quality': config.quality}
+    if output_format == 'JPEG':
+        save_kwargs['optimize'] = True
+    img.save(buffer, format=output_format, **save_kwargs)
+    data = buffer.getvalue()
+
+    stats = {
+        'preset': config.name,
+        'bytesAntes': image.info.get('source_bytes'),
+        'bytesDespues': len(data),
+        'pixelesAntes': original_size[0] * original_size[1],
+        'pixelesDespues': img.size[0] * img.size[1],
+        'dimensionesAntes': list(original_size),
+        'dimensionesDespues': list(img.size),
+        'modoAntes': original_mode,
+        'modoDespues': img.mode,
+        'formato': output_format,
+        'tiempoMs': int((time.time() - start_time) * 1000),
+    }
+
+    return PreprocessResult(
+        image=img,
+        payload={'mime_type': MIME_TYPES[output_format], 'data': data},
+        stats=stats,
+    )
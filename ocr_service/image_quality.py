@@ -0,0 +1,298 @@
+"""
+Control de calidad de la imagen antes de llamar a Gemini
+
+Una llamada al modelo tarda 30-120 s; una página en blanco, movida o muy
+torcida no va a dar un resultado útil. Este control (pocos ms, vectorizado
+con NumPy) se ejecuta después de decodificar la imagen y antes del
+preprocesamiento:
+
+- paleta / transparencia (P, PA, RGBA, LA): se convierte a RGB sobre
+  fondo blanco (lo que test_image_quality.py solo advertía)
+- bajo_contraste: rango p2-p98 de luminancia estrecho → autocontraste
+- inclinacion: ángulo de las filas (perfil de proyección) mayor al
+  máximo → se endereza
+- borrosa: varianza del laplaciano baja en la zona con más tinta → rechazo
+- en_blanco: casi sin píxeles de tinta → rechazo
+
+Contraste, tinta e inclinación se miden sobre una reducción de la imagen
+(~1000 px de lado); el laplaciano sobre un recorte a resolución completa,
+porque el desenfoque se ve a la escala del escaneo.
+
+Modos:
+- off: sin control
+- reportar: solo agrega los códigos al resultado y a las métricas
+- corregir: además corrige lo corregible y rechaza lo que no
+"""
+
+import math
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from metrics import QUALITY_ISSUES
+
+MODO_OFF = 'off'
+MODO_REPORTAR = 'reportar'
+MODO_CORREGIR = 'corregir'
+QUALITY_MODES = (MODO_OFF, MODO_REPORTAR, MODO_CORREGIR)
+
+CODIGO_PALETA = 'paleta'
+CODIGO_TRANSPARENCIA = 'transparencia'
+CODIGO_BAJO_CONTRASTE = 'bajo_contraste'
+CODIGO_INCLINACION = 'inclinacion'
+CODIGO_BORROSA = 'borrosa'
+CODIGO_EN_BLANCO = 'en_blanco'
+
+# Sin corrección posible: la llamada al modelo fallaría
+CODIGOS_RECHAZO = (CODIGO_EN_BLANCO, CODIGO_BORROSA)
+
+
+@dataclass(frozen=True)
+class QualityConfig:
+    """Umbrales del control de calidad"""
+    mode: str = MODO_CORREGIR
+    analysis_side: int = 1000           # Lado de la reducción para contraste, tinta e inclinación
+    blur_crop: int = 768                # Lado del recorte a resolución completa para el laplaciano
+    min_sharpness: float = 60.0         # Varianza del laplaciano (recorte normalizado a 0-255)
+    min_contrast: int = 60              # p98 - p2 de luminancia
+    min_ink_ratio: float = 0.002        # Fracción de píxeles de tinta
+    max_skew_degrees: float = 3.0       # Inclinación tolerada sin enderezar
+    skew_search_degrees: float = 15.0   # Rango de búsqueda del ángulo
+
+    def __post_init__(self):
+        if self.mode not in QUALITY_MODES:
+            raise ValueError(f"Modo de control de calidad inválido: {self.mode} (usar {', '.join(QUALITY_MODES)})")
+
+    def signature(self) -> str:
+        """Firma estable de la configuración (forma parte de la clave del cache)"""
+        values = asdict(self)
+        return ','.join(f"{key}={values[key]}" for key in sorted(values))
+
+
+@dataclass
+class QualityReport:
+    """Resultado del control de una imagen"""
+    codigos: List[str] = field(default_factory=list)
+    correcciones: List[str] = field(default_factory=list)
+    metricas: Dict[str, Any] = field(default_factory=dict)
+    rechazada: bool = False
+    tiempo_ms: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'codigos': self.codigos,
+            'correcciones': self.correcciones,
+            'metricas': self.metricas,
+            'rechazada': self.rechazada,
+            'tiempoMs': round(self.tiempo_ms, 1),
+        }
+
+
+class ImageQualityError(ValueError):
+    """La imagen no supera el control de calidad (no se llama al modelo)"""
+
+    def __init__(self, report: QualityReport):
+        codigos = ', '.join(c for c in report.codigos if c in CODIGOS_RECHAZO)
+        super().__init__(f"Imagen rechazada por control de calidad: {codigos}")
+        self.report = report
+
+
+def _luminance(image: Image.Image) -> Image.Image:
+    """Escala de grises de cualquier modo (las transparencias sobre blanco)"""
+    if image.mode in ('L', 'I;16', 'I', 'F'):
+        return image if image.mode == 'L' else image.convert('L')
+    if image.mode in ('PA', 'P') and (image.mode == 'PA' or 'transparency' in image.info):
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA'):
+        # Componer en L (un canal) es ~4x más barato que aplanar en RGB
+        return Image.composite(image.convert('L'), Image.new('L', image.size, 255), image.getchannel('A'))
+    return image.convert('L')
+
+
+def _flatten_alpha(image: Image.Image) -> Image.Image:
+    """Compone la imagen sobre fondo blanco (RGB)"""
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def grayscale_preview(image: Image.Image, side: int) -> Image.Image:
+    """
+    Reducción barata en escala de grises (lado mayor ~side) para análisis:
+    muestreo al doble del tamaño final (nearest, no lee todos los píxeles)
+    y promedio 2x2. Un reduce() directo sobre 24 MP cuesta ~50 ms en RGB y
+    ~230 ms en RGBA; así, unos pocos ms sin perder trazos de 2-3 px
+    """
+    factor = max(image.size) / side
+    if factor <= 1:
+        return _luminance(image)
+    size = (max(2, round(image.size[0] * 2 / factor)), max(2, round(image.size[1] * 2 / factor)))
+    sampled = image.resize(size, Image.Resampling.NEAREST)
+    return _luminance(sampled).reduce(2)
+
+
+def luminance_percentiles(gray: np.ndarray, low: float, high: float):
+    """Percentiles de una imagen uint8 por histograma (sin ordenar)"""
+    cumulative = np.cumsum(np.bincount(gray.ravel(), minlength=256))
+    total = cumulative[-1]
+    return (
+        int(np.searchsorted(cumulative, total * low / 100)),
+        int(np.searchsorted(cumulative, total * high / 100)),
+    )
+
+
+def estimate_skew(ink: np.ndarray, search: float) -> float:
+    """
+    Ángulo (grados) que maximiza la nitidez del perfil de filas
+
+    Para ángulos chicos la rotación se aproxima con un corte (y - x·tan a):
+    se proyectan solo las coordenadas de tinta, sin rotar la imagen.
+    Búsqueda gruesa (1°) y luego fina (0.1°).
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) > 60_000:
+        step = len(ys) // 60_000 + 1
+        ys, xs = ys[::step], xs[::step]
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32) - ink.shape[1] / 2
+    height = ink.shape[0]
+    margin = int(abs(math.tan(math.radians(search))) * ink.shape[1] / 2) + 1
+
+    def score(angle: float) -> float:
+        rows = np.round(ys - xs * math.tan(math.radians(angle))).astype(np.int64) + margin
+        profile = np.bincount(rows, minlength=height + 2 * margin).astype(np.float64)
+        return float(np.dot(profile, profile))
+
+    coarse = max(np.arange(-search, search + 0.5, 1.0), key=score)
+    fine = max(np.arange(coarse - 1, coarse + 1.05, 0.1), key=score)
+    return round(float(fine), 1)
+
+
+def _sharpness(gray: np.ndarray) -> float:
+    """Varianza del laplaciano (4 vecinos) del recorte, normalizado a 0-255"""
+    low, high = luminance_percentiles(gray, 2, 98)
+    crop = gray.astype(np.float32)
+    if high > low:
+        crop = (crop - low) * (255.0 / (high - low))
+    laplacian = (
+        crop[1:-1, :-2] + crop[1:-1, 2:] + crop[:-2, 1:-1] + crop[2:, 1:-1] - 4 * crop[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def _densest_region(ink: np.ndarray, grid: int = 4):
+    """Celda (fila, columna) de una grilla grid x grid con más tinta"""
+    h, w = ink.shape
+    cells = ink[:h - h % grid, :w - w % grid].reshape(grid, h // grid, grid, w // grid).sum(axis=(1, 3))
+    row, col = np.unravel_index(int(np.argmax(cells)), cells.shape)
+    return (row + 0.5) / grid, (col + 0.5) / grid
+
+
+def assess_image(image: Image.Image, config: Optional[QualityConfig] = None) -> QualityReport:
+    """
+    Mide la imagen sin modificarla
+
+    Returns:
+        QualityReport con los códigos detectados (sin correcciones)
+    """
+    config = config or QualityConfig()
+    start = time.perf_counter()
+    report = QualityReport()
+
+    if image.mode in ('P', 'PA'):
+        report.codigos.append(CODIGO_PALETA)
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        report.codigos.append(CODIGO_TRANSPARENCIA)
+
+    small = np.asarray(grayscale_preview(image, config.analysis_side))
+
+    low, high = luminance_percentiles(small, 2, 98)
+    contraste = high - low
+    # Tinta: más oscuro que el punto medio entre fondo (p98) y trazo (p2)
+    threshold = high - max(contraste, 1) * 0.5
+    ink = small < threshold
+    ink_ratio = float(ink.mean()) if contraste >= 16 else 0.0
+    report.metricas.update({'contraste': contraste, 'tinta': round(ink_ratio, 4)})
+
+    if ink_ratio < config.min_ink_ratio:
+        report.codigos.append(CODIGO_EN_BLANCO)
+    else:
+        if contraste < config.min_contrast:
+            report.codigos.append(CODIGO_BAJO_CONTRASTE)
+
+        angle = estimate_skew(ink, config.skew_search_degrees)
+        report.metricas['inclinacionGrados'] = angle
+        if abs(angle) > config.max_skew_degrees:
+            report.codigos.append(CODIGO_INCLINACION)
+
+        # Laplaciano a resolución completa en la zona con más tinta
+        cy, cx = _densest_region(ink)
+        half = config.blur_crop // 2
+        left = min(max(0, int(cx * image.size[0]) - half), max(0, image.size[0] - config.blur_crop))
+        top = min(max(0, int(cy * image.size[1]) - half), max(0, image.size[1] - config.blur_crop))
+        crop = image.crop((left, top, left + config.blur_crop, top + config.blur_crop))
+        sharpness = _sharpness(np.asarray(_luminance(crop)))
+        report.metricas['nitidez'] = round(sharpness, 1)
+        if sharpness < config.min_sharpness:
+            report.codigos.append(CODIGO_BORROSA)
+
+    report.tiempo_ms = (time.perf_counter() - start) * 1000
+    return report
+
+
+def apply_quality_gate(image: Image.Image, config: QualityConfig):
+    """
+    Control de calidad de una imagen según config.mode
+
+    Returns:
+        (imagen, QualityReport): la imagen corregida (o la misma si no hubo
+        correcciones); report None si el modo es off
+
+    Raises:
+        ImageQualityError: En modo corregir, si la imagen está en blanco o borrosa
+    """
+    if config.mode == MODO_OFF:
+        return image, None
+
+    report = assess_image(image, config)
+    corregir = config.mode == MODO_CORREGIR
+
+    if corregir and any(codigo in CODIGOS_RECHAZO for codigo in report.codigos):
+        report.rechazada = True
+        for codigo in report.codigos:
+            QUALITY_ISSUES.inc(codigo=codigo, accion='rechazada')
+        raise ImageQualityError(report)
+
+    if corregir and report.codigos:
+        start = time.perf_counter()
+        info = dict(image.info)
+        if CODIGO_TRANSPARENCIA in report.codigos:
+            image = _flatten_alpha(image)
+            report.correcciones.append(CODIGO_TRANSPARENCIA)
+        elif CODIGO_PALETA in report.codigos:
+            image = image.convert('RGB')
+            report.correcciones.append(CODIGO_PALETA)
+        if CODIGO_BAJO_CONTRASTE in report.codigos:
+            if image.mode not in ('L', 'RGB'):
+                image = image.convert('RGB')
+            image = ImageOps.autocontrast(image, cutoff=1)
+            report.correcciones.append(CODIGO_BAJO_CONTRASTE)
+        if CODIGO_INCLINACION in report.codigos:
+            fill = 255 if image.mode == 'L' else (255,) * len(image.getbands())
+            # El ángulo medido es el corte que endereza las filas (rotate es antihorario)
+            image = image.rotate(
+                report.metricas['inclinacionGrados'], resample=Image.Resampling.BILINEAR,
+                expand=True, fillcolor=fill
+            )
+            report.correcciones.append(CODIGO_INCLINACION)
+        # La huella del request sigue siendo la de los bytes originales
+        image.info.update(info)
+        report.metricas['correccionMs'] = round((time.perf_counter() - start) * 1000, 1)
+
+    for codigo in report.codigos:
+        QUALITY_ISSUES.inc(codigo=codigo, accion='corregida' if codigo in report.correcciones else 'reportada')
+    return image, report
@@ -0,0 +1,120 @@
+"""
+Logging estructurado y no bloqueante para el servicio OCR
+
+Los registros se entregan a una cola y un hilo en segundo plano
+(QueueListener) los formatea y escribe. El hilo del request solo encola:
+no formatea mensajes ni escribe en stdout.
+
+Variables de entorno:
+- OCR_LOG_LEVEL: DEBUG, INFO (default), WARNING, ERROR
+- OCR_LOG_FORMAT: text (default) o json (una línea JSON por registro)
+- OCR_LOG_SAMPLE_RATE: fracción de requests (0.0 - 1.0) cuyo detalle
+  (respuesta cruda, estudiantes) se registra aunque el nivel no sea DEBUG
+"""
+
+import os
+import json
+import queue
+import random
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Atributos estándar de LogRecord (el resto son campos "extra" estructurados)
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler que no formatea en el hilo que emite el registro"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare() formatea el mensaje para que sea serializable;
+        # con una cola en memoria no hace falta y el formateo queda en el listener
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON con sus campos extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de texto con los campos extra como pares clave=valor"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s [%(threadName)s] %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extras = [
+            f"{key}={value}"
+            for key, value in vars(record).items()
+            if key not in _STANDARD_ATTRS and not key.startswith('_')
+        ]
+        return f"{text} {' '.join(extras)}" if extras else text
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None) -> QueueListener:
+    """
+    Configura el logging raíz con una cola y un listener en segundo plano
+
+    Es idempotente: llamadas posteriores devuelven el listener existente.
+
+    Args:
+        level: Nivel de logging (default: OCR_LOG_LEVEL o INFO)
+        log_format: 'text' o 'json' (default: OCR_LOG_FORMAT o text)
+
+    Returns:
+        QueueListener: Listener activo
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv('OCR_LOG_LEVEL', 'INFO')).upper()
+    log_format = (log_format or os.getenv('OCR_LOG_FORMAT', 'text')).lower()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def sample_request(rate: Optional[float] = None) -> bool:
+    """
+    Decide si un request se registra con detalle completo
+
+    Args:
+        rate: Fracción de muestreo (default: OCR_LOG_SAMPLE_RATE o 0)
+
+    Returns:
+        bool: True si el request fue muestreado
+    """
+    if rate is None:
+        rate = float(os.getenv('OCR_LOG_SAMPLE_RATE', '0') or 0)
+    return rate > 0 and random.random() < rate
@@ -4,17 +4,47 @@ Servicio Flask para procesamiento OCR con Gemini
 
 import os
 import sys
+import json
 import base64
+import logging
+import shutil
+import time
+import tempfile
+import threading
+import tracemalloc
 from datetime import datetime
-from flask import Flask, request, jsonify
+from typing import Any, Dict, Optional, Tuple
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from gemini_client import GeminiOCRClient
+from logging_setup import setup_logging
+from gemini_client import GeminiOCRClient, decode_base64_image
+from ocr_cache import OCRResultCache
+from ocr_jobs import OCRJobStore, OCRJobManager, job_to_response
+from ocr_batch import iter_batch_results, iter_document_results
+from ocr_document import open_document
+from rate_limiter import TokenBucketRateLimiter, RateLimitExceeded
+from upstream_guard import AdaptiveConcurrencyLimiter, CircuitBreaker, RetryPolicy, UpstreamUnavailable
+from image_preprocessing import get_preset
+from image_quality import ImageQualityError, QualityConfig
+from table_detection import TableDetectionConfig
+from model_cascade import CascadeConfig
+from ocr_tiling import TilingConfig
+from model_pool import ModelPool
+from context_cache import create_context_cache
+from response_archive import ResponseArchive
+from single_flight import SingleFlight
+from prompt_builder import validate_metadata
+from metrics import REGISTRY, REQUESTS_IN_FLIGHT, StageTimer
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Logging en segundo plano (antes de inicializar clientes)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Inicializar Flask
 app = Flask(__name__)
 CORS(app)  # Permitir CORS para requests desde Node.js
@@ -22,21 +52,263 @@ CORS(app)  # Permitir CORS para requests desde Node.js
 # Configuración
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-pro')
+GEMINI_FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', '')
+GEMINI_CASCADE_MIN_SCORE = float(os.getenv('GEMINI_CASCADE_MIN_SCORE', 0.9))
 FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', 30))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', 1_000_000))
+GEMINI_RATE_LIMIT_MAX_WAIT = float(os.getenv('GEMINI_RATE_LIMIT_MAX_WAIT', 120))
+GEMINI_MAX_ATTEMPTS = int(os.getenv('GEMINI_MAX_ATTEMPTS', 3))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', 2))
+GEMINI_CONCURRENCY_INITIAL = int(os.getenv('GEMINI_CONCURRENCY_INITIAL', 16))
+GEMINI_CONCURRENCY_MIN = int(os.getenv('GEMINI_CONCURRENCY_MIN', 1))
+GEMINI_CONCURRENCY_MAX = int(os.getenv('GEMINI_CONCURRENCY_MAX', 64))
+GEMINI_BREAKER_FAILURES = int(os.getenv('GEMINI_BREAKER_FAILURES', 5))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', 30))
+OCR_PREPROCESS_PRESET = os.getenv('OCR_PREPROCESS_PRESET', 'original')
+OCR_QUALITY_GATE = os.getenv('OCR_QUALITY_GATE', 'reportar').lower()
+OCR_QUALITY_MIN_SHARPNESS = float(os.getenv('OCR_QUALITY_MIN_SHARPNESS', 60))
+OCR_QUALITY_MIN_CONTRAST = int(os.getenv('OCR_QUALITY_MIN_CONTRAST', 60))
+OCR_QUALITY_MAX_SKEW = float(os.getenv('OCR_QUALITY_MAX_SKEW', 3))
+OCR_TABLE_DETECTION = os.getenv('OCR_TABLE_DETECTION', 'true').lower() == 'true'
+OCR_TABLE_CROP = os.getenv('OCR_TABLE_CROP', 'false').lower() == 'true'
+OCR_CONFIDENCE_THRESHOLD = int(os.getenv('OCR_CONFIDENCE_THRESHOLD', 70))
+OCR_TILE_BANDS = int(os.getenv('OCR_TILE_BANDS', 0))
+OCR_TILE_OVERLAP = float(os.getenv('OCR_TILE_OVERLAP', 0.15))
+OCR_TILE_HEADER_RATIO = float(os.getenv('OCR_TILE_HEADER_RATIO', 0.2))
+OCR_TILE_MIN_HEIGHT = int(os.getenv('OCR_TILE_MIN_HEIGHT', 0))
+OCR_OUTPUT_FORMAT = os.getenv('OCR_OUTPUT_FORMAT', 'objetos')
+OCR_CONTEXT_CACHE = os.getenv('OCR_CONTEXT_CACHE', 'off')
+OCR_CONTEXT_CACHE_TTL = int(os.getenv('OCR_CONTEXT_CACHE_TTL', 3600))
+OCR_UPLOAD_SPOOL_BYTES = int(os.getenv('OCR_UPLOAD_SPOOL_BYTES', 2 * 1024 * 1024))
+OCR_TRACE_MEMORY = os.getenv('OCR_TRACE_MEMORY', 'false').lower() == 'true'
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+OCR_CACHE_MAX_ITEMS = int(os.getenv('OCR_CACHE_MAX_ITEMS', 256))
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ocr_cache'))
+OCR_SINGLE_FLIGHT = os.getenv('OCR_SINGLE_FLIGHT', 'true').lower() == 'true'
+OCR_JOB_WORKERS = int(os.getenv('OCR_JOB_WORKERS', 4))
+OCR_JOB_MAX_QUEUE = int(os.getenv('OCR_JOB_MAX_QUEUE', 500))
+OCR_JOB_RETENTION_HOURS = float(os.getenv('OCR_JOB_RETENTION_HOURS', 72))
+OCR_JOB_LEASE_SECONDS = float(os.getenv('OCR_JOB_LEASE_SECONDS', 120))
+OCR_BATCH_CONCURRENCY = int(os.getenv('OCR_BATCH_CONCURRENCY', 4))
+OCR_BATCH_MAX_PAGES = int(os.getenv('OCR_BATCH_MAX_PAGES', 200))
+OCR_DOCUMENT_MAX_PAGES = int(os.getenv('OCR_DOCUMENT_MAX_PAGES', 1000))
+OCR_PDF_DPI = int(os.getenv('OCR_PDF_DPI', 200))
+OCR_ARCHIVE_ENABLED = os.getenv('OCR_ARCHIVE_ENABLED', 'false').lower() == 'true'
+OCR_ARCHIVE_DB = os.getenv('OCR_ARCHIVE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ocr_archive', 'respuestas.sqlite3'))
+OCR_WARMUP = os.getenv('OCR_WARMUP', 'background').lower()
+OCR_JOBS_DB = os.getenv('OCR_JOBS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ocr_jobs', 'ocr_jobs.sqlite3'))
+
+# Medición de memoria por request (solo asignaciones de Python: bodies,
+# strings base64, bytes decodificados; no incluye los buffers internos de PIL)
+if OCR_TRACE_MEMORY:
+    tracemalloc.start()
 
-# Inicializar cliente Gemini
+# Cliente Gemini y pool de trabajos: se crean en create_app o en el primer
+# request, una vez por proceso (cada worker de gunicorn/uvicorn inicializa
+# los suyos después del fork)
 gemini_client = None
+job_manager = None
+_services_lock = threading.Lock()
+_services_ready = False
+# Estado del warm-up (precarga del SDK de Gemini), reportado en /health
+warmup_status = {'estado': 'pendiente'}
 
-try:
-    if not GEMINI_API_KEY:
-        print("⚠️  WARNING: GEMINI_API_KEY no configurada. El servicio no funcionará.")
-        print("   Configure la API Key en el archivo .env")
+
+def init_services():
+    """
+    Inicializa el cliente Gemini (cache, rate limiter, pool de modelos) y el
+    pool de trabajos del proceso actual. Llamadas repetidas no hacen nada.
+    """
+    global gemini_client, job_manager, _services_ready
+    
+    with _services_lock:
+        if _services_ready:
+            return
+        _services_ready = True
+        
+        try:
+            if not GEMINI_API_KEY:
+                logger.warning("GEMINI_API_KEY no configurada. El servicio no funcionará. Configure la API Key en el archivo .env")
+            else:
+                ocr_cache = None
+                if OCR_CACHE_ENABLED:
+                    ocr_cache = OCRResultCache(max_items=OCR_CACHE_MAX_ITEMS, cache_dir=OCR_CACHE_DIR or None)
+                    logger.info(
+                        "Cache OCR habilitado (memoria: %d entradas, disco: %s)",
+                        OCR_CACHE_MAX_ITEMS, OCR_CACHE_DIR or 'deshabilitado'
+                    )
+                rate_limiter = TokenBucketRateLimiter(GEMINI_RPM, GEMINI_TPM)
+                model_pool = ModelPool()
+                context_cache = create_context_cache(OCR_CONTEXT_CACHE, model_pool, ttl_seconds=OCR_CONTEXT_CACHE_TTL)
+                response_archive = ResponseArchive(OCR_ARCHIVE_DB) if OCR_ARCHIVE_ENABLED else None
+                gemini_client = GeminiOCRClient(
+                    GEMINI_API_KEY,
+                    GEMINI_MODEL,
+                    cache=ocr_cache,
+                    rate_limiter=rate_limiter,
+                    rate_limit_max_wait=GEMINI_RATE_LIMIT_MAX_WAIT,
+                    model_pool=model_pool,
+                    preprocess=get_preset(OCR_PREPROCESS_PRESET),
+                    tiling=TilingConfig(
+                        bands=OCR_TILE_BANDS,
+                        overlap=OCR_TILE_OVERLAP,
+                        header_ratio=OCR_TILE_HEADER_RATIO,
+                        min_height=OCR_TILE_MIN_HEIGHT,
+                    ),
+                    context_cache=context_cache,
+                    output_format=OCR_OUTPUT_FORMAT,
+                    archive=response_archive,
+                    retry_policy=RetryPolicy(max_attempts=GEMINI_MAX_ATTEMPTS, base_delay=GEMINI_RETRY_BASE_DELAY),
+                    concurrency=AdaptiveConcurrencyLimiter(
+                        initial_limit=GEMINI_CONCURRENCY_INITIAL,
+                        min_limit=GEMINI_CONCURRENCY_MIN,
+                        max_limit=GEMINI_CONCURRENCY_MAX,
+                    ),
+                    breaker=CircuitBreaker(
+                        failure_threshold=GEMINI_BREAKER_FAILURES,
+                        reset_timeout=GEMINI_BREAKER_RESET_SECONDS,
+                    ),
+                    single_flight=SingleFlight() if OCR_SINGLE_FLIGHT else None,
+                    quality=QualityConfig(
+                        mode=OCR_QUALITY_GATE,
+                        min_sharpness=OCR_QUALITY_MIN_SHARPNESS,
+                        min_contrast=OCR_QUALITY_MIN_CONTRAST,
+                        max_skew_degrees=OCR_QUALITY_MAX_SKEW,
+                    ) if OCR_QUALITY_GATE != 'off' else None,
+                    table_detection=TableDetectionConfig(crop=OCR_TABLE_CROP) if OCR_TABLE_DETECTION else None,
+                    cascade=CascadeConfig(
+                        fast_model=GEMINI_FAST_MODEL,
+                        min_score=GEMINI_CASCADE_MIN_SCORE,
+                    ) if GEMINI_FAST_MODEL else None,
+                    confidence_threshold=OCR_CONFIDENCE_THRESHOLD,
+                )
+                logger.info("Preprocesamiento de imágenes: %s", OCR_PREPROCESS_PRESET)
+                logger.info("Control de calidad de imagen: %s", OCR_QUALITY_GATE)
+                if OCR_TABLE_DETECTION:
+                    logger.info("Detección de tabla: filas esperadas en el prompt%s", ", recorte a la tabla" if OCR_TABLE_CROP else "")
+                logger.info("Formato de salida del modelo: %s", OCR_OUTPUT_FORMAT)
+                if GEMINI_FAST_MODEL:
+                    logger.info(
+                        "Cascada de modelos: %s → %s (puntaje mínimo %.2f)",
+                        GEMINI_FAST_MODEL, GEMINI_MODEL, GEMINI_CASCADE_MIN_SCORE
+                    )
+                if OCR_TILE_BANDS > 1:
+                    logger.info("Modo franjas: %d franjas (solapamiento %.0f%%)", OCR_TILE_BANDS, OCR_TILE_OVERLAP * 100)
+                if context_cache is not None:
+                    logger.info("Cache de contexto del prompt: %s (TTL %ds)", OCR_CONTEXT_CACHE, OCR_CONTEXT_CACHE_TTL)
+                if response_archive is not None:
+                    logger.info("Archivo de respuestas crudas: %s", OCR_ARCHIVE_DB)
+                if OCR_SINGLE_FLIGHT:
+                    logger.info("Single-flight: requests idénticos en curso comparten una llamada a Gemini")
+                logger.info("Rate limiter: %d RPM, %d TPM", GEMINI_RPM, GEMINI_TPM)
+                logger.info(
+                    "Llamadas a Gemini: %d intentos, concurrencia adaptativa %d-%d, circuito abre tras %d errores",
+                    GEMINI_MAX_ATTEMPTS, GEMINI_CONCURRENCY_MIN, GEMINI_CONCURRENCY_MAX, GEMINI_BREAKER_FAILURES
+                )
+                logger.info("Cliente Gemini inicializado")
+
+                job_store = OCRJobStore(OCR_JOBS_DB)
+                purgados = job_store.purge_finished(OCR_JOB_RETENTION_HOURS * 3600)
+                job_manager = OCRJobManager(
+                    gemini_client,
+                    job_store,
+                    max_workers=OCR_JOB_WORKERS,
+                    max_queue=OCR_JOB_MAX_QUEUE,
+                    lease_seconds=OCR_JOB_LEASE_SECONDS,
+                )
+                reanudados = job_manager.start()
+                logger.info(
+                    "Pool de trabajos OCR: %d workers (%d reanudados, %d purgados)",
+                    OCR_JOB_WORKERS, reanudados, purgados
+                )
+        except Exception as e:
+            logger.error("Error al inicializar Gemini: %s. El servicio estará disponible pero retornará errores.", e)
+
+
+def create_app() -> Flask:
+    """
+    Fábrica de la app para servidores de producción
+    
+    WSGI (un hilo por request en curso):
+        gunicorn -w 2 -k gthread --threads 32 -b 0.0.0.0:5000 'main:create_app()'
+    Con 'main:app' (o flask run) los servicios se inicializan en el primer
+    request, que paga ese costo.
+    ASGI (/api/ocr/process asíncrono, ver asgi.py):
+        uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+    
+    Los workers comparten la base de trabajos (OCR_JOBS_DB): cada trabajo
+    lo toma un solo proceso y solo se reencolan los de procesos caídos.
+    
+    Returns:
+        Flask: La app, con los servicios del proceso inicializados
+    """
+    init_services()
+    start_warmup()
+    return app
+
+
+def start_warmup():
+    """
+    Precarga el SDK de Gemini y los handles del modelo según OCR_WARMUP
+    
+    - background: en un hilo; el puerto abre y /health responde sin esperar
+    - sync: antes de servir (el arranque tarda lo que tarda el import del SDK)
+    - off: el primer request de OCR paga la carga
+    """
+    if gemini_client is None or OCR_WARMUP == 'off':
+        return
+    with _services_lock:
+        if warmup_status['estado'] != 'pendiente':
+            return
+        warmup_status['estado'] = 'en_curso'
+    
+    def run():
+        start = time.perf_counter()
+        try:
+            pasos = gemini_client.warm_up()
+            warmup_status.update(estado='listo', pasosMs={k: round(v, 1) for k, v in pasos.items()})
+        except Exception as e:
+            logger.warning("Warm-up fallido (se cargará en el primer request): %s", e)
+            warmup_status.update(estado='error', error=str(e))
+        warmup_status['tiempoMs'] = round((time.perf_counter() - start) * 1000, 1)
+    
+    if OCR_WARMUP == 'sync':
+        run()
     else:
-        gemini_client = GeminiOCRClient(GEMINI_API_KEY, GEMINI_MODEL)
-        print("✓ Cliente Gemini inicializado")
-except Exception as e:
-    print(f"❌ Error al inicializar Gemini: {e}")
-    print("   El servicio estará disponible pero retornará errores.")
+        threading.Thread(target=run, name='ocr-warmup', daemon=True).start()
+
+
+@app.before_request
+def track_request_start():
+    # main:app sin create_app (flask run, gunicorn main:app): inicializar
+    # en el primer request, como asgi.app
+    if not _services_ready:
+        init_services()
+        start_warmup()
+    # Gauge de requests en curso; teardown_request lo decrementa incluso en
+    # respuestas en streaming (se ejecuta al terminar de enviar el body)
+    g.metrics_endpoint = request.endpoint or 'desconocido'
+    REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+
+@app.teardown_request
+def track_request_end(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Métricas en formato de texto de Prometheus
+    
+    Incluye histogramas por etapa del pipeline (ocr_stage_duration_seconds),
+    finish_reason, respuestas bloqueadas, fallas de parseo, tokens y
+    requests en curso.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.route('/health', methods=['GET'])
@@ -60,6 +332,37 @@ def health():
             status['gemini_healthy'] = False
             status['gemini_error'] = str(e)
     
+    if gemini_client:
+        status['rate_limiter'] = gemini_client.rate_limiter.stats()
+        status['concurrency'] = gemini_client.concurrency.stats()
+        status['circuit_breaker'] = gemini_client.breaker.stats()
+        status['warmup'] = dict(warmup_status)
+    
+    if job_manager:
+        status['jobs'] = job_manager.stats()
+    
+    if gemini_client and gemini_client.context_cache is not None:
+        status['context_cache'] = gemini_client.context_cache.stats()
+    
+    if gemini_client and gemini_client.cascade is not None:
+        status['cascade'] = gemini_client.cascade.stats()
+        status['upstream_por_modelo'] = gemini_client.upstream_stats()
+    
+    if gemini_client and gemini_client.single_flight is not None:
+        status['single_flight'] = gemini_client.single_flight.stats()
+    
+    if gemini_client and gemini_client.archive is not None:
+        try:
+            status['archive'] = gemini_client.archive.stats()
+        except Exception as e:
+            status['archive'] = {'error': str(e)}
+    
+    if gemini_client and gemini_client.cache is not None:
+        try:
+            status['cache'] = gemini_client.cache.stats()
+        except Exception as e:
+            status['cache'] = {'error': str(e)}
+    
     # Devolver 200 si está configurado, aunque health check falle
     # El health check puede fallar pero el procesamiento real funcionar
     status_code = 200 if gemini_client is not None else 503
@@ -92,8 +395,7 @@ def test_image():
         # Prompt SUPER simple
         simple_prompt = "Describe qué ves en esta imagen. ¿Es un documento? ¿Qué tipo? ¿Puedes leer algún texto?"
         
-        print(f"\n🧪 TEST SIMPLE DE IMAGEN")
-        print(f"Enviando imagen a Gemini con prompt simple...")
+        logger.info("Test simple de imagen: enviando a Gemini con prompt simple")
         
         response = gemini_client.model.generate_content([image, simple_prompt])
         
@@ -105,23 +407,161 @@ def test_image():
         }), 200
         
     except Exception as e:
-        print(f"❌ Error en test: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en test de imagen: %s", e)
         return jsonify({
             'success': False,
             'error': str(e),
         }), 500
 
 
+def _read_binary_upload():
+    """
+    Lee una imagen enviada como multipart/form-data o application/octet-stream
+    
+    - multipart/form-data: archivo en el campo "image"; "metadata" (JSON),
+      "use_cache", "preprocess" y "bands" como campos del formulario
+    - application/octet-stream: el body es la imagen; "metadata" (JSON) en el
+      header X-OCR-Metadata o en el query string, junto con use_cache, preprocess y bands
+    
+    Returns:
+        (archivo, opciones, ruta, spool): el archivo queda abierto; si spool no
+        es None, el llamador debe cerrarlo al terminar
+    
+    Raises:
+        ValueError: Si falta la imagen o la metadata no es JSON válido
+    """
+    spool = None
+    
+    if request.mimetype == 'multipart/form-data':
+        # Werkzeug ya guarda los archivos grandes en un temporal en disco
+        upload = request.files.get('image')
+        if upload is None:
+            raise ValueError('Se requiere el archivo "image" en el formulario')
+        fields = request.form
+        metadata_raw = fields.get('metadata')
+        file_obj = upload.stream
+        ruta = 'multipart'
+    else:
+        # Copiar el body por bloques a un temporal (memoria hasta OCR_UPLOAD_SPOOL_BYTES, luego disco)
+        spool = tempfile.SpooledTemporaryFile(max_size=OCR_UPLOAD_SPOOL_BYTES)
+        shutil.copyfileobj(request.stream, spool, 1024 * 1024)
+        if spool.tell() == 0:
+            spool.close()
+            raise ValueError('Request body vacío')
+        fields = request.args
+        metadata_raw = request.headers.get('X-OCR-Metadata') or fields.get('metadata')
+        file_obj = spool
+        ruta = 'octet-stream'
+    
+    try:
+        options = upload_options(fields, metadata_raw)
+    except ValueError:
+        if spool is not None:
+            spool.close()
+        raise
+    return file_obj, options, ruta, spool
+
+
+def upload_options(fields, metadata_raw: Optional[str]) -> Dict[str, Any]:
+    """
+    Opciones de un upload binario a partir de sus campos (formulario o query string)
+    
+    Raises:
+        ValueError: Si la metadata no es JSON válido
+    """
+    try:
+        metadata = json.loads(metadata_raw) if metadata_raw else None
+    except json.JSONDecodeError as e:
+        raise ValueError(f'metadata no es JSON válido: {e}')
+    
+    return {
+        'metadata': metadata,
+        'use_cache': str(fields.get('use_cache', 'true')).lower() != 'false',
+        'preprocess': fields.get('preprocess'),
+        'bands': fields.get('bands'),
+    }
+
+
+class OCRRequestError(Exception):
+    """Request de OCR inválido (se responde con status_code sin procesar)"""
+    
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _load_ocr_request(timer: StageTimer):
+    """
+    Lee el request de OCR (JSON, multipart u octet-stream) y carga la imagen
+    
+    Returns:
+        (opciones, imagen, ruta, spool): si spool no es None, el llamador
+        debe cerrarlo cuando termine de procesar la imagen
+    
+    Raises:
+        OCRRequestError: Si falta el body, la metadata o la imagen
+        ValueError: Si el upload binario es inválido
+    """
+    spool = None
+    try:
+        # Parsear request
+        with timer.stage('parseo_body'):
+            if request.mimetype in ('multipart/form-data', 'application/octet-stream'):
+                file_obj, data, ruta, spool = _read_binary_upload()
+            else:
+                data = request.get_json()
+                file_obj = None
+                ruta = 'json'
+        
+        if not data:
+            raise OCRRequestError('Request body vacío')
+        
+        if not data.get('metadata'):
+            raise OCRRequestError('Metadata requerida')
+        
+        # Cargar imagen
+        if file_obj is not None:
+            # Imagen binaria: PIL lee directamente del archivo temporal
+            with timer.stage('apertura_imagen'):
+                image = gemini_client.load_image_from_file(file_obj)
+        elif 'image_base64' in data:
+            # Imagen como base64
+            image = gemini_client.load_image_from_base64(data['image_base64'], timer=timer)
+        elif 'image_path' in data:
+            # Imagen como ruta
+            image_path = data['image_path']
+            if not os.path.exists(image_path):
+                raise OCRRequestError(f'Imagen no encontrada: {image_path}', 404)
+            with timer.stage('apertura_imagen'):
+                image = gemini_client.load_and_prepare_image(image_path)
+        else:
+            raise OCRRequestError('Imagen requerida (image_base64 o image_path)')
+        
+        return data, image, ruta, spool
+    except Exception:
+        if spool is not None:
+            spool.close()
+        raise
+
+
 @app.route('/api/ocr/process', methods=['POST'])
 def process_ocr():
     """
     Procesa un acta con OCR
     
+    Acepta tres formatos de request:
+    - application/json con image_base64 o image_path (compatibilidad)
+    - multipart/form-data con el archivo "image" y el campo "metadata" (JSON)
+    - application/octet-stream con la imagen como body y la metadata en el
+      header X-OCR-Metadata (JSON) o en ?metadata=
+    Los formatos binarios evitan el 33% extra de base64 y las copias en memoria.
+    
     Request Body (JSON):
     {
         "image_base64": "...",  // o "image_path": "/path/to/image.jpg"
+        "use_cache": true,      // opcional, false fuerza un nuevo procesamiento
+        "preprocess": "balanceado",  // opcional: original, calidad, balanceado, compacto
+        "bands": 3,             // opcional: OCR por franjas en paralelo (0 = acta completa)
         "metadata": {
             "anio_lectivo": 1995,
             "grado": "Quinto Grado",
@@ -143,10 +583,18 @@ def process_ocr():
             "totalEstudiantes": 30,
             "estudiantes": [...],
             "metadataActa": {...},
-            "confianza": 95,
+            "confianza": 88,  // 0-100, calculada de la consistencia (ocr_consistency)
+            "confianzaEstudiantes": [100, 100, 60, ...],
+            "revisionSugerida": {"umbral": 70, "reprocesarActa": false, "estudiantes": [{"numero": 3, "confianza": 60, "problemas": ["situacion_final", "desaprobadas"]}]},
             "advertencias": [],
-            "procesadoCon": "gemini-2.5-pro",
-            "tiempoProcesamientoMs": 8500
+            "procesadoCon": "gemini-2.5-pro",  // o GEMINI_FAST_MODEL si la cascada aceptó su resultado
+            "cascada": {"nivel": "rapido", "escalada": false, "consistencia": {"puntaje": 1.0, ...}},  // con GEMINI_FAST_MODEL
+            "tiempoProcesamientoMs": 8500,
+            "cache": {"hit": false, "nivel": null, "clave": "..."},
+            "memoria": {"ruta": "multipart", "picoBytes": 2100000},  // con OCR_TRACE_MEMORY=true
+            "preprocesamiento": {"preset": "balanceado", "bytesAntes": 9800000, "bytesDespues": 610000, ...},
+            "etapasMs": {"parseo_body": 12.4, "decodificacion_base64": 8.1, ..., "llamada_modelo": 8420.5},
+            "bandas": [{"indice": 0, "filasPx": [700, 1450], "estudiantes": 14, "tiempoMs": 3100}, ...]  // con bands > 1
         }
     }
     """
@@ -156,74 +604,599 @@ def process_ocr():
             'error': 'Servicio OCR no disponible. API Key no configurada.',
         }), 503
     
+    spool = None
+    memory_baseline = None
+    if OCR_TRACE_MEMORY:
+        tracemalloc.reset_peak()
+        memory_baseline = tracemalloc.get_traced_memory()[0]
+    
+    timer = StageTimer()
+    
     try:
-        # Parsear request
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'Request body vacío',
-            }), 400
-        
-        metadata = data.get('metadata')
-        if not metadata:
-            return jsonify({
-                'success': False,
-                'error': 'Metadata requerida',
-            }), 400
-        
-        # Cargar imagen
-        image = None
-        
-        if 'image_base64' in data:
-            # Imagen como base64
-            image_base64 = data['image_base64']
-            image = gemini_client.load_image_from_base64(image_base64)
-        elif 'image_path' in data:
-            # Imagen como ruta
-            image_path = data['image_path']
-            if not os.path.exists(image_path):
-                return jsonify({
-                    'success': False,
-                    'error': f'Imagen no encontrada: {image_path}',
-                }), 404
-            image = gemini_client.load_and_prepare_image(image_path)
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Imagen requerida (image_base64 o image_path)',
-            }), 400
+        data, image, ruta, spool = _load_ocr_request(timer)
         
         # Procesar con Gemini
-        resultado = gemini_client.process_acta(image, metadata)
+        resultado = gemini_client.process_acta(
+            image,
+            data['metadata'],
+            use_cache=bool(data.get('use_cache', True)),
+            preprocess=data.get('preprocess'),
+            timer=timer,
+            bands=data.get('bands'),
+        )
+        
+        if memory_baseline is not None:
+            resultado['memoria'] = {
+                'ruta': ruta,
+                'picoBytes': tracemalloc.get_traced_memory()[1] - memory_baseline,
+            }
         
         return jsonify({
             'success': True,
             'data': resultado,
         }), 200
     
-    except ValueError as e:
+    except Exception as e:
+        body, status_code, headers = ocr_error_response(e)
+        return jsonify(body), status_code, headers
+    
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+def ocr_error_response(error: Exception) -> Tuple[Dict[str, Any], int, Dict[str, str]]:
+    """
+    Respuesta de error de /api/ocr/process (compartida con la ruta ASGI)
+    
+    Returns:
+        (body, status_code, headers)
+    """
+    if isinstance(error, OCRRequestError):
+        return {'success': False, 'error': str(error)}, error.status_code, {}
+    
+    if isinstance(error, ImageQualityError):
+        # Página en blanco o borrosa: no se llamó a Gemini
+        return {'success': False, 'error': str(error), 'calidadImagen': error.report.as_dict()}, 422, {}
+    
+    if isinstance(error, ValueError):
         # Error de validación
+        return {'success': False, 'error': f'Error de validación: {str(error)}'}, 400, {}
+    
+    if isinstance(error, UpstreamUnavailable):
+        # Gemini caído o sobrecargado (circuito abierto o reintentos agotados)
+        return {
+            'success': False,
+            'error': str(error),
+            'retryAfterSeconds': round(error.retry_after, 1),
+        }, 503, {'Retry-After': str(int(error.retry_after) + 1)}
+    
+    if isinstance(error, RateLimitExceeded):
+        # Cuota de Gemini agotada: el cliente puede reintentar luego
+        return {
+            'success': False,
+            'error': str(error),
+            'retryAfterSeconds': round(error.retry_after, 1),
+        }, 429, {'Retry-After': str(int(error.retry_after) + 1)}
+    
+    if isinstance(error, RuntimeError):
+        # Error de procesamiento
+        return {'success': False, 'error': f'Error de procesamiento: {str(error)}'}, 500, {}
+    
+    # Error inesperado
+    logger.exception("Error inesperado: %s", error)
+    return {'success': False, 'error': f'Error interno del servidor: {str(error)}'}, 500, {}
+
+
+def _sse(event: str, data) -> str:
+    """Formatea un evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/ocr/process/stream', methods=['POST'])
+def process_ocr_stream():
+    """
+    Procesa un acta con OCR y entrega los estudiantes a medida que Gemini
+    los genera (server-sent events)
+    
+    Acepta los mismos formatos y campos que /api/ocr/process. Los errores
+    del request (metadata, imagen) responden JSON con 4xx antes de iniciar
+    el stream; los errores de procesamiento llegan como evento "error".
+    
+    Eventos (text/event-stream):
+    event: estudiante
+    data: {"indice": 0, "estudiante": {"numero": 1, "nombreCompleto": "...", ...}}
+    
+    event: resultado
+    data: {"success": true, "data": {...}}   // idéntico a /api/ocr/process
+    
+    event: error
+    data: {"success": false, "error": "...", "status": 500}
+    """
+    if not gemini_client:
+        return jsonify({
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        }), 503
+    
+    timer = StageTimer()
+    
+    try:
+        data, image, ruta, spool = _load_ocr_request(timer)
+    except OCRRequestError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+        }), e.status_code
+    except (ValueError, RuntimeError) as e:
         return jsonify({
             'success': False,
             'error': f'Error de validación: {str(e)}',
         }), 400
     
-    except RuntimeError as e:
-        # Error de procesamiento
+    # Validar metadata antes de abrir el stream para responder el error con 400
+    is_valid, error_msg = validate_metadata(data['metadata'])
+    if not is_valid:
+        if spool is not None:
+            spool.close()
         return jsonify({
             'success': False,
-            'error': f'Error de procesamiento: {str(e)}',
-        }), 500
+            'error': f'Error de validación: Metadata inválida: {error_msg}',
+        }), 400
     
+    # Decodificar la imagen antes de abrir el stream: el upload temporal se
+    # puede cerrar aunque el cliente se desconecte con el hilo aún en curso
+    try:
+        with timer.stage('carga_imagen'):
+            image.load()
     except Exception as e:
-        # Error inesperado
-        print(f"❌ Error inesperado: {e}")
         return jsonify({
             'success': False,
-            'error': f'Error interno del servidor: {str(e)}',
-        }), 500
+            'error': f'Error de validación: imagen inválida: {str(e)}',
+        }), 400
+    finally:
+        if spool is not None:
+            spool.close()
+    
+    events = gemini_client.process_acta_stream(
+        image,
+        data['metadata'],
+        use_cache=bool(data.get('use_cache', True)),
+        preprocess=data.get('preprocess'),
+        timer=timer,
+        bands=data.get('bands'),
+    )
+    
+    def generate():
+        try:
+            for item in events:
+                if item['tipo'] == 'estudiante':
+                    yield _sse('estudiante', {'indice': item['indice'], 'estudiante': item['data']})
+                else:
+                    yield _sse('resultado', {'success': True, 'data': item['data']})
+        except ImageQualityError as e:
+            yield _sse('error', {'success': False, 'error': str(e), 'calidadImagen': e.report.as_dict(), 'status': 422})
+        except ValueError as e:
+            yield _sse('error', {'success': False, 'error': f'Error de validación: {str(e)}', 'status': 400})
+        except RateLimitExceeded as e:
+            yield _sse('error', {
+                'success': False,
+                'error': str(e),
+                'retryAfterSeconds': round(e.retry_after, 1),
+                'status': 503 if isinstance(e, UpstreamUnavailable) else 429,
+            })
+        except RuntimeError as e:
+            yield _sse('error', {'success': False, 'error': f'Error de procesamiento: {str(e)}', 'status': 500})
+        except Exception as e:
+            logger.exception("Error inesperado en stream: %s", e)
+            yield _sse('error', {'success': False, 'error': f'Error interno del servidor: {str(e)}', 'status': 500})
+        finally:
+            events.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/ocr/process-batch', methods=['POST'])
+def process_ocr_batch():
+    """
+    Procesa varias páginas (libro de actas) en paralelo
+    
+    Request Body (JSON):
+    {
+        "pages": [
+            {"pagina": 1, "image_base64": "...", "metadata": {...}},
+            {"pagina": 2, "image_path": "/path/pag2.jpg", "metadata": {...}},
+            ...
+        ],
+        "stream": true   // opcional (default true)
+    }
+    
+    Response con stream=true (application/x-ndjson), una línea por página
+    en orden de finalización y un resumen al final:
+    {"tipo": "pagina", "indice": 1, "pagina": 2, "success": true, "data": {...}, "tiempoMs": 8100}
+    {"tipo": "pagina", "indice": 0, "pagina": 1, "success": false, "error": "...", "tiempoMs": 9400}
+    {"tipo": "resumen", "totalPaginas": 2, "exitosas": 1, "fallidas": 1, "tiempoTotalMs": 9400}
+    
+    Con stream=false responde un único JSON con las páginas en orden original.
+    """
+    if not gemini_client:
+        return jsonify({
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        }), 503
+    
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('pages'), list) or len(data['pages']) == 0:
+        return jsonify({
+            'success': False,
+            'error': 'Se requiere una lista no vacía de páginas (pages)',
+        }), 400
+    
+    pages = data['pages']
+    if len(pages) > OCR_BATCH_MAX_PAGES:
+        return jsonify({
+            'success': False,
+            'error': f'Máximo {OCR_BATCH_MAX_PAGES} páginas por lote (recibidas: {len(pages)})',
+        }), 400
+    
+    if not all(isinstance(page, dict) for page in pages):
+        return jsonify({
+            'success': False,
+            'error': 'Cada página debe ser un objeto',
+        }), 400
+    
+    results = iter_batch_results(gemini_client, pages, max_concurrency=OCR_BATCH_CONCURRENCY)
+    return _batch_response(results, bool(data.get('stream', True)))
+
+
+def _batch_response(results, stream: bool, cleanup=None):
+    """
+    Respuesta de un lote: NDJSON por página en orden de finalización, o con
+    stream=false un único JSON con las páginas en orden original
+    
+    Args:
+        results: Iterador de iter_batch_results / iter_document_results
+        cleanup: Se llama al terminar la respuesta (también si el cliente se desconecta)
+    """
+    if not stream:
+        paginas = []
+        resumen = None
+        try:
+            for item in results:
+                if item['tipo'] == 'resumen':
+                    resumen = item
+                else:
+                    paginas.append(item)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        paginas.sort(key=lambda item: item['indice'])
+        return jsonify({
+            'success': resumen['fallidas'] == 0,
+            'data': {'paginas': paginas, 'resumen': resumen},
+        }), 200
+    
+    def generate():
+        for item in results:
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'},
+    )
+    if cleanup is not None:
+        response.call_on_close(cleanup)
+    return response
+
+
+def _save_document_upload():
+    """
+    Guarda un documento subido en un temporal en disco
+    
+    - multipart/form-data: archivo en el campo "document"
+    - application/octet-stream: el body es el documento; "metadata" (JSON)
+      en el header X-OCR-Metadata o en el query string
+    
+    Las páginas se abren de a una desde el archivo, por eso se copia a
+    disco por bloques (nunca completo en memoria).
+    
+    Returns:
+        (ruta, campos, metadata_raw): el llamador debe borrar la ruta al terminar
+    
+    Raises:
+        ValueError: Si falta el documento
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('document')
+        if upload is None:
+            raise ValueError('Se requiere el archivo "document" en el formulario')
+        source = upload.stream
+        fields = request.form
+        metadata_raw = fields.get('metadata')
+    else:
+        source = request.stream
+        fields = request.args
+        metadata_raw = request.headers.get('X-OCR-Metadata') or fields.get('metadata')
+    
+    temp = tempfile.NamedTemporaryFile(prefix='ocr-documento-', delete=False)
+    try:
+        with temp:
+            shutil.copyfileobj(source, temp, 1024 * 1024)
+            size = temp.tell()
+        if size == 0:
+            raise ValueError('Request body vacío')
+    except Exception:
+        os.unlink(temp.name)
+        raise
+    return temp.name, fields, metadata_raw
+
+
+def _document_options(fields, metadata_raw: Optional[str]) -> Dict[str, Any]:
+    """Opciones de /api/ocr/process-document enviadas como campos de un upload"""
+    data = upload_options(fields, metadata_raw)
+    try:
+        data['metadata_paginas'] = json.loads(fields['metadata_paginas']) if fields.get('metadata_paginas') else None
+    except json.JSONDecodeError as e:
+        raise ValueError(f'metadata_paginas no es JSON válido: {e}')
+    paginas = fields.get('paginas')
+    data['paginas'] = [int(p) for p in paginas.split(',') if p.strip()] if paginas else None
+    data['stream'] = str(fields.get('stream', 'true')).lower() != 'false'
+    return data
+
+
+@app.route('/api/ocr/process-document', methods=['POST'])
+def process_ocr_document():
+    """
+    Procesa un libro enviado como un único documento multipágina (TIFF o PDF)
+    
+    Las páginas se decodifican de a una a medida que se procesan, con la
+    misma concurrencia que /api/ocr/process-batch.
+    
+    Request:
+    - JSON: {"document_path": "/ruta/libro.tif", "metadata": {...},
+             "metadata_paginas": {"3": {"seccion": "B"}}, "paginas": [1, 2, 3], "stream": true}
+    - multipart/form-data: archivo en el campo "document"; metadata,
+      metadata_paginas, paginas ("1,2,3"), use_cache, preprocess, bands y
+      stream como campos del formulario
+    - application/octet-stream: el body es el documento; metadata en el
+      header X-OCR-Metadata y el resto en el query string
+    
+    metadata es común a todas las páginas; metadata_paginas reemplaza
+    campos por número de página (ej: otra sección u otras áreas).
+    
+    Response: igual que /api/ocr/process-batch, con "pagina" = número de
+    página en el documento y "formato" (tiff, pdf...) en el resumen.
+    """
+    if not gemini_client:
+        return jsonify({
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        }), 503
+    
+    temp_path = None
+    document = None
+    
+    def cleanup():
+        if document is not None:
+            document.close()
+        if temp_path is not None:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+    
+    try:
+        if request.mimetype in ('multipart/form-data', 'application/octet-stream'):
+            temp_path, fields, metadata_raw = _save_document_upload()
+            data = _document_options(fields, metadata_raw)
+            path = temp_path
+        else:
+            data = request.get_json(silent=True) or {}
+            path = data.get('document_path')
+            if not path:
+                raise OCRRequestError('Documento requerido (document_path, multipart "document" u octet-stream)')
+            if not os.path.exists(path):
+                raise OCRRequestError(f'Documento no encontrado: {path}', 404)
+        
+        if not data.get('metadata'):
+            raise OCRRequestError('Metadata requerida')
+        
+        document = open_document(path, pdf_dpi=OCR_PDF_DPI)
+        paginas = [int(p) for p in data.get('paginas') or range(1, document.page_count + 1)]
+        fuera_de_rango = [p for p in paginas if not 1 <= p <= document.page_count]
+        if fuera_de_rango:
+            raise OCRRequestError(
+                f'Páginas fuera de rango: {fuera_de_rango} (el documento tiene {document.page_count})'
+            )
+        if len(paginas) > OCR_DOCUMENT_MAX_PAGES:
+            raise OCRRequestError(f'Máximo {OCR_DOCUMENT_MAX_PAGES} páginas por documento (recibidas: {len(paginas)})')
+        page_metadata = {int(k): v for k, v in (data.get('metadata_paginas') or {}).items()}
+    except OCRRequestError as e:
+        cleanup()
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except (ValueError, TypeError) as e:
+        # DocumentError, JSON o números de página inválidos
+        cleanup()
+        return jsonify({'success': False, 'error': f'Error de validación: {str(e)}'}), 400
+    
+    logger.info("Documento recibido: %s, %d página(s) a procesar", document.formato, len(paginas))
+    results = iter_document_results(
+        gemini_client,
+        document,
+        data['metadata'],
+        page_metadata=page_metadata,
+        paginas=paginas,
+        options={k: data[k] for k in ('use_cache', 'preprocess', 'bands') if data.get(k) is not None},
+        max_concurrency=OCR_BATCH_CONCURRENCY,
+    )
+    return _batch_response(results, data.get('stream', True) is not False, cleanup)
+
+
+@app.route('/api/ocr/jobs', methods=['POST'])
+def create_ocr_job():
+    """
+    Encola un acta para procesamiento OCR asíncrono
+    
+    Request Body (JSON): igual que /api/ocr/process (incluidos preprocess y
+    bands), más opcionalmente
+    {
+        "callback_url": "http://backend:3000/api/ocr/callback"
+    }
+    
+    Response (202):
+    {
+        "success": true,
+        "data": {"jobId": "...", "estado": "en_cola", "url": "/api/ocr/jobs/<id>"}
+    }
+    """
+    if not gemini_client or not job_manager:
+        return jsonify({
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        }), 503
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': 'Request body vacío',
+        }), 400
+    
+    metadata = data.get('metadata')
+    if not metadata:
+        return jsonify({
+            'success': False,
+            'error': 'Metadata requerida',
+        }), 400
+    
+    # Validar metadata antes de encolar para responder el error de inmediato
+    is_valid, error_msg = validate_metadata(metadata)
+    if not is_valid:
+        return jsonify({
+            'success': False,
+            'error': f'Error de validación: Metadata inválida: {error_msg}',
+        }), 400
+    
+    # Mismas opciones que /api/ocr/process, validadas antes de encolar
+    options = {k: data[k] for k in ('preprocess', 'bands') if data.get(k) is not None}
+    try:
+        get_preset(options.get('preprocess'))
+        if 'bands' in options and int(options['bands']) < 0:
+            raise ValueError(f"Número de franjas inválido: {options['bands']}")
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            'success': False,
+            'error': f'Error de validación: {str(e)}',
+        }), 400
+    
+    image_bytes = None
+    image_path = None
+    
+    if 'image_base64' in data:
+        try:
+            image_bytes = decode_base64_image(data['image_base64'])
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'image_base64 inválido: {str(e)}',
+            }), 400
+    elif 'image_path' in data:
+        image_path = data['image_path']
+        if not os.path.exists(image_path):
+            return jsonify({
+                'success': False,
+                'error': f'Imagen no encontrada: {image_path}',
+            }), 404
+    else:
+        return jsonify({
+            'success': False,
+            'error': 'Imagen requerida (image_base64 o image_path)',
+        }), 400
+    
+    if job_manager.is_full():
+        return jsonify({
+            'success': False,
+            'error': 'Cola de trabajos OCR llena. Intente más tarde.',
+        }), 429
+    
+    job_id = job_manager.submit(
+        metadata,
+        image_bytes=image_bytes,
+        image_path=image_path,
+        use_cache=bool(data.get('use_cache', True)),
+        callback_url=data.get('callback_url'),
+        options=options,
+    )
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'jobId': job_id,
+            'estado': 'en_cola',
+            'url': f'/api/ocr/jobs/{job_id}',
+        },
+    }), 202
+
+
+@app.route('/api/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """
+    Consulta el estado de un trabajo OCR
+    
+    Estados: en_cola, procesando, completado (incluye resultado), error (incluye error)
+    """
+    if not job_manager:
+        return jsonify({
+            'success': False,
+            'error': 'Servicio OCR no disponible. API Key no configurada.',
+        }), 503
+    
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Trabajo no encontrado: {job_id}',
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job_to_response(job),
+    }), 200
+
+
+@app.route('/api/ocr/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    Invalida entradas del cache de resultados OCR
+    
+    Request Body (JSON, todos opcionales):
+    {
+        "model": "gemini-2.5-pro",   // solo entradas de este modelo
+        "prompt_version": "v1"       // solo entradas de esta versión de prompt
+    }
+    Sin filtros se vacía todo el cache.
+    """
+    if not gemini_client or gemini_client.cache is None:
+        return jsonify({
+            'success': False,
+            'error': 'Cache OCR no habilitado',
+        }), 503
+    
+    data = request.get_json(silent=True) or {}
+    eliminadas = gemini_client.cache.invalidate(
+        model_name=data.get('model'),
+        prompt_version=data.get('prompt_version'),
+    )
+    
+    return jsonify({
+        'success': True,
+        'data': {'entradasEliminadas': eliminadas},
+    }), 200
 
 
 @app.errorhandler(404)
@@ -255,7 +1228,7 @@ if __name__ == '__main__':
         print("\n⚠️  ADVERTENCIA: Configura GEMINI_API_KEY en .env")
         print("   Ver: PLANIFICACION/03_IA_OCR/COMO_OBTENER_API_KEY.md\n")
     
-    app.run(
+    create_app().run(
         host='0.0.0.0',
         port=FLASK_PORT,
         debug=os.getenv('FLASK_ENV') == 'development'
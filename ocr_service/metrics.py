@@ -0,0 +1,411 @@
+"""
+Métricas del servicio OCR en formato de texto de Prometheus
+
+Registro mínimo (sin dependencias) con contadores, gauges e histogramas
+etiquetados. GET /metrics expone REGISTRY.render().
+
+StageTimer mide cada etapa del pipeline de un request: alimenta el
+histograma ocr_stage_duration_seconds y arma el desglose etapasMs que se
+devuelve en cada respuesta para rastrear actas lentas desde el backend.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Buckets en segundos: desde decodificaciones de milisegundos hasta
+# llamadas al modelo de varios minutos
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# finish_reason de Gemini (enum Candidate.FinishReason)
+FINISH_REASON_NAMES = {
+    0: 'FINISH_REASON_UNSPECIFIED',
+    1: 'STOP',
+    2: 'MAX_TOKENS',
+    3: 'SAFETY',
+    4: 'RECITATION',
+    5: 'OTHER',
+}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base de una métrica con etiquetas"""
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etiquetas esperadas {self.labelnames}, recibidas {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+        ]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Un contador no puede decrementarse")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (ej: requests en curso)"""
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        """Incrementa el gauge mientras dura el bloque"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Histograma acumulado con buckets fijos"""
+    metric_type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiqueta: [conteo por bucket..., conteo +Inf], suma
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas expuestas en /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Texto en formato de exposición de Prometheus (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ocr_stage_duration_seconds',
+    'Duración de cada etapa del pipeline OCR',
+    ('etapa',),
+)
+FINISH_REASONS = REGISTRY.counter(
+    'ocr_gemini_finish_reason_total',
+    'Respuestas de Gemini por finish_reason',
+    ('reason',),
+)
+BLOCKED = REGISTRY.counter(
+    'ocr_gemini_blocked_total',
+    'Respuestas de Gemini bloqueadas o sin candidatos',
+    ('motivo',),
+)
+PARSE_FAILURES = REGISTRY.counter(
+    'ocr_parse_failures_total',
+    'Respuestas de Gemini que no se pudieron parsear o validar',
+    ('tipo',),
+)
+TRUNCATED = REGISTRY.counter(
+    'ocr_truncated_responses_total',
+    'Respuestas cortadas o malformadas de las que se recuperaron estudiantes',
+    ('motivo',),
+)
+CONTINUATIONS = REGISTRY.counter(
+    'ocr_continuation_requests_total',
+    'Requests de continuación tras una respuesta truncada',
+)
+TOKENS = REGISTRY.counter(
+    'ocr_gemini_tokens_total',
+    'Tokens reportados en usage_metadata de Gemini',
+    ('tipo',),
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    'ocr_http_requests_in_flight',
+    'Requests HTTP en curso por endpoint',
+    ('endpoint',),
+)
+MODEL_CALLS_IN_FLIGHT = REGISTRY.gauge(
+    'ocr_gemini_calls_in_flight',
+    'Llamadas a Gemini en curso',
+)
+MODEL_ERRORS = REGISTRY.counter(
+    'ocr_gemini_errors_total',
+    'Llamadas a Gemini fallidas por tipo de error (cuota, servidor, timeout, cliente, otro)',
+    ('tipo',),
+)
+MODEL_RETRIES = REGISTRY.counter(
+    'ocr_gemini_retries_total',
+    'Reintentos de llamadas a Gemini por tipo de error',
+    ('tipo',),
+)
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    'ocr_gemini_concurrency_limit',
+    'Límite adaptativo (AIMD) de llamadas simultáneas a Gemini',
+)
+CIRCUIT_REJECTED = REGISTRY.counter(
+    'ocr_gemini_circuit_rejected_total',
+    'Llamadas rechazadas sin llamar a Gemini por el circuit breaker abierto',
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    'ocr_requests_coalesced_total',
+    'Requests idénticos a uno en curso que recibieron su resultado sin llamar a Gemini',
+)
+QUALITY_ISSUES = REGISTRY.counter(
+    'ocr_image_quality_issues_total',
+    'Problemas del control de calidad de imagen por código y acción (rechazada, corregida, reportada)',
+    ('codigo', 'accion'),
+)
+TABLE_ROWS = REGISTRY.counter(
+    'ocr_table_rows_check_total',
+    'Filas detectadas en la tabla vs estudiantes extraídos (coincide, difiere, sin_tabla)',
+    ('resultado',),
+)
+CASCADE_RESULTS = REGISTRY.counter(
+    'ocr_cascade_results_total',
+    'Actas de la cascada de modelos: aceptadas con el modelo rápido o escaladas al fuerte',
+    ('resultado',),
+)
+CASCADE_ESCALATIONS = REGISTRY.counter(
+    'ocr_cascade_escalations_total',
+    'Actas escaladas al modelo fuerte por motivo (error, validacion, puntaje)',
+    ('motivo',),
+)
+CASCADE_LATENCY_SAVED = REGISTRY.counter(
+    'ocr_cascade_latency_saved_seconds_total',
+    'Latencia ahorrada por actas aceptadas con el modelo rápido (vs. promedio del modelo fuerte)',
+)
+CASCADE_LATENCY_WASTED = REGISTRY.counter(
+    'ocr_cascade_latency_wasted_seconds_total',
+    'Tiempo gastado en el modelo rápido por actas que luego se escalaron',
+)
+ACTA_CONFIDENCE = REGISTRY.histogram(
+    'ocr_acta_confidence',
+    'Confianza calculada de cada acta (0-100) a partir de sus chequeos de consistencia',
+    buckets=(30, 50, 60, 70, 80, 90, 95, 100),
+)
+CONTEXT_CACHE_EVENTS = REGISTRY.counter(
+    'ocr_context_cache_total',
+    'Uso del cache de contexto del prompt (creado, reutilizado, error)',
+    ('evento',),
+)
+
+
+def finish_reason_name(value) -> str:
+    """Nombre legible de un finish_reason (enum del SDK o entero)"""
+    if value is None:
+        return 'NONE'
+    name = getattr(value, 'name', None)
+    if name:
+        return name
+    try:
+        return FINISH_REASON_NAMES.get(int(value), str(value))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class StageTimer:
+    """Mide las etapas de un request y acumula su desglose en milisegundos"""
+
+    def __init__(self, histogram: Histogram = STAGE_SECONDS):
+        self.histogram = histogram
+        self._etapas: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Mide el bloque como la etapa `name` (se acumula si se repite)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.histogram.observe(elapsed, etapa=name)
+            self._etapas[name] = self._etapas.get(name, 0.0) + elapsed * 1000
+
+    def record(self, name: str, seconds: float):
+        """Registra una duración medida fuera de un bloque `stage`"""
+        self.histogram.observe(seconds, etapa=name)
+        self._etapas[name] = self._etapas.get(name, 0.0) + seconds * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """Desglose {etapa: ms} en el orden en que se ejecutaron"""
+        return {name: round(ms, 1) for name, ms in self._etapas.items()}
+
+
+class TokenUsage:
+    """Tokens de Gemini consumidos por un request (suma todas sus llamadas)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entrada = 0
+        self.entrada_cacheada = 0
+        self.salida = 0
+        self.llamadas = 0
+
+    def add(self, usage_metadata):
+        """Acumula el usage_metadata de una respuesta y alimenta ocr_gemini_tokens_total"""
+        entrada = getattr(usage_metadata, 'prompt_token_count', 0) or 0
+        cacheada = getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+        salida = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+        TOKENS.inc(entrada, tipo='entrada')
+        TOKENS.inc(cacheada, tipo='entrada_cacheada')
+        TOKENS.inc(salida, tipo='salida')
+        with self._lock:
+            self.entrada += entrada
+            self.entrada_cacheada += cacheada
+            self.salida += salida
+            self.llamadas += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        """Resumen para la respuesta (prompt_token_count ya incluye los cacheados)"""
+        return {
+            'entrada': self.entrada,
+            'entradaCacheada': self.entrada_cacheada,
+            'entradaSinCache': self.entrada - self.entrada_cacheada,
+            'salida': self.salida,
+            'llamadas': self.llamadas,
+        }
@@ -0,0 +1,103 @@
+"""
+Cascada de modelos: primero un modelo rápido, el fuerte solo si hace falta
+
+Cada acta iba a GEMINI_MODEL (gemini-2.5-pro), el nivel más lento y caro,
+aunque sea un acta mecanografiada y limpia. Con la cascada el acta se
+procesa primero con un modelo rápido (ej: gemini-2.5-flash) y su
+resultado se revisa:
+
+- error del modelo rápido o respuesta que no pasa validate_ocr_response
+- puntaje de consistencia (ocr_consistency) menor al mínimo
+
+En esos casos se vuelve a procesar con el modelo fuerte; si no, el
+resultado del modelo rápido es el definitivo. procesadoCon indica el
+modelo que produjo el resultado.
+
+La latencia ahorrada se estima contra el promedio móvil de las actas
+procesadas por el modelo fuerte (o initial_strong_latency mientras no
+haya ninguna); las escaladas suman el tiempo perdido en el modelo rápido.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from metrics import CASCADE_RESULTS, CASCADE_ESCALATIONS, CASCADE_LATENCY_SAVED, CASCADE_LATENCY_WASTED
+from ocr_consistency import ConsistencyReport
+
+NIVEL_RAPIDO = 'rapido'
+NIVEL_FUERTE = 'fuerte'
+
+MOTIVO_ERROR = 'error'
+MOTIVO_VALIDACION = 'validacion'
+MOTIVO_PUNTAJE = 'puntaje'
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    """Configuración de la cascada"""
+    fast_model: str
+    min_score: float = 0.9                  # Puntaje de consistencia mínimo para aceptar el modelo rápido
+    initial_strong_latency: float = 60.0    # Segundos estimados por acta en el modelo fuerte (hasta medirlo)
+
+
+class ModelCascade:
+    """Decisión de escalar y estadísticas de la cascada (seguro entre hilos)"""
+
+    def __init__(self, config: CascadeConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._strong_latency = config.initial_strong_latency
+        self.aceptadas = 0
+        self.escaladas: Dict[str, int] = {}
+        self.ahorrado = 0.0
+        self.perdido = 0.0
+
+    @property
+    def fast_model(self) -> str:
+        return self.config.fast_model
+
+    def review(self, report: ConsistencyReport) -> Optional[str]:
+        """Motivo para escalar el resultado del modelo rápido, o None si se acepta"""
+        if report.puntaje < self.config.min_score:
+            return MOTIVO_PUNTAJE
+        return None
+
+    def accepted(self, fast_seconds: float):
+        """El resultado del modelo rápido fue aceptado"""
+        with self._lock:
+            saved = max(0.0, self._strong_latency - fast_seconds)
+            self.aceptadas += 1
+            self.ahorrado += saved
+        CASCADE_RESULTS.inc(resultado='aceptado')
+        CASCADE_LATENCY_SAVED.inc(saved)
+
+    def escalated(self, motivo: str, fast_seconds: float):
+        """El acta se vuelve a procesar con el modelo fuerte"""
+        with self._lock:
+            self.escaladas[motivo] = self.escaladas.get(motivo, 0) + 1
+            self.perdido += fast_seconds
+        CASCADE_RESULTS.inc(resultado='escalado')
+        CASCADE_ESCALATIONS.inc(motivo=motivo)
+        CASCADE_LATENCY_WASTED.inc(fast_seconds)
+
+    def observe_strong(self, seconds: float):
+        """Latencia de un acta en el modelo fuerte (promedio móvil exponencial)"""
+        with self._lock:
+            self._strong_latency += 0.2 * (seconds - self._strong_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado para /health"""
+        with self._lock:
+            escaladas = sum(self.escaladas.values())
+            total = self.aceptadas + escaladas
+            return {
+                'modelo_rapido': self.config.fast_model,
+                'puntaje_minimo': self.config.min_score,
+                'aceptadas': self.aceptadas,
+                'escaladas': escaladas,
+                'motivos': dict(self.escaladas),
+                'tasa_escalada': round(escaladas / total, 3) if total else None,
+                'latencia_fuerte_segundos': round(self._strong_latency, 1),
+                'ahorro_neto_segundos': round(self.ahorrado - self.perdido, 1),
+            }
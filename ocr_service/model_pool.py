@@ -0,0 +1,140 @@
+"""
+Pool de modelos Gemini pre-configurados
+
+Antes se creaba un genai.GenerativeModel nuevo (y se reconstruían
+safety_settings y generation_config) en cada request para evitar historial
+de chat. GenerativeModel.generate_content no guarda historial (solo
+ChatSession lo hace), así que un mismo handle se puede compartir entre
+hilos sin arrastrar contexto entre actas.
+
+Los handles se construyen una sola vez por combinación de
+(modelo, instrucciones de sistema, generation_config, safety_settings).
+
+google.generativeai (gRPC + protobuf, ~1 s de import) se carga recién al
+crear el primer handle: importar el servicio y responder /health no lo
+esperan. GeminiOCRClient.warm_up lo precarga en segundo plano.
+"""
+
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_sdk_lock = threading.Lock()
+_api_key: Optional[str] = None
+_configured_key: Optional[str] = None
+
+# ✅ CONFIGURACIÓN DE SEGURIDAD
+# Desactivar TODOS los filtros de seguridad
+# Categoría 7: HARM_CATEGORY_HARASSMENT
+# Categoría 8: HARM_CATEGORY_HATE_SPEECH
+# Categoría 9: HARM_CATEGORY_SEXUALLY_EXPLICIT
+# Categoría 10: HARM_CATEGORY_DANGEROUS_CONTENT
+#
+# IMPORTANTE: Usar formato de lista con strings para máxima compatibilidad
+SAFETY_SETTINGS = (
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+)
+
+# Configuración de generación para extracción OCR de actas
+OCR_GENERATION_CONFIG = {
+    'temperature': 0.1,  # Aumentado ligeramente para mejor interpretación
+    'top_p': 0.95,  # Ajustado para mejor balance
+    'top_k': 40,  # Aumentado para más opciones de tokens
+    'max_output_tokens': 16384,  # Suficiente para actas grandes
+}
+
+
+def configure_gemini(api_key: str):
+    """
+    Registra la API key; genai.configure se aplica al cargar el SDK
+    (o de inmediato si ya está cargado)
+    """
+    global _api_key
+    with _sdk_lock:
+        _api_key = api_key
+    if _configured_key is not None:
+        load_genai()
+
+
+def load_genai():
+    """
+    Importa google.generativeai y aplica la API key registrada
+
+    Returns:
+        module: google.generativeai
+    """
+    global _configured_key
+    import google.generativeai as genai
+
+    if _api_key is not None and _configured_key != _api_key:
+        with _sdk_lock:
+            if _configured_key != _api_key:
+                genai.configure(api_key=_api_key)
+                _configured_key = _api_key
+    return genai
+
+
+def _freeze(value: Any) -> str:
+    """Serializa una configuración de forma estable para usarla como clave"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ModelPool:
+    """Fábrica de handles GenerativeModel sin estado, compartidos entre hilos"""
+
+    def __init__(self):
+        self._models: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[Sequence[Dict[str, str]]] = SAFETY_SETTINGS
+    ):
+        """
+        Devuelve un handle pre-configurado (lo crea la primera vez)
+
+        Args:
+            model_name: Nombre del modelo (ej: gemini-2.5-pro)
+            system_instruction: Instrucciones de sistema
+            generation_config: Configuración de generación por defecto
+            safety_settings: Filtros de seguridad por defecto
+
+        Returns:
+            genai.GenerativeModel: Handle listo para generate_content
+        """
+        key = (
+            model_name,
+            system_instruction,
+            _freeze(generation_config),
+            _freeze(safety_settings),
+        )
+
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                genai = load_genai()
+                model = genai.GenerativeModel(
+                    model_name,
+                    system_instruction=system_instruction,
+                    generation_config=dict(generation_config) if generation_config else None,
+                    safety_settings=[dict(s) for s in safety_settings] if safety_settings else None,
+                )
+                self._models[key] = model
+                logger.info("Handle de modelo creado: %s (total en pool: %d)", model_name, len(self._models))
+            return model
+
+    def __len__(self) -> int:
+        return len(self._models)
@@ -0,0 +1,228 @@
+"""
+Procesamiento OCR por lotes (libro de actas completo)
+
+Las páginas de un libro se procesan con concurrencia acotada y los
+resultados se entregan a medida que cada página termina, de modo que el
+tiempo total se aproxima al de la página más lenta y no a la suma de todas.
+
+Las páginas pueden venir como imágenes sueltas (base64 o ruta) o de un
+documento multipágina (TIFF/PDF, ver ocr_document). Solo se abren tantas
+páginas como workers libres: la memoria no crece con el largo del libro.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from metrics import StageTimer
+from ocr_document import DocumentPages
+from image_quality import ImageQualityError
+
+
+def _process_page(client, page: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """
+    Procesa una página del lote y devuelve su resultado o su error
+
+    Nunca lanza excepciones: el error de una página no detiene el lote.
+    """
+    pagina = page.get('pagina', index + 1)
+    start_time = time.time()
+
+    def failure(error: str, **extra) -> Dict[str, Any]:
+        return {
+            'tipo': 'pagina',
+            'indice': index,
+            'pagina': pagina,
+            'success': False,
+            'error': error,
+            'tiempoMs': int((time.time() - start_time) * 1000),
+            **extra,
+        }
+
+    try:
+        metadata = page.get('metadata')
+        if not metadata:
+            return failure('Metadata requerida')
+
+        timer = StageTimer()
+        if 'documento' in page:
+            # Página de un documento multipágina: se decodifica recién aquí
+            with timer.stage('apertura_imagen'):
+                image = page['documento'].page(pagina)
+        elif 'image_base64' in page:
+            image = client.load_image_from_base64(page['image_base64'], timer=timer)
+        elif 'image_path' in page:
+            if not os.path.exists(page['image_path']):
+                return failure(f"Imagen no encontrada: {page['image_path']}")
+            with timer.stage('apertura_imagen'):
+                image = client.load_and_prepare_image(page['image_path'])
+        else:
+            return failure('Imagen requerida (image_base64 o image_path)')
+
+        try:
+            resultado = client.process_acta(
+                image,
+                metadata,
+                use_cache=bool(page.get('use_cache', True)),
+                preprocess=page.get('preprocess'),
+                timer=timer,
+                bands=page.get('bands'),
+            )
+        finally:
+            if 'documento' in page:
+                # Liberar los píxeles de la página antes de abrir la siguiente
+                image.close()
+
+        return {
+            'tipo': 'pagina',
+            'indice': index,
+            'pagina': pagina,
+            'success': True,
+            'data': resultado,
+            'tiempoMs': int((time.time() - start_time) * 1000),
+        }
+
+    except ImageQualityError as e:
+        # Página en blanco o borrosa (p. ej. separadores de un libro escaneado)
+        return failure(str(e), calidadImagen=e.report.as_dict())
+    except ValueError as e:
+        return failure(f'Error de validación: {str(e)}')
+    except RuntimeError as e:
+        return failure(f'Error de procesamiento: {str(e)}')
+    except Exception as e:
+        return failure(f'Error interno del servidor: {str(e)}')
+
+
+def iter_batch_results(
+    client,
+    pages: List[Dict[str, Any]],
+    max_concurrency: int = 4
+) -> Iterator[Dict[str, Any]]:
+    """
+    Procesa las páginas de un lote en paralelo
+
+    Produce un resultado por página en orden de finalización y, al final,
+    un resumen con {'tipo': 'resumen', ...}. El resumen lista en
+    paginasReprocesar las páginas fallidas (salvo las rechazadas por el
+    control de calidad) o con confianza bajo el umbral: se reprocesan solo
+    esas, no el libro entero.
+
+    Args:
+        client: GeminiOCRClient
+        pages: Lista de páginas [{"image_base64" | "image_path", "metadata", "pagina"?, "preprocess"?, "bands"?}]
+        max_concurrency: Máximo de páginas procesadas a la vez
+
+    Yields:
+        dict: Resultado de cada página y resumen final
+    """
+    return _iter_results(client, pages, len(pages), max_concurrency)
+
+
+def iter_document_results(
+    client,
+    document: DocumentPages,
+    metadata: Dict[str, Any],
+    page_metadata: Optional[Dict[int, Dict[str, Any]]] = None,
+    paginas: Optional[List[int]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    max_concurrency: int = 4
+) -> Iterator[Dict[str, Any]]:
+    """
+    Procesa las páginas de un documento multipágina (TIFF/PDF)
+
+    Cada página se abre y decodifica solo cuando un worker la toma, y se
+    cierra al terminar: como mucho max_concurrency páginas en memoria.
+
+    Args:
+        client: GeminiOCRClient
+        document: Documento abierto con ocr_document.open_document
+        metadata: Metadata común a todas las páginas
+        page_metadata: Campos que cambian por página ({pagina: {"seccion": "B", ...}}),
+            combinados sobre metadata
+        paginas: Páginas a procesar (desde 1); None = todas
+        options: use_cache, preprocess y bands para todas las páginas
+        max_concurrency: Máximo de páginas procesadas a la vez
+
+    Yields:
+        dict: Resultado de cada página (como iter_batch_results) y resumen final
+    """
+    page_metadata = page_metadata or {}
+    paginas = list(paginas or range(1, document.page_count + 1))
+
+    def pages():
+        for pagina in paginas:
+            yield dict(
+                options or {},
+                documento=document,
+                pagina=pagina,
+                metadata={**metadata, **page_metadata.get(pagina, {})},
+            )
+
+    return _iter_results(client, pages(), len(paginas), max_concurrency, document.formato)
+
+
+def _iter_results(
+    client,
+    pages: Iterable[Dict[str, Any]],
+    total: int,
+    max_concurrency: int,
+    formato: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Procesa páginas con una ventana de max_concurrency en vuelo
+
+    Cada página se envía al pool recién cuando termina otra, así las
+    páginas (y sus imágenes) se generan a medida que hay un worker libre.
+    """
+    start_time = time.time()
+    exitosas = 0
+    fallidas = 0
+    reprocesar = []
+    workers = max(1, min(max_concurrency, total or 1))
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-batch')
+    pending = set()
+    pages = enumerate(pages)
+
+    def submit_next() -> bool:
+        item = next(pages, None)
+        if item is None:
+            return False
+        index, page = item
+        pending.add(executor.submit(_process_page, client, page, index))
+        return True
+
+    try:
+        while len(pending) < workers and submit_next():
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                resultado = future.result()
+                if resultado['success']:
+                    exitosas += 1
+                    if resultado['data'].get('revisionSugerida', {}).get('reprocesarActa'):
+                        reprocesar.append((resultado['indice'], resultado['pagina']))
+                else:
+                    fallidas += 1
+                    if 'calidadImagen' not in resultado:
+                        reprocesar.append((resultado['indice'], resultado['pagina']))
+                submit_next()
+                yield resultado
+    finally:
+        # Si el cliente se desconecta, no seguir gastando llamadas a Gemini
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    resumen = {
+        'tipo': 'resumen',
+        'totalPaginas': total,
+        'exitosas': exitosas,
+        'fallidas': fallidas,
+        'paginasReprocesar': [pagina for _, pagina in sorted(reprocesar)],
+        'tiempoTotalMs': int((time.time() - start_time) * 1000),
+    }
+    if formato is not None:
+        resumen['formato'] = formato
+    yield resumen
@@ -0,0 +1,265 @@
+"""
+Cache de resultados OCR direccionado por contenido
+
+La clave de cada entrada es un hash SHA-256 de:
+- Los bytes decodificados de la imagen
+- La metadata normalizada del acta (año, grado, sección, turno, áreas)
+- El prompt generado por build_acta_prompt
+- El nombre del modelo de Gemini
+
+Dos niveles:
+- Memoria: LRU acotado (respuestas en milisegundos)
+- Disco: SQLite, sobrevive a reinicios del servicio
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from PIL import Image
+
+
+def image_digest(image: Image.Image) -> str:
+    """
+    Calcula el hash SHA-256 de una imagen
+
+    Si la imagen fue cargada por GeminiOCRClient, usa el hash de los bytes
+    originales (guardado en image.info['source_sha256']). En otro caso,
+    calcula el hash sobre los píxeles decodificados.
+
+    Args:
+        image: Imagen PIL
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    digest = image.info.get('source_sha256') if hasattr(image, 'info') else None
+    if digest:
+        return digest
+
+    hasher = hashlib.sha256()
+    hasher.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode('utf-8'))
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
+def normalize_metadata_for_key(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normaliza la metadata relevante para la clave del cache
+
+    Ignora campos que no afectan la extracción (colegio_origen, tipo_evaluacion)
+    y ordena las áreas por posición.
+    """
+    def norm(value: Any) -> str:
+        return ' '.join(str(value if value is not None else '').upper().split())
+
+    areas = sorted(
+        metadata.get('areas', []) or [],
+        key=lambda area: int(area.get('posicion', 0) or 0)
+    )
+
+    return {
+        'anio_lectivo': norm(metadata.get('anio_lectivo')),
+        'grado': norm(metadata.get('grado')),
+        'seccion': norm(metadata.get('seccion')),
+        'turno': norm(metadata.get('turno')),
+        'areas': [
+            [int(area.get('posicion', 0) or 0), norm(area.get('nombre')), norm(area.get('codigo'))]
+            for area in areas
+        ],
+    }
+
+
+def compute_cache_key(
+    image_hash: str,
+    metadata: Dict[str, Any],
+    prompt: str,
+    model_name: str
+) -> str:
+    """
+    Construye la clave del cache para un acta
+
+    Returns:
+        str: Hash SHA-256 hexadecimal
+    """
+    payload = json.dumps(
+        {
+            'image': image_hash,
+            'metadata': normalize_metadata_for_key(metadata),
+            'prompt': hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+            'model': model_name,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class OCRResultCache:
+    """Cache de dos niveles (memoria LRU + SQLite en disco) para resultados OCR"""
+
+    def __init__(self, max_items: int = 256, cache_dir: Optional[str] = None):
+        """
+        Inicializa el cache
+
+        Args:
+            max_items: Máximo de entradas en el nivel de memoria
+            cache_dir: Directorio para el nivel de disco (None = solo memoria)
+        """
+        self.max_items = max(1, max_items)
+        self._memory: 'OrderedDict[str, Tuple[str, str, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        self.db_path = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db_path = os.path.join(cache_dir, 'ocr_cache.sqlite3')
+            self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre una conexión SQLite, confirma la transacción y la cierra"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    clave TEXT PRIMARY KEY,
+                    modelo TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    resultado TEXT NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_modelo ON ocr_cache(modelo)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_prompt ON ocr_cache(prompt_version)')
+
+    def _remember(self, key: str, entry: Tuple[str, str, str]):
+        """Guarda una entrada en memoria respetando el límite LRU (requiere lock)"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Busca un resultado en el cache
+
+        Returns:
+            (resultado, nivel): nivel es 'memoria', 'disco' o None si no existe
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return json.loads(entry[2]), 'memoria'
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT modelo, prompt_version, resultado FROM ocr_cache WHERE clave = ?',
+                    (key,)
+                ).fetchone()
+            if row:
+                with self._lock:
+                    self._remember(key, (row[0], row[1], row[2]))
+                    self.hits_disk += 1
+                return json.loads(row[2]), 'disco'
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def set(self, key: str, resultado: Dict[str, Any], model_name: str, prompt_version: str):
+        """
+        Guarda un resultado en ambos niveles del cache
+        """
+        serialized = json.dumps(resultado, ensure_ascii=False)
+
+        with self._lock:
+            self._remember(key, (model_name, prompt_version, serialized))
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO ocr_cache (clave, modelo, prompt_version, creado_en, resultado) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, model_name, prompt_version, time.time(), serialized)
+                )
+
+    def invalidate(self, model_name: Optional[str] = None, prompt_version: Optional[str] = None) -> int:
+        """
+        Elimina entradas del cache
+
+        Sin argumentos elimina todo. Con model_name y/o prompt_version elimina
+        solo las entradas que coincidan con ambos filtros.
+
+        Returns:
+            int: Número de entradas eliminadas (memoria + disco, sin duplicar)
+        """
+        def matches(modelo: str, version: str) -> bool:
+            if model_name is not None and modelo != model_name:
+                return False
+            if prompt_version is not None and version != prompt_version:
+                return False
+            return True
+
+        with self._lock:
+            memory_keys = [k for k, (modelo, version, _) in self._memory.items() if matches(modelo, version)]
+            for key in memory_keys:
+                del self._memory[key]
+
+        removed = set(memory_keys)
+
+        if self.db_path:
+            conditions = []
+            params = []
+            if model_name is not None:
+                conditions.append('modelo = ?')
+                params.append(model_name)
+            if prompt_version is not None:
+                conditions.append('prompt_version = ?')
+                params.append(prompt_version)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+            with self._connect() as conn:
+                rows = conn.execute(f'SELECT clave FROM ocr_cache{where}', params).fetchall()
+                conn.execute(f'DELETE FROM ocr_cache{where}', params)
+            removed.update(row[0] for row in rows)
+
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del cache para /health"""
+        with self._lock:
+            stats = {
+                'entradas_memoria': len(self._memory),
+                'max_entradas_memoria': self.max_items,
+                'hits_memoria': self.hits_memory,
+                'hits_disco': self.hits_disk,
+                'misses': self.misses,
+            }
+
+        if self.db_path:
+            with self._connect() as conn:
+                stats['entradas_disco'] = conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+
+        return stats
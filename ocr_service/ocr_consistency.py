@@ -0,0 +1,250 @@
+"""
+Chequeos de consistencia de una extracción OCR
+
+validate_ocr_response solo verifica la estructura. Estos chequeos
+comparan lo extraído con lo que el acta implica:
+
+- notas_incompletas: la cantidad de notas no coincide con las áreas
+- desaprobadas: asignaturas_desaprobadas informada por el modelo distinta
+  del recuento de notas < 11
+- situacion_final: P (promovido) con áreas desaprobadas, o A (aprobado con
+  arrastres) sin ninguna
+- numero: Nº de orden no correlativo (repetido, salteado o faltante)
+- ilegible: nombre ILEGIBLE o más de un tercio de las notas en null
+- filas (del acta): estudiantes extraídos distintos de las filas
+  detectadas en la imagen
+
+El puntaje del acta (0-1) es la fracción de estudiantes sin problemas,
+penalizada por la diferencia con las filas detectadas.
+
+La confianza (0-100) reemplaza al 95 fijo que se devolvía antes: cada
+problema descuenta puntos al estudiante (PENALIZACIONES) y las notas en
+null descuentan en proporción. La del acta es el promedio de sus
+estudiantes con la misma penalización por filas. Los estudiantes bajo
+el umbral van a revisionSugerida; si el acta entera queda bajo el umbral
+conviene reprocesarla (solo esa página, no el libro).
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from response_parser import normalize_situacion_final
+
+NOTA_APROBATORIA = 11
+
+PROBLEMA_NOTAS = 'notas_incompletas'
+PROBLEMA_DESAPROBADAS = 'desaprobadas'
+PROBLEMA_SITUACION = 'situacion_final'
+PROBLEMA_NUMERO = 'numero'
+PROBLEMA_ILEGIBLE = 'ilegible'
+PROBLEMA_FILAS = 'filas'
+
+# Puntos de confianza que descuenta cada problema de un estudiante
+PENALIZACIONES = {
+    PROBLEMA_NOTAS: 40,
+    PROBLEMA_SITUACION: 30,
+    PROBLEMA_ILEGIBLE: 30,
+    PROBLEMA_DESAPROBADAS: 15,
+    PROBLEMA_NUMERO: 10,
+}
+PENALIZACION_NULAS = 40         # Por la fracción de notas en null (todas null = -40)
+UMBRAL_REVISION = 70            # Confianza mínima sin revisión
+
+
+@dataclass
+class ConsistencyReport:
+    """Resultado de los chequeos de un acta"""
+    puntaje: float = 1.0
+    problemas: List[List[str]] = field(default_factory=list)    # Por estudiante, en orden
+    filas_detectadas: Optional[int] = None
+    extraidos: int = 0
+    confianzas: List[int] = field(default_factory=list)         # Por estudiante (0-100)
+    confianza: int = 0                                          # Del acta (0-100)
+
+    @property
+    def conteo(self) -> Dict[str, int]:
+        """Estudiantes afectados por cada problema (y 'filas' si difiere)"""
+        conteo: Dict[str, int] = {}
+        for problemas in self.problemas:
+            for problema in problemas:
+                conteo[problema] = conteo.get(problema, 0) + 1
+        if self.filas_detectadas and self.filas_detectadas != self.extraidos:
+            conteo[PROBLEMA_FILAS] = abs(self.filas_detectadas - self.extraidos)
+        return conteo
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'puntaje': round(self.puntaje, 3),
+            'confianza': self.confianza,
+            'problemas': self.conteo,
+            'estudiantesConProblemas': sum(1 for problemas in self.problemas if problemas),
+        }
+
+
+def _notas(est: Dict[str, Any]) -> List[Any]:
+    notas = est.get('notas')
+    if isinstance(notas, dict):
+        return list(notas.values())
+    return notas if isinstance(notas, list) else []
+
+
+def _numero(est: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(est.get('numero'))
+    except (TypeError, ValueError):
+        return None
+
+
+def student_problems(est: Dict[str, Any], num_areas: int, numero_esperado: Optional[int]) -> List[str]:
+    """
+    Problemas de un estudiante tal como lo devolvió el modelo
+
+    Args:
+        est: Estudiante crudo de Gemini (snake_case)
+        num_areas: Áreas del acta
+        numero_esperado: Nº de orden que correspondería (el anterior + 1), o None
+    """
+    problemas = []
+    notas = _notas(est)
+    presentes = [nota for nota in notas if isinstance(nota, (int, float))]
+    desaprobadas = sum(1 for nota in presentes if nota < NOTA_APROBATORIA)
+
+    if len(notas) != num_areas:
+        problemas.append(PROBLEMA_NOTAS)
+
+    informadas = est.get('asignaturas_desaprobadas')
+    if isinstance(informadas, (int, float)) and not isinstance(informadas, bool) and int(informadas) != desaprobadas:
+        problemas.append(PROBLEMA_DESAPROBADAS)
+
+    situacion = normalize_situacion_final(est.get('situacion_final'))
+    completas = len(presentes) == num_areas
+    if (situacion == 'P' and desaprobadas > 0) or (situacion == 'A' and completas and desaprobadas == 0):
+        problemas.append(PROBLEMA_SITUACION)
+
+    numero = _numero(est)
+    if numero is None or (numero_esperado is not None and numero != numero_esperado):
+        problemas.append(PROBLEMA_NUMERO)
+
+    nombres = ' '.join(str(est.get(key) or '') for key in ('apellido_paterno', 'apellido_materno', 'nombres'))
+    nulas = len(notas) - len(presentes)
+    if 'ILEGIBLE' in nombres.upper() or (notas and nulas * 3 > len(notas)):
+        problemas.append(PROBLEMA_ILEGIBLE)
+
+    return problemas
+
+
+def student_confidence(est: Dict[str, Any], problemas: List[str]) -> int:
+    """Confianza (0-100) de un estudiante según sus problemas y sus notas en null"""
+    confianza = 100 - sum(PENALIZACIONES.get(problema, 0) for problema in problemas)
+    notas = _notas(est)
+    if notas:
+        nulas = sum(1 for nota in notas if not isinstance(nota, (int, float)))
+        confianza -= round(PENALIZACION_NULAS * nulas / len(notas))
+    return max(0, confianza)
+
+
+class StudentScorer:
+    """
+    Puntúa estudiantes en el orden de la tabla (el Nº esperado es el
+    anterior + 1). Lo usa check_consistency y el streaming, que asigna la
+    confianza a cada estudiante en cuanto se emite.
+    """
+
+    def __init__(self, num_areas: int):
+        self.num_areas = num_areas
+        self._anterior: Optional[int] = None
+
+    def score(self, est: Dict[str, Any]) -> Tuple[List[str], int]:
+        """
+        Returns:
+            (problemas, confianza) del estudiante crudo
+        """
+        anterior = self._anterior
+        problemas = student_problems(est, self.num_areas, anterior + 1 if anterior is not None else None)
+        numero = _numero(est)
+        self._anterior = numero if numero is not None else (anterior + 1 if anterior is not None else None)
+        return problemas, student_confidence(est, problemas)
+
+
+def check_consistency(
+    estudiantes: List[Dict[str, Any]],
+    num_areas: int,
+    filas_detectadas: Optional[int] = None
+) -> ConsistencyReport:
+    """
+    Chequea los estudiantes extraídos de un acta
+
+    Args:
+        estudiantes: Estudiantes crudos de Gemini, en el orden de la tabla
+        num_areas: Áreas del acta
+        filas_detectadas: Filas con estudiantes detectadas en la imagen (None = sin dato)
+
+    Returns:
+        ConsistencyReport
+    """
+    estudiantes = [est for est in estudiantes if isinstance(est, dict)]
+    report = ConsistencyReport(filas_detectadas=filas_detectadas, extraidos=len(estudiantes))
+
+    scorer = StudentScorer(num_areas)
+    for est in estudiantes:
+        problemas, confianza = scorer.score(est)
+        report.problemas.append(problemas)
+        report.confianzas.append(confianza)
+
+    if not estudiantes:
+        report.puntaje = 0.0
+        return report
+
+    report.puntaje = sum(1 for problemas in report.problemas if not problemas) / len(estudiantes)
+    confianza = sum(report.confianzas) / len(estudiantes)
+    if filas_detectadas:
+        factor = min(filas_detectadas, len(estudiantes)) / max(filas_detectadas, len(estudiantes))
+        report.puntaje *= factor
+        confianza *= factor
+    report.confianza = int(round(confianza))
+    return report
+
+
+def apply_confidence(
+    resultado: Dict[str, Any],
+    report: ConsistencyReport,
+    umbral: int = UMBRAL_REVISION
+) -> Dict[str, Any]:
+    """
+    Agrega al resultado (formato backend) la confianza calculada
+
+    - confianza: la del acta (0-100); cada estudiante lleva la suya en
+      su propio campo confianza
+    - confianzaEstudiantes: las mismas, en el orden de estudiantes
+    - consistencia: puntaje y conteo de problemas
+    - revisionSugerida: estudiantes bajo el umbral (Nº, confianza y
+      problemas) y si conviene reprocesar el acta completa
+
+    Args:
+        resultado: Resultado de convert_to_backend_format
+        report: check_consistency de los mismos estudiantes
+        umbral: Confianza mínima sin revisión
+
+    Returns:
+        El mismo resultado
+    """
+    resultado['confianza'] = report.confianza
+    for est, confianza in zip(resultado['estudiantes'], report.confianzas):
+        est['confianza'] = confianza
+    resultado['confianzaEstudiantes'] = list(report.confianzas)
+    resultado['consistencia'] = report.as_dict()
+    reprocesar = report.confianza < umbral
+    resultado['revisionSugerida'] = {
+        'umbral': umbral,
+        'reprocesarActa': reprocesar,
+        'estudiantes': [
+            {'numero': est['numero'], 'confianza': confianza, 'problemas': problemas}
+            for est, confianza, problemas in zip(resultado['estudiantes'], report.confianzas, report.problemas)
+            if confianza < umbral
+        ],
+    }
+    if reprocesar:
+        resultado['advertencias'].append(
+            f"Confianza del acta {report.confianza}% (mínimo {umbral}%): conviene reprocesarla"
+        )
+    return resultado
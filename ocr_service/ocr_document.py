@@ -0,0 +1,159 @@
+"""
+Documentos multipágina (libros escaneados en TIFF o PDF)
+
+Un libro de actas llega como un único TIFF multipágina o un PDF. En lugar
+de separar el archivo y re-codificar cada página a base64, el documento se
+abre una vez para contar sus páginas y cada página se decodifica recién
+cuando se va a procesar:
+
+- TIFF (y otros formatos multi-frame de PIL): cada página abre su propio
+  handle del archivo y hace seek() al frame; los píxeles se leen en
+  image.load(), dentro del pipeline OCR
+- PDF: la página se rasteriza con pypdfium2 (dependencia opcional) a la
+  resolución pedida
+
+Cada página es una imagen independiente que se libera al terminar de
+procesarla, así la memoria depende de las páginas en vuelo y no del
+tamaño del libro.
+"""
+
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FORMATO_PDF = 'pdf'
+PDF_MAGIC = b'%PDF-'
+PDF_DPI_DEFAULT = 200
+
+
+class DocumentError(ValueError):
+    """El documento no se puede abrir o la página no existe"""
+
+
+def file_sha256(path: str) -> str:
+    """Hash del archivo completo, leído por bloques"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+@dataclass
+class DocumentPage:
+    """Página de un documento (pagina empieza en 1)"""
+    pagina: int
+    total: int
+    image: Image.Image
+
+
+class DocumentPages:
+    """Documento multipágina abierto de forma perezosa"""
+
+    def __init__(self, path: str, pdf_dpi: int = PDF_DPI_DEFAULT):
+        """
+        Args:
+            path: Ruta del TIFF, PDF o imagen de una página
+            pdf_dpi: Resolución de rasterizado de las páginas PDF
+
+        Raises:
+            DocumentError: Si el archivo no es un documento soportado
+        """
+        self.path = path
+        self.pdf_dpi = pdf_dpi
+        self._pdf = None
+        self._pdf_lock = threading.Lock()
+        # Hash del archivo: base de la huella de cada página (cache OCR y single-flight)
+        self.source_sha256 = file_sha256(path)
+
+        with open(path, 'rb') as f:
+            header = f.read(len(PDF_MAGIC))
+
+        if header == PDF_MAGIC:
+            self.formato = FORMATO_PDF
+            self._pdf = _open_pdf(path)
+            self.page_count = len(self._pdf)
+        else:
+            try:
+                with Image.open(path) as img:
+                    self.formato = (img.format or 'desconocido').lower()
+                    self.page_count = getattr(img, 'n_frames', 1)
+            except Exception as e:
+                raise DocumentError(f"No se pudo abrir el documento: {e}")
+
+        if self.page_count < 1:
+            raise DocumentError("El documento no tiene páginas")
+        logger.info("Documento abierto: formato=%s páginas=%d", self.formato, self.page_count)
+
+    def page(self, pagina: int) -> Image.Image:
+        """
+        Abre una página sin decodificar el resto del documento
+
+        Args:
+            pagina: Número de página (desde 1)
+
+        Returns:
+            PIL.Image independiente; el llamador debe cerrarla al terminar
+        """
+        if not 1 <= pagina <= self.page_count:
+            raise DocumentError(f"Página fuera de rango: {pagina} (el documento tiene {self.page_count})")
+
+        if self.formato == FORMATO_PDF:
+            with self._pdf_lock:
+                # pdfium no es seguro entre hilos: rasterizar de a una página
+                pdf_page = self._pdf[pagina - 1]
+                try:
+                    bitmap = pdf_page.render(scale=self.pdf_dpi / 72)
+                    image = bitmap.to_pil()
+                finally:
+                    pdf_page.close()
+        else:
+            image = Image.open(self.path)
+            if pagina > 1:
+                image.seek(pagina - 1)
+
+        # Huella propia de la página: el hash del archivo es el mismo para todas
+        image.info['source_sha256'] = hashlib.sha256(
+            f"{self.source_sha256}:{pagina}:{self.pdf_dpi if self.formato == FORMATO_PDF else ''}".encode('utf-8')
+        ).hexdigest()
+        image.info['documento_pagina'] = pagina
+        return image
+
+    def iter_pages(self, paginas: Optional[Iterator[int]] = None) -> Iterator[DocumentPage]:
+        """Recorre las páginas de a una (todas o las indicadas)"""
+        for pagina in paginas or range(1, self.page_count + 1):
+            yield DocumentPage(pagina=pagina, total=self.page_count, image=self.page(pagina))
+
+    def close(self):
+        if self._pdf is not None:
+            with self._pdf_lock:
+                self._pdf.close()
+                self._pdf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_pdf(path: str):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise DocumentError("Para procesar PDF se requiere pypdfium2 (pip install pypdfium2)")
+    try:
+        return pdfium.PdfDocument(path)
+    except Exception as e:
+        raise DocumentError(f"No se pudo abrir el PDF: {e}")
+
+
+def open_document(path: str, pdf_dpi: int = PDF_DPI_DEFAULT) -> DocumentPages:
+    """Abre un TIFF/PDF multipágina (o una imagen simple como documento de una página)"""
+    return DocumentPages(path, pdf_dpi=pdf_dpi)
@@ -0,0 +1,463 @@
+"""
+Trabajos OCR asíncronos con pool de workers y estado persistente en SQLite
+
+Flujo:
+1. POST /api/ocr/jobs guarda el trabajo en SQLite (estado 'en_cola') y
+   responde inmediatamente con su id
+2. Un pool acotado de workers ejecuta process_acta en segundo plano
+3. GET /api/ocr/jobs/<id> consulta el estado o el resultado
+4. Opcionalmente se notifica a un callback_url al terminar
+
+Si el servicio se reinicia, los trabajos 'en_cola' o 'procesando' se
+vuelven a encolar al arrancar.
+
+Con varios procesos (gunicorn/uvicorn con --workers) todos comparten la
+base: cada trabajo se toma con un UPDATE condicional (solo un proceso lo
+gana) y queda a nombre del proceso con un lease que se renueva mientras
+corre. Solo vuelven a la cola los trabajos 'procesando' cuyo lease venció
+(su proceso murió), nunca los que otro proceso vivo está ejecutando.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo
+ESTADO_EN_COLA = 'en_cola'
+ESTADO_PROCESANDO = 'procesando'
+ESTADO_COMPLETADO = 'completado'
+ESTADO_ERROR = 'error'
+
+# Columnas agregadas después de la primera versión de la tabla
+_COLUMNAS_AGREGADAS = (('propietario', 'TEXT'), ('lease_hasta', 'REAL'), ('opciones', 'TEXT'))
+
+
+class OCRJobStore:
+    """Persistencia de trabajos OCR en SQLite"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre una conexión SQLite, confirma la transacción y la cierra"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_jobs (
+                    id TEXT PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    actualizado_en REAL NOT NULL,
+                    metadata TEXT NOT NULL,
+                    imagen BLOB,
+                    imagen_ruta TEXT,
+                    use_cache INTEGER NOT NULL DEFAULT 1,
+                    callback_url TEXT,
+                    callback_estado TEXT,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    resultado TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_jobs_estado ON ocr_jobs(estado, creado_en)')
+            columnas = {row['name'] for row in conn.execute('PRAGMA table_info(ocr_jobs)')}
+            for nombre, tipo in _COLUMNAS_AGREGADAS:
+                if nombre not in columnas:
+                    conn.execute(f'ALTER TABLE ocr_jobs ADD COLUMN {nombre} {tipo}')
+
+    def create(
+        self,
+        metadata: Dict[str, Any],
+        image_bytes: Optional[bytes] = None,
+        image_path: Optional[str] = None,
+        use_cache: bool = True,
+        callback_url: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Registra un trabajo nuevo en estado 'en_cola'
+
+        Args:
+            options: Opciones de process_acta del request (preprocess, bands)
+
+        Returns:
+            str: Id del trabajo
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO ocr_jobs (id, estado, creado_en, actualizado_en, metadata, imagen, '
+                'imagen_ruta, use_cache, callback_url, opciones) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    job_id, ESTADO_EN_COLA, now, now,
+                    json.dumps(metadata, ensure_ascii=False),
+                    sqlite3.Binary(image_bytes) if image_bytes is not None else None,
+                    image_path, int(use_cache), callback_url,
+                    json.dumps(options) if options else None,
+                )
+            )
+        return job_id
+
+    def get(self, job_id: str, include_image: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene un trabajo por id
+
+        Returns:
+            dict o None si no existe
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['metadata'] = json.loads(job['metadata'])
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+        job['use_cache'] = bool(job['use_cache'])
+        job['opciones'] = json.loads(job['opciones']) if job['opciones'] else {}
+        if not include_image:
+            job.pop('imagen', None)
+        return job
+
+    def count_pending(self) -> int:
+        """Cantidad de trabajos en cola o en proceso"""
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM ocr_jobs WHERE estado IN (?, ?)',
+                (ESTADO_EN_COLA, ESTADO_PROCESANDO)
+            ).fetchone()[0]
+
+    def requeue_interrupted(self) -> List[str]:
+        """
+        Devuelve a la cola los trabajos cuyo proceso murió (lease vencido)
+
+        Los trabajos 'procesando' con lease vigente pertenecen a otro
+        proceso vivo y no se tocan.
+
+        Returns:
+            list: Ids de trabajos pendientes, en orden de creación
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE ocr_jobs SET estado = ?, actualizado_en = ?, propietario = NULL, lease_hasta = NULL '
+                'WHERE estado = ? AND (lease_hasta IS NULL OR lease_hasta < ?)',
+                (ESTADO_EN_COLA, now, ESTADO_PROCESANDO, now)
+            )
+            rows = conn.execute(
+                'SELECT id FROM ocr_jobs WHERE estado = ? ORDER BY creado_en',
+                (ESTADO_EN_COLA,)
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def claim(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """
+        Toma un trabajo en cola para ejecutarlo (atómico entre procesos)
+
+        Returns:
+            bool: True si este owner lo tomó; False si ya no estaba en cola
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE ocr_jobs SET estado = ?, actualizado_en = ?, intentos = intentos + 1, '
+                'propietario = ?, lease_hasta = ? WHERE id = ? AND estado = ?',
+                (ESTADO_PROCESANDO, now, owner, now + lease_seconds, job_id, ESTADO_EN_COLA)
+            )
+            return cursor.rowcount == 1
+
+    def renew_leases(self, job_ids: List[str], owner: str, lease_seconds: float) -> int:
+        """
+        Extiende el lease de los trabajos que este owner está ejecutando
+
+        Returns:
+            int: Trabajos renovados
+        """
+        if not job_ids:
+            return 0
+        placeholders = ','.join('?' * len(job_ids))
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f'UPDATE ocr_jobs SET lease_hasta = ? WHERE estado = ? AND propietario = ? '
+                f'AND id IN ({placeholders})',
+                (time.time() + lease_seconds, ESTADO_PROCESANDO, owner, *job_ids)
+            )
+            return cursor.rowcount
+
+    def mark_done(self, job_id: str, resultado: Dict[str, Any]):
+        # La imagen ya no se necesita: liberar espacio
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE ocr_jobs SET estado = ?, actualizado_en = ?, resultado = ?, imagen = NULL WHERE id = ?',
+                (ESTADO_COMPLETADO, time.time(), json.dumps(resultado, ensure_ascii=False), job_id)
+            )
+
+    def mark_failed(self, job_id: str, error: str):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE ocr_jobs SET estado = ?, actualizado_en = ?, error = ?, imagen = NULL WHERE id = ?',
+                (ESTADO_ERROR, time.time(), error, job_id)
+            )
+
+    def mark_callback(self, job_id: str, callback_estado: str):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE ocr_jobs SET callback_estado = ? WHERE id = ?',
+                (callback_estado, job_id)
+            )
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """
+        Elimina trabajos terminados más antiguos que el umbral
+
+        Returns:
+            int: Número de trabajos eliminados
+        """
+        limit = time.time() - older_than_seconds
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'DELETE FROM ocr_jobs WHERE estado IN (?, ?) AND actualizado_en < ?',
+                (ESTADO_COMPLETADO, ESTADO_ERROR, limit)
+            )
+            return cursor.rowcount
+
+
+def job_to_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte un trabajo al formato de respuesta de la API
+    """
+    response = {
+        'jobId': job['id'],
+        'estado': job['estado'],
+        'creadoEn': job['creado_en'],
+        'actualizadoEn': job['actualizado_en'],
+        'intentos': job['intentos'],
+    }
+    if job['estado'] == ESTADO_COMPLETADO:
+        response['resultado'] = job['resultado']
+    if job['estado'] == ESTADO_ERROR:
+        response['error'] = job['error']
+    if job.get('callback_url'):
+        response['callbackEstado'] = job.get('callback_estado')
+    return response
+
+
+class OCRJobManager:
+    """Pool acotado de workers que ejecuta trabajos OCR persistidos"""
+
+    def __init__(
+        self,
+        client,
+        store: OCRJobStore,
+        max_workers: int = 4,
+        max_queue: int = 500,
+        callback_timeout: int = 10,
+        callback_retries: int = 3,
+        lease_seconds: float = 120.0
+    ):
+        """
+        Args:
+            client: GeminiOCRClient usado por los workers
+            store: Persistencia de trabajos
+            max_workers: Trabajos procesados en paralelo
+            max_queue: Máximo de trabajos pendientes antes de rechazar nuevos
+            callback_timeout: Timeout en segundos de cada notificación
+            callback_retries: Intentos de notificación al callback_url
+            lease_seconds: Duración del lease de un trabajo en proceso; se
+                renueva cada lease_seconds / 3 mientras el proceso vive
+        """
+        self.client = client
+        self.store = store
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.callback_timeout = callback_timeout
+        self.callback_retries = max(1, callback_retries)
+        self.lease_seconds = lease_seconds
+        # Identifica a este proceso como dueño de sus trabajos en la base
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='ocr-job'
+        )
+        self._submitted = set()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start(self) -> int:
+        """
+        Reanuda los trabajos pendientes de una ejecución anterior y arranca
+        el heartbeat que renueva los leases
+
+        Returns:
+            int: Número de trabajos reanudados
+        """
+        reanudados = self._requeue()
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='ocr-job-lease', daemon=True)
+            self._heartbeat.start()
+        return reanudados
+
+    def _requeue(self) -> int:
+        pending = self.store.requeue_interrupted()
+        for job_id in pending:
+            self._schedule(job_id)
+        return len(pending)
+
+    def _heartbeat_loop(self):
+        """Renueva los leases propios y recupera los trabajos de procesos caídos"""
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.renew_leases(running, self.worker_id, self.lease_seconds)
+                self._requeue()
+            except Exception as e:
+                logger.warning("Heartbeat de trabajos OCR falló: %s", e)
+
+    def is_full(self) -> bool:
+        """True si la cola alcanzó su límite"""
+        return self.store.count_pending() >= self.max_queue
+
+    def submit(
+        self,
+        metadata: Dict[str, Any],
+        image_bytes: Optional[bytes] = None,
+        image_path: Optional[str] = None,
+        use_cache: bool = True,
+        callback_url: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Registra y encola un trabajo OCR
+
+        Returns:
+            str: Id del trabajo
+        """
+        job_id = self.store.create(
+            metadata,
+            image_bytes=image_bytes,
+            image_path=image_path,
+            use_cache=use_cache,
+            callback_url=callback_url,
+            options=options,
+        )
+        self._schedule(job_id)
+        return job_id
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            if job_id in self._submitted:
+                return
+            self._submitted.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: str):
+        try:
+            # Otro proceso (u otro worker de este) pudo tomarlo antes
+            if not self.store.claim(job_id, self.worker_id, self.lease_seconds):
+                return
+            with self._lock:
+                self._running.add(job_id)
+            job = self.store.get(job_id, include_image=True)
+            logger.info("Trabajo OCR %s en proceso (intento %d)", job_id, job['intentos'])
+
+            try:
+                if job['imagen'] is not None:
+                    image = self.client.load_image_from_bytes(bytes(job['imagen']))
+                else:
+                    image = self.client.load_and_prepare_image(job['imagen_ruta'])
+
+                resultado = self.client.process_acta(
+                    image,
+                    job['metadata'],
+                    use_cache=job['use_cache'],
+                    **job['opciones']
+                )
+                self.store.mark_done(job_id, resultado)
+                logger.info("Trabajo OCR %s completado", job_id)
+            except Exception as e:
+                self.store.mark_failed(job_id, str(e))
+                logger.error("Trabajo OCR %s falló: %s", job_id, e)
+
+            if job.get('callback_url'):
+                self._notify_callback(job_id, job['callback_url'])
+        finally:
+            with self._lock:
+                self._submitted.discard(job_id)
+                self._running.discard(job_id)
+
+    def _notify_callback(self, job_id: str, callback_url: str):
+        """
+        Notifica el resultado al callback_url (POST JSON) con reintentos
+        """
+        job = self.store.get(job_id)
+        body = json.dumps({
+            'success': job['estado'] == ESTADO_COMPLETADO,
+            'data': job_to_response(job),
+        }, ensure_ascii=False).encode('utf-8')
+
+        for attempt in range(1, self.callback_retries + 1):
+            try:
+                req = urllib.request.Request(
+                    callback_url,
+                    data=body,
+                    headers={'Content-Type': 'application/json'},
+                    method='POST'
+                )
+                with urllib.request.urlopen(req, timeout=self.callback_timeout) as resp:
+                    resp.read()
+                self.store.mark_callback(job_id, 'enviado')
+                return
+            except Exception as e:
+                logger.warning("Callback de trabajo %s falló (intento %d): %s", job_id, attempt, e)
+                if attempt < self.callback_retries:
+                    time.sleep(2 ** attempt)
+
+        self.store.mark_callback(job_id, 'fallido')
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del pool para /health"""
+        with self._lock:
+            activos = len(self._submitted)
+        return {
+            'workers': self.max_workers,
+            'trabajos_pendientes': activos,
+            'max_cola': self.max_queue,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Detiene el pool (los trabajos pendientes se reanudan al reiniciar)"""
+        self._stop.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,158 @@
+"""
+OCR por franjas horizontales para actas largas
+
+Las actas con muchas filas generan respuestas largas: son las llamadas más
+lentas y a veces terminan con finish_reason MAX_TOKENS, perdiendo toda la
+extracción. En modo franjas, la tabla se divide en bandas horizontales
+solapadas; cada banda lleva una copia del encabezado (título y nombres de
+columnas) para que el modelo sepa qué columna es cada área. Las bandas se
+procesan en paralelo y los estudiantes se fusionan por 'numero',
+descartando los duplicados de las zonas de solapamiento.
+
+La latencia pasa a depender de la banda más lenta y cada respuesta
+contiene solo una fracción de las filas.
+"""
+
+import unicodedata
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class TilingConfig:
+    """Configuración del modo franjas"""
+    bands: int = 0                  # Número de franjas (0 o 1 = desactivado)
+    overlap: float = 0.15           # Solapamiento, como fracción de la altura de cada franja
+    header_ratio: float = 0.2       # Fracción superior de la imagen con título y encabezado de la tabla
+    min_height: int = 0             # Altura mínima (px) para dividir; imágenes más bajas van enteras
+
+    @property
+    def enabled(self) -> bool:
+        return self.bands > 1
+
+    def signature(self) -> str:
+        """Firma estable de la configuración (forma parte de la clave del cache)"""
+        values = asdict(self)
+        return ','.join(f"{key}={values[key]}" for key in sorted(values))
+
+
+@dataclass
+class Band:
+    """Franja de la imagen lista para enviar al modelo"""
+    index: int                      # 0-based
+    total: int
+    image: Image.Image              # Encabezado + filas de la franja
+    top: int                        # Rango de filas (px) de la imagen original
+    bottom: int
+
+
+def should_tile(image: Image.Image, config: Optional[TilingConfig]) -> bool:
+    """True si la imagen debe procesarse por franjas"""
+    return config is not None and config.enabled and image.size[1] >= config.min_height
+
+
+def split_into_bands(image: Image.Image, config: TilingConfig) -> List[Band]:
+    """
+    Divide la imagen en franjas horizontales solapadas con el encabezado repetido
+
+    Args:
+        image: Imagen completa del acta
+        config: Configuración del modo franjas
+
+    Returns:
+        list: Franjas de arriba hacia abajo
+    """
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    width, height = image.size
+    header_height = max(0, min(int(height * config.header_ratio), height - config.bands))
+    body_height = height - header_height
+    band_height = body_height / config.bands
+    overlap = int(band_height * config.overlap)
+
+    header = image.crop((0, 0, width, header_height)) if header_height else None
+    dpi = image.info.get('dpi')
+
+    bands = []
+    for index in range(config.bands):
+        top = header_height + int(index * band_height) - (overlap if index > 0 else 0)
+        bottom = header_height + int((index + 1) * band_height) + (overlap if index < config.bands - 1 else 0)
+        top, bottom = max(header_height, top), min(height, bottom)
+
+        body = image.crop((0, top, width, bottom))
+        canvas = Image.new(image.mode, (width, header_height + body.size[1]), 'white')
+        if header is not None:
+            canvas.paste(header, (0, 0))
+        canvas.paste(body, (0, header_height))
+        if dpi:
+            canvas.info['dpi'] = dpi
+
+        bands.append(Band(index=index, total=config.bands, image=canvas, top=top, bottom=bottom))
+    return bands
+
+
+def student_numero(student: Dict[str, Any]) -> Optional[int]:
+    """Nº de orden de un estudiante, o None si falta o no es válido"""
+    try:
+        value = int(student.get('numero'))
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _name_key(student: Dict[str, Any]) -> Tuple[str, ...]:
+    parts = []
+    for field in ('apellido_paterno', 'apellido_materno', 'nombres', 'nombre_completo', 'apellidos_y_nombres'):
+        value = unicodedata.normalize('NFKD', str(student.get(field) or ''))
+        parts.append(''.join(c for c in value if c.isalnum()).upper())
+    return tuple(parts)
+
+
+def _completeness(student: Dict[str, Any]) -> Tuple[int, int]:
+    """Cuántas notas y campos de nombre trae un estudiante (para elegir entre duplicados)"""
+    notas = student.get('notas') or []
+    if isinstance(notas, dict):
+        notas = list(notas.values())
+    filled_notas = sum(1 for nota in notas if nota is not None)
+    filled_names = sum(1 for part in _name_key(student) if part)
+    return filled_notas, filled_names
+
+
+def merge_band_students(bands_students: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Fusiona los estudiantes extraídos de cada franja
+
+    Los duplicados (filas en la zona de solapamiento) se resuelven por
+    'numero' conservando la versión más completa; las filas sin número
+    válido se deduplican por nombre. El resultado queda ordenado por número.
+
+    Args:
+        bands_students: Estudiantes de cada franja, en orden de franja
+
+    Returns:
+        list: Estudiantes fusionados
+    """
+    by_numero: Dict[int, Dict[str, Any]] = {}
+    unnumbered: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    for students in bands_students:
+        for student in students:
+            numero = student_numero(student)
+            if numero is not None:
+                current = by_numero.get(numero)
+                if current is None or _completeness(student) > _completeness(current):
+                    by_numero[numero] = student
+            else:
+                key = _name_key(student)
+                current = unnumbered.get(key)
+                if current is None or _completeness(student) > _completeness(current):
+                    unnumbered[key] = student
+
+    # Sin número, pero ya extraído con número en otra franja: descartar
+    numbered_names = {_name_key(student) for student in by_numero.values()}
+    extra = [student for key, student in unnumbered.items() if key not in numbered_names]
+
+    return [by_numero[numero] for numero in sorted(by_numero)] + extra
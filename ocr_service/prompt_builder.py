@@ -1,80 +1,206 @@
 """
 Construcción de prompts para Gemini OCR
 Basado en SPRINT_01_SETUP_GEMINI.md
+
+El prompt de un acta se compila en dos partes:
+- Prefijo: instrucciones y reglas de extracción más la lista de áreas.
+  Solo depende del conjunto de áreas, así que se compila una vez por
+  conjunto (memoizado) y puede guardarse en el cache de contexto de Gemini.
+- Sufijo: datos propios del acta (año, grado, sección, turno) e
+  instrucciones extra (franja, continuación). Es lo único que cambia.
 """
 
-def build_acta_prompt(metadata: dict) -> str:
+import hashlib
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from model_pool import OCR_GENERATION_CONFIG
+from response_parser import COMPACT_COLUMNS, OUTPUT_FORMAT_OBJETOS, OUTPUT_FORMAT_FILAS
+
+# Versión de la plantilla de prompt. Incrementar cada vez que cambien las
+# instrucciones: forma parte de la clave del cache de resultados OCR y permite
+# invalidar los resultados obtenidos con plantillas anteriores.
+PROMPT_VERSION = 'v2'
+
+# Si el acta no trae áreas se usa la plantilla estándar de secundaria
+DEFAULT_AREAS = (
+    {'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'},
+    {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'},
+    {'posicion': 3, 'nombre': 'INGLÉS', 'codigo': 'ING'},
+    {'posicion': 4, 'nombre': 'ARTE', 'codigo': 'ART'},
+    {'posicion': 5, 'nombre': 'HISTORIA, GEOGRAFÍA Y ECONOMÍA', 'codigo': 'HGE'},
+    {'posicion': 6, 'nombre': 'FORMACIÓN CIUDADANA Y CÍVICA', 'codigo': 'FCC'},
+    {'posicion': 7, 'nombre': 'PERSONA, FAMILIA Y RELACIONES HUMANAS', 'codigo': 'PFRH'},
+    {'posicion': 8, 'nombre': 'EDUCACIÓN FÍSICA', 'codigo': 'EFI'},
+    {'posicion': 9, 'nombre': 'EDUCACIÓN RELIGIOSA', 'codigo': 'ERE'},
+    {'posicion': 10, 'nombre': 'CIENCIA, TECNOLOGÍA Y AMBIENTE', 'codigo': 'CTA'},
+    {'posicion': 11, 'nombre': 'EDUCACIÓN PARA EL TRABAJO', 'codigo': 'EPT'},
+)
+
+AreasKey = Tuple[Tuple[Any, Any, Any], ...]
+
+# Tokens de salida por fila de estudiante (base + por nota), medidos sobre
+# los ejemplos de cada formato; dimensionan max_output_tokens cuando se
+# conoce el número de filas del acta
+TOKENS_POR_FILA = {
+    OUTPUT_FORMAT_OBJETOS: (50, 5),
+    OUTPUT_FORMAT_FILAS: (20, 3),
+}
+# Reserva para el razonamiento del modelo (cuenta dentro de max_output_tokens)
+TOKENS_RESERVA_RAZONAMIENTO = 8192
+MAX_OUTPUT_TOKENS_LIMITE = 32768
+
+
+# Secciones del prompt que dependen del formato de salida
+_FORMATO_OBJETOS = """
+✅ FORMATO DE RESPUESTA JSON (copia EXACTAMENTE esta estructura):
+
+{
+  "estudiantes": [
+    {
+      "numero": 1,
+      "codigo": "12345",
+      "tipo": "G",
+      "apellido_paterno": "GARCÍA",
+      "apellido_materno": "LÓPEZ",
+      "nombres": "JUAN CARLOS",
+      "sexo": "M",
+      "notas": [14, 15, 16, 12, 11, 10, 13, 15, 14, 11, 12],
+      "comportamiento": "18",
+      "asignaturas_desaprobadas": 2,
+      "situacion_final": "A",
+      "observaciones": null
+    },
+    {
+      "numero": 2,
+      "codigo": "",
+      "tipo": "G",
+      "apellido_paterno": "MARTÍNEZ",
+      "apellido_materno": "SILVA",
+      "nombres": "MARÍA ELENA",
+      "sexo": "F",
+      "notas": [16, 17, 18, 15, 14, 13, 16, 17, 15, 14, 15],
+      "comportamiento": "19",
+      "asignaturas_desaprobadas": 0,
+      "situacion_final": "P",
+      "observaciones": null
+    }
+  ]
+}
+""".strip()
+
+
+def _format_sections(output_format: str, num_areas: int) -> Tuple[str, str, str]:
     """
-    Construye el prompt para Gemini basado en la metadata del acta
+    Secciones del prompt propias del formato de salida
+    
+    Returns:
+        (campo asignaturas_desaprobadas, formato de respuesta, reglas de formato)
+    """
+    if output_format == OUTPUT_FORMAT_OBJETOS:
+        return (
+            "10. **asignaturas_desaprobadas** (int): Cantidad de notas menores a 11 (cuenta las desaprobadas)",
+            _FORMATO_OBJETOS,
+            "✓ Cuenta SIEMPRE las asignaturas desaprobadas (notas < 11)\n"
+            "✓ Cada estudiante DEBE tener exactamente estos campos: numero, codigo, tipo, apellido_paterno, "
+            "apellido_materno, nombres, sexo, notas, comportamiento, asignaturas_desaprobadas, situacion_final, observaciones",
+        )
+    if output_format == OUTPUT_FORMAT_FILAS:
+        columnas = ', '.join(COMPACT_COLUMNS)
+        formato = f"""
+✅ FORMATO DE RESPUESTA JSON (compacto: una fila por estudiante, sin repetir nombres de campos):
+Cada fila es {{"d": [...], "n": [...]}}
+- "d": EXACTAMENTE {len(COMPACT_COLUMNS)} valores de texto (o null), en este orden:
+  {columnas}
+- "n": las {num_areas} notas en el orden de las áreas (números 0-20 o null)
+
+{{"filas": [
+  {{"d": ["1", "12345", "G", "GARCÍA", "LÓPEZ", "JUAN CARLOS", "M", "18", "A", null], "n": [14, 15, 16, 12, 11, 10, 13, 15, 14, 11, 12]}},
+  {{"d": ["2", "", "G", "MARTÍNEZ", "SILVA", "MARÍA ELENA", "F", "19", "P", null], "n": [16, 17, 18, 15, 14, 13, 16, 17, 15, 14, 15]}}
+]}}
+""".strip()
+        return (
+            "10. **asignaturas_desaprobadas**: NO la incluyas (se calcula a partir de las notas)",
+            formato,
+            f"✓ Cada fila DEBE tener \"d\" con los {len(COMPACT_COLUMNS)} valores en el orden indicado "
+            f"y \"n\" con {num_areas} notas",
+        )
+    raise ValueError(f"Formato de salida desconocido: {output_format}")
+
+
+@dataclass(frozen=True)
+class ActaPrompt:
+    """Prompt compilado de un acta"""
+    prefix: str                     # Reglas + áreas: igual para todas las actas con las mismas áreas
+    suffix: str                     # Datos del acta e instrucciones extra
+    signature: str                  # Huella del prefijo (clave del cache de contexto)
+    output_format: str = OUTPUT_FORMAT_OBJETOS
+    num_areas: int = 0
+    expected_rows: Optional[int] = None     # Filas detectadas en la imagen (detección de tabla)
+
+    @property
+    def text(self) -> str:
+        """Prompt completo, para enviarlo sin cache de contexto"""
+        return f"{self.prefix}\n\n{self.suffix}"
+
+    def with_instructions(self, extra: str) -> 'ActaPrompt':
+        """Copia con instrucciones agregadas al sufijo (el prefijo no cambia)"""
+        return replace(self, suffix=f"{self.suffix}\n{extra}")
+
+    def expected_output_tokens(self) -> Optional[int]:
+        """Tokens de salida esperados para las filas detectadas (None si no se conocen)"""
+        if not self.expected_rows:
+            return None
+        base, per_area = TOKENS_POR_FILA.get(self.output_format, TOKENS_POR_FILA[OUTPUT_FORMAT_OBJETOS])
+        return 64 + self.expected_rows * (base + per_area * self.num_areas)
+
+    def max_output_tokens(self) -> Optional[int]:
+        """
+        max_output_tokens para las filas detectadas: salida esperada con 25%
+        de margen más la reserva de razonamiento, en múltiplos de 1024 (así
+        varía poco entre actas)
+        
+        Nunca baja del max_output_tokens por defecto (OCR_GENERATION_CONFIG):
+        el razonamiento de gemini-2.5-pro cuenta dentro del límite y un
+        conteo de filas corto no debe provocar respuestas cortadas. Las
+        filas detectadas solo suben el límite en actas largas.
+        """
+        expected = self.expected_output_tokens()
+        if expected is None:
+            return None
+        budget = TOKENS_RESERVA_RAZONAMIENTO + int(expected * 1.25)
+        budget = max(OCR_GENERATION_CONFIG['max_output_tokens'], -(-budget // 1024) * 1024)
+        return min(MAX_OUTPUT_TOKENS_LIMITE, budget)
+
+
+def areas_key(areas) -> AreasKey:
+    """Clave hashable de un conjunto de áreas (posición, nombre, código)"""
+    return tuple(
+        (area.get('posicion', 0), area.get('nombre', 'N/A'), area.get('codigo', 'N/A'))
+        for area in areas
+    )
+
+
+@lru_cache(maxsize=256)
+def compile_prompt_prefix(key: AreasKey, output_format: str = OUTPUT_FORMAT_OBJETOS) -> Tuple[str, str]:
+    """
+    Compila el prefijo estático para un conjunto de áreas (memoizado)
     
     Args:
-        metadata: {
-            'anio_lectivo': 1995,
-            'grado': 'Quinto Grado',
-            'seccion': 'A',
-            'turno': 'MAÑANA',
-            'tipo_evaluacion': 'FINAL',
-            'areas': [
-                {'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'},
-                {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'},
-                ...
-            ]
-        }
+        key: Resultado de areas_key()
+        output_format: 'objetos' (un objeto por estudiante) o 'filas' (compacto)
     
     Returns:
-        str: Prompt formateado para Gemini
+        (prefijo, firma SHA-256 abreviada del prefijo)
     """
+    num_areas = len(key)
+    plantilla_areas_str = '\n'.join(f"{posicion}. {nombre} ({codigo})" for posicion, nombre, codigo in key)
+    campo_desaprobadas, formato_respuesta, reglas_formato = _format_sections(output_format, num_areas)
     
-    anio = metadata.get('anio_lectivo', 'N/A')
-    grado = metadata.get('grado', 'N/A')
-    seccion = metadata.get('seccion', 'N/A')
-    turno = metadata.get('turno', 'N/A')
-    areas = metadata.get('areas', [])
-    num_areas = len(areas)
-    
-    # Construir plantilla de áreas
-    plantilla_areas = []
-    for area in areas:
-        posicion = area.get('posicion', 0)
-        nombre = area.get('nombre', 'N/A')
-        codigo = area.get('codigo', 'N/A')
-        plantilla_areas.append(f"{posicion}. {nombre} ({codigo})")
-    
-    # Si no hay áreas, generar plantilla estándar de secundaria
-    if not areas or len(areas) == 0:
-        areas = [
-            {'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'},
-            {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'},
-            {'posicion': 3, 'nombre': 'INGLÉS', 'codigo': 'ING'},
-            {'posicion': 4, 'nombre': 'ARTE', 'codigo': 'ART'},
-            {'posicion': 5, 'nombre': 'HISTORIA, GEOGRAFÍA Y ECONOMÍA', 'codigo': 'HGE'},
-            {'posicion': 6, 'nombre': 'FORMACIÓN CIUDADANA Y CÍVICA', 'codigo': 'FCC'},
-            {'posicion': 7, 'nombre': 'PERSONA, FAMILIA Y RELACIONES HUMANAS', 'codigo': 'PFRH'},
-            {'posicion': 8, 'nombre': 'EDUCACIÓN FÍSICA', 'codigo': 'EFI'},
-            {'posicion': 9, 'nombre': 'EDUCACIÓN RELIGIOSA', 'codigo': 'ERE'},
-            {'posicion': 10, 'nombre': 'CIENCIA, TECNOLOGÍA Y AMBIENTE', 'codigo': 'CTA'},
-            {'posicion': 11, 'nombre': 'EDUCACIÓN PARA EL TRABAJO', 'codigo': 'EPT'},
-        ]
-        plantilla_areas = []
-        for area in areas:
-            posicion = area.get('posicion', 0)
-            nombre = area.get('nombre', 'N/A')
-            codigo = area.get('codigo', 'N/A')
-            plantilla_areas.append(f"{posicion}. {nombre} ({codigo})")
-        num_areas = len(areas)
-    
-    plantilla_areas_str = '\n'.join(plantilla_areas)
-    
-    prompt = f"""
+    prefix = f"""
 🎯 ANÁLISIS OCR DE ACTA DE EVALUACIÓN ESCOLAR
 
-📋 INFORMACIÓN DEL ACTA:
-- Año Lectivo: {anio}
-- Grado: {grado}
-- Sección: {seccion}
-- Turno: {turno}
-- Número de áreas curriculares: {num_areas}
-
 📚 ÁREAS CURRICULARES (EN ORDEN):
 {plantilla_areas_str}
 
@@ -120,7 +246,7 @@ Para CADA estudiante (CADA fila de la tabla), extrae EXACTAMENTE estos campos:
 7. **sexo** (string): "M" o "F"
 8. **notas** (array de números): EXACTAMENTE {num_areas} notas (0-20 o null)
 9. **comportamiento** (string): Nota de comportamiento (puede ser letra A-D o número 0-20)
-10. **asignaturas_desaprobadas** (int): Cantidad de notas menores a 11 (cuenta las desaprobadas)
+{campo_desaprobadas}
 11. **situacion_final** (string): "P", "A" o "R"
 12. **observaciones** (string o null): Anotaciones especiales
 
@@ -131,40 +257,7 @@ Para CADA estudiante (CADA fila de la tabla), extrae EXACTAMENTE estos campos:
 - NUNCA dejes los nombres vacíos ("" o null)
 - Si no puedes leer el nombre claramente, escribe "ILEGIBLE" pero NUNCA lo dejes vacío
 
-✅ FORMATO DE RESPUESTA JSON (copia EXACTAMENTE esta estructura):
-
-{{
-  "estudiantes": [
-    {{
-      "numero": 1,
-      "codigo": "12345",
-      "tipo": "G",
-      "apellido_paterno": "GARCÍA",
-      "apellido_materno": "LÓPEZ",
-      "nombres": "JUAN CARLOS",
-      "sexo": "M",
-      "notas": [14, 15, 16, 12, 11, 10, 13, 15, 14, 11, 12],
-      "comportamiento": "18",
-      "asignaturas_desaprobadas": 2,
-      "situacion_final": "A",
-      "observaciones": null
-    }},
-    {{
-      "numero": 2,
-      "codigo": "",
-      "tipo": "G",
-      "apellido_paterno": "MARTÍNEZ",
-      "apellido_materno": "SILVA",
-      "nombres": "MARÍA ELENA",
-      "sexo": "F",
-      "notas": [16, 17, 18, 15, 14, 13, 16, 17, 15, 14, 15],
-      "comportamiento": "19",
-      "asignaturas_desaprobadas": 0,
-      "situacion_final": "P",
-      "observaciones": null
-    }}
-  ]
-}}
+{formato_respuesta}
 
 🚨 REGLAS CRÍTICAS:
 ✓ Extrae TODOS los estudiantes de la tabla (si hay 25 filas, extrae las 25)
@@ -176,8 +269,7 @@ Para CADA estudiante (CADA fila de la tabla), extrae EXACTAMENTE estos campos:
 ✓ NO inventes datos - solo extrae lo que ves
 ✓ NO agregues explicaciones - solo el JSON
 ✓ Verifica que el número de notas coincida con {num_areas} áreas
-✓ Cuenta SIEMPRE las asignaturas desaprobadas (notas < 11)
-✓ Cada estudiante DEBE tener exactamente estos campos: numero, codigo, tipo, apellido_paterno, apellido_materno, nombres, sexo, notas, comportamiento, asignaturas_desaprobadas, situacion_final, observaciones
+{reglas_formato}
 
 🔍 CÓMO EXTRAER NOMBRES:
 La columna "Apellidos y Nombres" típicamente tiene formato:
@@ -200,11 +292,127 @@ Si el texto está muy borroso:
   * A = Aprobado (terminó con algunas materias desaprobadas para recuperar)
   * R = Reprobado (no alcanzó el mínimo o se retiró)
 - El comportamiento suele ser una letra (A, B, C, D) o número (0-20)
+"""
+    
+    prefix = prefix.strip()
+    signature = hashlib.sha256(f"{PROMPT_VERSION}|{prefix}".encode('utf-8')).hexdigest()[:16]
+    return prefix, signature
+
 
+def compile_acta_prompt(
+    metadata: dict,
+    output_format: str = OUTPUT_FORMAT_OBJETOS,
+    expected_rows: Optional[int] = None
+) -> ActaPrompt:
+    """
+    Compila el prompt de un acta en prefijo estático y sufijo dinámico
+    
+    Args:
+        metadata: {
+            'anio_lectivo': 1995,
+            'grado': 'Quinto Grado',
+            'seccion': 'A',
+            'turno': 'MAÑANA',
+            'tipo_evaluacion': 'FINAL',
+            'areas': [
+                {'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'},
+                {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'},
+                ...
+            ]
+        }
+        output_format: Formato de salida pedido al modelo ('objetos' o 'filas')
+        expected_rows: Filas de estudiantes detectadas en la imagen (None = sin dato)
+    
+    Returns:
+        ActaPrompt: Prompt compilado
+    """
+    areas = metadata.get('areas') or DEFAULT_AREAS
+    prefix, signature = compile_prompt_prefix(areas_key(areas), output_format)
+    
+    suffix = f"""
+📋 INFORMACIÓN DEL ACTA:
+- Año Lectivo: {metadata.get('anio_lectivo', 'N/A')}
+- Grado: {metadata.get('grado', 'N/A')}
+- Sección: {metadata.get('seccion', 'N/A')}
+- Turno: {metadata.get('turno', 'N/A')}
+- Número de áreas curriculares: {len(areas)}
+{_expected_rows_line(expected_rows)}
 ¡Adelante! Analiza la imagen con precisión quirúrgica.
 """
     
-    return prompt.strip()
+    return ActaPrompt(
+        prefix=prefix,
+        suffix=suffix.strip(),
+        signature=signature,
+        output_format=output_format,
+        num_areas=len(areas),
+        expected_rows=expected_rows,
+    )
+
+
+def _expected_rows_line(expected_rows: Optional[int]) -> str:
+    if not expected_rows:
+        return ''
+    return (
+        f"- Filas con estudiantes detectadas en la tabla: {expected_rows}\n"
+        f"  (conteo automático: verifica que extraes {expected_rows} estudiantes; "
+        f"si ves más o menos filas, extrae las que realmente hay)\n"
+    )
+
+
+def build_acta_prompt(metadata: dict, expected_rows: Optional[int] = None) -> str:
+    """
+    Construye el prompt completo para Gemini basado en la metadata del acta
+    
+    Args:
+        metadata: Ver compile_acta_prompt
+        expected_rows: Filas de estudiantes detectadas en la imagen (None = sin dato)
+    
+    Returns:
+        str: Prompt formateado para Gemini
+    """
+    return compile_acta_prompt(metadata, expected_rows=expected_rows).text
+
+
+def build_band_instructions(band_index: int, total_bands: int) -> str:
+    """
+    Instrucciones adicionales para una franja del acta (modo franjas)
+    
+    Args:
+        band_index: Índice de la franja (0 = la de más arriba)
+        total_bands: Total de franjas del acta
+    
+    Returns:
+        str: Texto que se agrega al final del prompt del acta
+    """
+    return f"""
+✂️ FRANJA {band_index + 1} DE {total_bands}:
+Esta imagen NO es el acta completa. Arriba tiene el encabezado de la tabla
+(títulos y nombres de columnas) y debajo SOLO un rango de filas del acta.
+- Extrae ÚNICAMENTE las filas de estudiantes visibles en esta franja
+- Si una fila aparece cortada en el borde superior o inferior, OMÍTELA
+  (está completa en la franja vecina)
+- Usa el Nº de Orden impreso en la tabla para "numero": NO renumeres desde 1
+""".rstrip()
+
+
+def build_continuation_instructions(last_numero: int) -> str:
+    """
+    Instrucciones para continuar una extracción que se cortó
+    
+    Args:
+        last_numero: Último Nº de Orden extraído completo
+    
+    Returns:
+        str: Texto que se agrega al final del prompt del acta
+    """
+    return f"""
+⏭️ CONTINUACIÓN:
+Los estudiantes hasta el Nº de Orden {last_numero} YA fueron extraídos.
+- Extrae ÚNICAMENTE las filas con Nº de Orden MAYOR a {last_numero}
+- NO repitas los estudiantes anteriores
+- Mantén exactamente el mismo formato JSON de respuesta
+""".rstrip()
 
 
 def validate_metadata(metadata: dict) -> tuple[bool, str]:
@@ -0,0 +1,251 @@
+"""
+Rate limiter de token bucket para la API de Gemini
+
+Controla por separado:
+- RPM: requests por minuto
+- TPM: tokens por minuto (entrada + salida)
+
+Cada request reserva un permiso con una estimación de tokens; cuando llega
+la respuesta, se ajusta la reserva con el uso real reportado por Gemini
+(usage_metadata). Es seguro entre hilos y permite exactamente la
+concurrencia que la cuota admite, en lugar de un request cada 2 segundos.
+"""
+
+import math
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+
+# Tokens por imagen en Gemini 2.x: 258 si ambos lados <= 384 px,
+# en otro caso la imagen se divide en bloques de 768x768 de 258 tokens cada uno
+IMAGE_TOKENS_PER_TILE = 258
+IMAGE_SMALL_SIDE = 384
+IMAGE_TILE_SIDE = 768
+
+
+class RateLimitExceeded(RuntimeError):
+    """No se obtuvo permiso dentro del tiempo máximo de espera"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class RatePermit:
+    """Permiso otorgado por el limiter"""
+    tokens: int
+    granted_at: float
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estima los tokens de entrada que Gemini cobra por una imagen
+    """
+    if width <= IMAGE_SMALL_SIDE and height <= IMAGE_SMALL_SIDE:
+        return IMAGE_TOKENS_PER_TILE
+    tiles = math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE)
+    return tiles * IMAGE_TOKENS_PER_TILE
+
+
+def estimate_request_tokens(image_size, prompt: str, expected_output_tokens: int) -> int:
+    """
+    Estima el total de tokens (entrada + salida) de un request OCR
+
+    Args:
+        image_size: (ancho, alto) de la imagen, o None
+        prompt: Texto del prompt (~4 caracteres por token)
+        expected_output_tokens: Tokens de salida esperados
+
+    Returns:
+        int: Tokens estimados
+    """
+    tokens = len(prompt) // 4 + expected_output_tokens
+    if image_size:
+        tokens += estimate_image_tokens(image_size[0], image_size[1])
+    return tokens
+
+
+class TokenBucketRateLimiter:
+    """Limiter compartido con buckets independientes de RPM y TPM"""
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            requests_per_minute: Cuota de requests por minuto
+            tokens_per_minute: Cuota de tokens por minuto
+            clock: Reloj monotónico (inyectable para pruebas)
+        """
+        if requests_per_minute <= 0 or tokens_per_minute <= 0:
+            raise ValueError("Las cuotas RPM y TPM deben ser mayores a cero")
+
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._clock = clock
+
+        # Los buckets empiezan llenos: se permite la ráfaga que la cuota admite
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = clock()
+
+        self._cond = threading.Condition()
+        self.waiting = 0
+        self.granted = 0
+
+    def _refill(self):
+        """Recarga ambos buckets según el tiempo transcurrido (requiere lock)"""
+        now = self._clock()
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+            self._updated_at = now
+
+    def _clamp(self, tokens: int) -> int:
+        # Un request más grande que la cuota completa nunca se podría atender
+        return max(0, min(int(tokens), self.tpm))
+
+    def _wait_time(self, tokens: int) -> float:
+        """Segundos hasta que haya capacidad para el request (requiere lock)"""
+        missing_requests = max(0.0, 1 - self._requests)
+        missing_tokens = max(0.0, tokens - self._tokens)
+        return max(
+            missing_requests * 60.0 / self.rpm,
+            missing_tokens * 60.0 / self.tpm,
+        )
+
+    def estimate_wait(self, tokens: int = 0) -> float:
+        """
+        Estima cuántos segundos habría que esperar por un permiso
+
+        Args:
+            tokens: Tokens estimados del request
+
+        Returns:
+            float: Segundos (0 si hay capacidad inmediata)
+        """
+        with self._cond:
+            self._refill()
+            return self._wait_time(self._clamp(tokens))
+
+    def try_acquire(self, tokens: int = 0) -> Optional[RatePermit]:
+        """
+        Intenta obtener un permiso sin esperar
+
+        Returns:
+            RatePermit o None si no hay capacidad
+        """
+        tokens = self._clamp(tokens)
+        with self._cond:
+            self._refill()
+            if self._wait_time(tokens) > 0:
+                return None
+            return self._grant(tokens)
+
+    def _grant(self, tokens: int) -> RatePermit:
+        """Descuenta la reserva de ambos buckets (requiere lock)"""
+        self._requests -= 1
+        self._tokens -= tokens
+        self.granted += 1
+        return RatePermit(tokens=tokens, granted_at=self._clock())
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> RatePermit:
+        """
+        Espera (bloqueando el hilo) hasta obtener un permiso
+
+        Args:
+            tokens: Tokens estimados del request
+            timeout: Espera máxima en segundos (None = sin límite)
+
+        Returns:
+            RatePermit
+
+        Raises:
+            RateLimitExceeded: Si la espera necesaria supera el timeout
+        """
+        tokens = self._clamp(tokens)
+        deadline = None if timeout is None else self._clock() + timeout
+
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        return self._grant(tokens)
+
+                    if deadline is not None:
+                        remaining = deadline - self._clock()
+                        if wait > remaining:
+                            raise RateLimitExceeded(
+                                f"Cuota de Gemini agotada: se requiere esperar {wait:.1f}s",
+                                retry_after=wait
+                            )
+
+                    # Se despierta antes si otro hilo devuelve tokens (record_usage)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, tokens: int = 0, timeout: Optional[float] = None) -> RatePermit:
+        """
+        Versión asíncrona de acquire: espera sin bloquear el event loop
+        """
+        tokens = self._clamp(tokens)
+        start = self._clock()
+
+        while True:
+            permit = self.try_acquire(tokens)
+            if permit is not None:
+                return permit
+
+            wait = self.estimate_wait(tokens)
+            if timeout is not None and (self._clock() - start) + wait > timeout:
+                raise RateLimitExceeded(
+                    f"Cuota de Gemini agotada: se requiere esperar {wait:.1f}s",
+                    retry_after=wait
+                )
+            await asyncio.sleep(max(wait, 0.01))
+
+    def record_usage(self, permit: RatePermit, actual_tokens: Optional[int]):
+        """
+        Ajusta la reserva con el uso real reportado por Gemini
+
+        Si se usaron menos tokens de los estimados, la diferencia vuelve al
+        bucket (y despierta a los hilos en espera); si se usaron más, se
+        descuenta el excedente.
+        """
+        if actual_tokens is None:
+            return
+
+        delta = permit.tokens - int(actual_tokens)
+        if delta == 0:
+            return
+
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.tpm, self._tokens + delta)
+            if delta > 0:
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del limiter para /health"""
+        with self._cond:
+            self._refill()
+            return {
+                'rpm': self.rpm,
+                'tpm': self.tpm,
+                'requests_disponibles': round(self._requests, 2),
+                'tokens_disponibles': int(self._tokens),
+                'en_espera': self.waiting,
+                'permisos_otorgados': self.granted,
+            }
@@ -0,0 +1,170 @@
+"""
+Re-procesa el archivo de respuestas crudas con las reglas actuales
+
+Recorre ResponseArchive y pasa cada acta por
+extract_json_from_response → validate_ocr_response → convert_to_backend_format
+sin llamar a Gemini. El trabajo se reparte en un pool de procesos (uno por
+núcleo por defecto) con lotes de entradas comprimidas; el proceso principal
+solo lee SQLite, escribe resultados y compara con el resultado archivado.
+
+Salidas:
+- --salida: JSONL con {id, huella, resultado | error} por acta
+- --resumen: JSON con actas/estudiantes cambiados por campo, actas que
+  ahora fallan o ahora se recuperan y tiempos
+
+Uso:
+    python reparse_archive.py [--db .ocr_archive/respuestas.sqlite3] [--salida reparse.jsonl]
+                              [--resumen reparse_resumen.json] [--workers N] [--lote 64]
+                              [--umbral-confianza 70]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from response_archive import ESTADO_OK, ResponseArchive, decompress_json, reparse_entry
+
+# Campos por estudiante que se comparan con el resultado archivado
+CAMPOS_ESTUDIANTE = (
+    'nombreCompleto', 'apellidoPaterno', 'apellidoMaterno', 'nombres', 'sexo',
+    'notas', 'comportamiento', 'asignaturasDesaprobadas', 'situacionFinal', 'codigo', 'tipo',
+)
+
+
+def diff_resultados(anterior: Optional[Dict[str, Any]], nuevo: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Estudiantes con cambios por campo entre dos resultados (emparejados por número)
+
+    Returns:
+        {campo: estudiantes con cambio, 'agregados': n, 'eliminados': n}
+    """
+    cambios: Counter = Counter()
+    previos = {est.get('numero'): est for est in (anterior or {}).get('estudiantes', [])}
+    actuales = {est.get('numero'): est for est in (nuevo or {}).get('estudiantes', [])}
+    for numero, est in actuales.items():
+        previo = previos.get(numero)
+        if previo is None:
+            cambios['agregados'] += 1
+            continue
+        for campo in CAMPOS_ESTUDIANTE:
+            if previo.get(campo) != est.get(campo):
+                cambios[campo] += 1
+    cambios['eliminados'] = sum(1 for numero in previos if numero not in actuales)
+    return {campo: n for campo, n in cambios.items() if n}
+
+
+def process_batch(entries: List[Dict[str, Any]], umbral: int) -> List[Dict[str, Any]]:
+    """Trabajo de cada proceso: re-parsear un lote y comparar con lo archivado"""
+    salidas = []
+    for entry in entries:
+        salida = reparse_entry(entry, umbral)
+        salida['estadoAnterior'] = entry['estado']
+        anterior = decompress_json(entry['resultado'])
+        salida['cambios'] = diff_resultados(anterior, salida.get('resultado')) if 'resultado' in salida else {}
+        salidas.append(salida)
+    return salidas
+
+
+def iter_batches(archive: ResponseArchive, size: int, desde_id: int = 0):
+    batch = []
+    for entry in archive.iter_rows(batch_size=max(size, 200), desde_id=desde_id):
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-procesa el archivo de respuestas de Gemini')
+    parser.add_argument('--db', default=os.getenv('OCR_ARCHIVE_DB', '.ocr_archive/respuestas.sqlite3'))
+    parser.add_argument('--salida', default='reparse.jsonl', help='JSONL con los resultados re-normalizados')
+    parser.add_argument('--resumen', default='reparse_resumen.json', help='Resumen de diferencias (JSON)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos (default: núcleos)')
+    parser.add_argument('--lote', type=int, default=64, help='Actas por tarea enviada a cada proceso')
+    parser.add_argument('--desde-id', type=int, default=0, help='Procesar solo entradas con id mayor')
+    parser.add_argument(
+        '--umbral-confianza', type=int, default=int(os.getenv('OCR_CONFIDENCE_THRESHOLD', 70)),
+        help='Confianza mínima sin revisión (default: OCR_CONFIDENCE_THRESHOLD)'
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ No existe el archivo de respuestas: {args.db}")
+        sys.exit(1)
+    archive = ResponseArchive(args.db)
+    total = archive.count()
+    print(f"🔁 Re-procesando {total} actas de {args.db} con {args.workers} procesos (lotes de {args.lote})")
+
+    resumen = {
+        'actas': 0,
+        'actasCambiadas': 0,
+        'estudiantesCambiados': Counter(),
+        'ahoraFallan': 0,
+        'ahoraSeRecuperan': 0,
+        'siguenFallando': 0,
+        'errores': Counter(),
+    }
+    start = time.perf_counter()
+
+    def collect(salidas, out):
+        for salida in salidas:
+            cambios = salida.pop('cambios')
+            estado_anterior = salida.pop('estadoAnterior')
+            out.write(json.dumps(salida, ensure_ascii=False) + '\n')
+            resumen['actas'] += 1
+            if 'error' in salida:
+                resumen['errores'][salida['error'].split(':')[0]] += 1
+                if estado_anterior == ESTADO_OK:
+                    resumen['ahoraFallan'] += 1
+                else:
+                    resumen['siguenFallando'] += 1
+            elif estado_anterior != ESTADO_OK:
+                resumen['ahoraSeRecuperan'] += 1
+            elif cambios:
+                resumen['actasCambiadas'] += 1
+                resumen['estudiantesCambiados'].update(cambios)
+
+    # Como máximo dos lotes en vuelo por proceso: el archivo no se carga
+    # entero en memoria y los procesos nunca esperan trabajo
+    max_in_flight = max(1, args.workers * 2)
+    with open(args.salida, 'w', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=args.workers) as executor:
+        pending = set()
+        for batch in iter_batches(archive, args.lote, args.desde_id):
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result(), out)
+            pending.add(executor.submit(process_batch, batch, args.umbral_confianza))
+        for future in pending:
+            collect(future.result(), out)
+
+    elapsed = time.perf_counter() - start
+    resumen['estudiantesCambiados'] = dict(resumen['estudiantesCambiados'])
+    resumen['errores'] = dict(resumen['errores'])
+    resumen['tiempoSegundos'] = round(elapsed, 3)
+    resumen['actasPorSegundo'] = round(resumen['actas'] / elapsed, 1) if elapsed else None
+    with open(args.resumen, 'w', encoding='utf-8') as f:
+        json.dump(resumen, f, ensure_ascii=False, indent=2)
+
+    print("=" * 70)
+    print(f"   Actas re-procesadas:     {resumen['actas']} en {elapsed:.1f}s ({resumen['actasPorSegundo']} actas/s)")
+    print(f"   Actas con cambios:       {resumen['actasCambiadas']}")
+    for campo, n in sorted(resumen['estudiantesCambiados'].items(), key=lambda item: -item[1]):
+        print(f"      {campo:<24} {n} estudiantes")
+    print(f"   Ahora fallan:            {resumen['ahoraFallan']}")
+    print(f"   Ahora se recuperan:      {resumen['ahoraSeRecuperan']}")
+    print(f"   Siguen fallando:         {resumen['siguenFallando']}")
+    print(f"   Resultados: {args.salida}  Resumen: {args.resumen}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Archivo de respuestas crudas de Gemini (solo inserción, comprimido)
+
+Cada acta procesada con Gemini guarda el texto crudo de todas sus
+respuestas (una por llamada: acta completa, franjas o continuaciones)
+junto con la huella del request, la metadata, el formato de salida y el
+resultado que se devolvió. Con el archivo se pueden aplicar reglas nuevas
+de response_parser a actas ya digitalizadas sin volver a llamar a la API
+(ver reparse_archive.py).
+
+Almacenamiento: SQLite con las respuestas y el resultado comprimidos con
+zlib (el texto JSON se reduce ~8-10x).
+"""
+
+import os
+import json
+import time
+import zlib
+import logging
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from ocr_consistency import UMBRAL_REVISION, apply_confidence, check_consistency
+from ocr_tiling import merge_band_students
+from response_parser import (
+    OUTPUT_FORMAT_FILAS,
+    OUTPUT_FORMAT_OBJETOS,
+    convert_to_backend_format,
+    expand_compact_response,
+    extract_json_from_response,
+    salvage_students,
+    validate_ocr_response,
+)
+
+logger = logging.getLogger(__name__)
+
+# Estado del acta al momento de archivar
+ESTADO_OK = 'ok'
+ESTADO_ERROR = 'error'
+
+
+def compress_json(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'), 6)
+
+
+def decompress_json(blob: Optional[bytes]) -> Any:
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class ResponseArchive:
+    """Persistencia de respuestas crudas en SQLite (solo inserción)"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._init_db()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abre una conexión SQLite, confirma la transacción y la cierra"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    creado_en REAL NOT NULL,
+                    huella TEXT NOT NULL,
+                    modelo TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    formato TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    respuestas BLOB NOT NULL,
+                    resultado BLOB,
+                    error TEXT
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_respuestas_huella ON respuestas(huella)')
+
+    def append(
+        self,
+        huella: str,
+        modelo: str,
+        prompt_version: str,
+        formato: str,
+        metadata: Dict[str, Any],
+        respuestas: List[Dict[str, Any]],
+        resultado: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> int:
+        """
+        Archiva las respuestas de un acta
+
+        Args:
+            huella: Huella del request (clave del cache OCR)
+            respuestas: [{'texto': ..., 'finishReason': ...}] en orden de llamada
+            resultado: Resultado devuelto (None si el acta falló)
+            error: Mensaje de error si el acta falló
+
+        Returns:
+            int: Id de la entrada
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO respuestas (creado_en, huella, modelo, prompt_version, formato, estado, '
+                'metadata, respuestas, resultado, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    time.time(), huella, modelo, prompt_version, formato,
+                    ESTADO_OK if error is None else ESTADO_ERROR,
+                    json.dumps(metadata, ensure_ascii=False),
+                    sqlite3.Binary(compress_json(respuestas)),
+                    sqlite3.Binary(compress_json(resultado)) if resultado is not None else None,
+                    error,
+                )
+            )
+            return cursor.lastrowid
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM respuestas').fetchone()[0]
+
+    def iter_rows(self, batch_size: int = 200, desde_id: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre el archivo en orden de id, sin descomprimir
+
+        Yields:
+            dict con las columnas de cada entrada (respuestas/resultado como bytes zlib)
+        """
+        last_id = desde_id
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT * FROM respuestas WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                entry = dict(row)
+                entry['respuestas'] = bytes(entry['respuestas'])
+                if entry['resultado'] is not None:
+                    entry['resultado'] = bytes(entry['resultado'])
+                yield entry
+            last_id = rows[-1]['id']
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del archivo para /health"""
+        with self._connect() as conn:
+            total, errores = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(estado = ?), 0) FROM respuestas', (ESTADO_ERROR,)
+            ).fetchone()
+        return {
+            'actas_archivadas': total,
+            'actas_con_error': errores,
+            'bytes_en_disco': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+        }
+
+
+def parse_archived_responses(respuestas: List[Dict[str, Any]], formato: str = OUTPUT_FORMAT_OBJETOS) -> Dict[str, Any]:
+    """
+    Reconstruye los datos parseados de un acta a partir de sus respuestas crudas
+
+    Sigue las reglas de GeminiOCRClient._generate: las respuestas cortadas
+    (MAX_TOKENS o JSON inválido) aportan los estudiantes recuperables y las
+    bloqueadas no aportan nada. Una sola respuesta se usa tal cual; varias
+    (franjas o continuaciones) se fusionan por número de orden.
+
+    Raises:
+        ValueError: Si ninguna respuesta contiene datos utilizables
+    """
+    partes = []
+    for respuesta in respuestas:
+        texto = respuesta.get('texto') or ''
+        motivo = respuesta.get('finishReason')
+        if motivo == 'MAX_TOKENS':
+            partes.append({'estudiantes': salvage_students(texto, formato)})
+            continue
+        if motivo not in (None, 'STOP', 'NONE'):
+            continue
+        try:
+            data = extract_json_from_response(texto)
+        except ValueError:
+            estudiantes = salvage_students(texto, formato)
+            if not estudiantes and len(respuestas) == 1:
+                raise
+            data = {'estudiantes': estudiantes}
+        if formato == OUTPUT_FORMAT_FILAS:
+            data = expand_compact_response(data)
+        partes.append(data)
+
+    if not partes:
+        raise ValueError("Ninguna respuesta archivada contiene datos")
+    if len(partes) == 1:
+        return partes[0]
+    return {'estudiantes': merge_band_students([
+        [est for est in parte.get('estudiantes', []) if isinstance(est, dict)] if isinstance(parte, dict) else []
+        for parte in partes
+    ])}
+
+
+def reparse_entry(entry: Dict[str, Any], umbral: int = UMBRAL_REVISION) -> Dict[str, Any]:
+    """
+    Aplica las reglas actuales de response_parser a una entrada del archivo
+
+    Args:
+        entry: Fila de ResponseArchive.iter_rows
+        umbral: Confianza mínima sin revisión (OCR_CONFIDENCE_THRESHOLD)
+
+    Returns:
+        {'id', 'huella', 'resultado' | 'error'}
+    """
+    metadata = json.loads(entry['metadata']) if isinstance(entry['metadata'], str) else entry['metadata']
+    respuestas = decompress_json(entry['respuestas'])
+    salida = {'id': entry['id'], 'huella': entry['huella']}
+    try:
+        gemini_data = parse_archived_responses(respuestas, entry.get('formato') or OUTPUT_FORMAT_OBJETOS)
+        is_valid, error_msg = validate_ocr_response(gemini_data)
+        if not is_valid:
+            raise ValueError(f"Respuesta OCR inválida: {error_msg}")
+        salida['resultado'] = convert_to_backend_format(gemini_data, metadata, model_name=entry['modelo'])
+        report = check_consistency(gemini_data['estudiantes'], len(metadata.get('areas', [])))
+        apply_confidence(salida['resultado'], report, umbral)
+    except ValueError as e:
+        salida['error'] = str(e)
+    return salida
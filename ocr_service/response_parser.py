@@ -1,10 +1,42 @@
 """
 Parseo de respuestas JSON de Gemini
+
+Formatos de salida que se le pueden pedir al modelo:
+- objetos: {"estudiantes": [{"numero": 1, "apellido_paterno": ..., ...}]}
+  (original; las claves se repiten en cada estudiante)
+- filas: {"filas": [{"d": ["1", "12345", ...], "n": [14, 15, ...]}]}
+  Encabezado fijo (COMPACT_COLUMNS) y una fila por estudiante: datos en
+  "d" y notas en "n". expand_compact_response lo convierte a la forma
+  de "objetos", así que el resto del pipeline no cambia.
 """
 
 import re
 import json
-from typing import Dict, Any, List
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ``` de apertura sin cierre al inicio de la respuesta
+_OPEN_FENCE = re.compile(r'^\s*```(?:json)?\s*', re.IGNORECASE)
+
+OUTPUT_FORMAT_OBJETOS = 'objetos'
+OUTPUT_FORMAT_FILAS = 'filas'
+OUTPUT_FORMATS = (OUTPUT_FORMAT_OBJETOS, OUTPUT_FORMAT_FILAS)
+
+# Columnas de "d" en el formato filas (las notas van aparte, en "n")
+COMPACT_COLUMNS = (
+    'numero',
+    'codigo',
+    'tipo',
+    'apellido_paterno',
+    'apellido_materno',
+    'nombres',
+    'sexo',
+    'comportamiento',
+    'situacion_final',
+    'observaciones',
+)
 
 
 def extract_json_from_response(response_text: str) -> dict:
@@ -31,17 +63,240 @@ def extract_json_from_response(response_text: str) -> dict:
         if code_match:
             json_str = code_match.group(1)
         else:
-            # Asumir que toda la respuesta es JSON
-            json_str = response_text
+            # Asumir que toda la respuesta es JSON (sin un ``` de apertura
+            # suelto, que queda cuando la respuesta se corta)
+            json_str = _OPEN_FENCE.sub('', response_text, count=1)
     
     # Parsear JSON
     try:
         data = json.loads(json_str)
         return data
     except json.JSONDecodeError as e:
+        # Texto sobrante después del objeto (ej: un ``` o una explicación)
+        start = json_str.find('{')
+        if start >= 0:
+            try:
+                data, _ = json.JSONDecoder().raw_decode(json_str, start)
+                return data
+            except json.JSONDecodeError:
+                pass
         raise ValueError(f"No se pudo parsear JSON: {e}")
 
 
+def salvage_students(response_text: str, output_format: str = OUTPUT_FORMAT_OBJETOS) -> List[dict]:
+    """
+    Recupera los estudiantes completos de una respuesta cortada o malformada
+    
+    Cuando la respuesta termina por MAX_TOKENS el array queda abierto y
+    json.loads falla; todos los objetos de estudiante cerrados antes del
+    corte siguen siendo válidos.
+    
+    Args:
+        response_text: Texto de respuesta de Gemini (posiblemente truncado)
+        output_format: Formato pedido al modelo ('objetos' o 'filas')
+    
+    Returns:
+        list: Estudiantes sintácticamente completos, en orden (forma 'objetos')
+    """
+    parser = IncrementalStudentParser.for_format(output_format)
+    return [est for est in parser.feed(response_text) if isinstance(est, dict)]
+
+
+def compact_response_schema(num_areas: int) -> dict:
+    """
+    response_schema del formato filas para la salida estructurada de Gemini
+    
+    El schema no admite tuplas con tipos por posición: los datos van como
+    texto en "d" y las notas, numéricas, en "n" con exactamente num_areas
+    elementos.
+    """
+    notas = {'type': 'ARRAY', 'items': {'type': 'NUMBER', 'nullable': True}}
+    if num_areas:
+        notas['min_items'] = num_areas
+        notas['max_items'] = num_areas
+    return {
+        'type': 'OBJECT',
+        'properties': {
+            'filas': {
+                'type': 'ARRAY',
+                'items': {
+                    'type': 'OBJECT',
+                    'properties': {
+                        'd': {
+                            'type': 'ARRAY',
+                            'items': {'type': 'STRING', 'nullable': True},
+                            'min_items': len(COMPACT_COLUMNS),
+                            'max_items': len(COMPACT_COLUMNS),
+                        },
+                        'n': notas,
+                    },
+                    'required': ['d', 'n'],
+                },
+            },
+        },
+        'required': ['filas'],
+    }
+
+
+def expand_compact_row(row: Any, columns=COMPACT_COLUMNS) -> Any:
+    """
+    Convierte una fila del formato filas en un estudiante con las claves de 'objetos'
+    
+    Acepta {"d": [...], "n": [...]} o una lista [...datos, [notas]].
+    Devuelve el valor sin cambios si no tiene ninguna de esas formas
+    (validate_ocr_response lo rechaza después).
+    """
+    if isinstance(row, dict) and 'd' in row:
+        datos, notas = row.get('d') or [], row.get('n')
+    elif isinstance(row, list):
+        if row and isinstance(row[-1], list):
+            datos, notas = row[:-1], row[-1]
+        else:
+            datos, notas = row, None
+    else:
+        return row
+    
+    est = {column: datos[i] if i < len(datos) else None for i, column in enumerate(columns)}
+    
+    numero = est.get('numero')
+    if isinstance(numero, str):
+        try:
+            est['numero'] = int(float(numero.strip()))
+        except ValueError:
+            pass
+    
+    est['notas'] = notas if isinstance(notas, list) else []
+    est['asignaturas_desaprobadas'] = sum(
+        1 for nota in est['notas'] if isinstance(nota, (int, float)) and nota < 11
+    )
+    return est
+
+
+def expand_compact_response(data: Any) -> Any:
+    """
+    Expande una respuesta en formato filas a {"estudiantes": [...]}
+    
+    Si la respuesta ya trae "estudiantes" (el modelo ignoró el formato) o
+    no es un objeto, se devuelve sin cambios. Un encabezado "columnas" en
+    la respuesta reemplaza a COMPACT_COLUMNS.
+    """
+    if not isinstance(data, dict) or 'estudiantes' in data or 'filas' not in data:
+        return data
+    filas = data.get('filas')
+    if not isinstance(filas, list):
+        return {'estudiantes': filas}
+    columns = data.get('columnas') or COMPACT_COLUMNS
+    return {'estudiantes': [expand_compact_row(row, columns) for row in filas]}
+
+
+# Inicio del array de estudiantes en la respuesta JSON
+_ESTUDIANTES_ARRAY = re.compile(r'"estudiantes"\s*:\s*\[')
+_FILAS_ARRAY = re.compile(r'"filas"\s*:\s*\[')
+
+
+class IncrementalStudentParser:
+    """
+    Parser incremental del array "estudiantes" de una respuesta en streaming
+    
+    Recibe el texto por fragmentos (feed) y devuelve cada objeto de
+    estudiante en cuanto está sintácticamente completo, sin esperar al
+    final de la respuesta. Ignora el texto previo al array (```json, "{")
+    y sigue strings y escapes para no confundirse con llaves dentro de
+    nombres u observaciones.
+    
+    Con el formato filas (for_format) recorre el array "filas" y expande
+    cada fila a un estudiante.
+    """
+    
+    def __init__(self, array_pattern=_ESTUDIANTES_ARRAY, transform=None):
+        self._array_pattern = array_pattern
+        self._transform = transform
+        self._text = ''
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self.count = 0
+    
+    @classmethod
+    def for_format(cls, output_format: str) -> 'IncrementalStudentParser':
+        """Parser para el formato de salida pedido al modelo"""
+        if output_format == OUTPUT_FORMAT_FILAS:
+            return cls(_FILAS_ARRAY, expand_compact_row)
+        return cls()
+    
+    @property
+    def done(self) -> bool:
+        """True cuando se cerró el array de estudiantes"""
+        return self._done
+    
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        Agrega un fragmento de texto
+        
+        Returns:
+            list: Estudiantes completados con este fragmento
+        """
+        if self._done or not chunk:
+            return []
+        self._text += chunk
+        
+        if not self._in_array:
+            match = self._array_pattern.search(self._text)
+            if not match:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+        
+        found = []
+        text = self._text
+        i = self._pos
+        length = len(text)
+        while i < length:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif c == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        found.append(json.loads(text[self._object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = None
+            elif c == ']' and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+        
+        # Descartar el texto ya consumido fuera de un objeto en curso
+        keep_from = self._object_start if self._object_start is not None else i
+        self._text = text[keep_from:]
+        self._pos = i - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        
+        if self._transform is not None:
+            found = [self._transform(item) for item in found]
+        self.count += len(found)
+        return found
+
+
 def validate_ocr_response(data: dict) -> tuple[bool, str]:
     """
     Valida la estructura de la respuesta OCR
@@ -92,6 +347,33 @@ def validate_ocr_response(data: dict) -> tuple[bool, str]:
     return True, ""
 
 
+# Variantes conocidas → código normalizado (búsqueda exacta sobre el
+# texto en mayúsculas y sin espacios en los extremos)
+_SEXO = {
+    'M': 'M', 'MASCULINO': 'M', 'MALE': 'M', 'H': 'M', 'HOMBRE': 'M', 'VARON': 'M', 'VARÓN': 'M', 'V': 'M',
+    'F': 'F', 'FEMENINO': 'F', 'FEMALE': 'F', 'MUJER': 'F', 'DAMA': 'F',
+}
+
+_SITUACION_FINAL = {
+    # PROMOVIDO: Pase directo sin materias desaprobadas
+    'P': 'P', 'PROMOVIDO': 'P', 'PROMOVIDA': 'P', 'PROMOCIONADO': 'P', 'PASE DIRECTO': 'P', 'PASE': 'P', 'DIRECTO': 'P',
+    # APROBADO CON ARRASTRES: Terminó con algunas desaprobadas
+    'A': 'A', 'APROBADO': 'A', 'APROBADA': 'A', 'PASS': 'A', 'OK': 'A',
+    # REPROBADO: No alcanzó mínimo o muchas desaprobadas o retirado
+    'R': 'R', 'REPROBADO': 'R', 'REPROBADA': 'R', 'RETIRADO': 'R', 'RETIRADA': 'R', 'DESAPROBADO': 'R',
+    'DESAPROBADA': 'R', 'FAIL': 'R', 'NO': 'R', 'D': 'R', 'REPITENTE': 'R',
+    # Vacío o guión: probablemente retirado
+    '': 'R', '-': 'R', 'N/A': 'R', 'NONE': 'R', 'NULL': 'R',
+}
+
+# Texto no reconocido: primera palabra ("P (PROMOVIDO)", "R.") y, si
+# tampoco está en la tabla, la búsqueda por subcadenas de las reglas anteriores
+_PRIMERA_PALABRA = re.compile(r'[A-ZÁÉÍÓÚÑ/]+')
+_SEXO_M_LEGACY = re.compile(r'[MHV]')
+_SITUACION_P_LEGACY = re.compile(r'P|DIRECTO')
+_SITUACION_A_LEGACY = re.compile(r'A|OK')
+
+
 def normalize_sexo(sexo: Any) -> str:
     """
     Normaliza el sexo a 'M' o 'F'
@@ -100,24 +382,29 @@ def normalize_sexo(sexo: Any) -> str:
         sexo: Sexo en cualquier formato
     
     Returns:
-        str: 'M' (Masculino) o 'F' (Femenino)
+        str: 'M' (Masculino) o 'F' (Femenino); 'M' si no se reconoce
     """
     if sexo is None:
         return 'M'
     
+    # Caso común: el valor ya viene normalizado ('M', 'F')
+    normalized = _SEXO.get(sexo) if isinstance(sexo, str) else None
+    if normalized is not None:
+        return normalized
+    
     sexo_str = str(sexo).upper().strip()
+    normalized = _SEXO.get(sexo_str)
+    if normalized is not None:
+        return normalized
     
-    # Mapeo de variaciones comunes
-    masculino_variaciones = ['M', 'MASCULINO', 'MALE', 'H', 'HOMBRE', 'VARON', 'V']
-    femenino_variaciones = ['F', 'FEMENINO', 'FEMALE', 'MUJER', 'DAMA']
+    word = _PRIMERA_PALABRA.search(sexo_str)
+    normalized = _SEXO.get(word.group()) if word else None
+    if normalized is not None:
+        return normalized
     
-    if any(var in sexo_str for var in masculino_variaciones):
+    if _SEXO_M_LEGACY.search(sexo_str):
         return 'M'
-    elif any(var in sexo_str for var in femenino_variaciones):
-        return 'F'
-    
-    # Por defecto, retornar masculino
-    return 'M'
+    return 'F' if 'F' in sexo_str else 'M'
 
 
 def normalize_situacion_final(situacion: Any) -> str:
@@ -135,148 +422,173 @@ def normalize_situacion_final(situacion: Any) -> str:
     Returns:
         str: 'P' (Promovido), 'A' (Aprobado), 'R' (Reprobado/Retirado)
     """
-    # Si viene vacío o es guión, retornar R (probablemente retirado)
-    if situacion is None or str(situacion).strip() in ['', '-', 'N/A', 'NONE', 'NULL']:
+    if situacion is None:
         return 'R'
     
-    situacion_str = str(situacion).upper().strip()
-    
-    # PROMOVIDO: Pase directo sin materias desaprobadas
-    promovido_variaciones = ['P', 'PROMOVIDO', 'PROMOCIONADO', 'PASE DIRECTO', 'PASE', 'DIRECTO']
+    # Caso común: el valor ya viene normalizado ('P', 'A', 'R')
+    normalized = _SITUACION_FINAL.get(situacion) if isinstance(situacion, str) else None
+    if normalized is not None:
+        return normalized
     
-    # APROBADO CON ARRASTRES: Terminó con algunas desaprobadas
-    aprobado_variaciones = ['A', 'APROBADO', 'APROBADA', 'PASS', 'OK']
+    situacion_str = str(situacion).upper().strip()
+    normalized = _SITUACION_FINAL.get(situacion_str)
+    if normalized is not None:
+        return normalized
     
-    # REPROBADO: No alcanzó mínimo o muchas desaprobadas o retirado
-    reprobado_variaciones = ['R', 'REPROBADO', 'REPROBADA', 'RETIRADO', 'RETIRADA', 'DESAPROBADO', 'DESAPROBADA', 'FAIL', 'NO', 'D', 'REPITENTE']
+    word = _PRIMERA_PALABRA.search(situacion_str)
+    normalized = _SITUACION_FINAL.get(word.group()) if word else None
+    if normalized is not None:
+        return normalized
     
-    # Verificar en orden: P, A, R
-    if any(var in situacion_str for var in promovido_variaciones):
+    if _SITUACION_P_LEGACY.search(situacion_str):
         return 'P'
-    elif any(var in situacion_str for var in aprobado_variaciones):
+    if _SITUACION_A_LEGACY.search(situacion_str):
         return 'A'
-    elif any(var in situacion_str for var in reprobado_variaciones):
-        return 'R'
     
-    # Si no coincide con nada y llegó hasta aquí, asumir retirado
+    # Si no coincide con nada, asumir retirado
     return 'R'
 
 
-def convert_to_backend_format(gemini_data: dict, metadata: dict) -> dict:
+def _split_full_name(text: str, comma_separates_names: bool = True) -> Tuple[str, str, str]:
+    """
+    Separa "APELLIDO_PAT APELLIDO_MAT, Nombres" en sus tres partes
+    
+    Sin coma (o con comma_separates_names=False) se asume
+    "APELLIDO_PAT APELLIDO_MAT NOMBRES...".
+    """
+    if comma_separates_names and ',' in text:
+        apellidos, nombres = text.split(',', 1)
+        partes_apellidos = apellidos.strip().split(' ', 1)
+        apellido_pat = partes_apellidos[0]
+        apellido_mat = partes_apellidos[1] if len(partes_apellidos) > 1 else ''
+        return apellido_pat, apellido_mat, nombres.strip()
+    
+    partes = text.split(' ')
+    return (
+        partes[0],
+        partes[1] if len(partes) > 1 else '',
+        ' '.join(partes[2:]),
+    )
+
+
+# Campos alternativos con el nombre completo, en orden de preferencia:
+# (campo, la coma separa apellidos de nombres)
+_NAME_FALLBACKS = (
+    ('nombre_completo', True),
+    ('apellidos_y_nombres', True),
+    ('nombre', False),
+)
+
+
+def convert_student(est: dict) -> dict:
+    """
+    Convierte un estudiante del formato de Gemini al formato del backend
+    
+    Args:
+        est: Estudiante tal como lo devuelve Gemini
+    
+    Returns:
+        dict: Estudiante en formato backend (camelCase)
+    """
+    # Calcular asignaturas desaprobadas (notas < 11); notas puede ser array o dict
+    notas = est.get('notas', [])
+    if isinstance(notas, list):
+        asignaturas_desaprobadas = len([nota for nota in notas if nota is not None and nota < 11])
+    elif isinstance(notas, dict):
+        asignaturas_desaprobadas = len([nota for nota in notas.values() if nota is not None and nota < 11])
+    else:
+        asignaturas_desaprobadas = 0
+    
+    apellido_pat = str(est.get('apellido_paterno', '') or '').strip()
+    apellido_mat = str(est.get('apellido_materno', '') or '').strip()
+    nombres = str(est.get('nombres', '') or '').strip()
+    
+    # Sin apellido ni nombres: probar los formatos alternativos
+    if not apellido_pat and not nombres:
+        for field, comma_separates_names in _NAME_FALLBACKS:
+            value = str(est.get(field) or '').strip()
+            if value:
+                apellido_pat, apellido_mat, nombres = _split_full_name(value, comma_separates_names)
+                if apellido_pat or nombres:
+                    break
+    
+    # Construir nombreCompleto sin espacios duplicados ni comas sueltas
+    nombre_completo_str = ' '.join(f"{apellido_pat} {apellido_mat}, {nombres}".split())
+    nombre_completo_str = nombre_completo_str.replace(' ,', ',')
+    
+    # Si quedó vacío o solo puntuación, usar fallback
+    if nombre_completo_str in ('', ','):
+        nombre_completo_str = "Sin nombre"
+        apellido_pat = ''
+        apellido_mat = ''
+        nombres = ''
+    
+    return {
+        'numero': est.get('numero', 0),
+        'codigo': est.get('codigo', ''),
+        'tipo': est.get('tipo', 'G'),
+        'nombreCompleto': nombre_completo_str,
+        'apellidoPaterno': apellido_pat,
+        'apellidoMaterno': apellido_mat,
+        'nombres': nombres,
+        'sexo': normalize_sexo(est.get('sexo')),
+        'notas': notas,
+        'comportamiento': str(est.get('comportamiento', '0')),
+        'asignaturasDesaprobadas': asignaturas_desaprobadas,
+        'situacionFinal': normalize_situacion_final(est.get('situacion_final')),
+        'observaciones': est.get('observaciones'),
+    }
+
+
+def convert_to_backend_format(
+    gemini_data: dict,
+    metadata: dict,
+    log_detail: Optional[bool] = None,
+    model_name: str = 'gemini-2.5-pro'
+) -> dict:
     """
     Convierte el formato de Gemini al formato esperado por el backend Node.js
     
+    Una sola pasada sobre los estudiantes produce los registros, el conteo
+    por situación final y las advertencias.
+    
     Args:
         gemini_data: Datos parseados de Gemini
         metadata: Metadata original del acta
+        log_detail: Registrar cada estudiante crudo (None = solo en nivel DEBUG)
+        model_name: Modelo que produjo la respuesta (va en procesadoCon)
     
     Returns:
         dict: Datos en formato compatible con backend
     """
-    estudiantes_gemini = gemini_data.get('estudiantes', [])
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    if log_detail is None:
+        log_detail = debug_enabled
+    detail_level = logging.DEBUG if debug_enabled else logging.INFO
+    
     estudiantes_backend = []
+    situaciones = {'P': 0, 'A': 0, 'R': 0}
+    advertencias = []
     
-    for i, est in enumerate(estudiantes_gemini):
-        # DEBUG: Imprimir estudiante completo
-        print(f"\n🔍 DEBUG - Estudiante #{i+1} RAW de Gemini:")
-        print(f"{'-'*70}")
-        import json
-        print(json.dumps(est, indent=2, ensure_ascii=False))
-        print(f"{'-'*70}")
-        
-        # Calcular asignaturas desaprobadas (notas < 11)
-        notas = est.get('notas', [])
-        
-        # IMPORTANTE: Verificar si notas es array o dict
-        if isinstance(notas, list):
-            asignaturas_desaprobadas = sum(1 for nota in notas if nota is not None and nota < 11)
-        elif isinstance(notas, dict):
-            asignaturas_desaprobadas = sum(1 for nota in notas.values() if nota is not None and nota < 11)
-        else:
-            asignaturas_desaprobadas = 0
-        
-        # Construir nombre completo - INTENTAR MÚLTIPLES FORMATOS
-        apellido_pat = str(est.get('apellido_paterno', '') or '').strip()
-        apellido_mat = str(est.get('apellido_materno', '') or '').strip()
-        nombres = str(est.get('nombres', '') or '').strip()
-        
-        # FALLBACK 1: nombre_completo
-        if not apellido_pat and not nombres and 'nombre_completo' in est:
-            nombre_completo = str(est.get('nombre_completo', '')).strip()
-            if nombre_completo:
-                # Intentar separar: "APELLIDO_PAT APELLIDO_MAT, Nombres"
-                if ',' in nombre_completo:
-                    apellidos, nombres = nombre_completo.split(',', 1)
-                    partes_apellidos = apellidos.strip().split(' ', 1)
-                    apellido_pat = partes_apellidos[0] if len(partes_apellidos) > 0 else ''
-                    apellido_mat = partes_apellidos[1] if len(partes_apellidos) > 1 else ''
-                    nombres = nombres.strip()
-                else:
-                    # Si no hay coma, asumir todo es el nombre completo
-                    partes = nombre_completo.strip().split(' ')
-                    apellido_pat = partes[0] if len(partes) > 0 else ''
-                    apellido_mat = partes[1] if len(partes) > 1 else ''
-                    nombres = ' '.join(partes[2:]) if len(partes) > 2 else ''
-        
-        # FALLBACK 2: apellidos_y_nombres (formato alternativo)
-        if not apellido_pat and not nombres and 'apellidos_y_nombres' in est:
-            apellidos_y_nombres = str(est.get('apellidos_y_nombres', '')).strip()
-            if apellidos_y_nombres:
-                if ',' in apellidos_y_nombres:
-                    apellidos, nombres = apellidos_y_nombres.split(',', 1)
-                    partes_apellidos = apellidos.strip().split(' ', 1)
-                    apellido_pat = partes_apellidos[0] if len(partes_apellidos) > 0 else ''
-                    apellido_mat = partes_apellidos[1] if len(partes_apellidos) > 1 else ''
-                    nombres = nombres.strip()
-                else:
-                    partes = apellidos_y_nombres.strip().split(' ')
-                    apellido_pat = partes[0] if len(partes) > 0 else ''
-                    apellido_mat = partes[1] if len(partes) > 1 else ''
-                    nombres = ' '.join(partes[2:]) if len(partes) > 2 else ''
-        
-        # FALLBACK 3: nombre (campo único)
-        if not apellido_pat and not nombres and 'nombre' in est:
-            nombre_unico = str(est.get('nombre', '')).strip()
-            if nombre_unico:
-                partes = nombre_unico.strip().split(' ')
-                apellido_pat = partes[0] if len(partes) > 0 else ''
-                apellido_mat = partes[1] if len(partes) > 1 else ''
-                nombres = ' '.join(partes[2:]) if len(partes) > 2 else ''
-        
-        # Convertir formato
-        # Construir nombreCompleto
-        nombre_completo_str = f"{apellido_pat} {apellido_mat}, {nombres}".strip()
-        
-        # Limpiar espacios duplicados y comas sueltas
-        nombre_completo_str = ' '.join(nombre_completo_str.split())
-        nombre_completo_str = nombre_completo_str.replace(' ,', ',').replace(',  ', ', ')
+    for i, est in enumerate(gemini_data.get('estudiantes', [])):
+        # Estudiante crudo: se serializa solo si el detalle está habilitado
+        if log_detail:
+            logger.log(
+                detail_level, "Estudiante #%d RAW de Gemini:\n%s",
+                i + 1, json.dumps(est, indent=2, ensure_ascii=False)
+            )
         
-        # Si quedó vacío o solo puntuación, usar fallback
-        if not nombre_completo_str or nombre_completo_str in [',', ', ', '  ,  ', '  ']:
-            nombre_completo_str = f"Sin nombre"
-            apellido_pat = ''
-            apellido_mat = ''
-            nombres = ''
+        record = convert_student(est)
+        estudiantes_backend.append(record)
+        situaciones[record['situacionFinal']] += 1
         
-        estudiante_backend = {
-            'numero': est.get('numero', 0),
-            'codigo': est.get('codigo', ''),
-            'tipo': est.get('tipo', 'G'),
-            'nombreCompleto': nombre_completo_str,
-            'apellidoPaterno': apellido_pat,
-            'apellidoMaterno': apellido_mat,
-            'nombres': nombres,
-            'sexo': normalize_sexo(est.get('sexo')),
-            'notas': notas,
-            'comportamiento': str(est.get('comportamiento', '0')),
-            'asignaturasDesaprobadas': asignaturas_desaprobadas,
-            'situacionFinal': normalize_situacion_final(est.get('situacion_final')),
-            'observaciones': est.get('observaciones'),
-        }
-        estudiantes_backend.append(estudiante_backend)
-    
-    # Construir respuesta final
-    resultado = {
+        # Advertencia si el estudiante tiene muchas desaprobadas
+        if record['asignaturasDesaprobadas'] > 3:
+            advertencias.append(
+                f"Estudiante {record['numero']}: {record['asignaturasDesaprobadas']} asignaturas desaprobadas"
+            )
+    
+    return {
         'totalEstudiantes': len(estudiantes_backend),
         'estudiantes': estudiantes_backend,
         'metadataActa': {
@@ -287,17 +599,12 @@ def convert_to_backend_format(gemini_data: dict, metadata: dict) -> dict:
             'tipoEvaluacion': metadata.get('tipo_evaluacion', ''),
             'areas': metadata.get('areas', []),
         },
-        'confianza': 95,  # Gemini generalmente tiene alta confianza
-        'advertencias': [],
-        'procesadoCon': 'gemini-2.5-pro',
+        'confianza': None,  # La calcula ocr_consistency.apply_confidence
+        'advertencias': advertencias,
+        'procesadoCon': model_name,
+        'resumenSituacion': {
+            'promovidos': situaciones['P'],
+            'aprobados': situaciones['A'],
+            'reprobados': situaciones['R'],
+        },
     }
-    
-    # Agregar advertencias si hay estudiantes con muchas desaprobadas
-    for est in estudiantes_backend:
-        if est['asignaturasDesaprobadas'] > 3:
-            resultado['advertencias'].append(
-                f"Estudiante {est['numero']}: {est['asignaturasDesaprobadas']} asignaturas desaprobadas"
-            )
-    
-    return resultado
-
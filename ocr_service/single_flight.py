@@ -0,0 +1,80 @@
+"""
+Single-flight: un solo procesamiento por acta idéntica en vuelo
+
+Cuando el backend reintenta por timeout o un operador pulsa "procesar" dos
+veces llegan varios /api/ocr/process idénticos mientras el primero sigue
+esperando a Gemini. Con single-flight el primero (líder) hace la llamada y
+los duplicados se adjuntan a su Future y reciben el mismo resultado (o el
+mismo error) sin una nueva llamada al modelo.
+
+La clave es la huella del request (hash de la imagen, metadata, prompt,
+preprocesamiento y modelo), la misma del cache OCR: el single-flight cubre
+el intervalo en que el resultado todavía no está en cache.
+
+El Future es de concurrent.futures: los duplicados esperan con
+Future.result() en hilos o con asyncio.wrap_future() en el event loop.
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import COALESCED_REQUESTS
+
+
+@dataclass
+class Flight:
+    """Procesamiento en curso de una clave"""
+    key: str
+    started_at: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Registro de procesamientos en vuelo por clave (seguro entre hilos)"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """
+        Se une al procesamiento en vuelo de la clave, o lo inicia
+
+        Returns:
+            (flight, es_lider). El líder debe llamar a finish() siempre,
+            también si falla; los demás esperan flight.future
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                COALESCED_REQUESTS.inc()
+                return flight, False
+            flight = Flight(key=key)
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, flight: Flight, result: Any = None, error: Optional[BaseException] = None):
+        """Entrega el resultado (o el error) del líder a los duplicados"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado para /health"""
+        with self._lock:
+            return {
+                'en_vuelo': len(self._flights),
+                'esperando': sum(f.waiters for f in self._flights.values()),
+                'coalescidos': self.coalesced,
+            }
@@ -0,0 +1,254 @@
+"""
+Detección local de la tabla de notas y conteo de filas (solo CPU)
+
+Los escaneos traen márgenes anchos, sellos y bloques de firmas alrededor
+de la tabla, y el modelo no sabe cuántas filas esperar. Antes de la
+llamada a Gemini se buscan las líneas de la tabla sobre una reducción en
+escala de grises:
+
+- líneas: tramos continuos de tinta largos (horizontales y verticales),
+  proyectados según la inclinación medida (perfil de proyección); las
+  filas del perfil que cubren buena parte del ancho son renglones
+- tabla: rectángulo que encierra los renglones y columnas detectados
+- filas: franjas entre renglones con la altura típica de una fila y con
+  tinta adentro (el encabezado, más alto, y las filas vacías no cuentan)
+
+Con la tabla se recorta la imagen (menos píxeles → menos tokens de
+entrada), el número de filas va al prompt y dimensiona max_output_tokens,
+y se compara con totalEstudiantes al validar la respuesta.
+"""
+
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_quality import estimate_skew, grayscale_preview, luminance_percentiles
+
+
+@dataclass(frozen=True)
+class TableDetectionConfig:
+    """Configuración de la detección de la tabla"""
+    crop: bool = True                   # Recortar la imagen a la tabla
+    analysis_side: int = 1600           # Lado de la reducción analizada
+    run_ratio: float = 0.02             # Tramo continuo mínimo de una línea (fracción del lado)
+    min_line_ratio: float = 0.3         # Fracción del ancho (alto) que debe cubrir un renglón (columna)
+    margin_ratio: float = 0.015         # Margen alrededor de la tabla al recortar
+    min_crop_gain: float = 0.1          # Recortar solo si se quita al menos esta fracción de píxeles
+    min_row_ink: float = 0.01           # Tinta mínima (fracción) para contar una fila como ocupada
+    max_skew_degrees: float = 4.0       # Rango de búsqueda de la inclinación de las líneas
+
+    def signature(self) -> str:
+        """Firma estable de la configuración (forma parte de la clave del cache)"""
+        values = asdict(self)
+        return ','.join(f"{key}={values[key]}" for key in sorted(values))
+
+
+@dataclass
+class TableRegion:
+    """Resultado de la detección (coordenadas de la imagen original)"""
+    bbox: Optional[Tuple[int, int, int, int]] = None    # (izquierda, arriba, derecha, abajo)
+    filas: Optional[int] = None                         # Filas de estudiantes con contenido
+    lineas_horizontales: int = 0
+    lineas_verticales: int = 0
+    recortada: bool = False
+    pixeles_antes: int = 0
+    pixeles_despues: int = 0
+    tiempo_ms: float = 0.0
+    alturas_filas: List[int] = field(default_factory=list, repr=False)
+
+    @property
+    def detected(self) -> bool:
+        return self.bbox is not None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'detectada': self.detected,
+            'bbox': list(self.bbox) if self.bbox else None,
+            'filas': self.filas,
+            'lineasHorizontales': self.lineas_horizontales,
+            'lineasVerticales': self.lineas_verticales,
+            'recortada': self.recortada,
+            'pixelesAntes': self.pixeles_antes,
+            'pixelesDespues': self.pixeles_despues,
+            'tiempoMs': round(self.tiempo_ms, 1),
+        }
+
+
+def _run_mask(ink: np.ndarray, run: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tramos horizontales de al menos run píxeles de tinta
+
+    Se hace un OR de 3 filas vecinas antes de medir los tramos: una línea
+    levemente inclinada cambia de fila cada pocos píxeles.
+
+    Returns:
+        (inicio de cada tramo, píxeles cubiertos por algún tramo)
+    """
+    band = ink.copy()
+    band[1:] |= ink[:-1]
+    band[:-1] |= ink[1:]
+    cumulative = np.zeros((band.shape[0], band.shape[1] + 1), dtype=np.int32)
+    np.cumsum(band, axis=1, out=cumulative[:, 1:])
+    starts = (cumulative[:, run:] - cumulative[:, :-run]) == run
+
+    np.cumsum(starts, axis=1, out=cumulative[:, 1:starts.shape[1] + 1])
+    cumulative[:, starts.shape[1] + 1:] = cumulative[:, starts.shape[1]:starts.shape[1] + 1]
+    covered = np.zeros_like(band)
+    covered[:, :run] = cumulative[:, 1:run + 1] > 0
+    covered[:, run:] = (cumulative[:, run + 1:] - cumulative[:, 1:-run]) > 0
+    return starts, covered
+
+
+class _Lines:
+    """Líneas de un conjunto de tramos, en el eje proyectado según la inclinación"""
+
+    def __init__(self, starts: np.ndarray, angle: float, length: int, min_coverage: float):
+        self.ys, self.xs = np.nonzero(starts)
+        self.centers: List[float] = []
+        self.on_line = np.zeros(len(self.ys), dtype=bool)
+        if len(self.ys) == 0:
+            return
+        projected = _project(self.ys, self.xs, starts.shape[1], angle)
+        offset = projected.min()
+        profile = np.bincount(projected - offset)
+        peaks = np.nonzero(profile >= min_coverage * length)[0]
+        if len(peaks) == 0:
+            return
+
+        groups = [g for g in np.split(peaks, np.nonzero(np.diff(peaks) > 2)[0] + 1) if len(g)]
+        self.centers = [float(np.dot(g, profile[g]) / profile[g].sum()) + offset for g in groups]
+        # Tramos que pertenecen a alguna línea (±2 px del pico)
+        is_line = np.zeros(len(profile) + 4, dtype=bool)
+        for g in groups:
+            is_line[max(0, g[0] - 2):g[-1] + 3] = True
+        self.on_line = is_line[projected - offset]
+
+
+def _project(ys: np.ndarray, xs: np.ndarray, width: int, angle: float) -> np.ndarray:
+    """Fila de cada píxel después de enderezar (corte y - x·tan a)"""
+    return np.round(ys - (xs - width / 2) * np.tan(np.radians(angle))).astype(np.int64)
+
+
+def _merge_close(lines: List[float], min_gap: float) -> List[float]:
+    """Une líneas dobles o gruesas partidas (más cercanas que min_gap)"""
+    merged = []
+    for line in lines:
+        if merged and line - merged[-1][-1] < min_gap:
+            merged[-1].append(line)
+        else:
+            merged.append([line])
+    return [sum(group) / len(group) for group in merged]
+
+
+def detect_table(image: Image.Image, config: Optional[TableDetectionConfig] = None) -> TableRegion:
+    """
+    Busca la tabla del acta y cuenta sus filas de estudiantes
+
+    Returns:
+        TableRegion (bbox None si no se encontró una tabla con renglones)
+    """
+    config = config or TableDetectionConfig()
+    start = time.perf_counter()
+    width, height = image.size
+    region = TableRegion(pixeles_antes=width * height, pixeles_despues=width * height)
+
+    small = np.asarray(grayscale_preview(image, config.analysis_side))
+    small_height, small_width = small.shape
+    scale = width / small_width
+    low, high = luminance_percentiles(small, 2, 98)
+    if high - low < 16:
+        region.tiempo_ms = (time.perf_counter() - start) * 1000
+        return region
+    # Umbral más cerca del fondo que el de la tinta: las líneas finas quedan
+    # grises en la reducción
+    ink = small < high - (high - low) * 0.35
+
+    h_run = max(8, int(small_width * config.run_ratio))
+    v_run = max(8, int(small_height * config.run_ratio))
+    h_starts, h_covered = _run_mask(ink, h_run)
+    v_starts, v_covered = _run_mask(np.ascontiguousarray(ink.T), v_run)
+
+    # Inclinación de los renglones (residual: el control de calidad ya
+    # endereza las páginas muy torcidas)
+    angle = estimate_skew(h_starts, config.max_skew_degrees) if h_starts.any() else 0.0
+
+    rows = _Lines(h_starts, angle, small_width, config.min_line_ratio)
+    # Las columnas se inclinan en sentido contrario en la imagen transpuesta
+    cols = _Lines(v_starts, -angle, small_height, config.min_line_ratio)
+
+    lines = rows.centers
+    if len(lines) >= 2:
+        lines = _merge_close(lines, max(3.0, float(np.median(np.diff(lines))) * 0.3))
+    region.lineas_horizontales = len(lines)
+    region.lineas_verticales = len(cols.centers)
+    if len(lines) < 3:
+        region.tiempo_ms = (time.perf_counter() - start) * 1000
+        return region
+
+    # Rectángulo de los tramos que forman renglones y columnas
+    top, bottom = rows.ys[rows.on_line].min(), rows.ys[rows.on_line].max()
+    left, right = rows.xs[rows.on_line].min(), rows.xs[rows.on_line].max() + h_run
+    if len(cols.centers) >= 2:
+        # En la transpuesta, ys son columnas de la imagen y xs sus filas
+        left = min(left, cols.ys[cols.on_line].min())
+        right = max(right, cols.ys[cols.on_line].max())
+        top = min(top, cols.xs[cols.on_line].min())
+        bottom = max(bottom, cols.xs[cols.on_line].max() + v_run)
+
+    region.bbox = (
+        int(left * scale), int(top * scale),
+        min(width, int(np.ceil((right + 1) * scale))), min(height, int(np.ceil((bottom + 1) * scale))),
+    )
+
+    # Filas: franjas de altura típica (la mediana; el encabezado es más
+    # alto) con texto adentro. Los píxeles de renglones y columnas no
+    # cuentan, así las filas vacías de la tabla quedan fuera
+    text = ink & ~h_covered & ~v_covered.T
+    ys, xs = np.nonzero(text[top:bottom + 1, left:right + 1])
+    profile = np.bincount(_project(ys + top, xs + left, small_width, angle) - top + 8)
+    gaps = np.diff(lines)
+    typical = float(np.median(gaps))
+    table_width = max(1, right - left)
+    filas = 0
+    for top_line, gap in zip(lines[:-1], gaps):
+        if not 0.6 * typical <= gap <= 1.5 * typical:
+            continue
+        first, last = int(top_line + gap * 0.15) - top + 8, int(top_line + gap * 0.85) - top + 8
+        inner = profile[max(0, first):max(0, last)]
+        if inner.size and inner.sum() / ((last - first) * table_width) >= config.min_row_ink:
+            filas += 1
+            region.alturas_filas.append(int(gap * scale))
+    region.filas = filas
+
+    region.tiempo_ms = (time.perf_counter() - start) * 1000
+    return region
+
+
+def locate_table(image: Image.Image, config: TableDetectionConfig):
+    """
+    Detecta la tabla y, si config.crop, recorta la imagen a ella con un margen
+
+    Returns:
+        (imagen, TableRegion): la imagen recortada (o la misma)
+    """
+    region = detect_table(image, config)
+    if not config.crop or not region.detected:
+        return image, region
+
+    width, height = image.size
+    margin = int(max(width, height) * config.margin_ratio)
+    left, top, right, bottom = region.bbox
+    box = (max(0, left - margin), max(0, top - margin), min(width, right + margin), min(height, bottom + margin))
+    pixels = (box[2] - box[0]) * (box[3] - box[1])
+    if pixels > region.pixeles_antes * (1 - config.min_crop_gain):
+        return image, region
+
+    cropped = image.crop(box)
+    # La huella del request (source_sha256) y el DPI siguen siendo los del original
+    cropped.info.update(image.info)
+    region.recortada = True
+    region.pixeles_despues = pixels
+    return cropped, region
@@ -3,9 +3,11 @@ Script de prueba para el servicio OCR con Gemini
 Prueba localmente sin depender del backend Node.js
 """
 
+import importlib.util
 import os
 import sys
 import json
+import types
 from pathlib import Path
 from PIL import Image
 from dotenv import load_dotenv
@@ -15,12 +17,77 @@ load_dotenv()
 
 # Importar módulos del servicio
 from gemini_client import GeminiOCRClient
-from prompt_builder import build_acta_prompt, validate_metadata
-from response_parser import extract_json_from_response, validate_ocr_response, convert_to_backend_format
+from prompt_builder import build_acta_prompt, compile_acta_prompt, compile_prompt_prefix, validate_metadata
+from response_parser import (
+    extract_json_from_response,
+    validate_ocr_response,
+    convert_to_backend_format,
+    IncrementalStudentParser,
+    salvage_students,
+    expand_compact_response,
+    normalize_sexo,
+    normalize_situacion_final,
+    COMPACT_COLUMNS,
+)
+from ocr_cache import OCRResultCache, compute_cache_key, image_digest
+from ocr_jobs import OCRJobStore, OCRJobManager
+from ocr_batch import iter_batch_results, iter_document_results
+from ocr_document import DocumentError, open_document
+from rate_limiter import TokenBucketRateLimiter, RateLimitExceeded
+from image_preprocessing import PreprocessConfig, get_preset, preprocess_image
+from image_quality import ImageQualityError, QualityConfig, apply_quality_gate, assess_image
+from table_detection import TableDetectionConfig, detect_table, locate_table
+from ocr_consistency import UMBRAL_REVISION, apply_confidence, check_consistency, student_confidence, student_problems
+from model_cascade import CascadeConfig, ModelCascade
+from logging_setup import DeferredQueueHandler, JsonFormatter, sample_request
+from metrics import REGISTRY, PARSE_FAILURES, TABLE_ROWS, MetricsRegistry, StageTimer, finish_reason_name
+from ocr_tiling import TilingConfig, split_into_bands, merge_band_students
+from context_cache import LocalContextCacheBackend, PromptContextCache
+from response_archive import ResponseArchive, compress_json, decompress_json, reparse_entry
+from single_flight import SingleFlight
+from upstream_guard import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    RetryPolicy,
+    UpstreamUnavailable,
+    classify_error,
+)
 
 def print_separator():
     print("=" * 70)
 
+class _FakeResponse:
+    """Respuesta de generate_content; iterable por fragmentos como en streaming"""
+    
+    def __init__(self, text, finish_reason, usage, chunk_size):
+        self.text = text
+        self.candidates = [types.SimpleNamespace(finish_reason=finish_reason, safety_ratings=[])]
+        self.usage_metadata = usage
+        self.chunk_size = chunk_size
+    
+    def __iter__(self):
+        for k in range(0, len(self.text), self.chunk_size):
+            yield types.SimpleNamespace(text=self.text[k:k + self.chunk_size])
+
+def fake_response(text, finish_reason=1, usage=None, chunk_size=50):
+    """Respuesta de Gemini para los modelos falsos (finish_reason 1 = STOP, 2 = MAX_TOKENS)"""
+    return _FakeResponse(text, finish_reason, usage, chunk_size)
+
+class FakePool:
+    """
+    ModelPool de prueba: el mismo modelo falso para cualquier nombre, o uno
+    por nombre (dict). calls registra (modelo, system_instruction,
+    generation_config) de cada get.
+    """
+    
+    def __init__(self, model_or_map):
+        self.model = model_or_map
+        self.calls = []
+    
+    def get(self, model_name, system_instruction=None, generation_config=None, **kwargs):
+        self.calls.append((model_name, system_instruction, generation_config))
+        return self.model[model_name] if isinstance(self.model, dict) else self.model
+
 def test_metadata_validation():
     """Prueba la validación de metadata"""
     print("\n🧪 TEST 1: Validación de Metadata")
@@ -210,6 +277,1656 @@ def test_response_parser():
         print(f"   ❌ ERROR: {str(e)}")
         return False
 
+def test_ocr_cache():
+    """Prueba el cache de resultados OCR (memoria + disco)"""
+    print("\n🧪 TEST 5: Cache de Resultados OCR")
+    print_separator()
+    
+    import tempfile
+    
+    metadata = {
+        'anio_lectivo': 1995,
+        'grado': 'Quinto Grado',
+        'seccion': 'A',
+        'turno': 'MAÑANA',
+        'areas': [
+            {'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'},
+            {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'},
+        ]
+    }
+    prompt = build_acta_prompt(metadata)
+    image = Image.new('L', (64, 32), color=255)
+    resultado = {'totalEstudiantes': 1, 'estudiantes': [{'numero': 1}], 'tiempoProcesamientoMs': 9000}
+    
+    key = compute_cache_key(image_digest(image), metadata, prompt, 'gemini-2.5-pro')
+    
+    # Metadata equivalente (otro orden de áreas, mayúsculas, campos irrelevantes) → misma clave
+    metadata_equivalente = dict(metadata, grado='quinto grado', colegio_origen='I.E. San Martín')
+    metadata_equivalente['areas'] = list(reversed(metadata['areas']))
+    assert key == compute_cache_key(image_digest(image), metadata_equivalente, prompt, 'gemini-2.5-pro')
+    assert key != compute_cache_key(image_digest(image), metadata, prompt, 'gemini-2.5-flash')
+    print("   ✓ Clave estable y sensible al modelo")
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = OCRResultCache(max_items=2, cache_dir=cache_dir)
+        assert cache.get(key) == (None, None)
+        cache.set(key, resultado, 'gemini-2.5-pro', 'v1')
+        assert cache.get(key) == (resultado, 'memoria')
+        print("   ✓ Nivel de memoria")
+        
+        # Nueva instancia (simula reinicio del servicio)
+        cache = OCRResultCache(max_items=2, cache_dir=cache_dir)
+        assert cache.get(key) == (resultado, 'disco')
+        assert cache.get(key) == (resultado, 'memoria')
+        print("   ✓ Nivel de disco sobrevive reinicio")
+        
+        # LRU acotado
+        cache.set('otra-1', resultado, 'gemini-2.5-flash', 'v1')
+        cache.set('otra-2', resultado, 'gemini-2.5-flash', 'v1')
+        assert cache.stats()['entradas_memoria'] == 2
+        
+        # Invalidación por modelo y por versión de prompt
+        assert cache.invalidate(model_name='gemini-2.5-flash') == 2
+        assert cache.get('otra-1') == (None, None)
+        assert cache.invalidate(prompt_version='v0') == 0
+        assert cache.invalidate(prompt_version='v1') == 1
+        assert cache.get(key) == (None, None)
+        print("   ✓ Invalidación por modelo y versión de prompt")
+    
+    print("   ✅ Cache de resultados OCR OK")
+    return True
+
+def test_ocr_jobs():
+    """Prueba los trabajos OCR asíncronos y su reanudación tras reinicio"""
+    print("\n🧪 TEST 6: Trabajos OCR Asíncronos")
+    print_separator()
+    
+    import io
+    import time
+    import tempfile
+    
+    class FakeClient:
+        """Cliente de prueba: no llama a Gemini"""
+        options = []
+        
+        def load_image_from_bytes(self, image_data):
+            return Image.open(io.BytesIO(image_data))
+        
+        def process_acta(self, image, metadata, **kwargs):
+            self.options.append(kwargs)
+            if metadata.get('grado') == 'ERROR':
+                raise RuntimeError('fallo simulado')
+            return {'totalEstudiantes': 1, 'imagen': list(image.size)}
+    
+    buffer = io.BytesIO()
+    Image.new('L', (40, 20), color=255).save(buffer, format='PNG')
+    image_bytes = buffer.getvalue()
+    
+    def wait_finished(store, job_id, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = store.get(job_id)
+            if job['estado'] in ('completado', 'error'):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"Trabajo {job_id} no terminó")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'jobs.sqlite3')
+        
+        # Trabajos encolados antes de un "reinicio" (sin manager activo)
+        store = OCRJobStore(db_path)
+        pendiente = store.create({'grado': 'Quinto'}, image_bytes=image_bytes)
+        # Proceso caído a mitad de un trabajo: su lease ya venció
+        assert store.claim(store.create({'grado': 'Quinto'}, image_bytes=image_bytes), 'caido', lease_seconds=-1)
+        # Trabajo de otro proceso vivo: lease vigente, no se reencola
+        ajeno = store.create({'grado': 'Quinto'}, image_bytes=image_bytes)
+        assert store.claim(ajeno, 'vivo', lease_seconds=60)
+        assert not store.claim(ajeno, 'otro', lease_seconds=60)
+        
+        manager = OCRJobManager(FakeClient(), OCRJobStore(db_path), max_workers=2)
+        assert manager.start() == 2
+        job = wait_finished(store, pendiente)
+        assert job['estado'] == 'completado'
+        assert job['resultado'] == {'totalEstudiantes': 1, 'imagen': [40, 20]}
+        assert store.get(ajeno)['estado'] == 'procesando' and store.get(ajeno)['propietario'] == 'vivo'
+        print("   ✓ Trabajos pendientes reanudados tras reinicio (sin tocar los de procesos vivos)")
+        
+        fallido = manager.submit({'grado': 'ERROR'}, image_bytes=image_bytes)
+        job = wait_finished(store, fallido)
+        assert job['estado'] == 'error' and 'fallo simulado' in job['error']
+        print("   ✓ Errores registrados en el trabajo")
+        
+        con_opciones = manager.submit(
+            {'grado': 'Quinto'}, image_bytes=image_bytes, use_cache=False,
+            options={'preprocess': 'compacto', 'bands': 3}
+        )
+        assert wait_finished(store, con_opciones)['opciones'] == {'preprocess': 'compacto', 'bands': 3}
+        assert FakeClient.options[-1] == {'use_cache': False, 'preprocess': 'compacto', 'bands': 3}
+        print("   ✓ preprocess y bands del request llegan a process_acta como en /api/ocr/process")
+        
+        manager.shutdown()
+        
+        # Dos procesos sobre la misma base: cada trabajo se ejecuta una sola vez
+        class CountingClient(FakeClient):
+            calls = []
+            
+            def process_acta(self, image, metadata, **kwargs):
+                self.calls.append(metadata['n'])
+                time.sleep(0.01)
+                return super().process_acta(image, metadata, **kwargs)
+        
+        ids = [store.create({'grado': 'Quinto', 'n': n}, image_bytes=image_bytes) for n in range(12)]
+        managers = [OCRJobManager(CountingClient(), OCRJobStore(db_path), max_workers=3) for _ in range(2)]
+        for m in managers:
+            m.start()
+        for job_id in ids:
+            assert wait_finished(store, job_id)['intentos'] == 1
+        assert sorted(CountingClient.calls) == list(range(12))
+        for m in managers:
+            m.shutdown()
+        print("   ✓ Dos procesos comparten la base sin ejecutar un trabajo dos veces")
+    
+    print("   ✅ Trabajos OCR asíncronos OK")
+    return True
+
+def test_ocr_batch():
+    """Prueba el procesamiento concurrente de páginas de un libro"""
+    print("\n🧪 TEST 7: Lote de Páginas")
+    print_separator()
+    
+    import time
+    
+    class FakeClient:
+        """Cliente de prueba: cada página tarda 0.2s"""
+        def load_and_prepare_image(self, image_path):
+            return Image.new('L', (10, 10))
+        
+        def process_acta(self, image, metadata, **kwargs):
+            time.sleep(0.2)
+            return {'totalEstudiantes': metadata['total']}
+    
+    pages = [
+        {'pagina': n, 'image_path': __file__, 'metadata': {'total': n}}
+        for n in range(1, 9)
+    ]
+    pages.append({'pagina': 9, 'metadata': {'total': 9}})  # sin imagen
+    
+    start = time.time()
+    results = list(iter_batch_results(FakeClient(), pages, max_concurrency=8))
+    elapsed = time.time() - start
+    
+    resumen = results[-1]
+    paginas = {item['pagina']: item for item in results[:-1]}
+    assert resumen['tipo'] == 'resumen'
+    assert resumen['exitosas'] == 8 and resumen['fallidas'] == 1
+    assert paginas[5]['data'] == {'totalEstudiantes': 5}
+    assert not paginas[9]['success'] and 'Imagen requerida' in paginas[9]['error']
+    print(f"   ✓ 8 páginas de 0.2s procesadas en {elapsed:.2f}s")
+    assert elapsed < 0.2 * 8 / 2
+    
+    print("   ✅ Lote de páginas OK")
+    return True
+
+def test_rate_limiter():
+    """Prueba el rate limiter de token bucket (RPM + TPM)"""
+    print("\n🧪 TEST 8: Rate Limiter RPM/TPM")
+    print_separator()
+    
+    import threading
+    
+    now = [0.0]
+    limiter = TokenBucketRateLimiter(requests_per_minute=6, tokens_per_minute=6000, clock=lambda: now[0])
+    
+    # La cuota completa está disponible en ráfaga
+    permits = [limiter.try_acquire(500) for _ in range(6)]
+    assert all(permits)
+    assert limiter.try_acquire(0) is None
+    assert abs(limiter.estimate_wait(0) - 10.0) < 1e-6  # 6 RPM → 1 request cada 10s
+    print("   ✓ Ráfaga limitada por RPM")
+    
+    # El uso real menor al estimado devuelve tokens al bucket
+    now[0] = 60.0
+    permit = limiter.try_acquire(6000)
+    assert permit is not None and limiter.try_acquire(100) is None
+    assert limiter.estimate_wait(100) > 0
+    limiter.record_usage(permit, 1000)
+    assert limiter.try_acquire(4000) is not None
+    print("   ✓ Reserva de tokens ajustada con el uso real")
+    
+    with_timeout = TokenBucketRateLimiter(requests_per_minute=1, tokens_per_minute=1000)
+    with_timeout.acquire(10)
+    try:
+        with_timeout.acquire(10, timeout=0.05)
+        raise AssertionError("Debió exceder el timeout")
+    except RateLimitExceeded as e:
+        assert e.retry_after > 50
+    print("   ✓ Timeout con tiempo estimado de espera")
+    
+    # Concurrencia: 20 hilos compiten por 10 permisos disponibles
+    shared = TokenBucketRateLimiter(requests_per_minute=10, tokens_per_minute=10_000)
+    granted = []
+    
+    def worker():
+        permit = shared.try_acquire(100)
+        if permit is not None:
+            granted.append(permit)
+    
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 10
+    print("   ✓ Seguro entre hilos")
+    
+    print("   ✅ Rate limiter OK")
+    return True
+
+def test_image_preprocessing():
+    """Prueba el preprocesamiento de imágenes"""
+    print("\n🧪 TEST 9: Preprocesamiento de Imágenes")
+    print_separator()
+    
+    import io
+    
+    # Escaneo RGBA de 600 DPI (A3 horizontal ~ 9900 px de ancho)
+    image = Image.new('RGBA', (4000, 2800), color=(250, 250, 250, 255))
+    image.info['dpi'] = (600, 600)
+    
+    config = PreprocessConfig(grayscale=True, target_dpi=150, output_format='JPEG', quality=80)
+    prepared = preprocess_image(image, config)
+    
+    assert prepared.image.mode == 'L'
+    assert prepared.image.size == (1000, 700)
+    assert prepared.stats['pixelesDespues'] * 16 == prepared.stats['pixelesAntes']
+    assert prepared.payload['mime_type'] == 'image/jpeg'
+    assert Image.open(io.BytesIO(prepared.payload['data'])).size == (1000, 700)
+    print(f"   ✓ {prepared.stats['dimensionesAntes']} RGBA → {prepared.stats['dimensionesDespues']} L "
+          f"({prepared.stats['bytesDespues']:,} bytes)")
+    
+    # Sin DPI declarado se estima con el ancho de página
+    sin_dpi = Image.new('RGB', (3300, 2000), color='white')
+    prepared = preprocess_image(sin_dpi, PreprocessConfig(target_dpi=100, page_width_inches=16.5, output_format='WEBP'))
+    assert prepared.image.size == (1650, 1000)
+    assert prepared.payload['mime_type'] == 'image/webp'
+    print("   ✓ DPI estimado por ancho de página")
+    
+    assert get_preset('original') is None
+    assert get_preset('balanceado').target_dpi == 200
+    assert get_preset('calidad').signature() != get_preset('compacto').signature()
+    try:
+        get_preset('inexistente')
+        raise AssertionError("Debió rechazar el preset")
+    except ValueError:
+        pass
+    print("   ✓ Presets")
+    
+    print("   ✅ Preprocesamiento de imágenes OK")
+    return True
+
+def test_logging():
+    """Prueba el logging en cola y el detalle condicional por estudiante"""
+    print("\n🧪 TEST 10: Logging Estructurado")
+    print_separator()
+    
+    import queue
+    import logging
+    
+    # El handler en cola no formatea en el hilo que emite
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    record = logging.makeLogRecord({'msg': 'acta %s', 'args': ('A-1',), 'acta': 'A-1'})
+    handler.emit(record)
+    queued = log_queue.get_nowait()
+    assert queued.msg == 'acta %s' and queued.args == ('A-1',)
+    assert not hasattr(queued, 'message')
+    line = json.loads(JsonFormatter().format(queued))
+    assert line['msg'] == 'acta A-1' and line['acta'] == 'A-1'
+    print("   ✓ Formateo diferido al listener")
+    
+    # Sin DEBUG ni muestreo no se registra el detalle de cada estudiante
+    records = []
+    capture = logging.Handler()
+    capture.emit = records.append
+    parser_logger = logging.getLogger('response_parser')
+    previous_level = parser_logger.level
+    parser_logger.addHandler(capture)
+    parser_logger.setLevel(logging.INFO)
+    try:
+        gemini_data = {'estudiantes': [
+            {'numero': 1, 'apellido_paterno': 'QUISPE', 'nombres': 'Ana', 'sexo': 'M', 'notas': [12], 'situacion_final': 'A'},
+            {'numero': 2, 'apellido_paterno': 'MAMANI', 'nombres': 'Luis', 'sexo': 'H', 'notas': [9], 'situacion_final': 'R'},
+        ]}
+        metadata = {'areas': [{'posicion': 1, 'nombre': 'MATEMATICA', 'codigo': 'MAT'}]}
+        convert_to_backend_format(gemini_data, metadata)
+        assert not any('RAW' in r.msg for r in records)
+        convert_to_backend_format(gemini_data, metadata, log_detail=True)
+        assert sum('RAW' in r.msg for r in records) == 2
+    finally:
+        parser_logger.removeHandler(capture)
+        parser_logger.setLevel(previous_level)
+    print("   ✓ Detalle por estudiante solo si se solicita")
+    
+    assert sample_request(0) is False
+    assert sample_request(1.0) is True
+    print("   ✓ Muestreo de requests")
+    
+    print("   ✅ Logging OK")
+    return True
+
+def test_metrics():
+    """Prueba el registro de métricas y el desglose por etapas"""
+    print("\n🧪 TEST 11: Métricas Prometheus")
+    print_separator()
+    
+    registry = MetricsRegistry()
+    requests_total = registry.counter('ocr_test_total', 'Requests de prueba', ('estado',))
+    in_flight = registry.gauge('ocr_test_in_flight', 'Requests en curso')
+    stages = registry.histogram('ocr_test_stage_seconds', 'Etapas de prueba', ('etapa',), buckets=(0.1, 1))
+    
+    requests_total.inc(estado='ok')
+    requests_total.inc(2, estado='error')
+    with in_flight.track_inprogress():
+        assert in_flight.value() == 1
+    assert in_flight.value() == 0
+    stages.observe(0.05, etapa='llamada_modelo')
+    stages.observe(0.5, etapa='llamada_modelo')
+    stages.observe(5, etapa='llamada_modelo')
+    
+    text = registry.render()
+    assert '# TYPE ocr_test_total counter' in text
+    assert 'ocr_test_total{estado="error"} 2' in text
+    assert 'ocr_test_stage_seconds_bucket{etapa="llamada_modelo",le="0.1"} 1' in text
+    assert 'ocr_test_stage_seconds_bucket{etapa="llamada_modelo",le="1"} 2' in text
+    assert 'ocr_test_stage_seconds_bucket{etapa="llamada_modelo",le="+Inf"} 3' in text
+    assert 'ocr_test_stage_seconds_count{etapa="llamada_modelo"} 3' in text
+    try:
+        requests_total.inc(estadoo='ok')
+        raise AssertionError("Debió rechazar etiquetas desconocidas")
+    except ValueError:
+        pass
+    print("   ✓ Formato de exposición de Prometheus")
+    
+    timer = StageTimer(histogram=stages)
+    with timer.stage('parseo_body'):
+        pass
+    with timer.stage('validacion'):
+        pass
+    with timer.stage('parseo_body'):
+        pass
+    assert list(timer.as_dict()) == ['parseo_body', 'validacion']
+    assert stages.count(etapa='parseo_body') == 2
+    print(f"   ✓ Desglose por etapas: {timer.as_dict()}")
+    
+    assert finish_reason_name(1) == 'STOP'
+    assert finish_reason_name(None) == 'NONE'
+    print("   ✓ Nombres de finish_reason")
+    
+    print("   ✅ Métricas OK")
+    return True
+
+def test_ocr_tiling():
+    """Prueba el OCR por franjas: división, fusión y procesamiento en paralelo"""
+    print("\n🧪 TEST 12: OCR por Franjas")
+    print_separator()
+    
+    import re
+    import time
+    import threading
+    
+    # Encabezado de 200 px + 800 px de filas en 4 franjas con 10% de solapamiento
+    image = Image.new('RGB', (600, 1000), color='white')
+    bands = split_into_bands(image, TilingConfig(bands=4, overlap=0.1, header_ratio=0.2))
+    assert len(bands) == 4
+    assert bands[0].top == 200 and bands[-1].bottom == 1000
+    assert all(band.image.size[1] == 200 + band.bottom - band.top for band in bands)
+    assert all(bands[i].bottom > bands[i + 1].top for i in range(3))  # solapadas
+    print(f"   ✓ Franjas: {[(band.top, band.bottom) for band in bands]}")
+    
+    merged = merge_band_students([
+        [{'numero': 1, 'nombres': 'ANA', 'notas': [12]}, {'numero': 2, 'nombres': 'LUIS', 'notas': [None]}],
+        [{'numero': 2, 'nombres': 'LUIS', 'notas': [14]}, {'numero': 3, 'nombres': 'EVA', 'notas': [15]}],
+    ])
+    assert [est['numero'] for est in merged] == [1, 2, 3]
+    assert merged[1]['notas'] == [14]  # se conserva la versión más completa
+    print("   ✓ Fusión por número sin duplicados")
+    
+    def student(numero):
+        return {
+            'numero': numero, 'codigo': '', 'tipo': 'G',
+            'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI', 'nombres': f'ALUMNO {numero}',
+            'sexo': 'M', 'notas': [12, 13], 'comportamiento': '15', 'situacion_final': 'P',
+        }
+    
+    concurrencia = {'en_curso': 0, 'maxima': 0}
+    lock = threading.Lock()
+    
+    class FakeModel:
+        """Cada franja tarda 0.2s y devuelve sus filas más una fila solapada"""
+        def generate_content(self, contents):
+            with lock:
+                concurrencia['en_curso'] += 1
+                concurrencia['maxima'] = max(concurrencia['maxima'], concurrencia['en_curso'])
+            time.sleep(0.2)
+            with lock:
+                concurrencia['en_curso'] -= 1
+            match = re.search(r'FRANJA (\d+) DE (\d+)', contents[1])
+            index = int(match.group(1)) - 1
+            numeros = range(index * 10 + 1, min(index * 10 + 12, 31))
+            return fake_response(json.dumps({'estudiantes': [student(n) for n in numeros]}))
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel()))
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA'}, {'posicion': 2, 'nombre': 'COMUNICACIÓN'}],
+    }
+    resultado = client.process_acta(Image.new('L', (600, 1500), color=255), metadata, bands=3)
+    
+    assert resultado['totalEstudiantes'] == 30
+    assert [est['numero'] for est in resultado['estudiantes']] == list(range(1, 31))
+    assert len(resultado['bandas']) == 3
+    assert concurrencia['maxima'] >= 2  # franjas en paralelo, no en serie
+    print(f"   ✓ 3 franjas procesadas con hasta {concurrencia['maxima']} llamadas simultáneas, "
+          f"{resultado['totalEstudiantes']} estudiantes")
+    
+    print("   ✅ OCR por franjas OK")
+    return True
+
+def test_streaming():
+    """Prueba el parser incremental y el procesamiento en streaming"""
+    print("\n🧪 TEST 13: Streaming de Estudiantes")
+    print_separator()
+    
+    estudiantes = [
+        {'numero': n, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI',
+         'nombres': 'ANA {"MARÍA"}' if n == 2 else f'ALUMNO {n}', 'sexo': 'F',
+         'notas': [12, 9], 'situacion_final': 'A'}
+        for n in range(1, 6)
+    ]
+    text = '```json\n' + json.dumps({'estudiantes': estudiantes}, indent=2, ensure_ascii=False) + '\n```'
+    
+    # Fragmentos de cualquier tamaño, con llaves y comillas dentro de strings
+    for size in (1, 7, 64, len(text)):
+        parser = IncrementalStudentParser()
+        found = []
+        for k in range(0, len(text), size):
+            found.extend(parser.feed(text[k:k + size]))
+        assert found == estudiantes and parser.done
+    print("   ✓ Parser incremental")
+    
+    class FakeModel:
+        def generate_content(self, contents, stream=False):
+            return fake_response(text)
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel()))
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA'}, {'posicion': 2, 'nombre': 'COMUNICACIÓN'}],
+    }
+    image = Image.new('L', (100, 100), color=255)
+    
+    events = list(client.process_acta_stream(image, metadata))
+    assert [event['tipo'] for event in events] == ['estudiante'] * 5 + ['resultado']
+    streamed = [event['data'] for event in events[:-1]]
+    final = events[-1]['data']
+    assert streamed == final['estudiantes']
+    
+    normal = client.process_acta(image, metadata)
+    for resultado in (final, normal):
+        resultado.pop('etapasMs')
+        resultado.pop('tiempoProcesamientoMs')
+    assert final == normal
+    print("   ✓ Resultado final idéntico al procesamiento sin streaming")
+    
+    print("   ✅ Streaming OK")
+    return True
+
+def test_truncated_response():
+    """Prueba la recuperación de respuestas truncadas y la continuación"""
+    print("\n🧪 TEST 14: Respuestas Truncadas")
+    print_separator()
+    
+    def student(numero):
+        return {
+            'numero': numero, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI',
+            'nombres': f'ALUMNO {numero}', 'sexo': 'M', 'notas': [12, 14], 'situacion_final': 'P',
+        }
+    
+    full = json.dumps({'estudiantes': [student(n) for n in range(1, 11)]}, indent=2)
+    cut = '```json\n' + full[:full.index('"numero": 7') + 30]  # cortado dentro del estudiante 7
+    
+    try:
+        extract_json_from_response(cut)
+        raise AssertionError("Debió fallar con JSON truncado")
+    except ValueError:
+        pass
+    assert [est['numero'] for est in salvage_students(cut)] == [1, 2, 3, 4, 5, 6]
+    assert extract_json_from_response('```json\n' + full)['estudiantes'][9]['numero'] == 10  # ``` sin cierre
+    assert extract_json_from_response(full + '\n```\nListo.')['estudiantes'][0]['numero'] == 1
+    print("   ✓ Estudiantes recuperados de una respuesta cortada")
+    
+    class FakeModel:
+        """Primera llamada cortada por MAX_TOKENS; la continuación trae el resto"""
+        def __init__(self):
+            self.prompts = []
+        
+        def generate_content(self, contents, stream=False):
+            self.prompts.append(contents[1])
+            if len(self.prompts) == 1:
+                text, reason = cut, 2  # 2 = MAX_TOKENS
+            else:
+                text, reason = json.dumps({'estudiantes': [student(n) for n in range(6, 11)]}), 1
+            return fake_response(text, reason)
+    
+    model = FakeModel()
+    client = GeminiOCRClient('test-key', model_pool=FakePool(model))
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA'}, {'posicion': 2, 'nombre': 'COMUNICACIÓN'}],
+    }
+    resultado = client.process_acta(Image.new('L', (100, 100), color=255), metadata)
+    
+    assert len(model.prompts) == 2
+    assert 'MAYOR a 6' in model.prompts[1]
+    assert [est['numero'] for est in resultado['estudiantes']] == list(range(1, 11))
+    assert resultado['continuaciones'] == 1
+    print("   ✓ Continuación desde el último número recuperado")
+    
+    # En streaming: la continuación repite el estudiante 6
+    model = FakeModel()
+    client = GeminiOCRClient('test-key', model_pool=FakePool(model))
+    streamed = []
+    resultado = client.process_acta(Image.new('L', (100, 100), color=255), metadata, on_student=streamed.append)
+    assert len(model.prompts) == 2 and resultado['continuaciones'] == 1
+    assert [est['numero'] for est in streamed] == list(range(1, 11))
+    assert streamed == resultado['estudiantes']
+    print("   ✓ En streaming la continuación no repite estudiantes ya emitidos")
+    
+    print("   ✅ Respuestas truncadas OK")
+    return True
+
+def test_context_cache():
+    """Prueba el prompt compilado y el cache de contexto (stand-in local)"""
+    print("\n🧪 TEST 15: Prompt Compilado y Cache de Contexto")
+    print_separator()
+    
+    areas = [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}, {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'}]
+    acta_a = {'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA', 'areas': areas}
+    acta_b = dict(acta_a, grado='Cuarto Grado', seccion='B')
+    
+    hits_before = compile_prompt_prefix.cache_info().hits
+    prompt_a = compile_acta_prompt(acta_a)
+    prompt_b = compile_acta_prompt(acta_b)
+    assert prompt_a.prefix == prompt_b.prefix and prompt_a.signature == prompt_b.signature
+    assert 'Quinto Grado' in prompt_a.suffix and 'Cuarto Grado' in prompt_b.suffix
+    assert 'Quinto Grado' not in prompt_a.prefix
+    assert compile_prompt_prefix.cache_info().hits > hits_before
+    assert build_acta_prompt(acta_a) == prompt_a.text
+    assert compile_acta_prompt(dict(acta_a, areas=areas[:1])).signature != prompt_a.signature
+    print(f"   ✓ Prefijo memoizado por conjunto de áreas ({len(prompt_a.prefix)} caracteres, sufijo {len(prompt_a.suffix)})")
+    
+    class FakeModel:
+        def __init__(self):
+            self.contents = []
+        
+        def generate_content(self, contents, stream=False):
+            self.contents.append(contents)
+            return fake_response(
+                json.dumps({'estudiantes': [{'numero': 1, 'apellido_paterno': 'QUISPE', 'notas': [12, 14]}]}),
+                usage=types.SimpleNamespace(prompt_token_count=2500, candidates_token_count=300, total_token_count=2800),
+            )
+    
+    model = FakeModel()
+    pool = FakePool(model)
+    backend = LocalContextCacheBackend(pool)
+    client = GeminiOCRClient('test-key', model_pool=pool, context_cache=PromptContextCache(backend))
+    image = Image.new('L', (100, 100), color=255)
+    resultado_a = client.process_acta(image, acta_a)
+    resultado_b = client.process_acta(image, acta_b)
+    
+    assert len(backend.handles) == 1
+    handle = next(iter(backend.handles.values()))
+    assert handle.prefix == prompt_a.prefix and handle.system_instruction == client.system_instruction
+    assert [contents[0] for contents in model.contents] == [prompt_a.prefix] * 2
+    assert model.contents[0][-1] == prompt_a.suffix and model.contents[1][-1] == prompt_b.suffix
+    tokens = resultado_b['tokens']
+    # La primera acta crea el cache y ya lo usa en su propia llamada
+    assert resultado_a['tokens'] == tokens
+    assert tokens['entrada'] == 2500 and tokens['entradaCacheada'] == handle.token_count
+    assert tokens['entradaSinCache'] == 2500 - handle.token_count and tokens['salida'] == 300
+    print(f"   ✓ Prefijo cacheado una vez y reutilizado ({tokens['entradaCacheada']} de {tokens['entrada']} tokens de entrada cacheados)")
+    
+    class FailingBackend(LocalContextCacheBackend):
+        def create(self, *args, **kwargs):
+            raise RuntimeError("contenido por debajo del mínimo de tokens")
+    
+    model.contents.clear()
+    failing = PromptContextCache(FailingBackend(pool))
+    client = GeminiOCRClient('test-key', model_pool=pool, context_cache=failing)
+    resultado = client.process_acta(image, acta_a)
+    assert model.contents[0][-1] == prompt_a.text
+    assert resultado['tokens']['entradaCacheada'] == 0
+    assert failing.stats()['prefijos_sin_cache'] == 1
+    print("   ✓ Sin cache disponible se envía el prompt completo")
+    
+    print("   ✅ Cache de contexto OK")
+    return True
+
+def test_compact_output_format():
+    """Prueba el formato de salida compacto (filas)"""
+    print("\n🧪 TEST 16: Formato de Salida Compacto")
+    print_separator()
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}, {'posicion': 2, 'nombre': 'COMUNICACIÓN', 'codigo': 'COM'}],
+    }
+    objetos = {'estudiantes': [
+        {'numero': 1, 'codigo': '12345', 'tipo': 'G', 'apellido_paterno': 'GARCÍA', 'apellido_materno': 'LÓPEZ',
+         'nombres': 'JUAN CARLOS', 'sexo': 'M', 'notas': [14, 9], 'comportamiento': '18',
+         'asignaturas_desaprobadas': 1, 'situacion_final': 'A', 'observaciones': None},
+        {'numero': 2, 'codigo': '', 'tipo': 'G', 'apellido_paterno': 'MARTÍNEZ', 'apellido_materno': 'SILVA',
+         'nombres': 'MARÍA ELENA', 'sexo': 'F', 'notas': [16, None], 'comportamiento': '19',
+         'asignaturas_desaprobadas': 0, 'situacion_final': 'P', 'observaciones': 'TRASLADO'},
+    ]}
+    filas = {'filas': [
+        {'d': [str(est[c]) if est[c] is not None else None for c in COMPACT_COLUMNS], 'n': est['notas']}
+        for est in objetos['estudiantes']
+    ]}
+    
+    assert expand_compact_response(filas) == objetos
+    assert expand_compact_response(objetos) is objetos  # el modelo ignoró el formato
+    assert convert_to_backend_format(expand_compact_response(filas), metadata) == convert_to_backend_format(objetos, metadata)
+    print("   ✓ Las filas se expanden al mismo formato que 'objetos'")
+    
+    text = json.dumps(filas, ensure_ascii=False)
+    assert [est['numero'] for est in salvage_students(text[:-30], 'filas')] == [1]
+    parser = IncrementalStudentParser.for_format('filas')
+    streamed = [est for i in range(0, len(text), 7) for est in parser.feed(text[i:i + 7])]
+    assert streamed == objetos['estudiantes'] and parser.done
+    print("   ✓ Recuperación y streaming de filas")
+    
+    class FakeModel:
+        def generate_content(self, contents, stream=False):
+            self.prompt = contents[-1]
+            return fake_response(text)
+    
+    pool = FakePool(FakeModel())
+    client = GeminiOCRClient('test-key', model_pool=pool, output_format='filas')
+    resultado = client.process_acta(Image.new('L', (100, 100), color=255), metadata)
+    
+    generation_config = pool.calls[-1][2]
+    schema = generation_config['response_schema']
+    assert generation_config['response_mime_type'] == 'application/json'
+    assert schema['properties']['filas']['items']['properties']['n']['max_items'] == 2
+    assert '"filas"' in pool.model.prompt and '"asignaturas_desaprobadas": 2' not in pool.model.prompt
+    esperado = apply_confidence(convert_to_backend_format(objetos, metadata), check_consistency(objetos['estudiantes'], 2))
+    assert resultado['estudiantes'] == esperado['estudiantes']
+    print("   ✓ Cliente con response_schema y resultado idéntico al formato 'objetos'")
+    
+    try:
+        GeminiOCRClient('test-key', model_pool=pool, output_format='tabla')
+        raise AssertionError("Debió rechazar un formato desconocido")
+    except ValueError:
+        pass
+    
+    print("   ✅ Formato compacto OK")
+    return True
+
+def test_normalization():
+    """Prueba los normalizadores por tabla y la conversión en una pasada"""
+    print("\n🧪 TEST 17: Normalización de Respuestas")
+    print_separator()
+    
+    casos_sexo = {
+        'M': 'M', 'f': 'F', ' H ': 'M', 'MASCULINO': 'M', 'FEMENINO': 'F', 'Mujer': 'F',
+        'FEMALE': 'F', 'VARÓN': 'M', 'F.': 'F', None: 'M', '?': 'M',
+    }
+    for valor, esperado in casos_sexo.items():
+        assert normalize_sexo(valor) == esperado, (valor, normalize_sexo(valor))
+    print(f"   ✓ Sexo: {len(casos_sexo)} variantes")
+    
+    casos_situacion = {
+        'P': 'P', 'a': 'A', 'R': 'R', 'PROMOVIDO': 'P', 'APROBADO': 'A', 'REPROBADO': 'R',
+        'DESAPROBADO': 'R', 'RETIRADA': 'R', 'PASE DIRECTO': 'P', 'P (PROMOVIDO)': 'P',
+        '-': 'R', '': 'R', None: 'R', 'null': 'R', 15: 'R',
+    }
+    for valor, esperado in casos_situacion.items():
+        assert normalize_situacion_final(valor) == esperado, (valor, normalize_situacion_final(valor))
+    print(f"   ✓ Situación final: {len(casos_situacion)} variantes")
+    
+    gemini_data = {'estudiantes': [
+        {'numero': 1, 'nombre_completo': 'GARCÍA LÓPEZ, Juan Carlos', 'notas': [5, 8, 9, 10, 15], 'situacion_final': 'R'},
+        {'numero': 2, 'apellidos_y_nombres': 'PÉREZ ROJAS ANA', 'notas': [12, 13], 'situacion_final': 'P'},
+        {'numero': 3, 'nombre': 'QUISPE, MAMANI LUIS', 'notas': [12, 9], 'situacion_final': 'A'},
+        {'numero': 4, 'nombre_completo': None, 'notas': [], 'situacion_final': 'A'},
+    ]}
+    resultado = convert_to_backend_format(gemini_data, {'areas': []})
+    nombres = [(e['apellidoPaterno'], e['apellidoMaterno'], e['nombres']) for e in resultado['estudiantes']]
+    assert nombres == [
+        ('GARCÍA', 'LÓPEZ', 'Juan Carlos'),
+        ('PÉREZ', 'ROJAS', 'ANA'),
+        ('QUISPE,', 'MAMANI', 'LUIS'),  # 'nombre' no se separa por coma
+        ('', '', ''),
+    ]
+    assert resultado['estudiantes'][3]['nombreCompleto'] == 'Sin nombre'
+    assert resultado['resumenSituacion'] == {'promovidos': 1, 'aprobados': 2, 'reprobados': 1}
+    assert resultado['advertencias'] == ["Estudiante 1: 4 asignaturas desaprobadas"]
+    print("   ✓ Nombres alternativos, resumen por situación y advertencias en una pasada")
+    
+    print("   ✅ Normalización OK")
+    return True
+
+def test_response_archive():
+    """Prueba el archivo de respuestas crudas y su re-procesamiento"""
+    print("\n🧪 TEST 18: Archivo de Respuestas")
+    print_separator()
+    
+    import tempfile
+    from reparse_archive import process_batch
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+    }
+    estudiantes = [
+        {'numero': n, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI', 'nombres': f'ALUMNO {n}',
+         'sexo': 'FEMENINO', 'notas': [12], 'situacion_final': 'P'}
+        for n in (1, 2, 3)
+    ]
+    completo = json.dumps({'estudiantes': estudiantes})
+    cortado = json.dumps({'estudiantes': estudiantes[:2]})[:-2]  # termina por MAX_TOKENS
+    continuacion = json.dumps({'estudiantes': estudiantes[2:]})
+    
+    class FakeModel:
+        def __init__(self, replies):
+            self.replies = replies
+        
+        def generate_content(self, contents, stream=False):
+            return fake_response(*self.replies.pop(0))
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ResponseArchive(os.path.join(tmp, 'respuestas.sqlite3'))
+        casos = [
+            [(completo, 1)],
+            [(cortado, 2), (continuacion, 1)],
+            [('sin json', 1)],
+        ]
+        resultados = []
+        for replies in casos:
+            client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel(replies)), archive=archive)
+            try:
+                resultados.append(client.process_acta(Image.new('L', (100, 100), color=255), metadata))
+            except RuntimeError:
+                resultados.append(None)
+        
+        entries = list(archive.iter_rows(batch_size=2))
+        assert [e['estado'] for e in entries] == ['ok', 'ok', 'error']
+        assert len(decompress_json(entries[1]['respuestas'])) == 2
+        assert entries[0]['huella'] == compute_cache_key(
+            image_digest(Image.new('L', (100, 100), color=255)), metadata,
+            compile_acta_prompt(metadata).text, 'gemini-2.5-pro'
+        )
+        assert archive.stats()['actas_con_error'] == 1
+        print(f"   ✓ {len(entries)} actas archivadas (incluida la continuación y la fallida)")
+        
+        for entry, original in zip(entries, resultados):
+            salida = reparse_entry(entry)
+            if original is None:
+                assert 'error' in salida
+            else:
+                assert salida['resultado']['estudiantes'] == original['estudiantes']
+                assert reparse_entry(entry, umbral=95)['resultado']['revisionSugerida']['umbral'] == 95
+        print("   ✓ Re-procesar reproduce los resultados originales")
+        
+        # Simular que el resultado archivado se obtuvo con reglas anteriores
+        anterior = decompress_json(entries[0]['resultado'])
+        for est in anterior['estudiantes']:
+            est['sexo'] = 'M'
+        entries[0]['resultado'] = compress_json(anterior)
+        salidas = process_batch(entries, UMBRAL_REVISION)
+        assert salidas[0]['cambios'] == {'sexo': 3}
+        assert salidas[1]['cambios'] == {} and salidas[2]['estadoAnterior'] == 'error'
+        print("   ✓ Diferencias por campo contra el resultado archivado")
+    
+    print("   ✅ Archivo de respuestas OK")
+    return True
+
+def test_async_processing():
+    """Prueba process_acta_async: mismo resultado y llamadas concurrentes sin hilos"""
+    print("\n🧪 TEST 19: Procesamiento Asíncrono")
+    print_separator()
+    
+    import asyncio
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+    }
+    estudiantes = [
+        {'numero': n, 'apellido_paterno': 'QUISPE', 'nombres': f'ALUMNO {n}', 'notas': [12], 'situacion_final': 'P'}
+        for n in (1, 2, 3)
+    ]
+    completo = json.dumps({'estudiantes': estudiantes})
+    
+    class FakeModel:
+        def __init__(self, replies=None):
+            self.replies = replies
+            self.in_flight = 0
+            self.max_in_flight = 0
+        
+        def generate_content(self, contents, stream=False):
+            return fake_response(completo)
+        
+        async def generate_content_async(self, contents):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.2)
+            self.in_flight -= 1
+            return fake_response(*self.replies.pop(0)) if self.replies else fake_response(completo)
+    
+    limiter = TokenBucketRateLimiter(requests_per_minute=10_000, tokens_per_minute=100_000_000)
+    model = FakeModel()
+    client = GeminiOCRClient('test-key', model_pool=FakePool(model), rate_limiter=limiter)
+    image = Image.new('L', (100, 100), color=255)
+    
+    sync_result = client.process_acta(image, metadata)
+    
+    async def run_many(n):
+        return await asyncio.gather(*(client.process_acta_async(image, metadata) for _ in range(n)))
+    
+    results = asyncio.run(run_many(20))
+    assert all(r['estudiantes'] == sync_result['estudiantes'] for r in results)
+    assert model.max_in_flight >= 2, model.max_in_flight  # llamadas en paralelo, no en serie
+    print(f"   ✓ 20 actas concurrentes (hasta {model.max_in_flight} llamadas simultáneas) "
+          f"con el mismo resultado que process_acta")
+    
+    cortado = json.dumps({'estudiantes': estudiantes[:2]})[:-2]
+    client = GeminiOCRClient(
+        'test-key', model_pool=FakePool(FakeModel([(cortado, 2), (json.dumps({'estudiantes': estudiantes[2:]}), 1)])),
+        rate_limiter=limiter
+    )
+    resultado = asyncio.run(client.process_acta_async(image, metadata))
+    assert resultado['totalEstudiantes'] == 3 and resultado['continuaciones'] == 1
+    print("   ✓ Continuación asíncrona de respuestas truncadas")
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel([('sin json', 1)])), rate_limiter=limiter)
+    try:
+        asyncio.run(client.process_acta_async(image, metadata))
+        raise AssertionError("Debió fallar con una respuesta sin JSON")
+    except RuntimeError as e:
+        assert 'Error en procesamiento OCR' in str(e)
+    print("   ✓ Errores con el mismo formato que process_acta")
+    
+    print("   ✅ Procesamiento asíncrono OK")
+    return True
+
+def test_lazy_startup():
+    """Prueba que el SDK de Gemini se cargue recién al usarlo y el warm-up"""
+    print("\n🧪 TEST 20: Arranque Perezoso")
+    print_separator()
+    
+    import subprocess
+    import tempfile
+    
+    code = (
+        "import sys, main; "
+        "assert 'google.generativeai' not in sys.modules, 'SDK importado con main'; "
+        "main.app.test_client().get('/metrics'); "
+        "assert main.gemini_client is not None, 'main:app no inicializó los servicios'; "
+        "main.init_services(); "
+        "assert 'google.generativeai' not in sys.modules, 'SDK importado al crear el cliente'; "
+        "main.gemini_client.warm_up(); "
+        "assert 'google.generativeai' in sys.modules"
+    )
+    env = dict(
+        os.environ, GEMINI_API_KEY='test-key', OCR_CACHE_ENABLED='false', OCR_LOG_LEVEL='WARNING', OCR_WARMUP='off',
+        OCR_JOBS_DB=os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'),
+    )
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr[-2000:]
+    print("   ✓ import main y la creación del cliente (también en el primer request a main:app) no cargan google.generativeai")
+    
+    pool = FakePool(object())
+    client = GeminiOCRClient('test-key', model_pool=pool, output_format='filas')
+    pasos = client.warm_up()
+    assert set(pasos) == {'sdk', 'modelo_y_prompt'}
+    assert pool.calls and 'response_schema' in pool.calls[0][2]
+    print(f"   ✓ warm_up precarga el SDK y el handle OCR ({sum(pasos.values()):.0f}ms)")
+    
+    print("   ✅ Arranque perezoso OK")
+    return True
+
+def test_upstream_guard():
+    """Prueba reintentos clasificados, concurrencia AIMD y circuit breaker"""
+    print("\n🧪 TEST 21: Sobrecarga de Gemini")
+    print_separator()
+    
+    import asyncio
+    
+    class ResourceExhausted(Exception):
+        pass
+    
+    class ServiceUnavailable(Exception):
+        code = 503
+    
+    assert classify_error(ResourceExhausted('429 Quota exceeded')) == 'cuota'
+    assert classify_error(ServiceUnavailable('503')) == 'servidor'
+    assert classify_error(TimeoutError()) == 'timeout'
+    assert classify_error(ValueError('400 imagen inválida')) == 'otro'
+    print("   ✓ Errores clasificados en cuota, servidor, timeout y otros")
+    
+    now = [0.0]
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, min_limit=1, max_limit=10, clock=lambda: now[0])
+    for _ in range(8):
+        assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release('cuota')
+    limiter.release('cuota')  # misma ventana: no se reduce dos veces
+    assert limiter.limit == 4
+    limiter.release('cliente')
+    assert limiter.limit == 4
+    for _ in range(5):
+        limiter.release()
+    assert limiter.limit == 5 and limiter.stats()['en_curso'] == 0
+    print(f"   ✓ AIMD: 8 → 4 ante 429, sube con los éxitos ({limiter.limit})")
+    
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    for kind in ('servidor', 'cliente', 'timeout'):
+        breaker.before_call()
+        breaker.record(kind)
+    assert breaker.state == 'abierto'
+    try:
+        breaker.before_call()
+        raise AssertionError("Debió rechazar con el circuito abierto")
+    except UpstreamUnavailable as e:
+        assert e.retry_after == 30
+    now[0] += 31
+    breaker.before_call()  # llamada de prueba
+    try:
+        breaker.before_call()
+        raise AssertionError("Solo una llamada de prueba en semiabierto")
+    except UpstreamUnavailable:
+        pass
+    breaker.record()
+    assert breaker.state == 'cerrado'
+    print("   ✓ Circuit breaker: abre, rechaza sin llamar y cierra tras la prueba")
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+    }
+    completo = json.dumps({'estudiantes': [
+        {'numero': 1, 'apellido_paterno': 'QUISPE', 'nombres': 'ANA', 'notas': [12], 'situacion_final': 'P'}
+    ]})
+    
+    class FakeModel:
+        def __init__(self, failures):
+            self.failures = list(failures)
+            self.calls = []
+        
+        def _reply(self, contents):
+            self.calls.append(contents[0])
+            if self.failures:
+                raise self.failures.pop(0)
+            return fake_response(completo)
+        
+        def generate_content(self, contents, stream=False):
+            return self._reply(contents)
+        
+        async def generate_content_async(self, contents):
+            return self._reply(contents)
+    
+    def make_client(model, breaker=None):
+        return GeminiOCRClient(
+            'test-key', model_pool=FakePool(model),
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01),
+            concurrency=AdaptiveConcurrencyLimiter(initial_limit=8),
+            breaker=breaker,
+        )
+    
+    image = Image.new('L', (100, 100), color=255)
+    model = FakeModel([ResourceExhausted('429'), ServiceUnavailable('503')])
+    client = make_client(model)
+    resultado = client.process_acta(image, metadata, use_cache=False)
+    assert resultado['totalEstudiantes'] == 1 and len(model.calls) == 3
+    assert all(sent is model.calls[0] for sent in model.calls)
+    assert client.concurrency.limit == 4
+    print("   ✓ 429 y 503 reintentados con la misma imagen ya preparada")
+    
+    model = FakeModel([ServiceUnavailable('503')])
+    resultado = asyncio.run(make_client(model).process_acta_async(image, metadata, use_cache=False))
+    assert resultado['totalEstudiantes'] == 1 and len(model.calls) == 2
+    print("   ✓ Reintentos también en process_acta_async")
+    
+    model = FakeModel([ValueError('400 Bad Request')])
+    try:
+        make_client(model).process_acta(image, metadata, use_cache=False)
+        raise AssertionError("Debió fallar sin reintentar")
+    except RuntimeError as e:
+        assert not isinstance(e, UpstreamUnavailable) and len(model.calls) == 1
+    print("   ✓ Errores del cliente no se reintentan")
+    
+    model = FakeModel([ServiceUnavailable('503')] * 10)
+    client = make_client(model, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    try:
+        client.process_acta(image, metadata, use_cache=False)
+        raise AssertionError("Debió agotar los reintentos")
+    except UpstreamUnavailable:
+        assert len(model.calls) == 3
+    try:
+        client.process_acta(image, metadata, use_cache=False)
+        raise AssertionError("Debió fallar rápido con el circuito abierto")
+    except UpstreamUnavailable as e:
+        assert len(model.calls) == 3 and e.retry_after > 50
+    stats = client.breaker.stats()
+    assert stats['estado'] == 'abierto' and stats['rechazadas'] == 1
+    print("   ✓ Reintentos agotados → 503; luego el circuito rechaza sin llamar a Gemini")
+    
+    print("   ✅ Sobrecarga de Gemini OK")
+    return True
+
+def test_single_flight():
+    """Prueba que requests idénticos en curso compartan una llamada a Gemini"""
+    print("\n🧪 TEST 22: Single-Flight")
+    print_separator()
+    
+    import time
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+    }
+    completo = json.dumps({'estudiantes': [
+        {'numero': 1, 'apellido_paterno': 'QUISPE', 'nombres': 'ANA', 'notas': [12], 'situacion_final': 'P'}
+    ]})
+    
+    class FakeModel:
+        def __init__(self, text=completo):
+            self.text = text
+            self.calls = 0
+        
+        def _reply(self):
+            self.calls += 1
+            return fake_response(self.text)
+        
+        def generate_content(self, contents, stream=False):
+            time.sleep(0.3)
+            return self._reply()
+        
+        async def generate_content_async(self, contents):
+            await asyncio.sleep(0.3)
+            return self._reply()
+    
+    def make_client(model):
+        return GeminiOCRClient('test-key', model_pool=FakePool(model), single_flight=SingleFlight())
+    
+    image = Image.new('L', (100, 100), color=255)
+    model = FakeModel()
+    client = make_client(model)
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: client.process_acta(image, metadata), range(5)))
+    assert model.calls == 1 and client.single_flight.coalesced == 4
+    assert all(r['estudiantes'] == results[0]['estudiantes'] for r in results)
+    niveles = sorted(str(r['cache']['nivel']) for r in results)
+    assert niveles == ['None'] + ['en_vuelo'] * 4
+    assert results[0] is not results[1]
+    print("   ✓ 5 requests idénticos en paralelo → 1 llamada, 4 coalescidos")
+    
+    otra = dict(metadata, seccion='B')
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(lambda md: client.process_acta(image, md), [metadata, otra, metadata]))
+        list(pool.map(lambda _: client.process_acta(image, metadata, use_cache=False), range(2)))
+    assert model.calls == 5
+    print("   ✓ Metadata distinta y use_cache=False no se coalescen")
+    
+    model = FakeModel()
+    client = make_client(model)
+    
+    async def run_many(n):
+        return await asyncio.gather(*(client.process_acta_async(image, metadata) for _ in range(n)))
+    
+    results = asyncio.run(run_many(5))
+    assert model.calls == 1 and len(results) == 5
+    assert client.single_flight.stats() == {'en_vuelo': 0, 'esperando': 0, 'coalescidos': 4}
+    print("   ✓ También en process_acta_async")
+    
+    model = FakeModel(text='sin json')
+    client = make_client(model)
+    
+    def failing(_):
+        try:
+            client.process_acta(image, metadata)
+        except RuntimeError as e:
+            return str(e)
+    
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        errores = list(pool.map(failing, range(3)))
+    assert model.calls == 1 and all(e and 'Error en procesamiento OCR' in e for e in errores)
+    print("   ✓ Los duplicados reciben el mismo error del líder")
+    
+    print("   ✅ Single-flight OK")
+    return True
+
+def test_document_ingestion():
+    """Prueba libros multipágina (TIFF/PDF) con páginas abiertas de a una"""
+    print("\n🧪 TEST 23: Documentos Multipágina")
+    print_separator()
+    
+    import time
+    import tempfile
+    import threading
+    
+    workdir = tempfile.mkdtemp()
+    tiff_path = os.path.join(workdir, 'libro.tif')
+    pages = [Image.new('L', (100 + n, 80), color=255) for n in range(6)]
+    pages[0].save(tiff_path, save_all=True, append_images=pages[1:])
+    
+    document = open_document(tiff_path)
+    assert document.formato == 'tiff' and document.page_count == 6
+    page = document.page(3)
+    assert page.size == (102, 80) and page.info['documento_pagina'] == 3
+    assert image_digest(page) != image_digest(document.page(4))
+    page.close()
+    print("   ✓ TIFF de 6 páginas: cada página se abre sola y con su propia huella")
+    
+    class FakeClient:
+        """Registra cuántas páginas están abiertas a la vez"""
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.open_pages = 0
+            self.max_open = 0
+            self.sizes = {}
+        
+        def process_acta(self, image, metadata, **kwargs):
+            with self.lock:
+                self.open_pages += 1
+                self.max_open = max(self.max_open, self.open_pages)
+            image.load()
+            time.sleep(0.05)
+            with self.lock:
+                self.open_pages -= 1
+                self.sizes[image.info['documento_pagina']] = image.size
+            if metadata.get('seccion') == 'X':
+                raise ValueError('sección inválida')
+            return {'seccion': metadata['seccion']}
+    
+    client = FakeClient()
+    results = list(iter_document_results(
+        client, document, {'seccion': 'A'}, page_metadata={2: {'seccion': 'B'}, 5: {'seccion': 'X'}},
+        max_concurrency=2
+    ))
+    resumen = results[-1]
+    paginas = {item['pagina']: item for item in results[:-1]}
+    assert resumen['totalPaginas'] == 6 and resumen['exitosas'] == 5 and resumen['formato'] == 'tiff'
+    assert paginas[1]['data'] == {'seccion': 'A'} and paginas[2]['data'] == {'seccion': 'B'}
+    assert not paginas[5]['success'] and 'sección inválida' in paginas[5]['error']
+    assert client.sizes == {n + 1: (100 + n, 80) for n in range(6)}
+    assert client.max_open <= 2
+    print(f"   ✓ Metadata por página y como máximo {client.max_open} páginas abiertas a la vez")
+    
+    results = list(iter_document_results(FakeClient(), document, {'seccion': 'A'}, paginas=[6, 1]))
+    assert sorted(item['pagina'] for item in results[:-1]) == [1, 6]
+    document.close()
+    print("   ✓ Selección de páginas")
+    
+    try:
+        open_document(__file__)
+        raise AssertionError("Debió rechazar un archivo que no es documento")
+    except DocumentError:
+        pass
+    
+    if importlib.util.find_spec('pypdfium2') is None:
+        print("   ⚠️  pypdfium2 no instalado: se omite la prueba de PDF")
+    else:
+        pdf_path = os.path.join(workdir, 'libro.pdf')
+        pages[0].save(pdf_path, save_all=True, append_images=pages[1:3])
+        with open_document(pdf_path, pdf_dpi=144) as pdf:
+            assert pdf.formato == 'pdf' and pdf.page_count == 3
+            assert pdf.page(2).size == (202, 160)  # 72 DPI → 144 DPI
+        print("   ✓ PDF rasterizado por página con pypdfium2")
+    
+    print("   ✅ Documentos multipágina OK")
+    return True
+
+def test_image_quality():
+    """Prueba el control de calidad de la imagen antes de llamar a Gemini"""
+    print("\n🧪 TEST 24: Control de Calidad de Imagen")
+    print_separator()
+    
+    import time
+    from PIL import ImageDraw, ImageFilter
+    
+    def acta(width=2400, height=1600):
+        """Tabla con renglones y texto, como un acta escaneada"""
+        img = Image.new('L', (width, height), color=235)
+        draw = ImageDraw.Draw(img)
+        for y in range(120, height - 120, 60):
+            draw.line([(80, y), (width - 80, y)], fill=30, width=3)
+            for x in range(120, width - 300, 280):
+                draw.text((x, y + 15), "QUISPE 14 15", fill=20, font_size=26)
+        for x in range(80, width - 80, 280):
+            draw.line([(x, 120), (x, height - 120)], fill=30, width=2)
+        return img.convert('RGB')
+    
+    base = acta()
+    casos = {
+        'limpia': (base, []),
+        'en_blanco': (Image.new('RGB', base.size, (240, 240, 240)), ['en_blanco']),
+        'borrosa': (base.filter(ImageFilter.GaussianBlur(6)), ['borrosa']),
+        'bajo_contraste': (base.point(lambda v: 110 + v * 0.12), ['bajo_contraste']),
+        'inclinacion': (base.rotate(7, expand=True, fillcolor=(235, 235, 235)), ['inclinacion']),
+        'transparencia': (base.convert('RGBA'), ['transparencia']),
+        'paleta': (base.convert('P'), ['paleta']),
+    }
+    for nombre, (image, esperados) in casos.items():
+        report = assess_image(image)
+        # Una imagen muy borrosa también pierde contraste: basta con que estén los esperados
+        assert set(esperados) <= set(report.codigos) and (esperados or not report.codigos), (nombre, report.codigos)
+    assert assess_image(casos['inclinacion'][0]).metricas['inclinacionGrados'] == -7.0
+    print(f"   ✓ Detecta {', '.join(nombre for nombre in casos if nombre != 'limpia')}")
+    
+    corregir = QualityConfig()
+    imagen = casos['inclinacion'][0].copy()
+    imagen.info['source_sha256'] = 'abc'
+    corregida, report = apply_quality_gate(imagen, corregir)
+    assert report.correcciones == ['inclinacion'] and corregida.info['source_sha256'] == 'abc'
+    assert abs(assess_image(corregida).metricas['inclinacionGrados']) <= 0.5
+    corregida, report = apply_quality_gate(casos['transparencia'][0], corregir)
+    assert corregida.mode == 'RGB' and report.correcciones == ['transparencia']
+    corregida, _ = apply_quality_gate(casos['bajo_contraste'][0], corregir)
+    assert assess_image(corregida).codigos == []
+    print("   ✓ Endereza, aplana la transparencia y ajusta el contraste")
+    
+    try:
+        apply_quality_gate(casos['borrosa'][0], corregir)
+        raise AssertionError("Debió rechazar la imagen borrosa")
+    except ImageQualityError as e:
+        assert e.report.rechazada and 'borrosa' in str(e)
+    imagen, report = apply_quality_gate(casos['en_blanco'][0], QualityConfig(mode='reportar'))
+    assert imagen is casos['en_blanco'][0] and report.codigos == ['en_blanco'] and not report.rechazada
+    assert apply_quality_gate(base, QualityConfig(mode='off')) == (base, None)
+    try:
+        QualityConfig(mode='estricto')
+        raise AssertionError("Debió rechazar un modo inválido")
+    except ValueError:
+        pass
+    print("   ✓ Rechaza en modo corregir, solo reporta en modo reportar")
+    
+    grande = base.resize((6000, 4000))
+    assess_image(grande)
+    start = time.perf_counter()
+    assess_image(grande)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert elapsed_ms < 250, elapsed_ms
+    print(f"   ✓ Escaneo de 6000x4000 analizado en {elapsed_ms:.0f}ms")
+    
+    class FakeModel:
+        def __init__(self):
+            self.calls = 0
+        
+        def generate_content(self, contents, stream=False):
+            self.calls += 1
+            return fake_response(json.dumps({'estudiantes': [
+                {'numero': 1, 'apellido_paterno': 'QUISPE', 'nombres': 'ANA', 'notas': [12], 'situacion_final': 'P'}
+            ]}))
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': 1, 'nombre': 'MATEMÁTICA', 'codigo': 'MAT'}],
+    }
+    pool = FakePool(FakeModel())
+    client = GeminiOCRClient('test-key', model_pool=pool, quality=corregir)
+    try:
+        client.process_acta(casos['en_blanco'][0], metadata)
+        raise AssertionError("Debió rechazar la página en blanco")
+    except ImageQualityError:
+        pass
+    assert pool.model.calls == 0
+    resultado = client.process_acta(casos['inclinacion'][0], metadata)
+    assert pool.model.calls == 1 and resultado['calidadImagen']['correcciones'] == ['inclinacion']
+    assert 'control_calidad' in resultado['etapasMs']
+    print("   ✓ La página en blanco no llega al modelo; calidadImagen en el resultado")
+    
+    # La configuración del control forma parte de la clave del cache
+    assert corregir.signature() != QualityConfig(mode='reportar').signature()
+    cache = OCRResultCache(max_items=8)
+    GeminiOCRClient('test-key', model_pool=pool, quality=corregir, cache=cache).process_acta(casos['inclinacion'][0], metadata)
+    assert pool.model.calls == 2
+    otro = GeminiOCRClient('test-key', model_pool=pool, quality=QualityConfig(mode='reportar'), cache=cache)
+    assert otro.process_acta(casos['inclinacion'][0], metadata)['cache']['hit'] is False and pool.model.calls == 3
+    print("   ✓ Cambiar el modo o los umbrales del control no sirve resultados del cache anterior")
+    
+    print("   ✅ Control de calidad OK")
+    return True
+
+def test_table_detection():
+    """Prueba la detección de la tabla, el conteo de filas y su uso en el request"""
+    print("\n🧪 TEST 25: Detección de Tabla y Conteo de Filas")
+    print_separator()
+    
+    from PIL import ImageDraw
+    
+    def acta(filas=18, vacias=4, inclinacion=0):
+        """Acta con margen, título, encabezado alto, filas vacías al final, sello y firma"""
+        img = Image.new('L', (2400, 1800), color=240)
+        draw = ImageDraw.Draw(img)
+        left, top, right, header, row = 250, 250, 2200, 120, 50
+        draw.text((left, 90), "ACTA CONSOLIDADA DE EVALUACION", fill=20, font_size=40)
+        lines = [top, top + header] + [top + header + row * (i + 1) for i in range(filas + vacias)]
+        for y in lines:
+            draw.line([(left, y), (right, y)], fill=30, width=2)
+        for x in range(left, right + 1, (right - left) // 14):
+            draw.line([(x, top), (x, lines[-1])], fill=30, width=2)
+        for i in range(filas):
+            y = lines[2 + i] - row + 12
+            draw.text((left + 20, y), f"{i + 1} QUISPE MAMANI, ANA", fill=20, font_size=24)
+            for k in range(8):
+                draw.text((left + 700 + k * 170, y), "14", fill=20, font_size=24)
+        draw.ellipse((1700, lines[-1] + 80, 1950, lines[-1] + 330), outline=60, width=4)
+        draw.line([(400, lines[-1] + 250), (900, lines[-1] + 230)], fill=20, width=2)
+        img = img.convert('RGB')
+        if inclinacion:
+            img = img.rotate(inclinacion, fillcolor=(240, 240, 240))
+        return img
+    
+    for filas, vacias, inclinacion in ((18, 4, 0), (25, 0, 0), (12, 8, 1.5)):
+        region = detect_table(acta(filas, vacias, inclinacion))
+        assert region.filas == filas, (filas, vacias, inclinacion, region.as_dict())
+    left, top, right, bottom = detect_table(acta()).bbox
+    assert abs(left - 250) <= 12 and abs(top - 250) <= 12 and abs(right - 2200) <= 12 and bottom < 1500
+    print("   ✓ Filas con estudiantes (sin encabezado ni filas vacías), también con 1.5° de inclinación")
+    
+    imagen = acta()
+    imagen.info['source_sha256'] = 'abc'
+    recortada, region = locate_table(imagen, TableDetectionConfig())
+    assert region.recortada and recortada.info['source_sha256'] == 'abc'
+    assert recortada.size[1] < 1400 and region.pixeles_despues < region.pixeles_antes * 0.7
+    sin_tabla = Image.new('RGB', (800, 600), 'white')
+    assert locate_table(sin_tabla, TableDetectionConfig())[0] is sin_tabla
+    assert locate_table(imagen, TableDetectionConfig(crop=False))[0] is imagen
+    print(f"   ✓ Recorte a la tabla: {region.pixeles_antes} → {region.pixeles_despues} px")
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}'} for i in range(8)],
+    }
+    prompt = compile_acta_prompt(metadata, expected_rows=18)
+    assert 'detectadas en la tabla: 18' in prompt.suffix and prompt.prefix == compile_acta_prompt(metadata).prefix
+    assert 'detectadas' not in build_acta_prompt(metadata)
+    # Las filas detectadas solo suben el límite por defecto (16384), nunca lo bajan
+    assert prompt.max_output_tokens() == 16384
+    larga = compile_acta_prompt(metadata, expected_rows=80).max_output_tokens()
+    assert 16384 < larga <= 32768 and larga % 1024 == 0
+    assert compile_acta_prompt(metadata, expected_rows=1000).max_output_tokens() == 32768
+    assert compile_acta_prompt(metadata).max_output_tokens() is None
+    print(f"   ✓ Filas en el sufijo del prompt y max_output_tokens={prompt.max_output_tokens()}")
+    
+    class FakeModel:
+        def __init__(self, estudiantes):
+            self.estudiantes = estudiantes
+            self.calls = []
+        
+        def generate_content(self, contents, stream=False, **kwargs):
+            self.calls.append((contents, kwargs))
+            return fake_response(json.dumps({'estudiantes': [
+                {'numero': n + 1, 'apellido_paterno': 'QUISPE', 'nombres': 'ANA', 'notas': [14] * 8,
+                 'situacion_final': 'P'}
+                for n in range(self.estudiantes)
+            ]}))
+    
+    model = FakeModel(18)
+    client = GeminiOCRClient('test-key', model_pool=FakePool(model), table_detection=TableDetectionConfig())
+    resultado = client.process_acta(acta(), metadata)
+    (imagen_enviada, texto), kwargs = model.calls[0]
+    assert imagen_enviada.size[1] < 1400 and 'detectadas en la tabla: 18' in texto
+    assert kwargs['generation_config']['max_output_tokens'] == prompt.max_output_tokens()
+    assert resultado['tabla']['filas'] == 18 and resultado['tabla']['coincide']
+    assert 'deteccion_tabla' in resultado['etapasMs']
+    print("   ✓ El modelo recibe la tabla recortada, las filas esperadas y max_output_tokens")
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel(15)), table_detection=TableDetectionConfig())
+    resultado = client.process_acta(acta(), metadata)
+    assert not resultado['tabla']['coincide']
+    assert any('18 filas' in a and 'se extrajeron 15' in a for a in resultado['advertencias'])
+    print("   ✓ Advertencia si totalEstudiantes no coincide con las filas detectadas")
+    
+    print("   ✅ Detección de tabla OK")
+    return True
+
+def test_model_cascade():
+    """Prueba los chequeos de consistencia y la cascada modelo rápido → modelo fuerte"""
+    print("\n🧪 TEST 26: Cascada de Modelos")
+    print_separator()
+    
+    import asyncio
+    
+    def estudiante(numero, notas=None, situacion='P', **extra):
+        est = {'numero': numero, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI', 'nombres': 'ANA',
+               'notas': notas if notas is not None else [14, 15, 13], 'situacion_final': situacion}
+        est.update(extra)
+        return est
+    
+    buenos = [estudiante(n) for n in range(1, 11)]
+    report = check_consistency(buenos, 3)
+    assert report.puntaje == 1.0 and report.conteo == {}
+    assert check_consistency(buenos, 3, filas_detectadas=10).puntaje == 1.0
+    assert check_consistency(buenos, 3, filas_detectadas=20).puntaje == 0.5
+    assert check_consistency([], 3).puntaje == 0.0
+    
+    assert student_problems(estudiante(1, [14, 15]), 3, None) == ['notas_incompletas']
+    assert student_problems(estudiante(1, [14, 8, 13]), 3, None) == ['situacion_final']
+    assert student_problems(estudiante(1, [14, 15, 13], 'A'), 3, None) == ['situacion_final']
+    assert student_problems(estudiante(1, [14, 8, 13], 'A', asignaturas_desaprobadas=2), 3, None) == ['desaprobadas']
+    assert student_problems(estudiante(5), 3, 4) == ['numero']
+    assert student_problems(estudiante(1, [None, None, 14], 'R'), 3, None) == ['ilegible']
+    assert student_problems(estudiante(1, nombres='ILEGIBLE'), 3, None) == ['ilegible']
+    mixtos = buenos[:8] + [estudiante(9, [14, 8, 13]), estudiante(11)]
+    report = check_consistency(mixtos, 3)
+    assert report.puntaje == 0.8 and report.conteo == {'situacion_final': 1, 'numero': 1}
+    assert report.as_dict()['estudiantesConProblemas'] == 2
+    print("   ✓ Chequeos: notas por área, desaprobadas, situación final, Nº de orden, ilegibles y filas")
+    
+    class FakeModel:
+        def __init__(self, respuesta):
+            self.respuesta = respuesta
+            self.calls = 0
+        
+        def generate_content(self, contents, stream=False, **kwargs):
+            self.calls += 1
+            if isinstance(self.respuesta, Exception):
+                raise self.respuesta
+            return fake_response(
+                self.respuesta if isinstance(self.respuesta, str) else json.dumps({'estudiantes': self.respuesta})
+            )
+        
+        async def generate_content_async(self, contents, **kwargs):
+            return self.generate_content(contents, **kwargs)
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}'} for i in range(3)],
+    }
+    image = Image.new('RGB', (400, 300), 'white')
+    
+    def cliente(respuesta_rapida, **kwargs):
+        rapido, fuerte = FakeModel(respuesta_rapida), FakeModel(buenos)
+        client = GeminiOCRClient(
+            'test-key', 'modelo-fuerte',
+            model_pool=FakePool({'modelo-rapido': rapido, 'modelo-fuerte': fuerte}),
+            cascade=CascadeConfig(fast_model='modelo-rapido', min_score=0.9), **kwargs
+        )
+        return client, rapido, fuerte
+    
+    client, rapido, fuerte = cliente(buenos)
+    emitidos = []
+    resultado = client.process_acta(image, metadata, on_student=emitidos.append)
+    assert resultado['procesadoCon'] == 'modelo-rapido' and rapido.calls == 1 and fuerte.calls == 0
+    assert resultado['cascada']['nivel'] == 'rapido' and not resultado['cascada']['escalada']
+    assert resultado['consistencia']['puntaje'] == 1.0 and len(emitidos) == 10
+    print("   ✓ Resultado consistente del modelo rápido: se acepta sin llamar al fuerte")
+    
+    casos = (
+        (mixtos, 'puntaje'),
+        ('{"estudiantes": "no es una lista"}', 'validacion'),
+        ('esto no es JSON', 'validacion'),
+        (RuntimeError('modelo no disponible'), 'error'),
+    )
+    for respuesta, motivo in casos:
+        client, rapido, fuerte = cliente(respuesta, retry_policy=RetryPolicy(max_attempts=1))
+        emitidos = []
+        resultado = client.process_acta(image, metadata, on_student=emitidos.append)
+        assert resultado['procesadoCon'] == 'modelo-fuerte' and fuerte.calls == 1, motivo
+        assert resultado['cascada']['escalada'] and resultado['cascada']['motivo'] == motivo
+        assert resultado['totalEstudiantes'] == 10 and len(emitidos) == 10
+        stats = client.cascade.stats()
+        assert stats['escaladas'] == 1 and stats['motivos'] == {motivo: 1} and stats['tasa_escalada'] == 1.0
+    print("   ✓ Escala al modelo fuerte por puntaje bajo, validación o error del modelo rápido")
+    
+    class ServiceUnavailable(Exception):
+        """Como google.api_core.exceptions.ServiceUnavailable (503)"""
+    
+    # Reintentos agotados en el modelo rápido (503): se escala, no falla el request
+    client, rapido, fuerte = cliente(
+        ServiceUnavailable('503'), retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01),
+        table_detection=TableDetectionConfig()
+    )
+    filas_antes = TABLE_ROWS.value(resultado='sin_tabla')
+    fallas_antes = PARSE_FAILURES.value(tipo='validacion')
+    resultado = client.process_acta(image, metadata)
+    assert rapido.calls == 2 and fuerte.calls == 1
+    assert resultado['procesadoCon'] == 'modelo-fuerte' and resultado['cascada']['motivo'] == 'error'
+    assert TABLE_ROWS.value(resultado='sin_tabla') == filas_antes + 1
+    # Validación fallida del modelo rápido: no cuenta como falla ni duplica métricas
+    client, rapido, fuerte = cliente('{"estudiantes": "no es una lista"}', table_detection=TableDetectionConfig())
+    client.process_acta(image, metadata)
+    assert PARSE_FAILURES.value(tipo='validacion') == fallas_antes
+    assert TABLE_ROWS.value(resultado='sin_tabla') == filas_antes + 2
+    print("   ✓ Reintentos agotados escalan; métricas solo del resultado que se devuelve")
+    
+    # Modelo rápido caído con requests concurrentes: abre solo su circuito
+    from concurrent.futures import ThreadPoolExecutor
+    client, rapido, fuerte = cliente(
+        ServiceUnavailable('503'), retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01),
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        resultados = list(pool.map(lambda _: client.process_acta(image, metadata, use_cache=False), range(6)))
+    assert all(r['procesadoCon'] == 'modelo-fuerte' and r['cascada']['motivo'] == 'error' for r in resultados)
+    upstream = client.upstream_stats()
+    assert upstream['modelo-rapido']['circuit_breaker']['estado'] == 'abierto'
+    assert upstream['modelo-fuerte']['circuit_breaker']['estado'] == 'cerrado' and fuerte.calls == 6
+    assert client.concurrency.limit == upstream['modelo-fuerte']['concurrency']['limite'] == 16
+    print("   ✓ Un modelo rápido caído no abre el circuito ni reduce la concurrencia del fuerte")
+    
+    client, rapido, fuerte = cliente(buenos)
+    resultado = asyncio.run(client.process_acta_async(image, metadata))
+    assert resultado['procesadoCon'] == 'modelo-rapido' and fuerte.calls == 0
+    client, rapido, fuerte = cliente(mixtos)
+    resultado = asyncio.run(client.process_acta_async(image, metadata))
+    assert resultado['procesadoCon'] == 'modelo-fuerte' and resultado['cascada']['motivo'] == 'puntaje'
+    print("   ✓ Misma cascada en process_acta_async")
+    
+    cascade = ModelCascade(CascadeConfig(fast_model='rapido', initial_strong_latency=30.0))
+    cascade.accepted(5.0)
+    cascade.accepted(5.0)
+    cascade.escalated('puntaje', 4.0)
+    stats = cascade.stats()
+    assert stats['aceptadas'] == 2 and stats['tasa_escalada'] == 0.333
+    assert stats['ahorro_neto_segundos'] == 46.0
+    render = REGISTRY.render()
+    assert 'ocr_cascade_escalations_total{motivo="puntaje"}' in render
+    assert 'ocr_cascade_latency_saved_seconds_total' in render
+    print(f"   ✓ Tasa de escalada y ahorro neto de latencia: {stats}")
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool({'gemini-2.5-pro': FakeModel(buenos)}))
+    assert client.process_acta(image, metadata)['procesadoCon'] == 'gemini-2.5-pro' and client.cascade is None
+    print("   ✓ Sin cascada procesadoCon es el modelo configurado")
+    
+    print("   ✅ Cascada de modelos OK")
+    return True
+
+def test_computed_confidence():
+    """Prueba la confianza calculada por estudiante y por acta y la revisión selectiva"""
+    print("\n🧪 TEST 27: Confianza Calculada")
+    print_separator()
+    
+    def estudiante(numero, notas=None, situacion='P', **extra):
+        est = {'numero': numero, 'apellido_paterno': 'QUISPE', 'apellido_materno': 'MAMANI', 'nombres': 'ANA',
+               'notas': notas if notas is not None else [14, 15, 13, 12], 'situacion_final': situacion}
+        est.update(extra)
+        return est
+    
+    assert student_confidence(estudiante(1), []) == 100
+    assert student_confidence(estudiante(1, [14, 15, 13]), ['notas_incompletas']) == 60
+    assert student_confidence(estudiante(1, [14, None, 13, 12]), []) == 90
+    assert student_confidence(estudiante(1, [None] * 4), ['ilegible']) == 30
+    assert student_confidence(estudiante(1, [14, 8]), ['notas_incompletas', 'situacion_final', 'numero']) == 20
+    
+    estudiantes = [estudiante(n) for n in range(1, 9)] + [
+        estudiante(9, [14, 8, 13, 12], asignaturas_desaprobadas=0),     # P con desaprobada, desaprobadas mal contadas
+        estudiante(10, [14, None, None, 12], 'R'),                       # la mitad ilegible
+    ]
+    report = check_consistency(estudiantes, 4)
+    assert report.confianzas[:8] == [100] * 8 and report.confianzas[8:] == [55, 50]
+    assert report.confianza == 90
+    assert check_consistency(estudiantes, 4, filas_detectadas=20).confianza == 45
+    assert check_consistency([], 4).confianza == 0
+    print(f"   ✓ Confianza por estudiante y del acta: {report.confianzas} → {report.confianza}")
+    
+    metadata = {
+        'anio_lectivo': 1995, 'grado': 'Quinto Grado', 'seccion': 'A', 'turno': 'MAÑANA',
+        'areas': [{'posicion': i + 1, 'nombre': f'AREA {i + 1}'} for i in range(4)],
+    }
+    resultado = apply_confidence(convert_to_backend_format({'estudiantes': estudiantes}, metadata), report)
+    assert resultado['confianza'] == 90 and len(resultado['confianzaEstudiantes']) == 10
+    assert [est['confianza'] for est in resultado['estudiantes']] == report.confianzas
+    revision = resultado['revisionSugerida']
+    assert revision['umbral'] == 70 and not revision['reprocesarActa']
+    assert [est['numero'] for est in revision['estudiantes']] == [9, 10]
+    assert revision['estudiantes'][0]['problemas'] == ['desaprobadas', 'situacion_final']
+    baja = apply_confidence(convert_to_backend_format({'estudiantes': estudiantes}, metadata), report, umbral=95)
+    assert baja['revisionSugerida']['reprocesarActa'] and any('reprocesarla' in a for a in baja['advertencias'])
+    print("   ✓ revisionSugerida lista solo los estudiantes bajo el umbral")
+    
+    class FakeModel:
+        def generate_content(self, contents, stream=False, **kwargs):
+            return fake_response(json.dumps({'estudiantes': estudiantes}))
+    
+    client = GeminiOCRClient('test-key', model_pool=FakePool(FakeModel()), confidence_threshold=60)
+    resultado = client.process_acta(Image.new('RGB', (400, 300), 'white'), metadata)
+    assert resultado['confianza'] == 90 and resultado['consistencia']['estudiantesConProblemas'] == 2
+    assert [est['numero'] for est in resultado['revisionSugerida']['estudiantes']] == [9, 10]
+    assert 'consistencia' in resultado['etapasMs']
+    assert [est['confianza'] for est in resultado['estudiantes']] == resultado['confianzaEstudiantes']
+    print("   ✓ process_acta devuelve la confianza calculada en lugar de un valor fijo")
+    
+    events = list(client.process_acta_stream(Image.new('RGB', (400, 300), 'white'), metadata, use_cache=False))
+    streamed = [event['data'] for event in events[:-1]]
+    assert [est['confianza'] for est in streamed] == [100] * 8 + [55, 50]
+    assert streamed == events[-1]['data']['estudiantes']
+    print("   ✓ Cada estudiante emitido en streaming ya trae su confianza")
+    
+    class FakeClient:
+        def load_and_prepare_image(self, image_path):
+            return Image.new('L', (10, 10))
+        
+        def process_acta(self, image, metadata, **kwargs):
+            return {'revisionSugerida': {'reprocesarActa': metadata['baja']}}
+    
+    pages = [{'pagina': n, 'image_path': __file__, 'metadata': {'baja': n in (3, 7)}} for n in range(1, 9)]
+    pages.append({'pagina': 9, 'metadata': {'baja': False}})  # sin imagen
+    resumen = list(iter_batch_results(FakeClient(), pages, max_concurrency=4))[-1]
+    assert resumen['paginasReprocesar'] == [3, 7, 9]
+    print("   ✓ El resumen del lote indica solo las páginas a reprocesar")
+    
+    print("   ✅ Confianza calculada OK")
+    return True
+
 def main():
     """Ejecutar todos los tests"""
     print("\n")
@@ -221,6 +1938,29 @@ def main():
         test_metadata_validation,
         test_prompt_builder,
         test_response_parser,
+        test_ocr_cache,
+        test_ocr_jobs,
+        test_ocr_batch,
+        test_rate_limiter,
+        test_image_preprocessing,
+        test_logging,
+        test_metrics,
+        test_ocr_tiling,
+        test_streaming,
+        test_truncated_response,
+        test_context_cache,
+        test_compact_output_format,
+        test_normalization,
+        test_response_archive,
+        test_async_processing,
+        test_lazy_startup,
+        test_upstream_guard,
+        test_single_flight,
+        test_document_ingestion,
+        test_image_quality,
+        test_table_detection,
+        test_model_cascade,
+        test_computed_confidence,
         test_gemini_client,
     ]
     
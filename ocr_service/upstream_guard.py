@@ -0,0 +1,386 @@
+"""
+Protección ante sobrecarga de Gemini: reintentos, concurrencia adaptativa
+y circuit breaker
+
+Las llamadas al modelo fallan de formas distintas y cada una pide una
+reacción distinta:
+- cuota (429 / ResourceExhausted): reintentar con backoff y bajar la
+  concurrencia
+- servidor (500, 502, 503) y timeout (504 / DeadlineExceeded): reintentar
+  con backoff; si persisten, abrir el circuito
+- cliente (400, 401, 403, 404) y otros: no se reintentan
+
+Componentes:
+- classify_error: tipo de error de una excepción del SDK
+- RetryPolicy: cuántas veces y con qué espera reintentar
+- AdaptiveConcurrencyLimiter: límite AIMD de llamadas simultáneas (sube +1
+  por cada `limite` llamadas exitosas, se reduce a la mitad ante cuota o
+  sobrecarga)
+- CircuitBreaker: tras N fallas seguidas rechaza las llamadas durante
+  reset_timeout segundos sin esperar a Gemini, luego deja pasar una de prueba
+
+Los reintentos ocurren dentro de GeminiOCRClient y reusan la imagen ya
+decodificada y preparada: no se vuelve a recibir ni a procesar el upload.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from rate_limiter import RateLimitExceeded
+
+ERROR_CUOTA = 'cuota'
+ERROR_SERVIDOR = 'servidor'
+ERROR_TIMEOUT = 'timeout'
+ERROR_CLIENTE = 'cliente'
+ERROR_OTRO = 'otro'
+
+# Errores del upstream: se reintentan, cuentan para el circuit breaker y
+# reducen el límite de concurrencia
+UPSTREAM_ERRORS = (ERROR_CUOTA, ERROR_SERVIDOR, ERROR_TIMEOUT)
+
+# Excepciones de google.api_core (o gRPC) por nombre de clase, para no
+# importar el SDK solo para clasificar
+_ERROR_NAMES = {
+    'ResourceExhausted': ERROR_CUOTA,
+    'TooManyRequests': ERROR_CUOTA,
+    'InternalServerError': ERROR_SERVIDOR,
+    'BadGateway': ERROR_SERVIDOR,
+    'ServiceUnavailable': ERROR_SERVIDOR,
+    'Unknown': ERROR_SERVIDOR,
+    'GatewayTimeout': ERROR_TIMEOUT,
+    'DeadlineExceeded': ERROR_TIMEOUT,
+    'InvalidArgument': ERROR_CLIENTE,
+    'BadRequest': ERROR_CLIENTE,
+    'Unauthenticated': ERROR_CLIENTE,
+    'PermissionDenied': ERROR_CLIENTE,
+    'Forbidden': ERROR_CLIENTE,
+    'NotFound': ERROR_CLIENTE,
+    'FailedPrecondition': ERROR_CLIENTE,
+}
+
+CIRCUITO_CERRADO = 'cerrado'
+CIRCUITO_ABIERTO = 'abierto'
+CIRCUITO_SEMIABIERTO = 'semiabierto'
+
+
+class UpstreamUnavailable(RateLimitExceeded):
+    """Gemini no está disponible: circuito abierto o reintentos agotados"""
+
+
+class RetriesExhausted(UpstreamUnavailable):
+    """Se agotaron los reintentos de una llamada (el circuito sigue cerrado)"""
+
+    def __init__(self, message: str, retry_after: float, kind: str):
+        super().__init__(message, retry_after)
+        self.kind = kind
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Clasifica una excepción de la llamada al modelo
+
+    Returns:
+        'cuota', 'servidor', 'timeout', 'cliente' u 'otro'
+    """
+    for cls in type(error).__mro__:
+        kind = _ERROR_NAMES.get(cls.__name__)
+        if kind is not None:
+            return kind
+
+    # GoogleAPICallError.code es el status HTTP
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        if code == 429:
+            return ERROR_CUOTA
+        if code in (408, 504):
+            return ERROR_TIMEOUT
+        if 500 <= code < 600:
+            return ERROR_SERVIDOR
+        if 400 <= code < 500:
+            return ERROR_CLIENTE
+
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return ERROR_TIMEOUT
+    if isinstance(error, ConnectionError):
+        return ERROR_SERVIDOR
+    return ERROR_OTRO
+
+
+class RetryPolicy:
+    """Reintentos con backoff exponencial y jitter para errores del upstream"""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 2.0,
+        max_delay: float = 30.0,
+        jitter: float = 0.25,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            max_attempts: Intentos totales por llamada (1 = sin reintentos)
+            base_delay: Espera antes del primer reintento; se duplica en cada uno
+            max_delay: Espera máxima entre intentos
+            jitter: Fracción aleatoria (+/-) de la espera, para no sincronizar
+                los reintentos de actas concurrentes
+            sleep: Función de espera (inyectable en pruebas)
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.sleep = sleep
+
+    def delay(self, attempt: int) -> float:
+        """Espera antes del intento attempt + 1 (attempt empieza en 1)"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        return kind in UPSTREAM_ERRORS and attempt < self.max_attempts
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Límite de llamadas simultáneas a Gemini con AIMD
+
+    Aumento aditivo: cada llamada exitosa suma 1/limite (≈ +1 por cada
+    ronda completa de llamadas). Disminución multiplicativa: un error de
+    cuota o sobrecarga multiplica el límite por decrease_factor, como mucho
+    una vez por ventana de backoff_interval segundos (las llamadas que ya
+    estaban en vuelo fallan juntas y no deben reducirlo varias veces).
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        backoff_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Se requiere 1 <= min_limit <= max_limit")
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.backoff_interval = backoff_interval
+        self._clock = clock
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+        self.waiting = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def clone(self) -> 'AdaptiveConcurrencyLimiter':
+        """Limiter nuevo con la misma configuración (ej: para otro modelo)"""
+        return AdaptiveConcurrencyLimiter(
+            self.initial_limit, self.min_limit, self.max_limit,
+            self.decrease_factor, self.backoff_interval, self._clock
+        )
+
+    def try_acquire(self) -> bool:
+        """Ocupa un lugar si hay capacidad, sin esperar"""
+        with self._cond:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Espera (bloqueando el hilo) un lugar libre
+
+        Raises:
+            RateLimitExceeded: Si no se libera un lugar dentro de timeout
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self._in_flight >= int(self._limit):
+                    remaining = None if deadline is None else deadline - self._clock()
+                    if remaining is not None and remaining <= 0:
+                        raise RateLimitExceeded(
+                            f"Límite de concurrencia de Gemini alcanzado ({int(self._limit)} llamadas en curso)",
+                            retry_after=self.backoff_interval
+                        )
+                    self._cond.wait(timeout=remaining)
+                self._in_flight += 1
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, timeout: Optional[float] = None):
+        """Versión asíncrona de acquire: espera sin bloquear el event loop"""
+        start = self._clock()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while not self.try_acquire():
+                if timeout is not None and self._clock() - start >= timeout:
+                    raise RateLimitExceeded(
+                        f"Límite de concurrencia de Gemini alcanzado ({self.limit} llamadas en curso)",
+                        retry_after=self.backoff_interval
+                    )
+                await asyncio.sleep(0.02)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, kind: Optional[str] = None):
+        """
+        Libera el lugar y ajusta el límite según el resultado
+
+        Args:
+            kind: None si la llamada tuvo éxito, o el tipo de classify_error
+                (los errores que no son del upstream no cambian el límite)
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if kind is None:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            elif kind in UPSTREAM_ERRORS:
+                now = self._clock()
+                if now - self._last_decrease >= self.backoff_interval:
+                    self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self.decreases += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del limiter para /health"""
+        with self._cond:
+            return {
+                'limite': int(self._limit),
+                'minimo': self.min_limit,
+                'maximo': self.max_limit,
+                'en_curso': self._in_flight,
+                'en_espera': self.waiting,
+                'reducciones': self.decreases,
+            }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de las llamadas a Gemini
+
+    cerrado → abierto: failure_threshold errores del upstream seguidos
+    abierto → semiabierto: pasado reset_timeout se deja pasar una llamada
+    semiabierto → cerrado si la llamada de prueba tiene éxito, o de vuelta
+    a abierto si falla
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CIRCUITO_CERRADO
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.openings = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def clone(self) -> 'CircuitBreaker':
+        """Breaker nuevo (cerrado) con la misma configuración"""
+        return CircuitBreaker(self.failure_threshold, self.reset_timeout, self._clock)
+
+    def _current_state(self) -> str:
+        """Estado considerando el vencimiento de reset_timeout (requiere lock)"""
+        if self._state == CIRCUITO_ABIERTO and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = CIRCUITO_SEMIABIERTO
+            self._probe_in_flight = False
+        return self._state
+
+    def before_call(self):
+        """
+        Autoriza una llamada
+
+        Raises:
+            UpstreamUnavailable: Si el circuito está abierto (o ya hay una
+                llamada de prueba en curso)
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CIRCUITO_CERRADO:
+                return
+            if state == CIRCUITO_SEMIABIERTO and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            retry_after = max(1.0, self.reset_timeout - (self._clock() - self._opened_at))
+        raise UpstreamUnavailable(
+            "Gemini no está disponible (circuito abierto tras errores consecutivos)",
+            retry_after=retry_after
+        )
+
+    def record(self, kind: Optional[str] = None):
+        """
+        Registra el resultado de una llamada autorizada
+
+        Args:
+            kind: None si tuvo éxito, o el tipo de classify_error. Los
+                errores del cliente no dicen nada de la salud del upstream
+                y no cambian el estado (salvo liberar la llamada de prueba).
+        """
+        with self._lock:
+            state = self._current_state()
+            if kind is None:
+                self._state = CIRCUITO_CERRADO
+                self._failures = 0
+                self._probe_in_flight = False
+            elif kind in UPSTREAM_ERRORS:
+                self._failures += 1
+                if state == CIRCUITO_SEMIABIERTO or self._failures >= self.failure_threshold:
+                    if state != CIRCUITO_ABIERTO:
+                        self.openings += 1
+                    self._state = CIRCUITO_ABIERTO
+                    self._opened_at = self._clock()
+                    self._probe_in_flight = False
+            else:
+                self._probe_in_flight = False
+
+    def cancel(self):
+        """La llamada autorizada no llegó a hacerse (ej: sin cuota o cancelada)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del breaker para /health"""
+        with self._lock:
+            state = self._current_state()
+            return {
+                'estado': state,
+                'fallas_consecutivas': self._failures,
+                'umbral': self.failure_threshold,
+                'reabre_en_segundos': (
+                    round(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)), 1)
+                    if state == CIRCUITO_ABIERTO else None
+                ),
+                'aperturas': self.openings,
+                'rechazadas': self.rejected,
+            }